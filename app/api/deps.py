@@ -1,47 +1,86 @@
-from typing import Generator, Optional
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
+from app.core.principal_cache import async_principal_cache, principal_cache
 from app.core.security import verify_password
-from app.crud.user import user
-from app.db.session import SessionLocal
+from app.crud.user import async_user, user
+from app.db import session
+from app.db.session import get_async_db, get_db
 from app.models.user import User
 from app.schemas.user import TokenPayload
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_PREFIX}/auth/login"
 )
+optional_oauth2 = OAuth2PasswordBearer(
+    tokenUrl=f"{settings.API_PREFIX}/auth/login", auto_error=False
+)
 
 
-def get_db() -> Generator:
-    try:
-        db = SessionLocal()
-        yield db
-    finally:
-        db.close()
-
-
-def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(reusable_oauth2)
-) -> User:
+def decode_token(token: str) -> TokenPayload:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
-        token_data = TokenPayload(**payload)
+        return TokenPayload(**payload)
     except (JWTError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user_obj = user.get(db, id=token_data.sub)
-    if not user_obj:
-        raise HTTPException(status_code=404, detail="User not found")
+
+
+def token_user_id(token: Optional[str]) -> Optional[int]:
+    """The user id of a valid token, None for a missing or invalid one"""
+    if token is None:
+        return None
+    try:
+        return decode_token(token).sub
+    except HTTPException:
+        return None
+
+
+def get_read_db(
+    db: Session = Depends(get_db),
+    token: Optional[str] = Depends(optional_oauth2)
+) -> Session:
+    """
+    The request's session, reading from a replica unless the caller wrote
+    within the last REPLICA_STICKY_SECONDS. For read-only endpoints.
+    """
+    db.info["replica"] = not session.replica_router.is_sticky(token_user_id(token))
+    return db
+
+
+async def get_async_read_db(
+    db: AsyncSession = Depends(get_async_db),
+    token: Optional[str] = Depends(optional_oauth2)
+) -> AsyncSession:
+    """Async counterpart of get_read_db"""
+    router = session.async_replica_router
+    db.info["replica"] = router is not None and not await router.is_sticky(token_user_id(token))
+    return db
+
+
+def get_current_user(
+    db: Session = Depends(get_db),
+    token: str = Depends(reusable_oauth2)
+) -> User:
+    token_data = decode_token(token)
+    # Commits of this session start the user's read-your-writes window
+    db.info["user_id"] = token_data.sub
+    user_obj = principal_cache.get(token_data.sub)
+    if user_obj is None:
+        user_obj = user.get(db, id=token_data.sub)
+        if not user_obj:
+            raise HTTPException(status_code=404, detail="User not found")
+        principal_cache.set(user_obj)
     return user_obj
 
 
@@ -60,4 +99,31 @@ def get_current_active_admin(
         raise HTTPException(
             status_code=400, detail="The user doesn't have enough privileges"
         )
-    return current_user 
\ No newline at end of file
+    return current_user 
+
+
+async def get_current_async_user(
+    db: AsyncSession = Depends(get_async_db),
+    token: str = Depends(reusable_oauth2)
+) -> User:
+    token_data = decode_token(token)
+    db.info["user_id"] = token_data.sub
+    user_obj = await async_principal_cache.get(token_data.sub)
+    if user_obj is None:
+        user_obj = await async_user.get(db, id=token_data.sub)
+        if not user_obj:
+            raise HTTPException(status_code=404, detail="User not found")
+        await async_principal_cache.set(user_obj)
+    return user_obj
+
+
+async def get_current_active_async_user(
+    current_user: User = Depends(get_current_async_user),
+) -> User:
+    return get_current_active_user(current_user)
+
+
+async def get_current_active_async_admin(
+    current_user: User = Depends(get_current_async_user),
+) -> User:
+    return get_current_active_admin(current_user)
@@ -1,8 +1,9 @@
 from fastapi import APIRouter
-from app.api.v1.endpoints import auth, categories, products, orders
+from app.api.v1.endpoints import admin, auth, categories, products, orders
 
 api_router = APIRouter()
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
 api_router.include_router(categories.router, prefix="/categories", tags=["categories"])
 api_router.include_router(products.router, prefix="/products", tags=["products"])
-api_router.include_router(orders.router, prefix="/orders", tags=["orders"]) 
\ No newline at end of file
+api_router.include_router(orders.router, prefix="/orders", tags=["orders"]) 
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from app.api.v1.async_endpoints import admin, auth, categories, products, orders
+
+async_api_router = APIRouter()
+async_api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
+async_api_router.include_router(categories.router, prefix="/categories", tags=["categories"])
+async_api_router.include_router(products.router, prefix="/products", tags=["products"])
+async_api_router.include_router(orders.router, prefix="/orders", tags=["orders"])
+async_api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
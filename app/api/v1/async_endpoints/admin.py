@@ -0,0 +1,182 @@
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api import deps
+from app.core.cache import async_catalog_cache
+from app.core.principal_cache import async_principal_cache
+from app.core.rate_limit import rate_limiter
+from app.core.rfm import RFMSegment
+from app.crud import crud_order, crud_sales, crud_segment, crud_stock
+from app.crud.export import ExportFormat, async_chunks, encoder_for
+from app.crud.pagination import next_cursor_headers
+from app.crud.sales import SalesMetric
+from app.db import session
+from app.models.order import OrderStatus
+from app.models.user import User
+from app.schemas.sales import SalesPoint, TopProduct
+from app.schemas.segment import SegmentRebuild, SegmentSummary, UserSegmentResponse
+from app.schemas.stock import VariationStock, VariationStockUpdate
+
+router = APIRouter()
+
+
+@router.get("/cache", response_model=Dict[str, float])
+async def get_cache_stats(
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Get catalog cache hit/miss counters of this worker.
+    """
+    return async_catalog_cache.stats()
+
+
+@router.get("/principal-cache", response_model=Dict[str, float])
+async def get_principal_cache_stats(
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Get authenticated user cache counters of this worker.
+    """
+    return async_principal_cache.stats()
+
+
+@router.get("/db-pool", response_model=Dict[str, float])
+async def get_db_pool_stats(
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Get database connection pool counters and checkout wait times of this worker.
+    """
+    return session.async_pool_metrics.stats(session.async_engine.pool)
+
+
+@router.get("/rate-limit", response_model=Dict[str, float])
+async def get_rate_limit_stats(
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Get rate limiter counters of this worker.
+    """
+    return rate_limiter.stats()
+
+
+@router.get("/orders/export", response_class=StreamingResponse)
+async def export_orders(
+    format: ExportFormat = ExportFormat.NDJSON,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    status: List[OrderStatus] = Query(default=[]),
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Stream orders created in [created_from, created_to) with their items, oldest first.
+    """
+    # The export reopens the request's session after its dependency closed
+    # it, and closes it again when the body is done
+    orders = crud_order.async_order.export(
+        db, created_from=created_from, created_to=created_to, statuses=status
+    )
+    encoder = encoder_for(format)
+    return StreamingResponse(
+        async_chunks(encoder, orders),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="orders.{format.value}"'},
+    )
+
+
+@router.get("/sales/daily", response_model=List[SalesPoint])
+async def get_daily_sales(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: List[OrderStatus] = Query(default=[]),
+    product_id: Optional[int] = None,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Get revenue, units and orders per day in [date_from, date_to], from the sales rollups.
+    """
+    return await crud_sales.async_sales.time_series(
+        db, date_from=date_from, date_to=date_to, statuses=status, product_id=product_id
+    )
+
+
+@router.get("/sales/top-products", response_model=List[TopProduct])
+async def get_top_products(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: List[OrderStatus] = Query(default=[]),
+    by: SalesMetric = SalesMetric.REVENUE,
+    limit: int = Query(default=10, ge=1, le=100),
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Get the products with the most revenue, units or orders in [date_from, date_to].
+    """
+    return await crud_sales.async_sales.top_products(
+        db, date_from=date_from, date_to=date_to, statuses=status, by=by, limit=limit
+    )
+
+
+@router.post("/segments/rebuild", response_model=SegmentRebuild)
+async def rebuild_segments(
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Recompute every customer's RFM segment from the orders, and report how long it took.
+    """
+    return await crud_segment.async_segment.rebuild(db)
+
+
+@router.get("/segments", response_model=List[UserSegmentResponse])
+async def get_segments(
+    response: Response,
+    segment: Optional[RFMSegment] = None,
+    skip: int = 0,
+    limit: int = Query(default=100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Get customers' RFM scores and segments by user id, of one segment if given.
+    """
+    segments = await crud_segment.async_segment.get_multi(
+        db, segment=segment, skip=skip, limit=limit, cursor=cursor
+    )
+    response.headers.update(next_cursor_headers(crud_segment.SEGMENTS_KEYSET.next_cursor(segments, limit)))
+    return segments
+
+
+@router.get("/segments/summary", response_model=List[SegmentSummary])
+async def get_segment_summary(
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Get the number of customers and their total spend per segment.
+    """
+    return await crud_segment.async_segment.summary(db)
+
+
+@router.put("/variations/{variation_id}/stock", response_model=VariationStock)
+async def set_variation_stock(
+    variation_id: int,
+    stock_in: VariationStockUpdate,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Set a variation's units left to order, or stop tracking them with null.
+    """
+    variation = await crud_stock.async_stock.set_stock(
+        db, variation_id=variation_id, stock=stock_in.stock
+    )
+    if variation is None:
+        raise HTTPException(status_code=404, detail="Variation not found")
+    return variation
@@ -0,0 +1,72 @@
+from typing import Any
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, models, schemas
+from app.api import deps
+from app.core import security
+
+router = APIRouter()
+
+
+@router.post("/login", response_model=schemas.Token)
+async def login(
+    db: AsyncSession = Depends(deps.get_async_db),
+    form_data: OAuth2PasswordRequestForm = Depends()
+) -> Any:
+    """
+    OAuth2 compatible token login, get an access token for future requests
+    """
+    user = await crud.async_user.authenticate(
+        db, email=form_data.username, password=form_data.password
+    )
+    if not user:
+        raise HTTPException(status_code=400, detail="Incorrect email or password")
+    elif not crud.async_user.is_active(user):
+        raise HTTPException(status_code=400, detail="Inactive user")
+
+    access_token = security.create_access_token(user.id)
+    refresh_token = security.create_refresh_token(user.id)
+
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+    }
+
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh_token(
+    current_user: models.User = Depends(deps.get_current_async_user),
+) -> Any:
+    """
+    Refresh access token
+    """
+    access_token = security.create_access_token(current_user.id)
+    refresh_token = security.create_refresh_token(current_user.id)
+
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+    }
+
+
+@router.post("/register", response_model=schemas.UserResponse)
+async def register(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    user_in: schemas.UserCreate,
+) -> Any:
+    """
+    Create new user.
+    """
+    user = await crud.async_user.get_by_email(db, email=user_in.email)
+    if user:
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this email already exists in the system.",
+        )
+    user = await crud.async_user.create(db, obj_in=user_in)
+    return user
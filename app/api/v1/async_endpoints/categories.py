@@ -0,0 +1,179 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api import deps
+from app.core.cache import async_catalog_cache
+from app.core.media import media_storage
+from app.crud import crud_category
+from app.schemas.category import CategoryCreate, CategoryUpdate, CategoryResponse, CategoryInDB
+from app.models.user import User
+from app.schemas.base import to_json
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[CategoryResponse])
+async def get_categories(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    skip: int = 0,
+    limit: int = 100,
+    parent_id: Optional[int] = None,
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get list of categories.
+    """
+    validators = await crud_category.async_category.validators(db)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
+    categories = await crud_category.async_category.get_multi_by_parent(
+        db, parent_id=parent_id, skip=skip, limit=limit
+    )
+    response.headers.update(validators.headers())
+    return categories
+
+
+@router.get("/tree", response_model=List[CategoryResponse])
+async def get_category_tree(
+    request: Request,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get full category tree with subcategories.
+    """
+    validators = await crud_category.async_category.validators(db)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
+    body = await async_catalog_cache.get_tree(validators.etag)
+    if body is None:
+        body = to_json(List[CategoryResponse], await crud_category.async_category.get_tree(db))
+        await async_catalog_cache.set_tree(validators.etag, body)
+    return Response(content=body, media_type="application/json", headers=validators.headers())
+
+
+@router.get("/{category_id}", response_model=CategoryResponse)
+async def get_category(
+    category_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get category by ID with its subcategory tree.
+    """
+    validators = await crud_category.async_category.validators(db, category_id=category_id)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
+    category = await crud_category.async_category.get_subtree(db, id=category_id)
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+    response.headers.update(validators.headers())
+    return category
+
+
+@router.get("/{category_id}/ancestors", response_model=List[CategoryInDB])
+async def get_category_ancestors(
+    category_id: int,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get the breadcrumb of a category, from the root down to its parent.
+    """
+    return await crud_category.async_category.get_ancestors(db, id=category_id)
+
+
+@router.post("/", response_model=CategoryResponse)
+async def create_category(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    category_in: CategoryCreate = Depends(),
+    image: Optional[UploadFile] = File(None),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Create new category.
+    """
+    category = await crud_category.async_category.get_by_name(db, name=category_in.name)
+    if category:
+        raise HTTPException(
+            status_code=400,
+            detail="Category with this name already exists"
+        )
+
+    # Stored under its content hash, so re-uploads are kept once
+    image_path = None
+    if image:
+        image_path = await media_storage.save(image)
+
+    category = await crud_category.async_category.create_with_image(
+        db, obj_in=category_in, image_path=image_path
+    )
+    return category
+
+
+@router.put("/{category_id}", response_model=CategoryResponse)
+async def update_category(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    category_id: int,
+    category_in: CategoryUpdate = Depends(),
+    image: Optional[UploadFile] = File(None),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Update category.
+    """
+    category = await crud_category.async_category.get(db, id=category_id)
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    # A category cannot be moved below itself
+    if category_in.parent_id is not None and category_in.parent_id != category.parent_id:
+        parent = await crud_category.async_category.get(db, id=category_in.parent_id)
+        if not parent:
+            raise HTTPException(status_code=404, detail="Parent category not found")
+        if crud_category.async_category.is_in_subtree(parent, root=category):
+            raise HTTPException(
+                status_code=400,
+                detail="Cannot move category into its own subtree"
+            )
+
+    # Stored under its content hash, so re-uploads are kept once
+    image_path = None
+    if image:
+        image_path = await media_storage.save(image)
+
+    category = await crud_category.async_category.update_with_image(
+        db, db_obj=category, obj_in=category_in, image_path=image_path
+    )
+    return category
+
+
+@router.delete("/{category_id}", response_model=CategoryResponse)
+async def delete_category(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    category_id: int,
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Delete category.
+    """
+    category = await crud_category.async_category.get_subtree(db, id=category_id)
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    # Check if category has subcategories
+    if category.subcategories:
+        raise HTTPException(
+            status_code=400,
+            detail="Cannot delete category with subcategories"
+        )
+
+    category = await crud_category.async_category.remove(db, id=category_id)
+    return category
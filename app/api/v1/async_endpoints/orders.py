@@ -0,0 +1,155 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api import deps
+from app.crud import crud_order, crud_user
+from app.crud.order import USER_ORDERS_KEYSET, InvalidOrderItems
+from app.crud.stock import InsufficientStock
+from app.crud.pagination import next_cursor_headers
+from app.schemas.order import OrderCreate, OrderUpdate, OrderResponse
+from app.models.user import User
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[OrderResponse])
+async def get_orders(
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get list of orders for current user.
+    """
+    if crud_user.async_user.is_admin(current_user):
+        # Admin can see all orders
+        orders = await crud_order.async_order.get_multi(db, skip=skip, limit=limit, cursor=cursor)
+        next_cursor = crud_order.async_order.keyset.next_cursor(orders, limit)
+    else:
+        # Regular users can only see their own orders
+        orders = await crud_order.async_order.get_by_user(
+            db, user_id=current_user.id, skip=skip, limit=limit, cursor=cursor
+        )
+        next_cursor = USER_ORDERS_KEYSET.next_cursor(orders, limit)
+    response.headers.update(next_cursor_headers(next_cursor))
+    return orders
+
+
+@router.get("/{order_id}", response_model=OrderResponse)
+async def get_order(
+    order_id: int,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get order by ID.
+    """
+    order = await crud_order.async_order.get(db, id=order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    # Check if user has permission to view this order
+    if not crud_user.async_user.is_admin(current_user) and order.user_id != current_user.id:
+        raise HTTPException(
+            status_code=403,
+            detail="Not enough permissions to view this order"
+        )
+
+    return order
+
+
+@router.post("/", response_model=OrderResponse)
+async def create_order(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    order_in: OrderCreate,
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Create new order.
+    """
+    # Items are validated and priced from the database in one query, and
+    # their stock taken all at once or not at all
+    try:
+        order = await crud_order.async_order.create_with_items(
+            db, obj_in=order_in, user_id=current_user.id
+        )
+    except InvalidOrderItems as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+    except InsufficientStock as e:
+        raise HTTPException(status_code=409, detail=e.errors)
+    return order
+
+
+@router.put("/{order_id}", response_model=OrderResponse)
+async def update_order(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    order_id: int,
+    order_in: OrderUpdate,
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Update order (admin only).
+    """
+    order = await crud_order.async_order.get(db, id=order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    try:
+        order = await crud_order.async_order.update(
+            db, db_obj=order, obj_in=order_in
+        )
+    except InsufficientStock as e:
+        # A cancelled order taking its items again
+        raise HTTPException(status_code=409, detail=e.errors)
+    return order
+
+
+@router.get("/{order_id}/total", response_model=float)
+async def get_order_total(
+    order_id: int,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get total amount for an order.
+    """
+    order = await crud_order.async_order.get(db, id=order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    # Check if user has permission to view this order
+    if not crud_user.async_user.is_admin(current_user) and order.user_id != current_user.id:
+        raise HTTPException(
+            status_code=403,
+            detail="Not enough permissions to view this order"
+        )
+
+    return await crud_order.async_order.get_total_amount(db, id=order_id)
+
+
+@router.get("/{order_id}/status", response_model=str)
+async def get_order_status(
+    order_id: int,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get status of an order.
+    """
+    order = await crud_order.async_order.get(db, id=order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    # Check if user has permission to view this order
+    if not crud_user.async_user.is_admin(current_user) and order.user_id != current_user.id:
+        raise HTTPException(
+            status_code=403,
+            detail="Not enough permissions to view this order"
+        )
+
+    return await crud_order.async_order.get_order_status(db, id=order_id)
@@ -0,0 +1,264 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, File, HTTPException, Request, Response, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api import deps
+from app.core.cache import async_catalog_cache, page_position
+from app.core.media import media_storage
+from app.crud import crud_product, crud_category
+from app.crud.pagination import next_cursor_headers
+from app.crud.catalog_import import ImportFormat
+from app.crud.product import SEARCH_KEYSET, ProductLoad
+from app.schemas.product import (
+    ProductCreate,
+    ProductImageCreate,
+    ProductImageResponse,
+    ProductImportReport,
+    ProductUpdate,
+    ProductResponse,
+    ProductSearchResult,
+    ProductVariationCreate
+)
+from app.models.user import User
+from app.schemas.base import to_json
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[ProductResponse])
+async def get_products(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    category_id: Optional[int] = None,
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get list of products.
+    """
+    validators = await crud_product.async_product.validators(db, category_id=category_id)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
+    if category_id:
+        page = page_position(cursor, skip)
+        cached = await async_catalog_cache.get_category_products(
+            category_id, page, limit, validators.etag
+        )
+        if cached is None:
+            products = await crud_product.async_product.get_multi_by_category(
+                db, category_id=category_id, skip=skip, limit=limit, cursor=cursor,
+                load=ProductLoad.RESPONSE
+            )
+            cached = (
+                to_json(List[ProductResponse], products),
+                crud_product.async_product.keyset.next_cursor(products, limit),
+            )
+            await async_catalog_cache.set_category_products(
+                category_id, page, limit, validators.etag, *cached
+            )
+        body, next_cursor = cached
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={**next_cursor_headers(next_cursor), **validators.headers()},
+        )
+    else:
+        products = await crud_product.async_product.get_multi(
+            db, skip=skip, limit=limit, cursor=cursor, load=ProductLoad.RESPONSE
+        )
+    next_cursor = crud_product.async_product.keyset.next_cursor(products, limit)
+    response.headers.update(next_cursor_headers(next_cursor))
+    response.headers.update(validators.headers())
+    return products
+
+
+@router.get("/search", response_model=List[ProductSearchResult])
+async def search_products(
+    *,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    query: str,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Search products by name or description, most relevant first.
+    """
+    products = await crud_product.async_product.search(
+        db, query=query, skip=skip, limit=limit, cursor=cursor, load=ProductLoad.RESPONSE
+    )
+    next_cursor = SEARCH_KEYSET.next_cursor(products, limit)
+    response.headers.update(next_cursor_headers(next_cursor))
+    return products
+
+
+@router.get("/{product_id}", response_model=ProductResponse)
+async def get_product(
+    product_id: int,
+    request: Request,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get product by ID.
+    """
+    validators = await crud_product.async_product.validators(db, product_id=product_id)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
+    body = await async_catalog_cache.get_product(product_id, validators.etag)
+    if body is None:
+        product = await crud_product.async_product.get(db, id=product_id, load=ProductLoad.RESPONSE)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        body = to_json(ProductResponse, product)
+        await async_catalog_cache.set_product(
+            product_id, product.category_id, validators.etag, body
+        )
+    return Response(content=body, media_type="application/json", headers=validators.headers())
+
+
+@router.post("/", response_model=ProductResponse)
+async def create_product(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    product_in: ProductCreate = Depends(),
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Create new product.
+    """
+    # Check if category exists
+    category = await crud_category.async_category.get(db, id=product_in.category_id)
+    if not category:
+        raise HTTPException(
+            status_code=404,
+            detail="Category not found"
+        )
+
+    # Check if product with same name exists
+    product = await crud_product.async_product.get_by_name(db, name=product_in.name)
+    if product:
+        raise HTTPException(
+            status_code=400,
+            detail="Product with this name already exists"
+        )
+
+    product = await crud_product.async_product.create_with_variations(
+        db, obj_in=product_in
+    )
+    return product
+
+
+@router.post("/import", response_model=ProductImportReport)
+async def import_products(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    file: UploadFile = File(...),
+    format: ImportFormat = ImportFormat.NDJSON,
+    upsert: bool = False,
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Import products with variations and images from an NDJSON or CSV file.
+    """
+    return await crud_product.async_product.import_products(
+        db, file=file.file, format=format, upsert=upsert
+    )
+
+
+@router.post("/{product_id}/images", response_model=ProductImageResponse)
+async def upload_product_image(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    product_id: int,
+    image: UploadFile = File(...),
+    variation_id: Optional[int] = None,
+    order: int = 0,
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Upload an image of a product, or of one of its variations.
+    """
+    product = await crud_product.async_product.get(db, id=product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if variation_id is not None and all(v.id != variation_id for v in product.variations):
+        raise HTTPException(status_code=404, detail="Variation not found")
+
+    image_path = await media_storage.save(image)
+    return await crud_product.async_product.add_image(
+        db, product=product,
+        obj_in=ProductImageCreate(image_path=image_path, variation_id=variation_id, order=order)
+    )
+
+
+@router.put("/{product_id}", response_model=ProductResponse)
+async def update_product(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    product_id: int,
+    product_in: ProductUpdate = Depends(),
+    variations: Optional[List[ProductVariationCreate]] = None,
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Update product.
+    """
+    product = await crud_product.async_product.get(db, id=product_id, load=ProductLoad.BARE)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    # Check if category exists if it's being updated
+    if product_in.category_id:
+        category = await crud_category.async_category.get(db, id=product_in.category_id)
+        if not category:
+            raise HTTPException(
+                status_code=404,
+                detail="Category not found"
+            )
+
+    product = await crud_product.async_product.update_with_variations(
+        db, db_obj=product, obj_in=product_in, variations=variations
+    )
+    return product
+
+
+@router.delete("/{product_id}", response_model=ProductResponse)
+async def delete_product(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    product_id: int,
+    current_user: User = Depends(deps.get_current_active_async_admin)
+):
+    """
+    Delete product.
+    """
+    product = await crud_product.async_product.get(db, id=product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    product = await crud_product.async_product.remove(db, id=product_id)
+    return product
+
+
+@router.get("/{product_id}/variations", response_model=List[ProductVariationCreate])
+async def get_product_variations(
+    product_id: int,
+    db: AsyncSession = Depends(deps.get_async_read_db),
+    current_user: User = Depends(deps.get_current_active_async_user)
+):
+    """
+    Get available variations for a product.
+    """
+    product = await crud_product.async_product.get(db, id=product_id, load=ProductLoad.BARE)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    variations = await crud_product.async_product.get_available_variations(
+        db, product_id=product_id
+    )
+    return variations
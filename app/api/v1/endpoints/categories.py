@@ -1,17 +1,22 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from app.api import deps
+from app.core.cache import catalog_cache
+from app.core.media import media_storage
 from app.crud import crud_category
-from app.schemas.category import CategoryCreate, CategoryUpdate, CategoryResponse
+from app.schemas.category import CategoryCreate, CategoryUpdate, CategoryResponse, CategoryInDB
 from app.models.user import User
+from app.schemas.base import to_json
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[CategoryResponse])
 def get_categories(
-    db: Session = Depends(deps.get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(deps.get_read_db),
     skip: int = 0,
     limit: int = 100,
     parent_id: Optional[int] = None,
@@ -20,38 +25,68 @@ def get_categories(
     """
     Get list of categories.
     """
+    validators = crud_category.category.validators(db)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
     categories = crud_category.category.get_multi_by_parent(
         db, parent_id=parent_id, skip=skip, limit=limit
     )
+    response.headers.update(validators.headers())
     return categories
 
 
 @router.get("/tree", response_model=List[CategoryResponse])
 def get_category_tree(
-    db: Session = Depends(deps.get_db),
+    request: Request,
+    db: Session = Depends(deps.get_read_db),
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
     Get full category tree with subcategories.
     """
-    return crud_category.category.get_tree(db)
+    validators = crud_category.category.validators(db)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
+    body = catalog_cache.get_tree(validators.etag)
+    if body is None:
+        body = to_json(List[CategoryResponse], crud_category.category.get_tree(db))
+        catalog_cache.set_tree(validators.etag, body)
+    return Response(content=body, media_type="application/json", headers=validators.headers())
 
 
 @router.get("/{category_id}", response_model=CategoryResponse)
 def get_category(
     category_id: int,
-    db: Session = Depends(deps.get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(deps.get_read_db),
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
-    Get category by ID.
+    Get category by ID with its subcategory tree.
     """
-    category = crud_category.category.get(db, id=category_id)
+    validators = crud_category.category.validators(db, category_id=category_id)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
+    category = crud_category.category.get_subtree(db, id=category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
+    response.headers.update(validators.headers())
     return category
 
 
+@router.get("/{category_id}/ancestors", response_model=List[CategoryInDB])
+def get_category_ancestors(
+    category_id: int,
+    db: Session = Depends(deps.get_read_db),
+    current_user: User = Depends(deps.get_current_active_user)
+):
+    """
+    Get the breadcrumb of a category, from the root down to its parent.
+    """
+    return crud_category.category.get_ancestors(db, id=category_id)
+
+
 @router.post("/", response_model=CategoryResponse)
 def create_category(
     *,
@@ -70,11 +105,10 @@ def create_category(
             detail="Category with this name already exists"
         )
     
-    # Handle image upload if provided
+    # Stored under its content hash, so re-uploads are kept once
     image_path = None
     if image:
-        # TODO: Implement image upload logic
-        image_path = f"categories/{image.filename}"
+        image_path = media_storage.save_from_thread(image)
     
     category = crud_category.category.create_with_image(
         db, obj_in=category_in, image_path=image_path
@@ -98,11 +132,21 @@ def update_category(
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    # Handle image upload if provided
+    # A category cannot be moved below itself
+    if category_in.parent_id is not None and category_in.parent_id != category.parent_id:
+        parent = crud_category.category.get(db, id=category_in.parent_id)
+        if not parent:
+            raise HTTPException(status_code=404, detail="Parent category not found")
+        if crud_category.category.is_in_subtree(parent, root=category):
+            raise HTTPException(
+                status_code=400,
+                detail="Cannot move category into its own subtree"
+            )
+    
+    # Stored under its content hash, so re-uploads are kept once
     image_path = None
     if image:
-        # TODO: Implement image upload logic
-        image_path = f"categories/{image.filename}"
+        image_path = media_storage.save_from_thread(image)
     
     category = crud_category.category.update_with_image(
         db, db_obj=category, obj_in=category_in, image_path=image_path
@@ -1,8 +1,11 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from app.api import deps
-from app.crud import crud_order, crud_product
+from app.crud import crud_order, crud_user
+from app.crud.order import USER_ORDERS_KEYSET, InvalidOrderItems
+from app.crud.stock import InsufficientStock
+from app.crud.pagination import next_cursor_headers
 from app.schemas.order import OrderCreate, OrderUpdate, OrderResponse
 from app.models.user import User
 
@@ -11,29 +14,34 @@ router = APIRouter()
 
 @router.get("/", response_model=List[OrderResponse])
 def get_orders(
-    db: Session = Depends(deps.get_db),
+    response: Response,
+    db: Session = Depends(deps.get_read_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
     Get list of orders for current user.
     """
-    if deps.get_current_active_admin(current_user):
+    if crud_user.user.is_admin(current_user):
         # Admin can see all orders
-        orders = crud_order.order.get_multi(db, skip=skip, limit=limit)
+        orders = crud_order.order.get_multi(db, skip=skip, limit=limit, cursor=cursor)
+        next_cursor = crud_order.order.keyset.next_cursor(orders, limit)
     else:
         # Regular users can only see their own orders
         orders = crud_order.order.get_by_user(
-            db, user_id=current_user.id, skip=skip, limit=limit
+            db, user_id=current_user.id, skip=skip, limit=limit, cursor=cursor
         )
+        next_cursor = USER_ORDERS_KEYSET.next_cursor(orders, limit)
+    response.headers.update(next_cursor_headers(next_cursor))
     return orders
 
 
 @router.get("/{order_id}", response_model=OrderResponse)
 def get_order(
     order_id: int,
-    db: Session = Depends(deps.get_db),
+    db: Session = Depends(deps.get_read_db),
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
@@ -44,7 +52,7 @@ def get_order(
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Check if user has permission to view this order
-    if not deps.get_current_active_admin(current_user) and order.user_id != current_user.id:
+    if not crud_user.user.is_admin(current_user) and order.user_id != current_user.id:
         raise HTTPException(
             status_code=403,
             detail="Not enough permissions to view this order"
@@ -63,24 +71,16 @@ def create_order(
     """
     Create new order.
     """
-    # Validate product variations
-    for item in order_in.items:
-        variation = crud_product.product.get_available_variations(
-            db, product_id=item.product_id
+    # Items are validated and priced from the database in one query, and
+    # their stock taken all at once or not at all
+    try:
+        order = crud_order.order.create_with_items(
+            db, obj_in=order_in, user_id=current_user.id
         )
-        if not variation:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Product variation not available for product ID {item.product_id}"
-            )
-    
-    # Set user ID from current user
-    order_data = order_in.model_dump()
-    order_data["user_id"] = current_user.id
-    
-    order = crud_order.order.create_with_items(
-        db, obj_in=order_in
-    )
+    except InvalidOrderItems as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+    except InsufficientStock as e:
+        raise HTTPException(status_code=409, detail=e.errors)
     return order
 
 
@@ -99,16 +99,20 @@ def update_order(
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    order = crud_order.order.update(
-        db, db_obj=order, obj_in=order_in
-    )
+    try:
+        order = crud_order.order.update(
+            db, db_obj=order, obj_in=order_in
+        )
+    except InsufficientStock as e:
+        # A cancelled order taking its items again
+        raise HTTPException(status_code=409, detail=e.errors)
     return order
 
 
 @router.get("/{order_id}/total", response_model=float)
 def get_order_total(
     order_id: int,
-    db: Session = Depends(deps.get_db),
+    db: Session = Depends(deps.get_read_db),
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
@@ -119,7 +123,7 @@ def get_order_total(
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Check if user has permission to view this order
-    if not deps.get_current_active_admin(current_user) and order.user_id != current_user.id:
+    if not crud_user.user.is_admin(current_user) and order.user_id != current_user.id:
         raise HTTPException(
             status_code=403,
             detail="Not enough permissions to view this order"
@@ -131,7 +135,7 @@ def get_order_total(
 @router.get("/{order_id}/status", response_model=str)
 def get_order_status(
     order_id: int,
-    db: Session = Depends(deps.get_db),
+    db: Session = Depends(deps.get_read_db),
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
@@ -142,7 +146,7 @@ def get_order_status(
         raise HTTPException(status_code=404, detail="Order not found")
     
     # Check if user has permission to view this order
-    if not deps.get_current_active_admin(current_user) and order.user_id != current_user.id:
+    if not crud_user.user.is_admin(current_user) and order.user_id != current_user.id:
         raise HTTPException(
             status_code=403,
             detail="Not enough permissions to view this order"
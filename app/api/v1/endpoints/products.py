@@ -1,70 +1,118 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from app.api import deps
+from app.core.cache import catalog_cache, page_position
+from app.core.media import media_storage
 from app.crud import crud_product, crud_category
+from app.crud.pagination import next_cursor_headers
+from app.crud.catalog_import import ImportFormat
+from app.crud.product import SEARCH_KEYSET, ProductLoad
 from app.schemas.product import (
     ProductCreate,
+    ProductImageCreate,
+    ProductImageResponse,
+    ProductImportReport,
     ProductUpdate,
     ProductResponse,
+    ProductSearchResult,
     ProductVariationCreate
 )
 from app.models.user import User
+from app.schemas.base import to_json
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[ProductResponse])
 def get_products(
-    db: Session = Depends(deps.get_db),
+    request: Request,
+    response: Response,
+    db: Session = Depends(deps.get_read_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     category_id: Optional[int] = None,
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
     Get list of products.
     """
+    validators = crud_product.product.validators(db, category_id=category_id)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
     if category_id:
-        products = crud_product.product.get_multi_by_category(
-            db, category_id=category_id, skip=skip, limit=limit
+        page = page_position(cursor, skip)
+        cached = catalog_cache.get_category_products(category_id, page, limit, validators.etag)
+        if cached is None:
+            products = crud_product.product.get_multi_by_category(
+                db, category_id=category_id, skip=skip, limit=limit, cursor=cursor,
+                load=ProductLoad.RESPONSE
+            )
+            cached = (
+                to_json(List[ProductResponse], products),
+                crud_product.product.keyset.next_cursor(products, limit),
+            )
+            catalog_cache.set_category_products(category_id, page, limit, validators.etag, *cached)
+        body, next_cursor = cached
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={**next_cursor_headers(next_cursor), **validators.headers()},
         )
     else:
-        products = crud_product.product.get_multi(db, skip=skip, limit=limit)
+        products = crud_product.product.get_multi(
+            db, skip=skip, limit=limit, cursor=cursor, load=ProductLoad.RESPONSE
+        )
+    next_cursor = crud_product.product.keyset.next_cursor(products, limit)
+    response.headers.update(next_cursor_headers(next_cursor))
+    response.headers.update(validators.headers())
     return products
 
 
-@router.get("/search", response_model=List[ProductResponse])
+@router.get("/search", response_model=List[ProductSearchResult])
 def search_products(
     *,
-    db: Session = Depends(deps.get_db),
+    response: Response,
+    db: Session = Depends(deps.get_read_db),
     query: str,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
-    Search products by name or description.
+    Search products by name or description, most relevant first.
     """
     products = crud_product.product.search(
-        db, query=query, skip=skip, limit=limit
+        db, query=query, skip=skip, limit=limit, cursor=cursor, load=ProductLoad.RESPONSE
     )
+    next_cursor = SEARCH_KEYSET.next_cursor(products, limit)
+    response.headers.update(next_cursor_headers(next_cursor))
     return products
 
 
 @router.get("/{product_id}", response_model=ProductResponse)
 def get_product(
     product_id: int,
-    db: Session = Depends(deps.get_db),
+    request: Request,
+    db: Session = Depends(deps.get_read_db),
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
     Get product by ID.
     """
-    product = crud_product.product.get(db, id=product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
+    validators = crud_product.product.validators(db, product_id=product_id)
+    if validators.not_modified(request.headers):
+        return validators.not_modified_response()
+    body = catalog_cache.get_product(product_id, validators.etag)
+    if body is None:
+        product = crud_product.product.get(db, id=product_id, load=ProductLoad.RESPONSE)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        body = to_json(ProductResponse, product)
+        catalog_cache.set_product(product_id, product.category_id, validators.etag, body)
+    return Response(content=body, media_type="application/json", headers=validators.headers())
 
 
 @router.post("/", response_model=ProductResponse)
@@ -99,6 +147,49 @@ def create_product(
     return product
 
 
+@router.post("/import", response_model=ProductImportReport)
+def import_products(
+    *,
+    db: Session = Depends(deps.get_db),
+    file: UploadFile = File(...),
+    format: ImportFormat = ImportFormat.NDJSON,
+    upsert: bool = False,
+    current_user: User = Depends(deps.get_current_active_admin)
+):
+    """
+    Import products with variations and images from an NDJSON or CSV file.
+    """
+    return crud_product.product.import_products(
+        db, file=file.file, format=format, upsert=upsert
+    )
+
+
+@router.post("/{product_id}/images", response_model=ProductImageResponse)
+def upload_product_image(
+    *,
+    db: Session = Depends(deps.get_db),
+    product_id: int,
+    image: UploadFile = File(...),
+    variation_id: Optional[int] = None,
+    order: int = 0,
+    current_user: User = Depends(deps.get_current_active_admin)
+):
+    """
+    Upload an image of a product, or of one of its variations.
+    """
+    product = crud_product.product.get(db, id=product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    if variation_id is not None and all(v.id != variation_id for v in product.variations):
+        raise HTTPException(status_code=404, detail="Variation not found")
+
+    image_path = media_storage.save_from_thread(image)
+    return crud_product.product.add_image(
+        db, product=product,
+        obj_in=ProductImageCreate(image_path=image_path, variation_id=variation_id, order=order)
+    )
+
+
 @router.put("/{product_id}", response_model=ProductResponse)
 def update_product(
     *,
@@ -111,7 +202,7 @@ def update_product(
     """
     Update product.
     """
-    product = crud_product.product.get(db, id=product_id)
+    product = crud_product.product.get(db, id=product_id, load=ProductLoad.BARE)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -151,13 +242,13 @@ def delete_product(
 @router.get("/{product_id}/variations", response_model=List[ProductVariationCreate])
 def get_product_variations(
     product_id: int,
-    db: Session = Depends(deps.get_db),
+    db: Session = Depends(deps.get_read_db),
     current_user: User = Depends(deps.get_current_active_user)
 ):
     """
     Get available variations for a product.
     """
-    product = crud_product.product.get(db, id=product_id)
+    product = crud_product.product.get(db, id=product_id, load=ProductLoad.BARE)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -0,0 +1,29 @@
+"""
+Rebuild the sales rollups from the orders.
+
+Orders keep DailySales and ProductSales current as they are placed and
+change; run this to fill them on a database that has orders from before
+them, or after orders were changed by hand.
+
+    python -m app.commands.rebuild_sales
+"""
+import argparse
+import time
+
+from app.crud import crud_sales
+from app.db import session
+
+
+def main() -> None:
+    argparse.ArgumentParser(description=__doc__.splitlines()[1]).parse_args()
+    started = time.perf_counter()
+    with session.SessionLocal() as db:
+        written = crud_sales.sales.rebuild(db)
+    print(
+        f"{written['daily_rows']} daily and {written['product_rows']} product rows "
+        f"in {time.perf_counter() - started:.2f} s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""
+Recompute every customer's RFM segment from the orders.
+
+Reads the orders in chunks of --chunk-size (RFM_CHUNK_SIZE by default),
+scores them with NumPy and replaces the UserSegment rows; run it from cron
+to keep GET /admin/segments current. Prints the time each step took.
+
+    python -m app.commands.rebuild_segments
+"""
+import argparse
+
+from app.crud import crud_segment
+from app.db import session
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+    with session.SessionLocal() as db:
+        report = crud_segment.segment.rebuild(db, chunk_size=args.chunk_size)
+    print(
+        f"{report['users']} customers from {report['orders']} orders in {report['seconds']:.2f} s "
+        f"(fetch {report['fetch_seconds']:.2f} s, score {report['score_seconds']:.2f} s, "
+        f"write {report['write_seconds']:.2f} s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Expire unpaid orders and write Redis stock counters back, until stopped.
+
+Runs the same upkeep as the API workers (see STOCK_SWEEP_SECONDS), for
+deployments that switch it off there. Any number may run at once: the
+sweep skips orders another one holds, and one write-back runs at a time.
+
+    python -m app.commands.stock_worker
+    python -m app.commands.stock_worker --once   # one round, e.g. from cron
+"""
+import argparse
+import logging
+import time
+
+from app.core.config import settings
+from app.crud import crud_stock
+from app.db import session
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sweep-seconds", type=float, default=settings.STOCK_SWEEP_SECONDS or 30)
+    parser.add_argument("--writeback-seconds", type=float, default=settings.STOCK_WRITEBACK_SECONDS or 1)
+    parser.add_argument("--once", action="store_true", help="run every job once and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    scheduled = crud_stock.jobs(
+        session.SessionLocal,
+        sweep_seconds=args.sweep_seconds,
+        writeback_seconds=args.writeback_seconds,
+    )
+    due = [0.0] * len(scheduled)
+    while True:
+        for index, (seconds, job) in enumerate(scheduled):
+            if time.monotonic() < due[index]:
+                continue
+            try:
+                done = job()
+            except Exception:
+                logger.exception("Stock upkeep failed")
+            else:
+                if done:
+                    logger.info("%s: %d", job.__name__, done)
+            due[index] = time.monotonic() + seconds
+        if args.once or not scheduled:
+            return
+        time.sleep(max(0.0, min(due) - time.monotonic()))
+
+
+if __name__ == "__main__":
+    main()
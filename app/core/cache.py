@@ -1,12 +1,283 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
 import redis
+import redis.asyncio
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 redis_client = redis.Redis(
     host=settings.REDIS_HOST,
     port=settings.REDIS_PORT,
     decode_responses=True
 )
 
+async_redis_client = redis.asyncio.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    decode_responses=True
+)
+
 
 def get_redis():
-    return redis_client 
\ No newline at end of file
+    return redis_client
+
+
+# Catalog read-through cache
+#
+# Serialized catalog responses are stored under the keys below. Every entry
+# that renders data of a category (its product lists, and product details
+# which carry the category name) is also registered in a per-category set,
+# so a write can drop exactly the entries it affects. Every entry is a hash
+# of the JSON body, the cursor of the following page for paginated lists,
+# and the ETag the filling request computed before reading the body. Reads
+# pass their own ETag and only get an entry stored under the same one: a
+# body read before a racing write, or from a lagging replica, carries the
+# ETag of that older state and is never served once the database reports a
+# newer one.
+
+CATEGORY_TREE_KEY = "catalog:category_tree"
+
+# A cached page: its JSON body and the cursor of the next page, if any
+Page = Tuple[str, Optional[str]]
+
+ENTRY_FIELDS = ("etag", "body", "next_cursor")
+
+
+def product_key(product_id: int) -> str:
+    return f"catalog:product:{product_id}"
+
+
+def category_products_key(category_id: int, page: str, limit: int) -> str:
+    return f"catalog:category:{category_id}:products:{page}:{limit}"
+
+
+def page_position(cursor: Optional[str], skip: int) -> str:
+    return f"after:{cursor}" if cursor else f"skip:{skip}"
+
+
+def category_lists_key(category_id: int) -> str:
+    return f"catalog:category:{category_id}:lists"
+
+
+def category_details_key(category_id: int) -> str:
+    return f"catalog:category:{category_id}:details"
+
+
+class CatalogCache:
+    """
+    Catalog cache on a sync Redis client. Redis errors never fail a request:
+    reads fall back to the database and writes are skipped. Hit and miss
+    counters are kept per worker process.
+    """
+
+    def __init__(self, client: redis.Redis, ttl: int):
+        self.client = client
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def _page(
+        self, etag: str, stored_etag: Optional[str], body: Optional[str], next_cursor: Optional[str]
+    ) -> Optional[Page]:
+        if stored_etag != etag:
+            body = None
+        if self._count(body) is None:
+            return None
+        return body, next_cursor or None
+
+    def _get(self, key: str, etag: str) -> Optional[Page]:
+        try:
+            return self._page(etag, *self.client.hmget(key, *ENTRY_FIELDS))
+        except redis.RedisError:
+            logger.warning("Catalog cache read failed for %s", key, exc_info=True)
+            return self._count(None)
+
+    def _body(self, key: str, etag: str) -> Optional[str]:
+        page = self._get(key, etag)
+        return page[0] if page else None
+
+    def _stage(self, pipe, key: str, etag: str, page: Page, depends_on: Optional[str]) -> None:
+        body, next_cursor = page
+        # Also replaces a plain string left by the layout before ETags
+        pipe.delete(key)
+        pipe.hset(key, mapping={"etag": etag, "body": body, "next_cursor": next_cursor or ""})
+        pipe.expire(key, self.ttl)
+        if depends_on:
+            pipe.sadd(depends_on, key)
+            pipe.expire(depends_on, self.ttl)
+
+    def _set(self, key: str, etag: str, page: Page, depends_on: Optional[str] = None) -> None:
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            self._stage(pipe, key, etag, page, depends_on)
+            pipe.execute()
+        except redis.RedisError:
+            logger.warning("Catalog cache write failed for %s", key, exc_info=True)
+
+    def _delete(self, keys: List[str], dependency_sets: Sequence[str] = ()) -> None:
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for dependency_set in dependency_sets:
+                pipe.smembers(dependency_set)
+            dependents = [key for members in pipe.execute() for key in members]
+            self.client.delete(*keys, *dependency_sets, *dependents)
+        except redis.RedisError:
+            logger.warning("Catalog cache invalidation failed for %s", keys, exc_info=True)
+
+    def get_tree(self, etag: str) -> Optional[str]:
+        return self._body(CATEGORY_TREE_KEY, etag)
+
+    def set_tree(self, etag: str, body: str) -> None:
+        self._set(CATEGORY_TREE_KEY, etag, (body, None))
+
+    def get_product(self, product_id: int, etag: str) -> Optional[str]:
+        return self._body(product_key(product_id), etag)
+
+    def set_product(self, product_id: int, category_id: int, etag: str, body: str) -> None:
+        self._set(product_key(product_id), etag, (body, None), category_details_key(category_id))
+
+    def get_category_products(
+        self, category_id: int, page: str, limit: int, etag: str
+    ) -> Optional[Page]:
+        return self._get(category_products_key(category_id, page, limit), etag)
+
+    def set_category_products(
+        self, category_id: int, page: str, limit: int, etag: str, body: str,
+        next_cursor: Optional[str]
+    ) -> None:
+        self._set(
+            category_products_key(category_id, page, limit),
+            etag,
+            (body, next_cursor),
+            category_lists_key(category_id),
+        )
+
+    def invalidate_tree(self) -> None:
+        self._delete([CATEGORY_TREE_KEY])
+
+    def invalidate_product(self, product_id: int, *category_ids: int) -> None:
+        """Drop a product and the product lists of the categories it is or was in"""
+        self._delete(
+            [product_key(product_id)],
+            [category_lists_key(category_id) for category_id in set(category_ids)],
+        )
+
+    def invalidate_products(self, product_ids: Iterable[int], category_ids: Iterable[int]) -> None:
+        """Drop many products and the product lists of their categories at once"""
+        keys = [product_key(product_id) for product_id in product_ids]
+        dependency_sets = [category_lists_key(category_id) for category_id in set(category_ids)]
+        if keys or dependency_sets:
+            self._delete(keys, dependency_sets)
+
+    def invalidate_category(self, category_id: int) -> None:
+        """Drop the tree and everything rendering the category's data"""
+        self._delete(
+            [CATEGORY_TREE_KEY],
+            [category_lists_key(category_id), category_details_key(category_id)],
+        )
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class AsyncCatalogCache(CatalogCache):
+    """Same cache on a `redis.asyncio` client, for the async endpoints and CRUD"""
+
+    async def _get(self, key: str, etag: str) -> Optional[Page]:
+        try:
+            return self._page(etag, *await self.client.hmget(key, *ENTRY_FIELDS))
+        except redis.RedisError:
+            logger.warning("Catalog cache read failed for %s", key, exc_info=True)
+            return self._count(None)
+
+    async def _body(self, key: str, etag: str) -> Optional[str]:
+        page = await self._get(key, etag)
+        return page[0] if page else None
+
+    async def _set(self, key: str, etag: str, page: Page, depends_on: Optional[str] = None) -> None:
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            self._stage(pipe, key, etag, page, depends_on)
+            await pipe.execute()
+        except redis.RedisError:
+            logger.warning("Catalog cache write failed for %s", key, exc_info=True)
+
+    async def _delete(self, keys: List[str], dependency_sets: Sequence[str] = ()) -> None:
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for dependency_set in dependency_sets:
+                pipe.smembers(dependency_set)
+            dependents = [key for members in await pipe.execute() for key in members]
+            await self.client.delete(*keys, *dependency_sets, *dependents)
+        except redis.RedisError:
+            logger.warning("Catalog cache invalidation failed for %s", keys, exc_info=True)
+
+    async def get_tree(self, etag: str) -> Optional[str]:
+        return await self._body(CATEGORY_TREE_KEY, etag)
+
+    async def set_tree(self, etag: str, body: str) -> None:
+        await self._set(CATEGORY_TREE_KEY, etag, (body, None))
+
+    async def get_product(self, product_id: int, etag: str) -> Optional[str]:
+        return await self._body(product_key(product_id), etag)
+
+    async def set_product(self, product_id: int, category_id: int, etag: str, body: str) -> None:
+        await self._set(
+            product_key(product_id), etag, (body, None), category_details_key(category_id)
+        )
+
+    async def get_category_products(
+        self, category_id: int, page: str, limit: int, etag: str
+    ) -> Optional[Page]:
+        return await self._get(category_products_key(category_id, page, limit), etag)
+
+    async def set_category_products(
+        self, category_id: int, page: str, limit: int, etag: str, body: str,
+        next_cursor: Optional[str]
+    ) -> None:
+        await self._set(
+            category_products_key(category_id, page, limit),
+            etag,
+            (body, next_cursor),
+            category_lists_key(category_id),
+        )
+
+    async def invalidate_tree(self) -> None:
+        await self._delete([CATEGORY_TREE_KEY])
+
+    async def invalidate_product(self, product_id: int, *category_ids: int) -> None:
+        await self._delete(
+            [product_key(product_id)],
+            [category_lists_key(category_id) for category_id in set(category_ids)],
+        )
+
+    async def invalidate_products(
+        self, product_ids: Iterable[int], category_ids: Iterable[int]
+    ) -> None:
+        keys = [product_key(product_id) for product_id in product_ids]
+        dependency_sets = [category_lists_key(category_id) for category_id in set(category_ids)]
+        if keys or dependency_sets:
+            await self._delete(keys, dependency_sets)
+
+    async def invalidate_category(self, category_id: int) -> None:
+        await self._delete(
+            [CATEGORY_TREE_KEY],
+            [category_lists_key(category_id), category_details_key(category_id)],
+        )
+
+catalog_cache = CatalogCache(redis_client, ttl=settings.CACHE_TTL_HOURS * 3600)
+async_catalog_cache = AsyncCatalogCache(async_redis_client, ttl=settings.CACHE_TTL_HOURS * 3600)
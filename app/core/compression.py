@@ -0,0 +1,258 @@
+import zlib
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # zstd is offered only when the package is installed
+    zstandard = None
+
+# Response compression
+#
+# Responses are compressed with the best encoding the client accepts: zstd
+# when `zstandard` is installed, else gzip. A body sent in one message is
+# compressed whole, and only when it has at least `minimum_size` bytes. A
+# streamed body is compressed chunk by chunk and every chunk is flushed, so
+# clients still receive each one as soon as the app sends it. Responses that
+# already have a Content-Encoding, media types that are compressed already,
+# and responses marked `Cache-Control: no-transform` are passed through.
+# Compressing changes the bytes but not the resource, so a strong ETag is
+# sent as a weak one; If-None-Match compares weakly and still matches. Every
+# response that would be compressed for some client gets Vary:
+# Accept-Encoding, also when this one accepts no encoding, so shared caches
+# keep the encodings apart.
+
+# Media types whose content is compressed already; image/svg+xml is text
+INCOMPRESSIBLE_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/zstd",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/x-bzip2",
+    "application/pdf",
+)
+COMPRESSIBLE_IMAGE_TYPES = ("image/svg+xml",)
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self.level = level
+        self._stream = None
+
+    def compress(self, body: bytes) -> bytes:
+        return gzip_compress(body, self.level)
+
+    def compress_chunk(self, chunk: bytes) -> bytes:
+        if self._stream is None:
+            self._stream = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return self._stream.compress(chunk) + self._stream.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._stream.flush(zlib.Z_FINISH)
+
+
+class ZstdEncoder:
+    name = "zstd"
+
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._stream = None
+
+    def compress(self, body: bytes) -> bytes:
+        return self._compressor.compress(body)
+
+    def compress_chunk(self, chunk: bytes) -> bytes:
+        if self._stream is None:
+            self._stream = self._compressor.compressobj()
+        return self._stream.compress(chunk) + self._stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._stream.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def gzip_compress(body: bytes, level: int) -> bytes:
+    # Same output as gzip.compress without its header timestamp
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Encodings this worker can produce, most preferred first"""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def negotiate(accept_encoding: str, encodings: Tuple[str, ...]) -> Optional[str]:
+    """The encoding of `encodings` the Accept-Encoding header ranks highest"""
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    best, best_weight = None, 0.0
+    for name in encodings:
+        weight = weights.get(name, weights.get("*", 0.0))
+        # Ties go to the earlier, preferred encoding
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    if "no-transform" in headers.get("cache-control", "").lower():
+        return False
+    content_type = headers.get("content-type", "").lower()
+    if content_type.startswith(COMPRESSIBLE_IMAGE_TYPES):
+        return True
+    return not content_type.startswith(INCOMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Compresses response bodies with the best encoding the client accepts"""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        *,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        zstd_level: int = 3,
+        enabled: bool = True,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "zstd": zstd_level}
+        self.encodings = available_encodings()
+        self.enabled = enabled
+
+    def encoder(self, name: str):
+        if name == "zstd":
+            return ZstdEncoder(self.levels["zstd"])
+        return GzipEncoder(self.levels["gzip"])
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.enabled or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        # Without an encoding the responder only adds Vary
+        encoder = self.encoder(encoding) if encoding is not None else None
+        responder = CompressionResponder(send, encoder, self.minimum_size)
+        await self.app(scope, receive, responder)
+
+
+class CompressionResponder:
+    """The `send` of one response: holds its start until the first body chunk"""
+
+    def __init__(self, send: Send, encoder, minimum_size: int):
+        self.send = send
+        self.encoder = encoder
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None
+        # None until the first body chunk decides, then "identity" or "stream"
+        self.mode: Optional[str] = None
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if message["status"] in (204, 304) or not compressible(headers):
+                self.mode = "identity"
+                await self.send(message)
+            else:
+                self.start = message
+            return
+        if message["type"] != "http.response.body" or self.mode == "identity":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.mode == "stream":
+            chunk = self.encoder.compress_chunk(body) if body else b""
+            if not more_body:
+                chunk += self.encoder.finish()
+            if chunk or not more_body:
+                await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        headers = MutableHeaders(raw=self.start["headers"])
+        if not more_body:
+            if len(body) < self.minimum_size:
+                await self.pass_through(message)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if self.encoder is None:
+                await self.pass_through(message)
+                return
+            body = self.encoder.compress(body)
+            self.set_encoding(headers)
+            headers["Content-Length"] = str(len(body))
+            self.mode = "identity"
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        # Streaming: the total size is unknown unless the app declared it
+        declared = headers.get("content-length")
+        if declared is not None and int(declared) < self.minimum_size:
+            await self.pass_through(message)
+            return
+        headers.add_vary_header("Accept-Encoding")
+        if self.encoder is None:
+            await self.pass_through(message)
+            return
+        self.set_encoding(headers)
+        if declared is not None:
+            del headers["Content-Length"]
+        self.mode = "stream"
+        await self.send(self.start)
+        await self.send(
+            {
+                "type": "http.response.body",
+                "body": self.encoder.compress_chunk(body),
+                "more_body": True,
+            }
+        )
+
+    async def pass_through(self, message: Message) -> None:
+        self.mode = "identity"
+        await self.send(self.start)
+        await self.send(message)
+
+    def set_encoding(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoder.name
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+
+def compression_options() -> dict:
+    return {
+        "minimum_size": settings.COMPRESSION_MINIMUM_SIZE,
+        "gzip_level": settings.COMPRESSION_GZIP_LEVEL,
+        "zstd_level": settings.COMPRESSION_ZSTD_LEVEL,
+        "enabled": settings.COMPRESSION_ENABLED,
+    }
@@ -0,0 +1,103 @@
+import enum
+import os
+from typing import List, Optional, Sequence
+
+from PIL import Image, ImageOps
+
+# Image variants
+#
+# Runs in the media worker processes (see app.core.media), so it imports
+# nothing from the app. A variant of `name.ext` at width W is stored next to
+# it as `name_W.webp`; widths at or above the original's are not rendered,
+# the original is the largest size there is. Variants asked for on the fly
+# (see app.core.variants) are written wherever the cache says.
+
+VARIANT_FORMAT = "WEBP"
+
+
+class ImageFormat(str, enum.Enum):
+    WEBP = "webp"
+    JPEG = "jpeg"
+    PNG = "png"
+
+
+# Pillow format, media type and extension of each output format
+OUTPUT_FORMATS = {
+    ImageFormat.WEBP: ("WEBP", "image/webp", ".webp"),
+    ImageFormat.JPEG: ("JPEG", "image/jpeg", ".jpg"),
+    ImageFormat.PNG: ("PNG", "image/png", ".png"),
+}
+
+# Leading bytes of the formats accepted for upload, and the extension each is
+# stored under
+SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+
+def sniff(head: bytes) -> Optional[str]:
+    """Extension for the image format the file starts with, if accepted"""
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def variant_path(path: str, width: int) -> str:
+    return f"{os.path.splitext(path)[0]}_{width}.webp"
+
+
+def _prepared(image: Image.Image) -> Image.Image:
+    # Camera photos are often stored sideways with an EXIF orientation tag
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGB", "RGBA"):
+        return image
+    transparent = image.mode in ("LA", "PA") or "transparency" in image.info
+    return image.convert("RGBA" if transparent else "RGB")
+
+
+def _resized(image: Image.Image, width: int) -> Image.Image:
+    if width >= image.width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def _save(image: Image.Image, target: str, format: str, quality: int) -> None:
+    if format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    # Written aside and renamed, so a variant is never read half written
+    partial = f"{target}.{os.getpid()}.part"
+    image.save(partial, format, quality=quality, **({"method": 4} if format == "WEBP" else {}))
+    os.replace(partial, target)
+
+
+def render_variants(path: str, widths: Sequence[int], quality: int) -> List[str]:
+    """Write the missing WebP variants of the image at `path`, returns their paths"""
+    written = []
+    with Image.open(path) as original:
+        image = _prepared(original)
+        for width in sorted(widths):
+            target = variant_path(path, width)
+            if width >= image.width or os.path.exists(target):
+                continue
+            _save(_resized(image, width), target, VARIANT_FORMAT, quality)
+            written.append(target)
+    return written
+
+
+def render_variant(
+    path: str, target: str, width: Optional[int], format: ImageFormat, quality: int
+) -> int:
+    """Write the image at `path` to `target`, at most `width` wide, returns its size"""
+    with Image.open(path) as original:
+        image = _prepared(original)
+        if width is not None:
+            image = _resized(image, width)
+        _save(image, target, OUTPUT_FORMATS[format][0], quality)
+    return os.path.getsize(target)
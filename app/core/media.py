@@ -0,0 +1,173 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Optional, Sequence, Set
+
+import aiofiles
+import aiofiles.os
+import anyio.from_thread
+from fastapi import UploadFile
+
+from app.core import images
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Media storage
+#
+# Uploads are copied to MEDIA_ROOT in chunks, with aiofiles, and hashed on
+# the way; the copy stops as soon as it passes `max_size`, so an oversized
+# file is never stored whole. The file is then renamed to a path made of its
+# SHA-256 (uploads/ab/cd/<sha256>.png), so an image uploaded twice is stored
+# once. Its format is sniffed from the first bytes, never taken from the
+# filename. Resized WebP variants are rendered by Pillow in a process pool,
+# after the upload has been answered, and only for newly stored images.
+# Paths handed out are relative to MEDIA_ROOT.
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload passes the size limit"""
+
+
+class UnsupportedMediaType(Exception):
+    """Raised when an upload is not an image in an accepted format"""
+
+
+class MediaStorage:
+    def __init__(
+        self,
+        root: str,
+        upload_dir: str,
+        *,
+        max_size: int,
+        chunk_size: int,
+        variant_widths: Sequence[int],
+        variant_quality: int,
+        workers: int,
+    ):
+        self.root = root
+        self.upload_dir = upload_dir
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.variant_widths = tuple(variant_widths)
+        self.variant_quality = variant_quality
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Own lock: cancelling on shutdown runs the done callbacks under `_lock`
+        self._pending_lock = threading.Lock()
+        self._pending: Set[Future] = set()
+
+    def path(self, relative: str) -> str:
+        return os.path.join(self.root, relative)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process with running threads is unsafe, spawn a clean one
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    async def save(self, upload: UploadFile) -> str:
+        """Store an uploaded image, returns its path relative to MEDIA_ROOT"""
+        if upload.size is not None and upload.size > self.max_size:
+            raise UploadTooLarge(f"Upload exceeds {self.max_size} bytes")
+        partial_dir = self.path(os.path.join(self.upload_dir, ".partial"))
+        await aiofiles.os.makedirs(partial_dir, exist_ok=True)
+        partial = os.path.join(partial_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        size = 0
+        extension = None
+        try:
+            async with aiofiles.open(partial, "wb") as out:
+                while chunk := await upload.read(self.chunk_size):
+                    if extension is None:
+                        extension = images.sniff(chunk)
+                        if extension is None:
+                            raise UnsupportedMediaType("Upload is not a JPEG, PNG, GIF or WebP image")
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise UploadTooLarge(f"Upload exceeds {self.max_size} bytes")
+                    digest.update(chunk)
+                    await out.write(chunk)
+            if extension is None:
+                raise UnsupportedMediaType("Upload is empty")
+            name = digest.hexdigest()
+            relative = os.path.join(self.upload_dir, name[:2], name[2:4], name + extension)
+            target = self.path(relative)
+            if await aiofiles.os.path.exists(target):
+                return relative
+            await aiofiles.os.makedirs(os.path.dirname(target), exist_ok=True)
+            await aiofiles.os.replace(partial, target)
+        finally:
+            if await aiofiles.os.path.exists(partial):
+                await aiofiles.os.remove(partial)
+        self.render_variants(relative)
+        return relative
+
+    def resolve(self, relative: str) -> Optional[str]:
+        """Absolute path of an uploaded file, None unless it is one"""
+        normalized = os.path.normpath(relative)
+        if not normalized.startswith(os.path.normpath(self.upload_dir) + os.sep):
+            return None
+        if ".partial" in normalized.split(os.sep):
+            return None
+        path = self.path(normalized)
+        return path if os.path.isfile(path) else None
+
+    def submit(self, fn: Callable, *args: Any) -> Future:
+        """Run `fn` in a worker process; it must live in a module the workers can import"""
+        return self._pool().submit(fn, *args)
+
+    def save_from_thread(self, upload: UploadFile) -> str:
+        """`save` for sync endpoints, which run in a worker thread of the event loop"""
+        return anyio.from_thread.run(self.save, upload)
+
+    def render_variants(self, relative: str) -> Optional[Future]:
+        """Queue the variants of a stored image; failures are logged, not raised"""
+        if not self.variant_widths:
+            return None
+        future = self.submit(
+            images.render_variants, self.path(relative), self.variant_widths, self.variant_quality
+        )
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(lambda done: self._rendered(relative, done))
+        return future
+
+    def _rendered(self, relative: str, future: Future) -> None:
+        with self._pending_lock:
+            self._pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(
+                "Rendering variants of %s failed", relative, exc_info=future.exception()
+            )
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """Wait for the variants queued so far"""
+        with self._pending_lock:
+            pending = list(self._pending)
+        wait(pending, timeout=timeout)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+media_storage = MediaStorage(
+    settings.MEDIA_ROOT,
+    settings.UPLOAD_DIR,
+    max_size=settings.MAX_UPLOAD_SIZE,
+    chunk_size=settings.UPLOAD_CHUNK_SIZE,
+    variant_widths=settings.VARIANT_WIDTHS,
+    variant_quality=settings.IMAGE_VARIANT_QUALITY,
+    workers=settings.IMAGE_WORKERS,
+)
@@ -0,0 +1,297 @@
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import anyio.to_thread
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.types import Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.images import ImageFormat
+from app.core.media import MediaStorage, media_storage
+from app.core.variants import VariantCache, variant_cache
+
+# Media file serving
+#
+# MEDIA_URL serves uploads (and, with `width`/`format`, their variants) from
+# MEDIA_ROOT without going through the API router. It is mounted outside
+# API_PREFIX, so rate limits do not apply to a page of thumbnails.
+#
+# Open files are kept in an LRU of descriptors, so a hot image costs no
+# open/fstat/close. That is safe because upload paths are content hashes:
+# a file never changes under its name, and its ETag is the hash itself.
+# Bodies are read with os.pread, which needs no seek and so can share one
+# descriptor between requests. When the server supports the ASGI zero-copy
+# send extension the descriptor is handed over for sendfile(2). Without it,
+# bodies up to `inline_size` are read on the event loop, since that is
+# cheaper than a thread hop for data in the page cache. Larger bodies are
+# read in `chunk_size` pieces in the threadpool.
+#
+# Responses answer If-None-Match and If-Modified-Since with 304, and a
+# single byte range (with If-Range) with 206. Several ranges get the whole
+# file.
+
+ZERO_COPY_SEND = "http.response.zerocopysend"
+IMMUTABLE = "public, max-age=31536000, immutable"
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+SHA256_NAME = re.compile(r"[0-9a-f]{64}$")
+
+
+@dataclass
+class OpenFile:
+    fd: int
+    size: int
+    etag: str
+    last_modified: str
+    mtime: int
+    content_type: str
+    # Requests reading it; an evicted file is closed once the last finishes
+    users: int = 0
+    evicted: bool = False
+
+
+def _open(path: str) -> OpenFile:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        stat = os.fstat(fd)
+    except OSError:
+        os.close(fd)
+        raise
+    name = os.path.splitext(os.path.basename(path))[0]
+    # Uploads are named by their SHA-256, anything else by size and mtime
+    etag = name if SHA256_NAME.match(name) else f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    return OpenFile(
+        fd=fd,
+        size=stat.st_size,
+        etag=f'"{etag}"',
+        last_modified=formatdate(stat.st_mtime, usegmt=True),
+        mtime=int(stat.st_mtime),
+        content_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+    )
+
+
+class FileHandleCache:
+    """Least recently used open files, at most `capacity` of them"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._files: "OrderedDict[str, OpenFile]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def open(self, path: str) -> Iterator[OpenFile]:
+        with self._lock:
+            file = self._files.get(path)
+            if file is not None:
+                self._files.move_to_end(path)
+                self.hits += 1
+                file.users += 1
+        if file is None:
+            file = _open(path)
+            file.users = 1
+            self.misses += 1
+            if self.capacity > 0:
+                with self._lock:
+                    self._replace(path, file)
+            else:
+                file.evicted = True
+        try:
+            yield file
+        finally:
+            with self._lock:
+                file.users -= 1
+                if file.evicted and file.users == 0:
+                    os.close(file.fd)
+
+    def _replace(self, path: str, file: OpenFile) -> None:
+        # Another request may have opened the same path meanwhile
+        self._evict(self._files.pop(path, None))
+        self._files[path] = file
+        while len(self._files) > self.capacity:
+            self._evict(self._files.popitem(last=False)[1])
+
+    def _evict(self, file: Optional[OpenFile]) -> None:
+        if file is None:
+            return
+        file.evicted = True
+        if file.users == 0:
+            os.close(file.fd)
+
+    def discard(self, path: str) -> None:
+        with self._lock:
+            self._evict(self._files.pop(path, None))
+
+    def clear(self) -> None:
+        with self._lock:
+            while self._files:
+                self._evict(self._files.popitem()[1])
+
+
+def _not_modified(file: OpenFile, headers: Headers) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or file.etag in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return file.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _byte_range(file: OpenFile, headers: Headers) -> Optional[Tuple[int, int]]:
+    """
+    (first, last) byte of a satisfiable single range, None for the whole file.
+    Raises ValueError when the range cannot be satisfied.
+    """
+    value = headers.get("range")
+    if value is None or file.size == 0:
+        return None
+    if_range = headers.get("if-range")
+    if if_range is not None and if_range not in (file.etag, file.last_modified):
+        return None
+    match = RANGE.match(value.strip())
+    if match is None:
+        # Several ranges, or another unit: the whole file is a valid answer
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # The last N bytes; none of them cannot be satisfied
+        if int(last) == 0:
+            raise ValueError("Range not satisfiable")
+        return max(0, file.size - int(last)), file.size - 1
+    if last and int(last) < int(first):
+        # An invalid range is ignored (RFC 9110, 14.1.1)
+        return None
+    if int(first) >= file.size:
+        raise ValueError("Range not satisfiable")
+    return int(first), min(int(last), file.size - 1) if last else file.size - 1
+
+
+class MediaFiles:
+    """ASGI app serving MEDIA_ROOT uploads, mounted at MEDIA_URL"""
+
+    def __init__(
+        self,
+        storage: MediaStorage,
+        variants: VariantCache,
+        *,
+        fd_cache_size: int,
+        chunk_size: int,
+        inline_size: int,
+    ):
+        self.storage = storage
+        self.variants = variants
+        self.files = FileHandleCache(fd_cache_size)
+        self.chunk_size = chunk_size
+        self.inline_size = inline_size
+        # Variant files the cache deletes must not stay open here
+        variants.on_evict = self.files.discard
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", 405, headers={"Allow": "GET, HEAD"})
+            return await response(scope, receive, send)
+        try:
+            path = await self._find(scope)
+        except ValueError as e:
+            return await JSONResponse({"detail": str(e)}, status_code=400)(scope, receive, send)
+        try:
+            if path is None:
+                raise FileNotFoundError(scope["path"])
+            with self.files.open(path) as file:
+                await self._respond(file, scope, send)
+        except FileNotFoundError:
+            # Also a variant another worker evicted just now
+            await JSONResponse({"detail": "Media not found"}, status_code=404)(scope, receive, send)
+
+    async def _find(self, scope: Scope) -> Optional[str]:
+        """The file to serve, None if there is none; ValueError for bad parameters"""
+        # The path below the mount point
+        relative = scope["path"][len(scope.get("root_path", "")):].lstrip("/")
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        width = query.get("width", [None])[0]
+        format = query.get("format", [None])[0]
+        if width is None and format is None:
+            return self.storage.resolve(relative)
+        if width is not None:
+            if not width.isdigit() or int(width) not in settings.RESIZE_WIDTHS:
+                raise ValueError(f"Width must be one of {settings.IMAGE_RESIZE_WIDTHS}")
+            width = int(width)
+        if format is not None and format not in {f.value for f in ImageFormat}:
+            raise ValueError(f"Format must be one of {', '.join(f.value for f in ImageFormat)}")
+        return await self.variants.get(
+            relative, width=width, format=ImageFormat(format or ImageFormat.WEBP)
+        )
+
+    async def _respond(self, file: OpenFile, scope: Scope, send: Send) -> None:
+        request_headers = Headers(scope=scope)
+        headers: List[Tuple[bytes, bytes]] = [
+            (b"content-type", file.content_type.encode()),
+            (b"etag", file.etag.encode()),
+            (b"last-modified", file.last_modified.encode()),
+            (b"cache-control", IMMUTABLE.encode()),
+            (b"accept-ranges", b"bytes"),
+        ]
+        if _not_modified(file, request_headers):
+            await send({"type": "http.response.start", "status": 304, "headers": headers[1:4]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        try:
+            byte_range = _byte_range(file, request_headers)
+        except ValueError:
+            await send({
+                "type": "http.response.start",
+                "status": 416,
+                "headers": [(b"content-range", f"bytes */{file.size}".encode()), (b"content-length", b"0")],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        status = 200
+        offset, count = 0, file.size
+        if byte_range is not None:
+            first, last = byte_range
+            status, offset, count = 206, first, last - first + 1
+            headers.append((b"content-range", f"bytes {first}-{last}/{file.size}".encode()))
+        headers.append((b"content-length", str(count).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if scope["method"] == "HEAD" or count == 0:
+            await send({"type": "http.response.body", "body": b""})
+        elif ZERO_COPY_SEND in scope.get("extensions", {}):
+            # A file object over the shared descriptor, which stays open after
+            with open(file.fd, "rb", buffering=0, closefd=False) as body:
+                await send({"type": ZERO_COPY_SEND, "file": body, "offset": offset, "count": count})
+        elif count <= self.inline_size:
+            await send({"type": "http.response.body", "body": os.pread(file.fd, count, offset)})
+        else:
+            end = offset + count
+            while offset < end:
+                size = min(self.chunk_size, end - offset)
+                chunk = await anyio.to_thread.run_sync(os.pread, file.fd, size, offset)
+                # A file never shrinks under its name; stop rather than spin if one did
+                offset = offset + len(chunk) if chunk else end
+                await send({"type": "http.response.body", "body": chunk, "more_body": offset < end})
+
+
+media_files = MediaFiles(
+    media_storage,
+    variant_cache,
+    fd_cache_size=settings.MEDIA_FD_CACHE_SIZE,
+    chunk_size=settings.MEDIA_READ_CHUNK_SIZE,
+    inline_size=settings.MEDIA_INLINE_READ_SIZE,
+)
@@ -0,0 +1,126 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+# Password hashing pool
+#
+# bcrypt is slow on purpose. Run on the request thread, a burst of logins
+# ties up the threadpool (or, on the async path, the event loop) that catalog
+# requests need. Hashes are instead computed in a small process pool. At most
+# `workers + queue_size` jobs are in flight; beyond that, or when a job does
+# not finish within `timeout` seconds, PasswordHasherBusy is raised and the
+# API answers 503. Only this module is imported by the worker processes.
+
+_context: Optional[CryptContext] = None
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool cannot take or finish a job in time"""
+
+
+def _init_worker(context_options: Dict[str, Any]) -> None:
+    global _context
+    _context = CryptContext(**context_options)
+
+
+def _ready() -> None:
+    pass
+
+
+def _hash(password: str) -> str:
+    return _context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Whether the password matches, and a new hash of it if the stored one is outdated"""
+    if not _context.verify(password, hashed_password):
+        return False, None
+    if _context.needs_update(hashed_password):
+        return True, _context.hash(password)
+    return True, None
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords in a process pool started on first use.
+    Blocking methods are for the sync path, `async_*` ones await the worker
+    without holding the event loop.
+    """
+
+    def __init__(
+        self, context_options: Dict[str, Any], *, workers: int, queue_size: int, timeout: float
+    ):
+        self.context_options = context_options
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process with running threads is unsafe, spawn a clean one
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.context_options,),
+                )
+            return self._executor
+
+    def start(self) -> None:
+        """Start the worker processes now rather than on the first login"""
+        pool = self._pool()
+        for future in [pool.submit(_ready) for _ in range(self.workers)]:
+            future.result()
+
+    def _submit(self, fn: Callable, *args: Any) -> Future:
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy("Password hashing queue is full")
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _result(self, future: Future) -> Any:
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy("Password hashing timed out")
+
+    async def _async_result(self, future: Future) -> Any:
+        try:
+            # Cancelling the wrapper on timeout cancels the job if still queued
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise PasswordHasherBusy("Password hashing timed out")
+
+    def hash(self, password: str) -> str:
+        return self._result(self._submit(_hash, password))
+
+    def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return self._result(self._submit(_verify, password, hashed_password))
+
+    async def async_hash(self, password: str) -> str:
+        return await self._async_result(self._submit(_hash, password))
+
+    async def async_verify(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        return await self._async_result(self._submit(_verify, password, hashed_password))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,213 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import redis
+import redis.asyncio
+from app.core.cache import async_redis_client, redis_client
+from app.core.config import settings
+from app.models.user import User, UserRole
+
+logger = logging.getLogger(__name__)
+
+# Authenticated principal cache
+#
+# get_current_user would otherwise load the user row on every authenticated
+# request. The fields the active and admin checks need are kept in a bounded
+# LRU per worker process and, optionally, in Redis as a second level shared
+# by all workers. CRUDUser.update and remove drop the entry; a worker that did
+# not make the change sees it once its own entry expires.
+
+PRINCIPAL_FIELDS = ("id", "email", "role", "is_active")
+
+
+def principal_key(user_id: int) -> str:
+    return f"principal:{user_id}"
+
+
+def principal_fields(user: User) -> Dict:
+    fields = {name: getattr(user, name) for name in PRINCIPAL_FIELDS}
+    fields["role"] = UserRole(fields["role"]).value
+    return fields
+
+
+def principal(fields: Dict) -> User:
+    """
+    A transient User carrying only the cached fields, enough for the
+    permission checks and for using `id`; it is not attached to a session.
+    """
+    return User(**{**fields, "role": UserRole(fields["role"])})
+
+
+class PrincipalCache:
+    """
+    Principal cache with a sync Redis client as second level. As with the
+    catalog cache, Redis errors only cost a database read, and counters are
+    kept per worker process.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        *,
+        ttl: int,
+        max_size: int,
+        use_redis: bool,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client = client
+        self.ttl = ttl
+        self.max_size = max_size
+        self.use_redis = use_redis
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.clear()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def clear(self) -> None:
+        with self._lock:
+            # user id -> (expiry on `clock`, fields)
+            self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+            self.hits = 0
+            self.redis_hits = 0
+            self.misses = 0
+
+    def _local(self, user_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, fields = entry
+            if expires_at <= self.clock():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return fields
+
+    def _store(self, fields: Dict) -> None:
+        with self._lock:
+            self._entries[fields["id"]] = (self.clock() + self.ttl, fields)
+            self._entries.move_to_end(fields["id"])
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _remote(self, value: Optional[str]) -> Optional[Dict]:
+        if value is None:
+            return None
+        fields = json.loads(value)
+        self._store(fields)
+        with self._lock:
+            self.redis_hits += 1
+        return fields
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def get(self, user_id: int) -> Optional[User]:
+        if not self.enabled:
+            return None
+        fields = self._local(user_id)
+        if fields is None and self.use_redis:
+            try:
+                fields = self._remote(self.client.get(principal_key(user_id)))
+            except redis.RedisError:
+                logger.warning("Principal cache read failed for %s", user_id, exc_info=True)
+        if fields is None:
+            self._miss()
+            return None
+        return principal(fields)
+
+    def set(self, user: User) -> None:
+        if not self.enabled:
+            return
+        fields = principal_fields(user)
+        self._store(fields)
+        if self.use_redis:
+            try:
+                self.client.set(principal_key(user.id), json.dumps(fields), ex=self.ttl)
+            except redis.RedisError:
+                logger.warning("Principal cache write failed for %s", user.id, exc_info=True)
+
+    def _forget(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def invalidate(self, user_id: int) -> None:
+        self._forget(user_id)
+        if self.use_redis:
+            try:
+                self.client.delete(principal_key(user_id))
+            except redis.RedisError:
+                logger.warning("Principal cache invalidation failed for %s", user_id, exc_info=True)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            saved = self.hits + self.redis_hits
+            total = saved + self.misses
+            return {
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": saved / total if total else 0.0,
+                "db_queries_saved": saved,
+                "size": len(self._entries),
+            }
+
+
+class AsyncPrincipalCache(PrincipalCache):
+    """Same cache on a `redis.asyncio` client, for the async dependencies and CRUD"""
+
+    async def get(self, user_id: int) -> Optional[User]:
+        if not self.enabled:
+            return None
+        fields = self._local(user_id)
+        if fields is None and self.use_redis:
+            try:
+                fields = self._remote(await self.client.get(principal_key(user_id)))
+            except redis.RedisError:
+                logger.warning("Principal cache read failed for %s", user_id, exc_info=True)
+        if fields is None:
+            self._miss()
+            return None
+        return principal(fields)
+
+    async def set(self, user: User) -> None:
+        if not self.enabled:
+            return
+        fields = principal_fields(user)
+        self._store(fields)
+        if self.use_redis:
+            try:
+                await self.client.set(principal_key(user.id), json.dumps(fields), ex=self.ttl)
+            except redis.RedisError:
+                logger.warning("Principal cache write failed for %s", user.id, exc_info=True)
+
+    async def invalidate(self, user_id: int) -> None:
+        self._forget(user_id)
+        if self.use_redis:
+            try:
+                await self.client.delete(principal_key(user_id))
+            except redis.RedisError:
+                logger.warning("Principal cache invalidation failed for %s", user_id, exc_info=True)
+
+
+principal_cache = PrincipalCache(
+    redis_client,
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+    max_size=settings.PRINCIPAL_CACHE_SIZE,
+    use_redis=settings.PRINCIPAL_CACHE_REDIS,
+)
+async_principal_cache = AsyncPrincipalCache(
+    async_redis_client,
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+    max_size=settings.PRINCIPAL_CACHE_SIZE,
+    use_redis=settings.PRINCIPAL_CACHE_REDIS,
+)
@@ -0,0 +1,346 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import redis
+import redis.asyncio
+from jose import JWTError, jwt
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.cache import async_redis_client
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rate limiting
+#
+# Every API request takes a token from the buckets of its rule, keyed by the
+# user id of a valid bearer token or else the client IP. The buckets live in
+# Redis and are updated by one Lua script call, atomically for all workers.
+# To save that round trip on most requests a worker takes up to `local_batch`
+# tokens at once and spends them locally for `local_ttl` seconds; unused ones
+# are dropped, so a batch can only make the limit stricter, never looser.
+# When Redis is unreachable or slower than `redis_timeout` seconds the same
+# buckets are kept in process instead (each worker then enforces the full
+# limit on its own) and Redis is retried after `redis_retry` seconds.
+
+# Takes up to ARGV[1] tokens from every bucket in KEYS, as many as all of them
+# hold. ARGV[2i], ARGV[2i + 1] are capacity and refill per second of KEYS[i].
+# Returns the tokens granted and, when none were, the milliseconds until the
+# next one.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local grant = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+    tokens = math.min(capacity, tokens + elapsed * rate)
+    levels[i] = tokens
+    grant = math.min(grant, math.floor(tokens))
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    redis.call('HSET', key, 'tokens', levels[i] - grant, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+end
+return {grant, math.ceil(wait * 1000)}
+"""
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Buckets kept by the in-process fallback; least recently used go first
+MAX_LOCAL_BUCKETS = 100000
+
+
+@dataclass(frozen=True)
+class Limit:
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    limits: Tuple[Limit, ...]
+
+
+def parse_limit(value: str) -> Limit:
+    """`10/minute` -> Limit(10, 60)"""
+    count, _, period = value.strip().partition("/")
+    return Limit(int(count), PERIODS[period.strip()])
+
+
+def parse_routes(value: str) -> Dict[Tuple[str, str], Rule]:
+    """`POST /api/v1/auth/login=10/minute, ...` -> {(method, path prefix): Rule}"""
+    routes = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        route, _, limit = entry.partition("=")
+        method, _, path = route.strip().partition(" ")
+        routes[(method.upper(), path.strip())] = Rule(
+            f"{method.upper()} {path.strip()}", (parse_limit(limit),)
+        )
+    return routes
+
+
+class TokenBuckets:
+    """The Lua token buckets, in process, for when Redis is unreachable"""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        # key -> (tokens, time of last update on `clock`)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, keys: Sequence[str], limits: Sequence[Limit], requested: int) -> Tuple[int, float]:
+        with self._lock:
+            now = self.clock()
+            levels = []
+            grant = requested
+            wait = 0.0
+            for key, limit in zip(keys, limits):
+                tokens, updated = self._buckets.get(key, (limit.capacity, now))
+                tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+                levels.append(tokens)
+                grant = min(grant, math.floor(tokens))
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / limit.rate)
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens - grant, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > MAX_LOCAL_BUCKETS:
+                self._buckets.popitem(last=False)
+            return grant, wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class RateLimiter:
+    """
+    Token bucket limiter on a `redis.asyncio` client. Counters are kept per
+    worker process, like the cache counters.
+    """
+
+    def __init__(
+        self,
+        client: redis.asyncio.Redis,
+        *,
+        default: Rule,
+        routes: Dict[Tuple[str, str], Rule],
+        prefix: str,
+        local_batch: int,
+        local_ttl: float,
+        redis_timeout: float,
+        redis_retry: float,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client = client
+        self.default = default
+        # Longest prefix first, so the most specific override wins
+        self.routes = sorted(routes.items(), key=lambda item: -len(item[0][1]))
+        self.prefix = prefix
+        self.local_batch = local_batch
+        self.local_ttl = local_ttl
+        self.redis_timeout = redis_timeout
+        self.redis_retry = redis_retry
+        self.enabled = enabled
+        self.clock = clock
+        self.fallback = TokenBuckets(clock)
+        self._lock = threading.Lock()
+        self.clear()
+
+    @property
+    def client(self) -> redis.asyncio.Redis:
+        return self._client
+
+    @client.setter
+    def client(self, client: redis.asyncio.Redis) -> None:
+        self._client = client
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def clear(self) -> None:
+        with self._lock:
+            # bucket key -> (tokens left, expiry on `clock`)
+            self._grants: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+            self._redis_down_until = 0.0
+            self.allowed = 0
+            self.limited = 0
+            self.local_hits = 0
+            self.redis_calls = 0
+            self.fallbacks = 0
+        self.fallback.clear()
+
+    def rule_for(self, method: str, path: str) -> Optional[Rule]:
+        if not path.startswith(self.prefix):
+            return None
+        for (route_method, route_path), rule in self.routes:
+            if method == route_method and path.startswith(route_path):
+                return rule
+        return self.default
+
+    def _batch(self, rule: Rule) -> int:
+        # A batch is at most a tenth of the smallest bucket
+        smallest = min(limit.capacity for limit in rule.limits)
+        return max(1, min(self.local_batch, smallest // 10))
+
+    def _take_local(self, key: str) -> bool:
+        with self._lock:
+            grant = self._grants.get(key)
+            if grant is None:
+                return False
+            tokens, expires_at = grant
+            if expires_at <= self.clock():
+                del self._grants[key]
+                return False
+            if tokens <= 1:
+                del self._grants[key]
+            else:
+                self._grants[key] = (tokens - 1, expires_at)
+            self.local_hits += 1
+            self.allowed += 1
+            return True
+
+    def _keep_local(self, key: str, tokens: int) -> None:
+        if tokens < 1:
+            return
+        with self._lock:
+            now = self.clock()
+            self._grants[key] = (tokens, now + self.local_ttl)
+            self._grants.move_to_end(key)
+            # Grants expire in the order they were made
+            while self._grants and (
+                len(self._grants) > MAX_LOCAL_BUCKETS or next(iter(self._grants.values()))[1] <= now
+            ):
+                self._grants.popitem(last=False)
+
+    def _redis_up(self) -> bool:
+        with self._lock:
+            return self._redis_down_until <= self.clock()
+
+    def _redis_failed(self) -> None:
+        with self._lock:
+            self._redis_down_until = self.clock() + self.redis_retry
+            self.fallbacks += 1
+
+    async def _take(self, keys: List[str], rule: Rule, requested: int) -> Tuple[int, float]:
+        if self._redis_up():
+            args = [requested]
+            for limit in rule.limits:
+                args += [limit.capacity, limit.rate]
+            try:
+                granted, wait_ms = await asyncio.wait_for(
+                    self._script(keys=keys, args=args), self.redis_timeout
+                )
+                with self._lock:
+                    self.redis_calls += 1
+                return int(granted), int(wait_ms) / 1000
+            except (redis.RedisError, asyncio.TimeoutError):
+                logger.warning("Rate limiter falling back to in-process buckets", exc_info=True)
+                self._redis_failed()
+        return self.fallback.take(keys, rule.limits, requested)
+
+    async def acquire(self, rule: Rule, identity: str) -> Optional[float]:
+        """None when the request may proceed, else seconds until it could"""
+        key = f"ratelimit:{rule.name}:{identity}"
+        if self._take_local(key):
+            return None
+        keys = [f"{key}:{limit.period:g}" for limit in rule.limits]
+        granted, wait = await self._take(keys, rule, self._batch(rule))
+        if granted < 1:
+            with self._lock:
+                self.limited += 1
+            return wait
+        self._keep_local(key, granted - 1)
+        with self._lock:
+            self.allowed += 1
+        return None
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "allowed": self.allowed,
+                "limited": self.limited,
+                "local_hits": self.local_hits,
+                "redis_calls": self.redis_calls,
+                "fallbacks": self.fallbacks,
+                "redis_up": float(self._redis_down_until <= self.clock()),
+            }
+
+
+def client_identity(scope: Scope) -> str:
+    """`user:<id>` for a valid bearer token, else `ip:<client address>`"""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer":
+                try:
+                    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+                    return f"user:{int(payload['sub'])}"
+                except (JWTError, KeyError, ValueError):
+                    pass
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """Answers 429 with Retry-After once the caller's bucket is empty"""
+
+    def __init__(self, app: ASGIApp, limiter: "RateLimiter"):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and self.limiter.enabled:
+            rule = self.limiter.rule_for(scope["method"], scope["path"])
+            if rule is not None:
+                retry_after = await self.limiter.acquire(rule, client_identity(scope))
+                if retry_after is not None:
+                    response = JSONResponse(
+                        status_code=429,
+                        content={"detail": "Too many requests"},
+                        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+                    )
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+
+rate_limiter = RateLimiter(
+    async_redis_client,
+    default=Rule(
+        "default",
+        (Limit(settings.RATE_LIMIT_PER_MINUTE, 60), Limit(settings.RATE_LIMIT_PER_HOUR, 3600)),
+    ),
+    routes=parse_routes(settings.RATE_LIMIT_ROUTES),
+    prefix=settings.API_PREFIX,
+    local_batch=settings.RATE_LIMIT_LOCAL_BATCH,
+    local_ttl=settings.RATE_LIMIT_LOCAL_TTL,
+    redis_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT,
+    redis_retry=settings.RATE_LIMIT_REDIS_RETRY,
+    enabled=settings.RATE_LIMIT_ENABLED,
+)
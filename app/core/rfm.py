@@ -0,0 +1,119 @@
+import enum
+from dataclasses import dataclass
+
+import numpy as np
+
+# RFM scoring
+#
+# Recency (days since the last order), frequency (orders) and monetary value
+# (total spent) per user, folded from columnar chunks of orders with NumPy:
+# every chunk is scattered into arrays indexed by user id, so memory is one
+# chunk plus three numbers per user id, however many orders there are. Each
+# measure is then scored 1-5 by quintile over all users who ordered, 5 being
+# best (most recent, most frequent, highest spend). Ties share a score, the
+# lower one, so the many users with a single order all score 1 on frequency
+# rather than spreading over 1-5 by accident. Segments follow the common RFM
+# map of recency and frequency scores.
+
+SCORES = 5
+SECONDS_PER_DAY = 86400.0
+
+
+class RFMSegment(str, enum.Enum):
+    CHAMPIONS = "champions"
+    LOYAL = "loyal"
+    POTENTIAL_LOYALISTS = "potential_loyalists"
+    NEW_CUSTOMERS = "new_customers"
+    PROMISING = "promising"
+    NEEDS_ATTENTION = "needs_attention"
+    ABOUT_TO_SLEEP = "about_to_sleep"
+    AT_RISK = "at_risk"
+    CANT_LOSE_THEM = "cant_lose_them"
+    HIBERNATING = "hibernating"
+    LOST = "lost"
+
+
+SEGMENTS = list(RFMSegment)
+# Segment by recency score (rows, 1 first) and frequency score (columns)
+_SEGMENT_GRID = (
+    ("lost", "lost", "at_risk", "cant_lose_them", "cant_lose_them"),
+    ("hibernating", "hibernating", "at_risk", "at_risk", "cant_lose_them"),
+    ("about_to_sleep", "about_to_sleep", "needs_attention", "loyal", "loyal"),
+    ("promising", "potential_loyalists", "loyal", "loyal", "champions"),
+    ("new_customers", "potential_loyalists", "potential_loyalists", "champions", "champions"),
+)
+# Index into SEGMENTS by [recency score - 1, frequency score - 1]
+SEGMENT_MAP = np.array(
+    [[SEGMENTS.index(RFMSegment(name)) for name in row] for row in _SEGMENT_GRID], dtype=np.int8
+)
+
+
+class RFMTotals:
+    """Last order time, order count and amount spent per user id, grown as ids appear"""
+
+    def __init__(self, capacity: int = 1024):
+        self.last = np.full(capacity, -np.inf)
+        self.frequency = np.zeros(capacity, dtype=np.int64)
+        self.monetary = np.zeros(capacity)
+        self.orders = 0
+
+    def _reserve(self, top: int) -> None:
+        capacity = len(self.frequency)
+        if top < capacity:
+            return
+        size = max(top + 1, capacity * 2)
+        self.last = np.concatenate([self.last, np.full(size - capacity, -np.inf)])
+        self.frequency = np.concatenate([self.frequency, np.zeros(size - capacity, dtype=np.int64)])
+        self.monetary = np.concatenate([self.monetary, np.zeros(size - capacity)])
+
+    def add(self, user_ids: np.ndarray, timestamps: np.ndarray, amounts: np.ndarray) -> None:
+        """Fold one chunk of orders: user ids, creation times (epoch seconds) and totals"""
+        if not len(user_ids):
+            return
+        self._reserve(int(user_ids.max()))
+        np.add.at(self.frequency, user_ids, 1)
+        np.add.at(self.monetary, user_ids, amounts)
+        np.maximum.at(self.last, user_ids, timestamps)
+        self.orders += len(user_ids)
+
+
+@dataclass
+class RFMScores:
+    user_ids: np.ndarray
+    recency_days: np.ndarray
+    frequency: np.ndarray
+    monetary: np.ndarray
+    recency_score: np.ndarray
+    frequency_score: np.ndarray
+    monetary_score: np.ndarray
+    segment: np.ndarray  # indexes into SEGMENTS
+
+
+def quintile_scores(values: np.ndarray, higher_is_better: bool = True) -> np.ndarray:
+    """1-5 by quintile of `values`; equal values get the same, lower, score"""
+    if not len(values):
+        return np.zeros(0, dtype=np.int8)
+    edges = np.quantile(values, np.linspace(0, 1, SCORES + 1)[1:-1])
+    if higher_is_better:
+        return (1 + np.searchsorted(edges, values, side="left")).astype(np.int8)
+    return (SCORES - np.searchsorted(edges, values, side="right")).astype(np.int8)
+
+
+def score(totals: RFMTotals, now: float) -> RFMScores:
+    """Scores and segments of every user with orders, as of `now` (epoch seconds)"""
+    user_ids = np.flatnonzero(totals.frequency)
+    recency = np.maximum(0, (now - totals.last[user_ids]) // SECONDS_PER_DAY).astype(np.int64)
+    frequency = totals.frequency[user_ids]
+    monetary = totals.monetary[user_ids]
+    recency_score = quintile_scores(recency, higher_is_better=False)
+    frequency_score = quintile_scores(frequency)
+    return RFMScores(
+        user_ids=user_ids,
+        recency_days=recency,
+        frequency=frequency,
+        monetary=monetary,
+        recency_score=recency_score,
+        frequency_score=frequency_score,
+        monetary_score=quintile_scores(monetary),
+        segment=SEGMENT_MAP[recency_score - 1, frequency_score - 1],
+    )
@@ -0,0 +1,273 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+from array import array
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+# In-process product search index
+#
+# An inverted index from words to the products containing them, plus a
+# trigram index over the vocabulary for typo tolerance. Postings are kept in
+# typed arrays (4 bytes per product id, 1 byte per weight) rather than dicts
+# or sets of Python ints, which is what keeps a 100k product catalog in a
+# few tens of megabytes. Every query word has to match a product word
+# exactly, as a prefix, or within an edit distance that grows with its length.
+
+NAME_WEIGHT = 4
+COLOR_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+MAX_WEIGHT = 255
+
+# How much a product word matching a query word counts, by kind of match
+EXACT_MATCH = 1.0
+PREFIX_MATCH = 0.8
+FUZZY_MATCH = 0.5
+
+# Upper bound on the words a short prefix expands to
+MAX_PREFIX_EXPANSIONS = 64
+
+Hit = Tuple[float, int]
+# Postings and weights of one indexed word, and the factor its weights score with
+Variant = Tuple[array, array, float]
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return re.findall(r"[^\W_]+", text.lower()) if text else []
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"^{term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_typos(term: str) -> int:
+    if len(term) < 4:
+        return 0
+    return 1 if len(term) < 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, or `limit + 1` as soon as it is known to exceed `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    # Only cells within `limit` of the diagonal can stay within the limit
+    previous = [min(j, over) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        current = [over] * (len(b) + 1)
+        current[0] = min(i, over)
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        for j in range(low, high + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != b[j - 1]),
+                over,
+            )
+        if min(current[low - 1:high + 1]) > limit:
+            return over
+        previous = current
+    return previous[-1]
+
+
+def matches(word: str, term: str) -> bool:
+    """Whether a text word is one the query word `term` finds"""
+    typos = max_typos(term)
+    return word.startswith(term) or bool(typos) and edit_distance(word, term, typos) <= typos
+
+
+class ProductSearchIndex:
+    """
+    Searchable index of product names, descriptions and variation colors.
+    Disabled unless SEARCH_BACKEND is "memory", in which case it is built at
+    startup and kept current by CRUDProduct writes in this process.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._term_ids: Dict[str, int] = {}
+            self._terms: List[str] = []
+            self._sorted_terms: List[str] = []
+            # Per term id: ascending product ids, and the term's weight in each
+            self._postings: List[array] = []
+            self._weights: List[array] = []
+            # Per trigram: ids of the terms containing it
+            self._trigrams: Dict[str, array] = {}
+            # Per product id: the term ids it was indexed under, for removal
+            self._documents: Dict[int, array] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _term_id(self, term: str) -> int:
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = len(self._terms)
+            self._term_ids[term] = term_id
+            self._terms.append(term)
+            bisect.insort(self._sorted_terms, term)
+            self._postings.append(array("I"))
+            self._weights.append(array("B"))
+            for gram in trigrams(term):
+                self._trigrams.setdefault(gram, array("I")).append(term_id)
+        return term_id
+
+    def _remove(self, product_id: int) -> None:
+        for term_id in self._documents.pop(product_id, ()):
+            postings = self._postings[term_id]
+            at = bisect.bisect_left(postings, product_id)
+            del postings[at]
+            del self._weights[term_id][at]
+
+    def add(
+        self, product_id: int, name: str, description: Optional[str], colors: Iterable[str] = ()
+    ) -> None:
+        """Index a product, replacing what was indexed for it before"""
+        if not self.enabled:
+            return
+        weights: Dict[str, int] = defaultdict(int)
+        fields = [(name, NAME_WEIGHT), (description, DESCRIPTION_WEIGHT)]
+        fields += [(color, COLOR_WEIGHT) for color in colors]
+        for text, weight in fields:
+            for term in tokenize(text):
+                weights[term] += weight
+
+        with self._lock:
+            self._remove(product_id)
+            term_ids = array("I")
+            for term, weight in weights.items():
+                term_id = self._term_id(term)
+                postings = self._postings[term_id]
+                at = bisect.bisect_left(postings, product_id)
+                postings.insert(at, product_id)
+                self._weights[term_id].insert(at, min(weight, MAX_WEIGHT))
+                term_ids.append(term_id)
+            self._documents[product_id] = term_ids
+
+    def remove(self, product_id: int) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._remove(product_id)
+
+    def _with_prefix(self, term: str) -> List[str]:
+        start = bisect.bisect_right(self._sorted_terms, term)
+        found = []
+        for other in self._sorted_terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not other.startswith(term):
+                break
+            found.append(other)
+        return found
+
+    def _similar(self, term: str, typos: int) -> List[int]:
+        grams = trigrams(term)
+        shared = Counter(chain.from_iterable(self._trigrams.get(gram, ()) for gram in grams))
+        # One edit changes at most three trigrams
+        needed = len(grams) - 3 * typos
+        similar = []
+        for term_id, count in shared.items():
+            other = self._terms[term_id]
+            if (
+                count >= needed
+                and abs(len(other) - len(term)) <= typos
+                and edit_distance(term, other, typos) <= typos
+            ):
+                similar.append(term_id)
+        return similar
+
+    def _variants(self, term: str) -> List[Variant]:
+        """
+        Postings of the indexed words a query word matches, with their score
+        factor (match quality times rarity), most common word first.
+        """
+        qualities: Dict[int, float] = {}
+        typos = max_typos(term)
+        if typos:
+            qualities.update((term_id, FUZZY_MATCH) for term_id in self._similar(term, typos))
+        qualities.update((self._term_ids[other], PREFIX_MATCH) for other in self._with_prefix(term))
+        if term in self._term_ids:
+            qualities[self._term_ids[term]] = EXACT_MATCH
+        documents = len(self._documents)
+        variants = [
+            (
+                self._postings[term_id],
+                self._weights[term_id],
+                quality * math.log(1 + documents / len(self._postings[term_id])),
+            )
+            for term_id, quality in qualities.items()
+            if self._postings[term_id]
+        ]
+        return sorted(variants, key=lambda variant: len(variant[0]), reverse=True)
+
+    @staticmethod
+    def _scores(variants: List[Variant], candidates: Optional[Dict[int, float]]) -> Dict[int, float]:
+        """Best score of each product for one query word, among `candidates` if given"""
+        scores: Dict[int, float] = {}
+        if candidates is not None and len(candidates) * 8 < sum(len(v[0]) for v in variants):
+            # Few products left: look them up instead of scanning the postings
+            for postings, weights, factor in variants:
+                for product_id in candidates:
+                    at = bisect.bisect_left(postings, product_id)
+                    if at < len(postings) and postings[at] == product_id:
+                        score = factor * weights[at]
+                        if score > scores.get(product_id, 0.0):
+                            scores[product_id] = score
+            return scores
+        for postings, weights, factor in variants:
+            if not scores:
+                # The most common word is scored in C straight from its arrays
+                scores = dict(zip(postings, map(factor.__mul__, weights)))
+                continue
+            for product_id, weight in zip(postings, weights):
+                score = factor * weight
+                if score > scores.get(product_id, 0.0):
+                    scores[product_id] = score
+        return scores
+
+    def search(
+        self, query: str, *, after: Optional[Hit] = None, skip: int = 0, limit: int = 100
+    ) -> List[Hit]:
+        """
+        One page of the products matching every word of `query`, as
+        (score, product id) best first, starting after the `after` hit.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            # Rarest word first, so the candidate set shrinks fastest
+            plans = sorted(
+                map(self._variants, terms),
+                key=lambda variants: sum(len(postings) for postings, _, _ in variants),
+            )
+            scores: Optional[Dict[int, float]] = None
+            for variants in plans:
+                term_scores = self._scores(variants, scores)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        product_id: score + term_scores[product_id]
+                        for product_id, score in scores.items()
+                        if product_id in term_scores
+                    }
+                if not scores:
+                    return []
+        hits: Iterable[Hit] = zip(scores.values(), scores.keys())
+        if after is not None:
+            hits = (hit for hit in hits if hit < after)
+        return heapq.nlargest(skip + limit, hits)[skip:]
+
+
+product_index = ProductSearchIndex(enabled=settings.SEARCH_BACKEND == "memory")
@@ -1,10 +1,27 @@
 from datetime import datetime, timedelta
-from typing import Any, Union
+from typing import Any, Optional, Tuple, Union
 from jose import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
+from app.core.passwords import PasswordHasher
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with other bcrypt rounds than BCRYPT_ROUNDS need an update, so
+# changing the setting rehashes passwords as users log in.
+PASSWORD_CONTEXT = {
+    "schemes": ["bcrypt"],
+    "deprecated": "auto",
+    "bcrypt__default_rounds": settings.BCRYPT_ROUNDS,
+    "bcrypt__min_rounds": settings.BCRYPT_ROUNDS,
+    "bcrypt__max_rounds": settings.BCRYPT_ROUNDS,
+}
+
+pwd_context = CryptContext(**PASSWORD_CONTEXT)
+password_hasher = PasswordHasher(
+    PASSWORD_CONTEXT,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    queue_size=settings.PASSWORD_HASH_QUEUE,
+    timeout=settings.PASSWORD_HASH_TIMEOUT,
+)
 
 
 def create_access_token(
@@ -14,7 +31,7 @@ def create_access_token(
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(
-            days=settings.ACCESS_TOKEN_EXPIRE_DAYS
+            minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
     to_encode = {"exp": expire, "sub": str(subject), "type": "access"}
     encoded_jwt = jwt.encode(
@@ -40,8 +57,26 @@ def create_refresh_token(
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify(plain_password, hashed_password)[0]
+
+
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """Whether the password matches, and its new hash if the stored one needs an update"""
+    return password_hasher.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password) 
\ No newline at end of file
+    return password_hasher.hash(password)
+
+
+async def async_verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    return await password_hasher.async_verify(plain_password, hashed_password)
+
+
+async def async_get_password_hash(password: str) -> str:
+    return await password_hasher.async_hash(password)
+ 
\ No newline at end of file
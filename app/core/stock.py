@@ -0,0 +1,229 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Mapping, Optional
+
+import redis
+
+from app.core.cache import redis_client
+
+# Redis stock counters
+#
+# With STOCK_BACKEND=redis the stock of every tracked variation is a counter
+# in Redis, and one Lua script takes all of an order's items at once: either
+# every counter holds enough and all are decremented, or none is touched.
+# Redis runs scripts one at a time, so a hot variation never oversells and
+# its reservations never wait on a database row lock.
+#
+# The database is brought in line by write-back: every change to a counter
+# is also added to the `writeback` hash, and a flusher periodically moves the
+# hash aside (`inflight`, under a lease), applies it to the stock column in
+# one UPDATE and drops it. A counter missing from Redis (first use, or after
+# `forget`) is loaded from the database plus the changes not yet written
+# back. A load is refused while a batch is in flight, as the database may or
+# may not have it yet, and `flushes` counts finished write-backs so a load
+# that raced a whole one is retried too. Variations that do not
+# track stock get an `untracked` counter. All keys share one hash tag, so the
+# scripts also run on Redis Cluster.
+
+UNTRACKED = "untracked"
+
+# KEYS[1] the write-back hash, KEYS[1 + j] the counter of variation ARGV[2j - 1]
+# wanting ARGV[2j] units. Returns {0, id...} with the tracked ids taken,
+# {1, id...} with the ids whose counters are missing (nothing taken), or
+# {2, id, available...} with the ids short of stock (nothing taken).
+RESERVE_SCRIPT = """
+local missing = {1}
+local short = {2}
+for j = 1, #KEYS - 1 do
+    local value = redis.call('GET', KEYS[j + 1])
+    if not value then
+        missing[#missing + 1] = ARGV[2 * j - 1]
+    elseif value ~= 'untracked' and tonumber(value) < tonumber(ARGV[2 * j]) then
+        short[#short + 1] = ARGV[2 * j - 1]
+        short[#short + 1] = value
+    end
+end
+if #missing > 1 then
+    return missing
+end
+if #short > 1 then
+    return short
+end
+local taken = {0}
+for j = 1, #KEYS - 1 do
+    if redis.call('GET', KEYS[j + 1]) ~= 'untracked' then
+        redis.call('DECRBY', KEYS[j + 1], ARGV[2 * j])
+        redis.call('HINCRBY', KEYS[1], ARGV[2 * j - 1], -tonumber(ARGV[2 * j]))
+        taken[#taken + 1] = ARGV[2 * j - 1]
+    end
+end
+return taken
+"""
+
+# Same keys and arguments: gives the units back. A missing counter gets them
+# through the write-back hash, so it loads with them.
+RELEASE_SCRIPT = """
+for j = 1, #KEYS - 1 do
+    local value = redis.call('GET', KEYS[j + 1])
+    if value ~= 'untracked' then
+        if value then
+            redis.call('INCRBY', KEYS[j + 1], ARGV[2 * j])
+        end
+        redis.call('HINCRBY', KEYS[1], ARGV[2 * j - 1], ARGV[2 * j])
+    end
+end
+return 0
+"""
+
+# KEYS[1..3] the write-back hash, the in-flight batch and the flush count,
+# KEYS[3 + j] the counter of variation ARGV[2j] with ARGV[2j + 1] units in
+# the database ('' when untracked). ARGV[1] is the flush count read before
+# the database was. Sets the counters still missing; returns 0 without
+# setting any when a write-back is in flight or finished meanwhile.
+LOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 or (redis.call('GET', KEYS[3]) or '') ~= ARGV[1] then
+    return 0
+end
+for j = 1, #KEYS - 3 do
+    if redis.call('EXISTS', KEYS[j + 3]) == 0 then
+        local id = ARGV[2 * j]
+        if ARGV[2 * j + 1] == '' then
+            redis.call('SET', KEYS[j + 3], 'untracked')
+        else
+            local pending = tonumber(redis.call('HGET', KEYS[1], id) or 0)
+            redis.call('SET', KEYS[j + 3], tonumber(ARGV[2 * j + 1]) + pending)
+        end
+    end
+end
+return 1
+"""
+
+# KEYS[1..3] the write-back hash, the in-flight batch and the lease; ARGV[1]
+# the lease in milliseconds. Returns the batch to write back as a flat
+# id, delta list: an in-flight one whose flusher lost its lease, else the
+# current hash. Empty when another flusher holds the lease or nothing changed.
+TAKE_WRITEBACK_SCRIPT = """
+if not redis.call('SET', KEYS[3], 1, 'NX', 'PX', ARGV[1]) then
+    return {}
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        redis.call('DEL', KEYS[3])
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# KEYS[1..3] the in-flight batch, the lease and the flush count
+FINISH_WRITEBACK_SCRIPT = """
+redis.call('DEL', KEYS[1], KEYS[2])
+return redis.call('INCR', KEYS[3])
+"""
+
+# KEYS[1] the write-back hash, KEYS[1 + j] the counter of variation ARGV[j]
+FORGET_SCRIPT = """
+for j = 1, #KEYS - 1 do
+    redis.call('DEL', KEYS[j + 1])
+    redis.call('HDEL', KEYS[1], ARGV[j])
+end
+return 0
+"""
+
+
+@dataclass
+class Reservation:
+    """What RESERVE_SCRIPT did: took `taken`, or nothing for want of `missing` or `short`"""
+
+    taken: List[int] = field(default_factory=list)
+    missing: List[int] = field(default_factory=list)
+    # variation id -> units available
+    short: Dict[int, int] = field(default_factory=dict)
+
+
+class StockCounter:
+    """Stock counters on a sync Redis client"""
+
+    def __init__(self, client: redis.Redis, *, prefix: str = "{stock}", lease_ms: int = 30000):
+        self.prefix = prefix
+        self.lease_ms = lease_ms
+        self.writeback_key = f"{prefix}:writeback"
+        self.inflight_key = f"{prefix}:writeback:inflight"
+        self.lease_key = f"{prefix}:writeback:lease"
+        self.flushes_key = f"{prefix}:writeback:flushes"
+        self.client = client
+
+    @property
+    def client(self) -> redis.Redis:
+        return self._client
+
+    @client.setter
+    def client(self, client: redis.Redis) -> None:
+        self._client = client
+        self._reserve = client.register_script(RESERVE_SCRIPT)
+        self._release = client.register_script(RELEASE_SCRIPT)
+        self._load = client.register_script(LOAD_SCRIPT)
+        self._take = client.register_script(TAKE_WRITEBACK_SCRIPT)
+        self._finish = client.register_script(FINISH_WRITEBACK_SCRIPT)
+        self._forget = client.register_script(FORGET_SCRIPT)
+
+    def key(self, variation_id: int) -> str:
+        return f"{self.prefix}:variation:{variation_id}"
+
+    def _items(self, quantities: Mapping[int, int]):
+        ids = sorted(quantities)
+        keys = [self.writeback_key, *(self.key(id) for id in ids)]
+        args = [value for id in ids for value in (id, quantities[id])]
+        return keys, args
+
+    def reserve(self, quantities: Mapping[int, int]) -> Reservation:
+        """Take `quantities` (variation id -> units) if every tracked counter holds enough"""
+        keys, args = self._items(quantities)
+        status, *values = self._reserve(keys=keys, args=args)
+        if status == 0:
+            return Reservation(taken=[int(id) for id in values])
+        if status == 1:
+            return Reservation(missing=[int(id) for id in values])
+        return Reservation(short={int(id): int(units) for id, units in zip(values[::2], values[1::2])})
+
+    def release(self, quantities: Mapping[int, int]) -> None:
+        keys, args = self._items(quantities)
+        self._release(keys=keys, args=args)
+
+    def flushes(self) -> str:
+        """Token to pass to `load`, read before the database"""
+        return self.client.get(self.flushes_key) or ""
+
+    def load(self, stock: Mapping[int, Optional[int]], flushes: str) -> bool:
+        """
+        Set the missing counters of `stock` (variation id -> units in the
+        database, None if untracked). False if a write-back is in flight or
+        finished since `flushes` was read, and the database must be read again.
+        """
+        ids = sorted(stock)
+        keys = [self.writeback_key, self.inflight_key, self.flushes_key, *(self.key(id) for id in ids)]
+        args = [flushes]
+        for id in ids:
+            args += [id, "" if stock[id] is None else stock[id]]
+        return bool(self._load(keys=keys, args=args))
+
+    def take_writeback(self) -> Dict[int, int]:
+        """Changes to write back (variation id -> delta), under the lease until `finish_writeback`"""
+        values = self._take(keys=[self.writeback_key, self.inflight_key, self.lease_key], args=[self.lease_ms])
+        return {int(id): int(delta) for id, delta in zip(values[::2], values[1::2])}
+
+    def finish_writeback(self) -> None:
+        self._finish(keys=[self.inflight_key, self.lease_key, self.flushes_key])
+
+    def forget(self, variation_ids: Iterable[int]) -> None:
+        """Drop counters and their pending changes, so they load from the database again"""
+        ids = sorted(set(variation_ids))
+        if ids:
+            self._forget(keys=[self.writeback_key, *(self.key(id) for id in ids)], args=ids)
+
+    def get(self, variation_id: int) -> Optional[str]:
+        """The counter as stored: units, UNTRACKED, or None if not loaded"""
+        return self.client.get(self.key(variation_id))
+
+
+stock_counter = StockCounter(redis_client)
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import anyio.to_thread
+
+from app.core import images
+from app.core.config import settings
+from app.core.images import ImageFormat
+from app.core.media import MediaStorage, media_storage
+
+logger = logging.getLogger(__name__)
+
+# Image variant cache
+#
+# Variants asked for on the fly (an uploaded image at another width or in
+# another format) are rendered once, in the media worker pool, and kept under
+# MEDIA_ROOT/IMAGE_CACHE_DIR. The cache holds at most `max_bytes`: past that
+# the least recently served variants are deleted. Recency is tracked in
+# memory, so after a restart the cache starts from the files' modification
+# times, and with several workers each evicts by its own view of the files.
+# Requests for a variant that is being rendered wait for that render rather
+# than starting another. The directory scan, stats and deletes run in worker
+# threads, so a cold cache does not hold up the event loop. Variants rendered
+# at upload time (see app.core.media) are served as they are. Originals never
+# change under their content-hash path, so neither does any variant of them.
+
+
+class VariantCache:
+    def __init__(self, storage: MediaStorage, directory: str, *, max_bytes: int, quality: int):
+        self.storage = storage
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.size = 0
+        self.renders = 0
+        # Cached file name -> size, least recently served first. Only touched
+        # from the event loop, like `_rendering`.
+        self._entries: Optional["OrderedDict[str, int]"] = None
+        self._scanning: Optional[asyncio.Future] = None
+        self._rendering: Dict[str, asyncio.Future] = {}
+        # Evicted file name -> the delete of its file, until that is done
+        self._removing: Dict[str, asyncio.Future] = {}
+        # Called with the path of every evicted file
+        self.on_evict: Optional[Callable[[str], None]] = None
+
+    def _root(self) -> str:
+        return self.storage.path(self.directory)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self._root(), name[:2], name)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        found = []
+        for path, _, names in os.walk(self._root()):
+            for name in names:
+                if not name.endswith(".part"):
+                    try:
+                        stat = os.stat(os.path.join(path, name))
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_mtime, name, stat.st_size))
+        return sorted(found)
+
+    async def _index(self) -> "OrderedDict[str, int]":
+        if self._entries is None:
+            # Requests arriving during the first scan wait for that one
+            if self._scanning is None:
+                self._scanning = asyncio.ensure_future(anyio.to_thread.run_sync(self._scan))
+                self._scanning.add_done_callback(lambda _: setattr(self, "_scanning", None))
+            found = await asyncio.shield(self._scanning)
+            if self._entries is None:
+                self._entries = OrderedDict((name, size) for _, name, size in found)
+                self.size = sum(self._entries.values())
+        return self._entries
+
+    async def _lookup(self, name: str) -> Optional[str]:
+        entries = await self._index()
+        removal = self._removing.get(name)
+        if removal is not None:
+            await asyncio.shield(removal)
+        path = self._file(name)
+        size = await anyio.to_thread.run_sync(_file_size, path)
+        if size is None:
+            # Evicted by another worker
+            if name in entries:
+                self.size -= entries.pop(name)
+                if self.on_evict is not None:
+                    self.on_evict(path)
+            return None
+        if name in entries:
+            entries.move_to_end(name)
+        else:
+            await self._add(name, size)
+        return path
+
+    async def _add(self, name: str, size: int) -> None:
+        entries = await self._index()
+        self.size += size - entries.pop(name, 0)
+        entries[name] = size
+        evicted = []
+        # The newest entry stays even if it alone is over the limit
+        while self.size > self.max_bytes and len(entries) > 1:
+            evicted_name, evicted_size = entries.popitem(last=False)
+            self.size -= evicted_size
+            if self.on_evict is not None:
+                self.on_evict(self._file(evicted_name))
+            evicted.append(evicted_name)
+        if evicted:
+            await self._remove(evicted)
+
+    async def _remove(self, names: List[str]) -> None:
+        removal = asyncio.ensure_future(
+            anyio.to_thread.run_sync(_remove_files, [self._file(name) for name in names])
+        )
+
+        def done(_) -> None:
+            for name in names:
+                if self._removing.get(name) is removal:
+                    del self._removing[name]
+
+        # Lookups of these names wait for the delete, so they never see a file about to go
+        for name in names:
+            self._removing[name] = removal
+        removal.add_done_callback(done)
+        await asyncio.shield(removal)
+
+    async def _render(self, source: str, name: str, width: Optional[int], format: ImageFormat) -> str:
+        target = self._file(name)
+        await anyio.to_thread.run_sync(_make_parent, target)
+        size = await asyncio.wrap_future(self.storage.submit(
+            images.render_variant, source, target, width, format, self.quality
+        ))
+        self.renders += 1
+        await self._add(name, size)
+        return target
+
+    def _upload(
+        self, relative: str, width: Optional[int], format: ImageFormat
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """The upload's path and its variant rendered at upload time, if they exist"""
+        source = self.storage.resolve(relative)
+        if source is None:
+            return None, None
+        if format == ImageFormat.WEBP and width in self.storage.variant_widths:
+            rendered = images.variant_path(source, width)
+            if os.path.exists(rendered):
+                return source, rendered
+        return source, None
+
+    async def get(self, relative: str, *, width: Optional[int], format: ImageFormat) -> Optional[str]:
+        """Path of the variant of an uploaded image, rendered if needed; None if there is no such upload"""
+        source, rendered = await anyio.to_thread.run_sync(self._upload, relative, width, format)
+        if source is None or rendered is not None:
+            return rendered
+
+        key = f"{os.path.normpath(relative)}|{width}|{format.value}".encode()
+        name = hashlib.sha256(key).hexdigest()[:40] + images.OUTPUT_FORMATS[format][2]
+        path = await self._lookup(name)
+        if path is not None:
+            return path
+        pending = self._rendering.get(name)
+        if pending is None:
+            pending = asyncio.ensure_future(self._render(source, name, width, format))
+            self._rendering[name] = pending
+            pending.add_done_callback(lambda _: self._rendering.pop(name, None))
+        # Shielded: a client going away must not cancel the render others wait for
+        return await asyncio.shield(pending)
+
+
+
+def _file_size(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return None
+
+
+def _remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _make_parent(path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+
+variant_cache = VariantCache(
+    media_storage,
+    settings.IMAGE_CACHE_DIR,
+    max_bytes=settings.IMAGE_CACHE_MAX_BYTES,
+    quality=settings.IMAGE_VARIANT_QUALITY,
+)
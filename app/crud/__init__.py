@@ -0,0 +1,21 @@
+from app.crud import category as crud_category
+from app.crud import order as crud_order
+from app.crud import product as crud_product
+from app.crud import sales as crud_sales
+from app.crud import segment as crud_segment
+from app.crud import stock as crud_stock
+from app.crud import user as crud_user
+from app.crud.category import category
+from app.crud.order import order
+from app.crud.product import product
+from app.crud.sales import sales
+from app.crud.segment import segment
+from app.crud.stock import stock
+from app.crud.user import user
+from app.crud.category import async_category
+from app.crud.order import async_order
+from app.crud.product import async_product
+from app.crud.sales import async_sales
+from app.crud.segment import async_segment
+from app.crud.stock import async_stock
+from app.crud.user import async_user
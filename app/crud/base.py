@@ -1,7 +1,14 @@
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
-from fastapi.encoders import jsonable_encoder
+import csv
+import functools
+import io
+from typing import Any, Dict, FrozenSet, Generic, List, Optional, Sequence, Type, TypeVar, Union
 from pydantic import BaseModel
+from sqlalchemy import Table, inspect, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+from app.crud.pagination import Keyset
+from app.db.routing import mark_written
 from app.models.base import Base
 
 ModelType = TypeVar("ModelType", bound=Base)
@@ -9,6 +16,101 @@ CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
+def bulk_insert(db: Session, model: Type[Base], rows: Sequence[Dict[str, Any]]) -> List[int]:
+    """
+    Insert `rows` with multi-row INSERT ... RETURNING statements (one per
+    batch of the dialect's insertmanyvalues page size) instead of a
+    statement per ORM object. Returns the new ids, in no particular order.
+    """
+    if not rows:
+        return []
+    return list(db.scalars(insert(model).returning(model.id), rows))
+
+
+async def async_bulk_insert(
+    db: AsyncSession, model: Type[Base], rows: Sequence[Dict[str, Any]]
+) -> List[int]:
+    """Async counterpart of `bulk_insert`"""
+    if not rows:
+        return []
+    return list(await db.scalars(insert(model).returning(model.id), rows))
+
+
+def copies(db: Session) -> bool:
+    """Whether `write_rows` uses COPY on this session's database"""
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def write_rows(db: Session, table: Table, columns: Sequence[str], rows: List[tuple]) -> None:
+    """Append rows with COPY on PostgreSQL, an executemany INSERT elsewhere"""
+    if not rows:
+        return
+    # Written on the raw connection, which the session does not see
+    mark_written(db)
+    if copies(db):
+        _copy(db, table, columns, rows)
+    else:
+        _executemany(db, table, columns, rows)
+
+
+def _executemany(db: Session, table: Table, columns: Sequence[str], rows: List[tuple]) -> None:
+    """
+    One executemany INSERT, handed to the driver directly. Building a
+    parameter dict per row and running it through the statement's bind
+    processors costs more than the INSERT itself, so each column's processor
+    is applied here instead, once per distinct value (every timestamp of a
+    batch is the same).
+    """
+    connection = db.connection()
+    dialect = connection.dialect
+    compiled = insert(table).compile(dialect=dialect, column_keys=list(columns))
+    processors = []
+    for column in columns:
+        process = table.c[column].type.dialect_impl(dialect).bind_processor(dialect)
+        processors.append(functools.lru_cache(maxsize=None, typed=True)(process) if process else None)
+    processed = [
+        tuple(value if process is None else process(value) for process, value in zip(processors, row))
+        for row in rows
+    ]
+    if compiled.positiontup is None:
+        parameters = [dict(zip(columns, row)) for row in processed]
+    else:
+        order = [columns.index(key) for key in compiled.positiontup]
+        parameters = [tuple(row[i] for i in order) for row in processed]
+    connection.exec_driver_sql(compiled.string, parameters)
+
+
+def _copy(db: Session, table: Table, columns: Sequence[str], rows: List[tuple]) -> None:
+    connection = db.connection()
+    dbapi_connection = connection.connection
+    if connection.dialect.driver == "asyncpg":
+        # Under AsyncSession.run_sync; asyncpg's COPY takes the rows as they
+        # are, inside the transaction the batch's SELECTs already began
+        await_only(dbapi_connection.driver_connection.copy_records_to_table(
+            table.name, records=rows, columns=list(columns)
+        ))
+        return
+    # psycopg2: CSV with strings quoted, so an unquoted empty field is NULL
+    buffer = io.StringIO()
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+    buffer.seek(0)
+    quote = connection.dialect.identifier_preparer.quote
+    statement = (
+        f"COPY {quote(table.name)} ({', '.join(quote(column) for column in columns)}) "
+        "FROM STDIN WITH (FORMAT csv)"
+    )
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+
+
+def column_keys(model: Type[Base]) -> FrozenSet[str]:
+    """Attribute names of the model's columns, the fields `update` may set"""
+    return frozenset(attr.key for attr in inspect(model).column_attrs)
+
+
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     def __init__(self, model: Type[ModelType]):
         """
@@ -18,18 +120,21 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         * `schema`: A Pydantic model (schema) class
         """
         self.model = model
+        self.keyset = Keyset(model.id)
+        self.columns = column_keys(model)
 
     def get(self, db: Session, id: Any) -> Optional[ModelType]:
         return db.query(self.model).filter(self.model.id == id).first()
 
     def get_multi(
-        self, db: Session, *, skip: int = 0, limit: int = 100
+        self, db: Session, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
     ) -> List[ModelType]:
-        return db.query(self.model).offset(skip).limit(limit).all()
+        return self.keyset.paginate(
+            db.query(self.model), cursor=cursor, skip=skip, limit=limit
+        ).all()
 
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
-        obj_in_data = jsonable_encoder(obj_in)
-        db_obj = self.model(**obj_in_data)
+        db_obj = self.model(**obj_in.model_dump())
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
@@ -42,14 +147,13 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db_obj: ModelType,
         obj_in: Union[UpdateSchemaType, Dict[str, Any]]
     ) -> ModelType:
-        obj_data = jsonable_encoder(db_obj)
         if isinstance(obj_in, dict):
             update_data = obj_in
         else:
             update_data = obj_in.model_dump(exclude_unset=True)
-        for field in obj_data:
-            if field in update_data:
-                setattr(db_obj, field, update_data[field])
+        for field, value in update_data.items():
+            if field in self.columns:
+                setattr(db_obj, field, value)
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
@@ -59,4 +163,59 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         obj = db.query(self.model).get(id)
         db.delete(obj)
         db.commit()
-        return obj 
\ No newline at end of file
+        return obj 
+
+class AsyncCRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
+    def __init__(self, model: Type[ModelType]):
+        """
+        Async counterpart of `CRUDBase` working on an `AsyncSession`.
+        **Parameters**
+        * `model`: A SQLAlchemy model class
+        """
+        self.model = model
+        self.keyset = Keyset(model.id)
+        self.columns = column_keys(model)
+
+    async def get(self, db: AsyncSession, id: Any) -> Optional[ModelType]:
+        result = await db.execute(select(self.model).where(self.model.id == id))
+        return result.scalars().first()
+
+    async def get_multi(
+        self, db: AsyncSession, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
+    ) -> List[ModelType]:
+        result = await db.execute(
+            self.keyset.paginate(select(self.model), cursor=cursor, skip=skip, limit=limit)
+        )
+        return list(result.scalars().all())
+
+    async def create(self, db: AsyncSession, *, obj_in: CreateSchemaType) -> ModelType:
+        db_obj = self.model(**obj_in.model_dump())
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: ModelType,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> ModelType:
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.model_dump(exclude_unset=True)
+        for field, value in update_data.items():
+            if field in self.columns:
+                setattr(db_obj, field, value)
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def remove(self, db: AsyncSession, *, id: int) -> ModelType:
+        obj = await db.get(self.model, id)
+        await db.delete(obj)
+        await db.commit()
+        return obj
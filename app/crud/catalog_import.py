@@ -0,0 +1,332 @@
+import csv
+import enum
+import io
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import orjson
+from pydantic import ValidationError
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.core.search import product_index
+from app.crud.base import copies, write_rows
+from app.models.category import Category
+from app.models.product import Product, ProductImage, ProductVariation
+from app.schemas.product import ProductCreate, ProductImportError, ProductImportReport
+
+# Bulk catalog import
+#
+# An upload is parsed as it is read, one product at a time, and validated in
+# batches: each product against ProductCreate, then the whole batch against
+# the database in a few statements (which categories exist, which names are
+# taken). Valid products are written with COPY on PostgreSQL and executemany
+# elsewhere, and each batch is committed on its own, so a bad row never
+# stops the rows around it. The report lists every rejected row with its
+# line number in the upload.
+#
+# The product name is the import's key. A name that is taken is an error,
+# or with `upsert` that product is updated in place: its fields are
+# overwritten, its variations are matched by color name (updated, added, and
+# the ones missing from the import marked unavailable rather than deleted,
+# since order items reference them) and its images are replaced. A matched
+# variation keeps its stock unless the import gives one.
+
+
+class ImportFormat(str, enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+# A CSV upload has one row per variation. Consecutive rows with the same name
+# are one product, whose own columns are read from its first row; `images`
+# holds the product's image paths separated by "|".
+CSV_COLUMNS = (
+    "name",
+    "description",
+    "category_id",
+    "is_available",
+    "color_name",
+    "color_hex",
+    "price",
+    "variation_is_available",
+    "stock",
+    "images",
+)
+
+# Columns written per table, in COPY order
+PRODUCT_COLUMNS = ("id", "name", "description", "category_id", "is_available", "created_at", "updated_at")
+VARIATION_COLUMNS = (
+    "product_id", "color_name", "color_hex", "price", "is_available", "stock", "created_at", "updated_at"
+)
+IMAGE_COLUMNS = ("product_id", "variation_id", "image_path", "order", "created_at", "updated_at")
+
+# (line, the product or why it is invalid, its name if known)
+Parsed = Tuple[int, Union[ProductCreate, List[Dict[str, Any]]], Optional[str]]
+
+
+def _errors(exc: ValidationError) -> List[Dict[str, Any]]:
+    return [{"loc": list(error["loc"]), "msg": error["msg"]} for error in exc.errors()]
+
+
+def _error(loc: Sequence[Any], msg: str) -> List[Dict[str, Any]]:
+    return [{"loc": list(loc), "msg": msg}]
+
+
+def parse_ndjson(file: BinaryIO) -> Iterator[Parsed]:
+    """One product per line, shaped like the body of POST /products"""
+    for line_number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, ProductCreate.model_validate_json(line), None
+        except ValidationError as e:
+            try:
+                name = orjson.loads(line).get("name")
+            except (orjson.JSONDecodeError, AttributeError):
+                name = None
+            yield line_number, _errors(e), name if isinstance(name, str) else None
+
+
+def parse_csv(file: BinaryIO) -> Iterator[Parsed]:
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8", newline=""))
+    missing = {"name", "category_id"} - set(reader.fieldnames or ())
+    if missing:
+        yield 1, _error(["header"], f"Missing columns: {', '.join(sorted(missing))}"), None
+        return
+    group: List[Dict[str, str]] = []
+    start = 0
+    for row in reader:
+        if group and row["name"] != group[0]["name"]:
+            yield _csv_product(start, group)
+            group = []
+        if not group:
+            start = reader.line_num
+        group.append(row)
+    if group:
+        yield _csv_product(start, group)
+
+
+def _csv_product(line: int, rows: List[Dict[str, str]]) -> Parsed:
+    first = rows[0]
+    paths = [path for path in (first.get("images") or "").split("|") if path]
+    data = {
+        "name": first["name"],
+        "description": first.get("description") or None,
+        "category_id": first.get("category_id"),
+        "is_available": first.get("is_available") or True,
+        "variations": [
+            {
+                "color_name": row["color_name"],
+                "color_hex": row.get("color_hex"),
+                "price": row.get("price"),
+                "is_available": row.get("variation_is_available") or True,
+                "stock": row.get("stock") or None,
+            }
+            for row in rows
+            if row.get("color_name")
+        ],
+        "images": [{"image_path": path, "order": order} for order, path in enumerate(paths)],
+    }
+    try:
+        return line, ProductCreate.model_validate(data), data["name"]
+    except ValidationError as e:
+        return line, _errors(e), data["name"]
+
+
+PARSERS = {ImportFormat.NDJSON: parse_ndjson, ImportFormat.CSV: parse_csv}
+
+
+@dataclass
+class WrittenBatch:
+    """What a committed batch changed, for the cache and the search index"""
+    updated_ids: List[int] = field(default_factory=list)
+    category_ids: Set[int] = field(default_factory=set)
+    # (id, name, description, variation colors) of every written product
+    index_entries: List[Tuple[int, str, Optional[str], List[str]]] = field(default_factory=list)
+    # Existing variations whose stock the import set
+    restocked_ids: List[int] = field(default_factory=list)
+
+    def index(self) -> None:
+        if product_index.enabled:
+            for entry in self.index_entries:
+                product_index.add(*entry)
+
+
+class CatalogImporter:
+    def __init__(self, *, upsert: bool = False, batch_size: int = 1000, max_errors: int = 1000):
+        self.upsert = upsert
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.report = ProductImportReport()
+        # Category ids seen to exist, so each is looked up once per import
+        self.categories: Set[int] = set()
+
+    def fail(self, line: int, name: Optional[str], errors: List[Dict[str, Any]]) -> None:
+        self.report.failed += 1
+        if len(self.report.errors) < self.max_errors:
+            self.report.errors.append(ProductImportError(row=line, name=name, errors=errors))
+
+    def batches(self, parsed: Iterable[Parsed]) -> Iterator[List[Tuple[int, ProductCreate]]]:
+        """Products that passed schema validation, `batch_size` at a time"""
+        batch = []
+        for line, product, name in parsed:
+            if isinstance(product, ProductCreate):
+                batch.append((line, product))
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+            else:
+                self.fail(line, name, product)
+        if batch:
+            yield batch
+
+    def ingest(self, db: Session, batch: List[Tuple[int, ProductCreate]]) -> WrittenBatch:
+        """
+        Check one batch against the database and write it, without committing.
+        Sync so that AsyncSession.run_sync can run it too.
+        """
+        valid = []
+        names: Set[str] = set()
+        for line, product in batch:
+            if product.name in names:
+                self.fail(line, product.name, _error(["name"], "Product name appears earlier in this import"))
+            elif any(image.variation_id is not None for image in product.images):
+                self.fail(line, product.name, _error(["images"], "variation_id cannot be set on import"))
+            else:
+                names.add(product.name)
+                valid.append((line, product))
+
+        unknown = {product.category_id for _, product in valid} - self.categories
+        if unknown:
+            self.categories.update(db.scalars(select(Category.id).where(Category.id.in_(unknown))))
+        # Lowest id wins where a name is taken more than once already
+        existing = {
+            row.name: row
+            for row in db.execute(
+                select(Product.id, Product.name, Product.category_id)
+                .where(Product.name.in_(names))
+                .order_by(Product.id.desc())
+            )
+        }
+
+        new, updated = [], []
+        for line, product in valid:
+            if product.category_id not in self.categories:
+                self.fail(line, product.name, _error(["category_id"], "Category not found"))
+            elif product.name not in existing:
+                new.append(product)
+            elif self.upsert:
+                updated.append((product, existing[product.name]))
+            else:
+                self.fail(line, product.name, _error(["name"], "Product with this name already exists"))
+
+        written = WrittenBatch()
+        now = datetime.utcnow()
+        if new:
+            self._insert(db, new, now, written)
+        if updated:
+            self._update(db, updated, now, written)
+        self.report.created += len(new)
+        self.report.updated += len(updated)
+        return written
+
+    def _insert(self, db: Session, products: List[ProductCreate], now: datetime, written: WrittenBatch) -> None:
+        rows = [
+            (p.name, p.description, p.category_id, p.is_available, now, now) for p in products
+        ]
+        if copies(db):
+            # COPY returns no ids, so they are taken from the sequence first
+            ids = list(db.scalars(
+                select(func.nextval(func.pg_get_serial_sequence("product", "id")))
+                .select_from(func.generate_series(1, len(rows)))
+            ))
+            write_rows(db, Product.__table__, PRODUCT_COLUMNS, [(id, *row) for id, row in zip(ids, rows)])
+        else:
+            # Names are unique within a batch, so RETURNING rows are matched
+            # by name; asking for parameter order would insert row by row
+            returned = dict(db.execute(
+                insert(Product.__table__).returning(Product.name, Product.id),
+                [dict(zip(PRODUCT_COLUMNS[1:], row)) for row in rows],
+            ).all())
+            ids = [returned[p.name] for p in products]
+        variations, images = [], []
+        for id, product in zip(ids, products):
+            variations.extend(
+                (id, v.color_name, v.color_hex, v.price, v.is_available, v.stock, now, now)
+                for v in product.variations
+            )
+            images.extend((id, None, i.image_path, i.order, now, now) for i in product.images)
+            written.category_ids.add(product.category_id)
+            written.index_entries.append(
+                (id, product.name, product.description, [v.color_name for v in product.variations])
+            )
+        write_rows(db, ProductVariation.__table__, VARIATION_COLUMNS, variations)
+        write_rows(db, ProductImage.__table__, IMAGE_COLUMNS, images)
+
+    def _update(self, db: Session, products: List[Tuple[ProductCreate, Any]], now: datetime, written: WrittenBatch) -> None:
+        ids = [row.id for _, row in products]
+        by_pk = bindparam("pk")
+        db.execute(
+            update(Product.__table__).where(Product.__table__.c.id == by_pk),
+            [
+                {
+                    "pk": row.id, "description": p.description, "category_id": p.category_id,
+                    "is_available": p.is_available, "updated_at": now,
+                }
+                for p, row in products
+            ],
+        )
+        current = {
+            (row.product_id, row.color_name): (row.id, row.stock)
+            for row in db.execute(
+                select(
+                    ProductVariation.id, ProductVariation.product_id, ProductVariation.color_name,
+                    ProductVariation.stock,
+                )
+                .where(ProductVariation.product_id.in_(ids))
+            )
+        }
+        changed, added, seen = [], [], set()
+        for p, row in products:
+            for v in p.variations:
+                key = (row.id, v.color_name)
+                seen.add(key)
+                if key in current:
+                    id, stock = current[key]
+                    if v.stock is not None:
+                        written.restocked_ids.append(id)
+                    changed.append({
+                        "pk": id, "color_hex": v.color_hex, "price": v.price,
+                        "is_available": v.is_available, "stock": stock if v.stock is None else v.stock,
+                        "updated_at": now,
+                    })
+                else:
+                    added.append((row.id, v.color_name, v.color_hex, v.price, v.is_available, v.stock, now, now))
+        retired = [
+            {"pk": id, "is_available": False, "updated_at": now}
+            for key, (id, _) in current.items() if key not in seen
+        ]
+        variation_pk = ProductVariation.__table__.c.id == by_pk
+        for params in (changed, retired):
+            if params:
+                db.execute(update(ProductVariation.__table__).where(variation_pk), params)
+        write_rows(db, ProductVariation.__table__, VARIATION_COLUMNS, added)
+
+        db.execute(delete(ProductImage.__table__).where(ProductImage.product_id.in_(ids)))
+        write_rows(db, ProductImage.__table__, IMAGE_COLUMNS, [
+            (row.id, None, i.image_path, i.order, now, now) for p, row in products for i in p.images
+        ])
+
+        colors: Dict[int, List[str]] = {}
+        for product_id, color_name in current:
+            colors.setdefault(product_id, []).append(color_name)
+        for p, row in products:
+            written.updated_ids.append(row.id)
+            written.category_ids.update((row.category_id, p.category_id))
+            kept = colors.get(row.id, [])
+            written.index_entries.append((
+                row.id, row.name, p.description,
+                kept + [v.color_name for v in p.variations if v.color_name not in kept],
+            ))
@@ -1,12 +1,91 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.crud.base import CRUDBase
+from typing import Any, Dict, List, Optional, Union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import Select, func, literal, or_, select, update
+from app.core.cache import async_catalog_cache, catalog_cache
+from app.crud.base import AsyncCRUDBase, CRUDBase
+from app.crud.validators import Validators, fingerprint
 from app.models.category import Category
 from app.schemas.category import CategoryCreate, CategoryUpdate
 
 
+# Categories store a materialized path of ids ("/1/5/12/"), so a subtree is a
+# prefix match and the ancestors of a node are the prefixes of its path. The
+# statements below are shared by the sync and async CRUD classes.
+
+def _tree_query() -> Select:
+    return select(Category).order_by(Category.order, Category.id)
+
+
+def _subtree_query(id: int) -> Select:
+    root = aliased(Category)
+    return (
+        _tree_query()
+        .join(root, Category.path.like(root.path + "%"))
+        .where(root.id == id)
+    )
+
+
+def _subtrees_query(roots: List[Category]) -> Select:
+    return _tree_query().where(
+        or_(*(Category.path.like(f"{root.path}%") for root in roots))
+    )
+
+
+def _ancestors_query(id: int) -> Select:
+    node = aliased(Category)
+    return (
+        select(Category)
+        .join(node, node.path.like(Category.path + "%"))
+        .where(node.id == id, Category.id != id)
+        .order_by(func.length(Category.path))
+    )
+
+
+def _move_subtree(old_path: str, new_path: str):
+    return (
+        update(Category)
+        .where(Category.path.like(f"{old_path}%"))
+        .values(path=literal(new_path) + func.substr(Category.path, len(old_path) + 1))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _child_path(parent: Optional[Category], id: int) -> str:
+    return f"{parent.path if parent else '/'}{id}/"
+
+
+def _attach_subcategories(categories: List[Category]) -> Dict[int, Category]:
+    """Wire up `subcategories` between already loaded rows, without lazy loads"""
+    children: Dict[int, List[Category]] = {c.id: [] for c in categories}
+    for c in categories:
+        if c.parent_id in children:
+            children[c.parent_id].append(c)
+    for c in categories:
+        set_committed_value(c, "subcategories", children[c.id])
+    return {c.id: c for c in categories}
+
+
+# Category responses render whole subtrees; the table is small, so every
+# category endpoint is validated against all of it. The count of a requested
+# category only tells whether it exists and is left out of the ETag.
+def _validators_query(category_id: Optional[int]):
+    scopes = [(Category, ())]
+    if category_id is not None:
+        scopes.append((Category, (Category.id == category_id,)))
+    return fingerprint(*scopes)
+
+
+def _validators(row, category_id: Optional[int]) -> Validators:
+    return Validators.from_row(row[:2], exists=category_id is None or row[2] > 0)
+
+
 class CRUDCategory(CRUDBase[Category, CategoryCreate, CategoryUpdate]):
+    def validators(self, db: Session, *, category_id: Optional[int] = None) -> Validators:
+        """ETag and Last-Modified of category responses, without loading any"""
+        return _validators(db.execute(_validators_query(category_id)).one(), category_id)
+
     def get_by_name(self, db: Session, *, name: str) -> Optional[Category]:
         return db.query(Category).filter(Category.name == name).first()
 
@@ -18,26 +97,23 @@ class CRUDCategory(CRUDBase[Category, CategoryCreate, CategoryUpdate]):
             query = query.filter(Category.parent_id.is_(None))
         else:
             query = query.filter(Category.parent_id == parent_id)
-        return query.order_by(Category.order).offset(skip).limit(limit).all()
+        categories = query.order_by(Category.order, Category.id).offset(skip).limit(limit).all()
+        if categories:
+            _attach_subcategories(db.scalars(_subtrees_query(categories)).all())
+        return categories
 
     def get_tree(self, db: Session) -> List[Category]:
-        """Get full category tree with subcategories"""
-        def get_subcategories(category: Category) -> List[Category]:
-            subcategories = db.query(Category).filter(
-                Category.parent_id == category.id
-            ).order_by(Category.order).all()
-            for subcategory in subcategories:
-                subcategory.subcategories = get_subcategories(subcategory)
-            return subcategories
-
-        root_categories = db.query(Category).filter(
-            Category.parent_id.is_(None)
-        ).order_by(Category.order).all()
-        
-        for category in root_categories:
-            category.subcategories = get_subcategories(category)
-        
-        return root_categories
+        """Get full category tree with subcategories in a single query"""
+        categories = _attach_subcategories(db.scalars(_tree_query()).all())
+        return [c for c in categories.values() if c.parent_id is None]
+
+    def get_subtree(self, db: Session, *, id: int) -> Optional[Category]:
+        """Get category with all of its descendants in a single query"""
+        return _attach_subcategories(db.scalars(_subtree_query(id)).all()).get(id)
+
+    def get_ancestors(self, db: Session, *, id: int) -> List[Category]:
+        """Get the breadcrumb of a category, root first, in a single query"""
+        return list(db.scalars(_ancestors_query(id)).all())
 
     def get_with_products_count(self, db: Session, *, id: int) -> Optional[Category]:
         """Get category with count of products"""
@@ -50,6 +126,9 @@ class CRUDCategory(CRUDBase[Category, CategoryCreate, CategoryUpdate]):
             Category.id == id
         ).group_by(Category.id).first()
 
+    def create(self, db: Session, *, obj_in: CategoryCreate) -> Category:
+        return self.create_with_image(db, obj_in=obj_in)
+
     def create_with_image(
         self, db: Session, *, obj_in: CategoryCreate, image_path: Optional[str] = None
     ) -> Category:
@@ -58,8 +137,30 @@ class CRUDCategory(CRUDBase[Category, CategoryCreate, CategoryUpdate]):
             obj_in_data["image"] = image_path
         db_obj = Category(**obj_in_data)
         db.add(db_obj)
+        db.flush()  # Flush to get the category ID for its path
+        parent = self.get(db, id=db_obj.parent_id) if db_obj.parent_id else None
+        db_obj.path = _child_path(parent, db_obj.id)
         db.commit()
         db.refresh(db_obj)
+        catalog_cache.invalidate_tree()
+        return db_obj
+
+    def update(
+        self,
+        db: Session,
+        *,
+        db_obj: Category,
+        obj_in: Union[CategoryUpdate, Dict[str, Any]]
+    ) -> Category:
+        update_data = obj_in if isinstance(obj_in, dict) else obj_in.model_dump(exclude_unset=True)
+        if "parent_id" in update_data and update_data["parent_id"] != db_obj.parent_id:
+            parent_id = update_data["parent_id"]
+            parent = self.get(db, id=parent_id) if parent_id else None
+            path = _child_path(parent, db_obj.id)
+            db.execute(_move_subtree(db_obj.path, path))
+            update_data = {**update_data, "path": path}
+        db_obj = super().update(db, db_obj=db_obj, obj_in=update_data)
+        catalog_cache.invalidate_category(db_obj.id)
         return db_obj
 
     def update_with_image(
@@ -73,7 +174,121 @@ class CRUDCategory(CRUDBase[Category, CategoryCreate, CategoryUpdate]):
         update_data = obj_in.model_dump(exclude_unset=True)
         if image_path:
             update_data["image"] = image_path
-        return super().update(db, db_obj=db_obj, obj_in=update_data)
+        return self.update(db, db_obj=db_obj, obj_in=update_data)
+
+    def remove(self, db: Session, *, id: int) -> Category:
+        obj = super().remove(db, id=id)
+        catalog_cache.invalidate_category(id)
+        return obj
+
+    def is_in_subtree(self, category: Category, *, root: Category) -> bool:
+        return category.path.startswith(root.path)
+
+    def rebuild_paths(self, db: Session) -> None:
+        """Recompute every materialized path, e.g. after a bulk load"""
+        parents = dict(db.execute(select(Category.id, Category.parent_id)).all())
+
+        def path_of(id: int) -> str:
+            parent_id = parents[id]
+            return f"{path_of(parent_id) if parent_id else '/'}{id}/"
+
+        if parents:
+            db.execute(
+                update(Category),
+                [{"id": id, "path": path_of(id)} for id in parents],
+            )
+        db.commit()
+
+
+class AsyncCRUDCategory(AsyncCRUDBase[Category, CategoryCreate, CategoryUpdate]):
+    # CategoryResponse nests subcategories recursively and lazy loads are not
+    # available on an AsyncSession, so responses use get_subtree.
+
+    async def validators(
+        self, db: AsyncSession, *, category_id: Optional[int] = None
+    ) -> Validators:
+        result = await db.execute(_validators_query(category_id))
+        return _validators(result.one(), category_id)
+
+    async def get_by_name(self, db: AsyncSession, *, name: str) -> Optional[Category]:
+        result = await db.execute(select(Category).where(Category.name == name))
+        return result.scalars().first()
+
+    async def get_multi_by_parent(
+        self, db: AsyncSession, *, parent_id: Optional[int] = None, skip: int = 0, limit: int = 100
+    ) -> List[Category]:
+        query = select(Category)
+        if parent_id is None:
+            query = query.where(Category.parent_id.is_(None))
+        else:
+            query = query.where(Category.parent_id == parent_id)
+        result = await db.execute(
+            query.order_by(Category.order, Category.id).offset(skip).limit(limit)
+        )
+        categories = list(result.scalars().all())
+        if categories:
+            _attach_subcategories((await db.scalars(_subtrees_query(categories))).all())
+        return categories
+
+    async def get_tree(self, db: AsyncSession) -> List[Category]:
+        """Get full category tree with subcategories in a single query"""
+        categories = _attach_subcategories((await db.scalars(_tree_query())).all())
+        return [c for c in categories.values() if c.parent_id is None]
+
+    async def get_subtree(self, db: AsyncSession, *, id: int) -> Optional[Category]:
+        """Get category with all of its descendants in a single query"""
+        result = await db.scalars(_subtree_query(id))
+        return _attach_subcategories(result.all()).get(id)
+
+    async def get_ancestors(self, db: AsyncSession, *, id: int) -> List[Category]:
+        """Get the breadcrumb of a category, root first, in a single query"""
+        return list((await db.scalars(_ancestors_query(id))).all())
+
+    async def create_with_image(
+        self, db: AsyncSession, *, obj_in: CategoryCreate, image_path: Optional[str] = None
+    ) -> Category:
+        obj_in_data = obj_in.model_dump()
+        if image_path:
+            obj_in_data["image"] = image_path
+        db_obj = Category(**obj_in_data)
+        db.add(db_obj)
+        await db.flush()  # Flush to get the category ID for its path
+        parent = await self.get(db, id=db_obj.parent_id) if db_obj.parent_id else None
+        db_obj.path = _child_path(parent, db_obj.id)
+        await db.commit()
+        await async_catalog_cache.invalidate_tree()
+        return await self.get_subtree(db, id=db_obj.id)
+
+    async def update_with_image(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: Category,
+        obj_in: CategoryUpdate,
+        image_path: Optional[str] = None
+    ) -> Category:
+        update_data = obj_in.model_dump(exclude_unset=True)
+        if image_path:
+            update_data["image"] = image_path
+        if "parent_id" in update_data and update_data["parent_id"] != db_obj.parent_id:
+            parent_id = update_data["parent_id"]
+            parent = await self.get(db, id=parent_id) if parent_id else None
+            update_data["path"] = _child_path(parent, db_obj.id)
+            await db.execute(_move_subtree(db_obj.path, update_data["path"]))
+        await super().update(db, db_obj=db_obj, obj_in=update_data)
+        await async_catalog_cache.invalidate_category(db_obj.id)
+        return await self.get_subtree(db, id=db_obj.id)
+
+    def is_in_subtree(self, category: Category, *, root: Category) -> bool:
+        return category.path.startswith(root.path)
+
+    async def remove(self, db: AsyncSession, *, id: int) -> Category:
+        obj = await self.get_subtree(db, id=id)
+        await db.delete(obj)
+        await db.commit()
+        await async_catalog_cache.invalidate_category(id)
+        return obj
 
 
-category = CRUDCategory(Category) 
\ No newline at end of file
+category = CRUDCategory(Category)
+async_category = AsyncCRUDCategory(Category)
@@ -0,0 +1,108 @@
+import csv
+import enum
+import io
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator
+
+import orjson
+
+from app.crud.order import EXPORT_ITEM_KEYS, EXPORT_ORDER_KEYS
+
+# Export encodings
+#
+# Orders from CRUDOrder.export are encoded one at a time and sent in chunks of
+# about CHUNK_SIZE bytes, so a response body never holds more than a chunk
+# and the ASGI server is not handed one message per order. NDJSON has one
+# order per line with its items nested; CSV has one row per item with the
+# order's columns repeated, and one row with empty item columns for an
+# order without items.
+
+CHUNK_SIZE = 64 * 1024
+
+Order = Dict[str, Any]
+
+
+class ExportFormat(str, enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class NDJSONEncoder:
+    media_type = "application/x-ndjson"
+
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, order: Order) -> bytes:
+        return orjson.dumps(order, option=orjson.OPT_APPEND_NEWLINE)
+
+
+class CSVEncoder:
+    media_type = "text/csv; charset=utf-8"
+    columns = (
+        *(f"order_{key}" if key == "id" else key for key in EXPORT_ORDER_KEYS),
+        *EXPORT_ITEM_KEYS,
+    )
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def header(self) -> bytes:
+        return self._rows([self.columns])
+
+    def encode(self, order: Order) -> bytes:
+        head = [_cell(order[key]) for key in EXPORT_ORDER_KEYS]
+        if not order["items"]:
+            return self._rows([head + [""] * len(EXPORT_ITEM_KEYS)])
+        return self._rows(
+            [head + [_cell(item[key]) for key in EXPORT_ITEM_KEYS] for item in order["items"]]
+        )
+
+    def _rows(self, rows) -> bytes:
+        self.writer.writerows(rows)
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return text.encode()
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return "" if value is None else value
+
+
+def encoder_for(format: ExportFormat):
+    return CSVEncoder() if format == ExportFormat.CSV else NDJSONEncoder()
+
+
+def chunks(encoder, orders: Iterable[Order]) -> Iterator[bytes]:
+    buffer = [encoder.header()]
+    size = len(buffer[0])
+    for order in orders:
+        line = encoder.encode(order)
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+async def async_chunks(encoder, orders: AsyncIterable[Order]) -> AsyncIterator[bytes]:
+    """Async counterpart of `chunks`"""
+    buffer = [encoder.header()]
+    size = len(buffer[0])
+    async for order in orders:
+        line = encoder.encode(order)
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
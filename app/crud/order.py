@@ -1,44 +1,257 @@
-from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.crud.base import CRUDBase
-from app.models.order import Order, OrderItem
+from datetime import datetime
+from typing import (
+    Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import Select, delete, func, select
+from app.core.config import settings
+from app.crud.base import AsyncCRUDBase, CRUDBase, async_bulk_insert, bulk_insert
+from app.crud.pagination import Keyset
+from app.crud.sales import item_lines, move_order, record_order
+from app.crud.stock import InsufficientStock, stock
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.product import Product, ProductVariation
 from app.schemas.order import OrderCreate, OrderUpdate, OrderItemCreate
 
 
+# A user's orders are listed newest first; the id breaks created_at ties.
+USER_ORDERS_KEYSET = Keyset(Order.created_at, Order.id, descending=True)
+
+# Everything OrderResponse reads, loaded with one query per relationship
+# for a whole page of orders
+ORDER_RESPONSE_OPTIONS = (
+    selectinload(Order.items).selectinload(OrderItem.product),
+    selectinload(Order.items)
+    .selectinload(OrderItem.variation)
+    .selectinload(ProductVariation.images),
+)
+
+
+class InvalidOrderItems(ValueError):
+    """Raised with every item of an order that cannot be placed"""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _variations_query(items: Sequence[OrderItemCreate]):
+    """
+    Every variation an order references, with its product's availability, in
+    one query. Rows are share-locked until commit so prices cannot change
+    between pricing the order and writing it.
+    """
+    return (
+        select(
+            ProductVariation.id,
+            ProductVariation.product_id,
+            ProductVariation.price,
+            ProductVariation.is_available,
+            Product.is_available.label("product_is_available"),
+        )
+        .join(Product, Product.id == ProductVariation.product_id)
+        .where(ProductVariation.id.in_({item.variation_id for item in items}))
+        .with_for_update(read=True, of=ProductVariation)
+    )
+
+
+def _price_items(
+    items: Sequence[OrderItemCreate], variations
+) -> Tuple[List[Dict[str, Any]], float]:
+    """Order item rows priced from the database, and the order total"""
+    by_id = {variation.id: variation for variation in variations}
+    errors = []
+    for index, item in enumerate(items):
+        variation = by_id.get(item.variation_id)
+        if variation is None:
+            error = "Product variation not found"
+        elif variation.product_id != item.product_id:
+            error = f"Product variation does not belong to product {item.product_id}"
+        elif not (variation.is_available and variation.product_is_available):
+            error = "Product variation is not available"
+        else:
+            continue
+        errors.append({
+            "loc": ["body", "items", index],
+            "msg": error,
+            "product_id": item.product_id,
+            "variation_id": item.variation_id,
+        })
+    if errors:
+        raise InvalidOrderItems(errors)
+
+    rows = [
+        {**item.model_dump(), "price": by_id[item.variation_id].price}
+        for item in items
+    ]
+    total = round(sum(row["price"] * row["quantity"] for row in rows), 2)
+    return rows, total
+
+
+def _new_status(db_obj: Order, obj_in: Union[OrderUpdate, Dict[str, Any]]) -> Optional[OrderStatus]:
+    """The status an update changes the order to, None if it keeps it"""
+    data = obj_in if isinstance(obj_in, dict) else obj_in.model_dump(exclude_unset=True)
+    status = data.get("status")
+    return status if status is not None and status != db_obj.status else None
+
+
+# Order export
+#
+# Orders are exported as plain rows, one per order item (orders without items
+# get one row with NULL item columns), ordered so that each order's rows are
+# consecutive. They are fetched in batches of ORDER_EXPORT_BATCH_SIZE through
+# a server-side cursor and folded back into one dict per order as they
+# stream, so memory stays flat however many orders are exported. No ORM
+# objects are built and nothing enters the session's identity map.
+
+EXPORT_ORDER_COLUMNS = (
+    Order.id,
+    Order.created_at,
+    Order.user_id,
+    Order.status,
+    Order.total_amount,
+    Order.full_name,
+    Order.email,
+    Order.phone,
+    Order.delivery_method,
+    Order.delivery_address,
+    Order.payment_method,
+)
+EXPORT_ITEM_COLUMNS = (
+    OrderItem.product_id,
+    OrderItem.variation_id,
+    Product.name.label("product_name"),
+    ProductVariation.color_name,
+    OrderItem.quantity,
+    OrderItem.price,
+)
+EXPORT_ORDER_KEYS = tuple(column.key for column in EXPORT_ORDER_COLUMNS)
+EXPORT_ITEM_KEYS = tuple(column.key for column in EXPORT_ITEM_COLUMNS)
+
+
+def _export_query(
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    statuses: Sequence[OrderStatus],
+) -> Select:
+    query = (
+        select(*EXPORT_ORDER_COLUMNS, OrderItem.id.label("item_id"), *EXPORT_ITEM_COLUMNS)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .outerjoin(ProductVariation, ProductVariation.id == OrderItem.variation_id)
+        .order_by(Order.created_at, Order.id, OrderItem.id)
+    )
+    if created_from is not None:
+        query = query.where(Order.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(Order.created_at < created_to)
+    if statuses:
+        query = query.where(Order.status.in_(statuses))
+    return query.execution_options(yield_per=settings.ORDER_EXPORT_BATCH_SIZE)
+
+
+class _OrderGroups:
+    """Folds export rows into one dict per order, with its `items` list"""
+
+    def __init__(self):
+        self.current: Optional[Dict[str, Any]] = None
+
+    def feed(self, rows: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+        # Rows are order columns, the item id, then item columns
+        split = len(EXPORT_ORDER_KEYS)
+        for row in rows:
+            if self.current is None or self.current["id"] != row[0]:
+                if self.current is not None:
+                    yield self.current
+                self.current = dict(zip(EXPORT_ORDER_KEYS, row[:split]))
+                self.current["items"] = []
+            if row[split] is not None:
+                self.current["items"].append(dict(zip(EXPORT_ITEM_KEYS, row[split + 1:])))
+
+    def finish(self) -> Iterator[Dict[str, Any]]:
+        if self.current is not None:
+            yield self.current
+            self.current = None
+
+
 class CRUDOrder(CRUDBase[Order, OrderCreate, OrderUpdate]):
+    def get(self, db: Session, id: Any) -> Optional[Order]:
+        return (
+            db.query(Order)
+            .options(*ORDER_RESPONSE_OPTIONS)
+            .filter(Order.id == id)
+            .populate_existing()
+            .first()
+        )
+
+    def get_multi(
+        self, db: Session, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
+    ) -> List[Order]:
+        query = db.query(Order).options(*ORDER_RESPONSE_OPTIONS)
+        return self.keyset.paginate(query, cursor=cursor, skip=skip, limit=limit).all()
+
     def get_by_user(
-        self, db: Session, *, user_id: int, skip: int = 0, limit: int = 100
+        self, db: Session, *, user_id: int, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
     ) -> List[Order]:
-        return (
+        query = (
             db.query(Order)
+            .options(*ORDER_RESPONSE_OPTIONS)
             .filter(Order.user_id == user_id)
-            .order_by(Order.created_at.desc())
-            .offset(skip)
-            .limit(limit)
-            .all()
         )
+        return USER_ORDERS_KEYSET.paginate(query, cursor=cursor, skip=skip, limit=limit).all()
+
+    def price_items(
+        self, db: Session, *, items: Sequence[OrderItemCreate]
+    ) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Validate and price order items against the database in one query.
+        Raises InvalidOrderItems listing every item that cannot be ordered.
+        """
+        return _price_items(items, db.execute(_variations_query(items)).all())
 
     def create_with_items(
-        self, db: Session, *, obj_in: OrderCreate
+        self, db: Session, *, obj_in: OrderCreate, user_id: int
     ) -> Order:
+        # Stock is taken first: its row locks come before pricing's share locks
+        try:
+            taken = stock.reserve(db, items=obj_in.items)
+            items, total_amount = self.price_items(db, items=obj_in.items)
+        except (InsufficientStock, InvalidOrderItems):
+            db.rollback()
+            raise
+
         # Create order
         obj_in_data = obj_in.model_dump(exclude={"items"})
-        db_obj = Order(**obj_in_data)
+        db_obj = Order(**obj_in_data, user_id=user_id, total_amount=total_amount)
         db.add(db_obj)
         db.flush()  # Flush to get the order ID
+        stock.hold(db, order_id=db_obj.id, taken=taken)
 
-        # Create order items
-        for item_in in obj_in.items:
-            item = OrderItem(
-                order_id=db_obj.id,
-                **item_in.model_dump()
-            )
-            db.add(item)
-
+        # All items in one multi-row insert
+        bulk_insert(db, OrderItem, [{**item, "order_id": db_obj.id} for item in items])
+        # Counted in the sales rollups in the same transaction
+        record_order(db, db_obj, item_lines(items))
         db.commit()
-        db.refresh(db_obj)
-        return db_obj
+        return self.get(db, id=db_obj.id)
+
+    def update(
+        self,
+        db: Session,
+        *,
+        db_obj: Order,
+        obj_in: Union[OrderUpdate, Dict[str, Any]]
+    ) -> Order:
+        status = _new_status(db_obj, obj_in)
+        if status is not None:
+            try:
+                stock.settle(db, order_id=db_obj.id, status=status)
+            except InsufficientStock:
+                db.rollback()
+                raise
+            move_order(db, db_obj.id, status=status)
+        return super().update(db, db_obj=db_obj, obj_in=obj_in)
 
     def update_with_items(
         self,
@@ -48,30 +261,42 @@ class CRUDOrder(CRUDBase[Order, OrderCreate, OrderUpdate]):
         obj_in: OrderUpdate,
         items: Optional[List[OrderItemCreate]] = None
     ) -> Order:
+        status = _new_status(db_obj, obj_in)
+        priced = None
+        try:
+            if status is not None or items:
+                stock.settle(db, order_id=db_obj.id, status=status, items=items or None)
+            if items:
+                priced, total_amount = self.price_items(db, items=items)
+        except (InsufficientStock, InvalidOrderItems):
+            db.rollback()
+            raise
+        if status is not None or priced is not None:
+            lines = None if priced is None else item_lines(priced)
+            move_order(db, db_obj.id, status=status, lines=lines)
+
         # Update order
         update_data = obj_in.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_obj, field, value)
 
         # Update items if provided
-        if items:
+        if priced is not None:
+            db_obj.total_amount = total_amount
+
             # Delete existing items
             db.query(OrderItem).filter(
                 OrderItem.order_id == db_obj.id
             ).delete()
 
             # Create new items
-            for item_in in items:
-                item = OrderItem(
-                    order_id=db_obj.id,
-                    **item_in.model_dump()
-                )
-                db.add(item)
+            bulk_insert(db, OrderItem, [{**item, "order_id": db_obj.id} for item in priced])
+            # The loaded collection still holds the deleted rows
+            db.expire(db_obj, ["items"])
 
         db.add(db_obj)
         db.commit()
-        db.refresh(db_obj)
-        return db_obj
+        return self.get(db, id=db_obj.id)
 
     def get_with_items(self, db: Session, *, id: int) -> Optional[Order]:
         return (
@@ -94,5 +319,199 @@ class CRUDOrder(CRUDBase[Order, OrderCreate, OrderUpdate]):
             return "not_found"
         return order.status
 
+    def export(
+        self,
+        db: Session,
+        *,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        statuses: Sequence[OrderStatus] = (),
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Orders created in [created_from, created_to) with one of `statuses`
+        (any if empty) and their items, oldest first, streamed from a
+        server-side cursor. Closes the session when exhausted or closed.
+        """
+        groups = _OrderGroups()
+        try:
+            result = db.execute(_export_query(created_from, created_to, statuses))
+            for rows in result.partitions():
+                yield from groups.feed(rows)
+            yield from groups.finish()
+        finally:
+            db.close()
+
+
+class AsyncCRUDOrder(AsyncCRUDBase[Order, OrderCreate, OrderUpdate]):
+    # An AsyncSession cannot lazy load during response serialization, so
+    # every read loads ORDER_RESPONSE_OPTIONS.
+
+    async def get(self, db: AsyncSession, id: Any) -> Optional[Order]:
+        result = await db.execute(
+            select(Order)
+            .options(*ORDER_RESPONSE_OPTIONS)
+            .where(Order.id == id)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalars().first()
+
+    async def get_multi(
+        self, db: AsyncSession, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None
+    ) -> List[Order]:
+        query = select(Order).options(*ORDER_RESPONSE_OPTIONS)
+        result = await db.execute(
+            self.keyset.paginate(query, cursor=cursor, skip=skip, limit=limit)
+        )
+        return list(result.scalars().all())
+
+    async def get_by_user(
+        self, db: AsyncSession, *, user_id: int, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None
+    ) -> List[Order]:
+        query = (
+            select(Order)
+            .options(*ORDER_RESPONSE_OPTIONS)
+            .where(Order.user_id == user_id)
+        )
+        result = await db.execute(
+            USER_ORDERS_KEYSET.paginate(query, cursor=cursor, skip=skip, limit=limit)
+        )
+        return list(result.scalars().all())
+
+    async def price_items(
+        self, db: AsyncSession, *, items: Sequence[OrderItemCreate]
+    ) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Validate and price order items against the database in one query.
+        Raises InvalidOrderItems listing every item that cannot be ordered.
+        """
+        result = await db.execute(_variations_query(items))
+        return _price_items(items, result.all())
+
+    async def create_with_items(
+        self, db: AsyncSession, *, obj_in: OrderCreate, user_id: int
+    ) -> Order:
+        # Stock is taken first: its row locks come before pricing's share locks
+        try:
+            taken = await db.run_sync(stock.reserve, items=obj_in.items)
+            items, total_amount = await self.price_items(db, items=obj_in.items)
+        except (InsufficientStock, InvalidOrderItems):
+            await db.rollback()
+            raise
+
+        # Create order
+        obj_in_data = obj_in.model_dump(exclude={"items"})
+        db_obj = Order(**obj_in_data, user_id=user_id, total_amount=total_amount)
+        db.add(db_obj)
+        await db.flush()  # Flush to get the order ID
+        await db.run_sync(stock.hold, order_id=db_obj.id, taken=taken)
+
+        # All items in one multi-row insert
+        await async_bulk_insert(db, OrderItem, [{**item, "order_id": db_obj.id} for item in items])
+        # Counted in the sales rollups in the same transaction
+        await db.run_sync(record_order, db_obj, item_lines(items))
+        await db.commit()
+        return await self.get(db, id=db_obj.id)
+
+    async def update(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: Order,
+        obj_in: Union[OrderUpdate, Dict[str, Any]]
+    ) -> Order:
+        status = _new_status(db_obj, obj_in)
+        if status is not None:
+            try:
+                await db.run_sync(stock.settle, order_id=db_obj.id, status=status)
+            except InsufficientStock:
+                await db.rollback()
+                raise
+            await db.run_sync(move_order, db_obj.id, status=status)
+        await super().update(db, db_obj=db_obj, obj_in=obj_in)
+        return await self.get(db, id=db_obj.id)
+
+    async def update_with_items(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: Order,
+        obj_in: OrderUpdate,
+        items: Optional[List[OrderItemCreate]] = None
+    ) -> Order:
+        status = _new_status(db_obj, obj_in)
+        priced = None
+        try:
+            if status is not None or items:
+                await db.run_sync(stock.settle, order_id=db_obj.id, status=status, items=items or None)
+            if items:
+                priced, total_amount = await self.price_items(db, items=items)
+        except (InsufficientStock, InvalidOrderItems):
+            await db.rollback()
+            raise
+        if status is not None or priced is not None:
+            lines = None if priced is None else item_lines(priced)
+            await db.run_sync(move_order, db_obj.id, status=status, lines=lines)
+
+        # Update order
+        update_data = obj_in.model_dump(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(db_obj, field, value)
+
+        # Update items if provided
+        if priced is not None:
+            db_obj.total_amount = total_amount
+
+            # Delete existing items
+            await db.execute(
+                delete(OrderItem).where(OrderItem.order_id == db_obj.id)
+            )
+
+            # Create new items
+            await async_bulk_insert(
+                db, OrderItem, [{**item, "order_id": db_obj.id} for item in priced]
+            )
+            # The loaded collection still holds the deleted rows
+            db.expire(db_obj, ["items"])
+
+        db.add(db_obj)
+        await db.commit()
+        return await self.get(db, id=db_obj.id)
+
+    async def get_total_amount(self, db: AsyncSession, *, id: int) -> float:
+        result = await db.execute(
+            select(func.sum(OrderItem.price * OrderItem.quantity))
+            .where(OrderItem.order_id == id)
+        )
+        return result.scalar() or 0.0
+
+    async def get_order_status(self, db: AsyncSession, *, id: int) -> str:
+        result = await db.execute(select(Order.status).where(Order.id == id))
+        status = result.scalar()
+        if status is None:
+            return "not_found"
+        return status
+
+    async def export(
+        self,
+        db: AsyncSession,
+        *,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        statuses: Sequence[OrderStatus] = (),
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Async counterpart of `CRUDOrder.export`"""
+        groups = _OrderGroups()
+        try:
+            result = await db.stream(_export_query(created_from, created_to, statuses))
+            async for rows in result.partitions():
+                for order in groups.feed(rows):
+                    yield order
+            for order in groups.finish():
+                yield order
+        finally:
+            await db.close()
+
 
-order = CRUDOrder(Order) 
\ No newline at end of file
+order = CRUDOrder(Order)
+async_order = AsyncCRUDOrder(Order) 
\ No newline at end of file
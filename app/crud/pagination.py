@@ -0,0 +1,85 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import Column, tuple_
+
+QueryType = TypeVar("QueryType")
+
+# List endpoints keep returning a bare JSON array and hand out the cursor of
+# the next page in this header; it is absent on the last page.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Keyset:
+    """
+    Keyset (cursor) pagination over a fixed sort order.
+
+    The cursor is an opaque, URL-safe encoding of the sort key of the last
+    row of a page; the next page starts right after it with a row-value
+    comparison that an index on the same columns can serve, so fetching page
+    10,000 costs the same as fetching page 1.
+    """
+
+    def __init__(self, *columns: Column, descending: bool = False):
+        self.columns = columns
+        self.descending = descending
+
+    def encode(self, obj: Any) -> str:
+        values = [getattr(obj, column.key) for column in self.columns]
+        raw = json.dumps(
+            [v.isoformat() if isinstance(v, datetime) else v for v in values],
+            separators=(",", ":"),
+        )
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    def decode(self, cursor: str) -> Tuple[Any, ...]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.columns):
+                raise InvalidCursor(cursor)
+            return tuple(
+                datetime.fromisoformat(value)
+                if column.type.python_type is datetime else column.type.python_type(value)
+                for column, value in zip(self.columns, values)
+            )
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as exc:
+            raise InvalidCursor(cursor) from exc
+
+    def order_by(self, query: QueryType) -> QueryType:
+        if self.descending:
+            return query.order_by(*(column.desc() for column in self.columns))
+        return query.order_by(*self.columns)
+
+    def paginate(
+        self, query: QueryType, *, cursor: Optional[str] = None, skip: int = 0, limit: int = 100
+    ) -> QueryType:
+        """
+        Order the query by the keyset and select one page of it: the rows
+        after `cursor` when given, otherwise the legacy `skip` offset.
+        """
+        query = self.order_by(query)
+        if cursor:
+            key = tuple_(*self.columns)
+            after = tuple_(*self.decode(cursor))
+            query = query.filter(key < after if self.descending else key > after)
+        elif skip:
+            query = query.offset(skip)
+        return query.limit(limit)
+
+    def next_cursor(self, items: Sequence[Any], limit: int) -> Optional[str]:
+        """Cursor of the page after `items`, or None when it was the last one"""
+        if not items or len(items) < limit:
+            return None
+        return self.encode(items[-1])
+
+
+def next_cursor_headers(next_cursor: Optional[str]) -> Dict[str, str]:
+    return {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
@@ -1,25 +1,219 @@
-from typing import List, Optional, Dict, Any
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.crud.base import CRUDBase
+import enum
+import re
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import Float, String, column, delete, func, literal_column, select, table
+from app.core.cache import async_catalog_cache, catalog_cache
+from app.core.config import settings
+from app.core.search import Hit, matches, product_index, tokenize
+from app.crud.base import AsyncCRUDBase, CRUDBase, async_bulk_insert, bulk_insert
+from app.crud.catalog_import import PARSERS, CatalogImporter, ImportFormat
+from app.crud.pagination import Keyset
+from app.crud.stock import stock
+from app.crud.validators import Validators, fingerprint
+from app.models.category import Category
 from app.models.product import Product, ProductVariation, ProductImage
-from app.schemas.product import ProductCreate, ProductUpdate, ProductVariationCreate
+from app.schemas.product import (
+    ProductCreate, ProductImageCreate, ProductImportReport, ProductUpdate, ProductVariationCreate
+)
+
+
+class ProductLoad(str, enum.Enum):
+    """Loading plans for product reads, picked per endpoint"""
+    # The product row only, for existence checks and writes
+    BARE = "bare"
+    # Everything ProductResponse serializes
+    RESPONSE = "response"
+
+
+# Collections are selectin-loaded (one extra query per collection for the
+# whole page) and the category is joined into the product query, so a page
+# of products costs a fixed number of statements whatever its size.
+PRODUCT_LOAD_PLANS = {
+    ProductLoad.BARE: (),
+    ProductLoad.RESPONSE: (
+        joinedload(Product.category),
+        selectinload(Product.images),
+        selectinload(Product.variations).selectinload(ProductVariation.images),
+    ),
+}
+
+
+# Search hits carry their relevance and a highlighted fragment of the text
+# under these attribute names, best matches first; the id breaks rank ties.
+SEARCH_RANK = "search_rank"
+SEARCH_SNIPPET = "search_snippet"
+SNIPPET_START, SNIPPET_STOP = "<mark>", "</mark>"
+SNIPPET_WORDS = 16
+
+# Encodes cursors of search pages; `search` seeks with the same keyset built
+# over the live rank expression.
+SEARCH_KEYSET = Keyset(literal_column(SEARCH_RANK, Float), Product.id, descending=True)
+
+# Products read per query while building the in-process search index
+INDEX_BATCH = 1000
+
+_product_fts = table("product_fts", column("rowid"))
+
+
+def _search_clauses(dialect: str, terms: List[str]) -> Tuple[Any, Any, Any, Optional[tuple]]:
+    """
+    Match condition, rank, snippet and the FTS table to join (if any) for a
+    search where every term has to match, as a prefix of a word.
+    """
+    if dialect == "postgresql":
+        vector = literal_column("product.search_vector")
+        tsquery = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        rank = func.ts_rank(vector, tsquery, type_=Float)
+        snippet = func.ts_headline(
+            "simple",
+            func.concat_ws(" ", Product.name, Product.description),
+            tsquery,
+            f"StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, "
+            f"MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}",
+            type_=String,
+        )
+        return vector.op("@@")(tsquery), rank, snippet, None
+    if dialect == "sqlite":
+        fts = literal_column("product_fts")
+        match = fts.op("MATCH")(" AND ".join(f'"{term}"*' for term in terms))
+        # bm25 scores better matches lower; a name match weighs 4x a description one
+        rank = -func.bm25(fts, 4.0, 1.0, type_=Float)
+        snippet = func.snippet(fts, -1, SNIPPET_START, SNIPPET_STOP, "…", SNIPPET_WORDS, type_=String)
+        return match, rank, snippet, (_product_fts, _product_fts.c.rowid == Product.id)
+    raise NotImplementedError(f"Full-text search is not available on {dialect}")
+
+
+def _index_product(product: Product) -> None:
+    if not product_index.enabled:
+        return
+    product_index.add(
+        product.id,
+        product.name,
+        product.description,
+        [variation.color_name for variation in product.variations],
+    )
+
+
+def _index_page(query: str, *, cursor: Optional[str], skip: int, limit: int) -> List[Hit]:
+    if cursor:
+        return product_index.search(query, after=SEARCH_KEYSET.decode(cursor), limit=limit)
+    return product_index.search(query, skip=skip, limit=limit)
+
+
+def _highlight(product: Product, terms: List[str]) -> Optional[str]:
+    """Snippet of the name or description around the first word the query finds"""
+    for text in (product.name, product.description):
+        # Words at odd positions, the text between them at even ones
+        parts = re.split(r"([^\W_]+)", text or "")
+        found = [
+            i for i in range(1, len(parts), 2)
+            if any(matches(parts[i].lower(), term) for term in terms)
+        ]
+        if not found:
+            continue
+        first = max(1, found[0] - SNIPPET_WORDS)
+        last = min(len(parts), first + 2 * SNIPPET_WORDS)
+        snippet = "".join(
+            f"{SNIPPET_START}{part}{SNIPPET_STOP}" if i in found else part
+            for i, part in enumerate(parts[first:last], first)
+        )
+        return f"{'…' if first > 1 else ''}{snippet}{'…' if last < len(parts) else ''}"
+    return None
+
+
+def _index_hits(hits: List[Hit], products: List[Product], query: str) -> List[Product]:
+    # A product another worker deleted may still be in this worker's index
+    by_id = {product.id: product for product in products}
+    terms = tokenize(query)
+    return _search_hits(
+        (by_id[product_id], score, _highlight(by_id[product_id], terms))
+        for score, product_id in hits
+        if product_id in by_id
+    )
+
+
+def _search_hits(rows) -> List[Product]:
+    products = []
+    for product, rank, snippet in rows:
+        setattr(product, SEARCH_RANK, rank)
+        setattr(product, SEARCH_SNIPPET, snippet)
+        products.append(product)
+    return products
+
+
+def _validators_query(product_id: Optional[int], category_id: Optional[int]):
+    """
+    Fingerprint of the products a response renders, with their variations,
+    images and the categories they take `category_name` from
+    """
+    if product_id is not None:
+        criteria = (Product.id == product_id,)
+    elif category_id is not None:
+        criteria = (Product.category_id == category_id,)
+    else:
+        return fingerprint((Product, ()), (ProductVariation, ()), (ProductImage, ()), (Category, ()))
+    products = select(Product.id).where(*criteria)
+    return fingerprint(
+        (Product, criteria),
+        (ProductVariation, (ProductVariation.product_id.in_(products),)),
+        (ProductImage, (ProductImage.product_id.in_(products),)),
+        (Category, (Category.id.in_(select(Product.category_id).where(*criteria)),)),
+    )
+
+
+def _validators(row, product_id: Optional[int]) -> Validators:
+    # The first column counts the requested products
+    return Validators.from_row(row, exists=product_id is None or row[0] > 0)
+
+
+def _importer(upsert: bool) -> CatalogImporter:
+    return CatalogImporter(
+        upsert=upsert,
+        batch_size=settings.CATALOG_IMPORT_BATCH_SIZE,
+        max_errors=settings.CATALOG_IMPORT_MAX_ERRORS,
+    )
 
 
 class CRUDProduct(CRUDBase[Product, ProductCreate, ProductUpdate]):
+    def validators(
+        self, db: Session, *, product_id: Optional[int] = None, category_id: Optional[int] = None
+    ) -> Validators:
+        """ETag and Last-Modified of product responses, without loading any"""
+        row = db.execute(_validators_query(product_id, category_id)).one()
+        return _validators(row, product_id)
+
+    def get(
+        self, db: Session, id: Any, *, load: ProductLoad = ProductLoad.RESPONSE
+    ) -> Optional[Product]:
+        return (
+            db.query(Product)
+            .options(*PRODUCT_LOAD_PLANS[load])
+            .filter(Product.id == id)
+            .first()
+        )
+
+    def get_multi(
+        self, db: Session, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+        load: ProductLoad = ProductLoad.RESPONSE
+    ) -> List[Product]:
+        query = db.query(Product).options(*PRODUCT_LOAD_PLANS[load])
+        return self.keyset.paginate(query, cursor=cursor, skip=skip, limit=limit).all()
+
     def get_by_name(self, db: Session, *, name: str) -> Optional[Product]:
         return db.query(Product).filter(Product.name == name).first()
 
     def get_multi_by_category(
-        self, db: Session, *, category_id: int, skip: int = 0, limit: int = 100
+        self, db: Session, *, category_id: int, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None, load: ProductLoad = ProductLoad.RESPONSE
     ) -> List[Product]:
-        return (
+        query = (
             db.query(Product)
+            .options(*PRODUCT_LOAD_PLANS[load])
             .filter(Product.category_id == category_id)
-            .offset(skip)
-            .limit(limit)
-            .all()
         )
+        return self.keyset.paginate(query, cursor=cursor, skip=skip, limit=limit).all()
 
     def create_with_variations(
         self, db: Session, *, obj_in: ProductCreate
@@ -30,27 +224,47 @@ class CRUDProduct(CRUDBase[Product, ProductCreate, ProductUpdate]):
         db.add(db_obj)
         db.flush()  # Flush to get the product ID
 
-        # Create variations
-        for variation_in in obj_in.variations:
-            variation = ProductVariation(
-                product_id=db_obj.id,
-                **variation_in.model_dump()
-            )
-            db.add(variation)
-        db.flush()
-
-        # Create images
-        for image_in in obj_in.images:
-            image = ProductImage(
-                product_id=db_obj.id,
-                variation_id=image_in.variation_id,
-                **image_in.model_dump(exclude={"variation_id"})
-            )
-            db.add(image)
+        # Create variations and images, a multi-row insert each
+        bulk_insert(db, ProductVariation, [
+            {**variation_in.model_dump(), "product_id": db_obj.id}
+            for variation_in in obj_in.variations
+        ])
+        bulk_insert(db, ProductImage, [
+            {**image_in.model_dump(), "product_id": db_obj.id}
+            for image_in in obj_in.images
+        ])
+
+        db.commit()
+        catalog_cache.invalidate_product(db_obj.id, db_obj.category_id)
+        product = self.get(db, id=db_obj.id)
+        _index_product(product)
+        return product
 
+    def add_image(
+        self, db: Session, *, product: Product, obj_in: ProductImageCreate
+    ) -> ProductImage:
+        image = ProductImage(**obj_in.model_dump(), product_id=product.id)
+        db.add(image)
         db.commit()
-        db.refresh(db_obj)
-        return db_obj
+        catalog_cache.invalidate_product(product.id, product.category_id)
+        return image
+
+    def import_products(
+        self, db: Session, *, file: BinaryIO, format: ImportFormat, upsert: bool = False
+    ) -> ProductImportReport:
+        """
+        Create (or with `upsert`, update by name) every valid product of an
+        NDJSON or CSV upload, committing each batch. Returns what was written
+        and every rejected row.
+        """
+        importer = _importer(upsert)
+        for batch in importer.batches(PARSERS[format](file)):
+            written = importer.ingest(db, batch)
+            db.commit()
+            catalog_cache.invalidate_products(written.updated_ids, written.category_ids)
+            stock.forget(written.restocked_ids)
+            written.index()
+        return importer.report
 
     def update_with_variations(
         self,
@@ -61,6 +275,7 @@ class CRUDProduct(CRUDBase[Product, ProductCreate, ProductUpdate]):
         variations: Optional[List[ProductVariationCreate]] = None
     ) -> Product:
         # Update product
+        old_category_id = db_obj.category_id
         update_data = obj_in.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_obj, field, value)
@@ -73,31 +288,49 @@ class CRUDProduct(CRUDBase[Product, ProductCreate, ProductUpdate]):
             ).delete()
 
             # Create new variations
-            for variation_in in variations:
-                variation = ProductVariation(
-                    product_id=db_obj.id,
-                    **variation_in.model_dump()
-                )
-                db.add(variation)
+            bulk_insert(db, ProductVariation, [
+                {**variation_in.model_dump(), "product_id": db_obj.id}
+                for variation_in in variations
+            ])
+            # The loaded collection still holds the deleted rows
+            db.expire(db_obj, ["variations"])
 
         db.add(db_obj)
         db.commit()
-        db.refresh(db_obj)
-        return db_obj
+        catalog_cache.invalidate_product(db_obj.id, old_category_id, db_obj.category_id)
+        product = self.get(db, id=db_obj.id)
+        _index_product(product)
+        return product
 
     def search(
-        self, db: Session, *, query: str, skip: int = 0, limit: int = 100
+        self, db: Session, *, query: str, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None, load: ProductLoad = ProductLoad.RESPONSE
     ) -> List[Product]:
-        search_query = f"%{query}%"
-        return (
-            db.query(Product)
-            .filter(
-                (Product.name.ilike(search_query)) |
-                (Product.description.ilike(search_query))
+        """Full-text search over names and descriptions, most relevant first"""
+        if product_index.enabled:
+            hits = _index_page(query, cursor=cursor, skip=skip, limit=limit)
+            if not hits:
+                return []
+            products = (
+                db.query(Product)
+                .options(*PRODUCT_LOAD_PLANS[load])
+                .filter(Product.id.in_([product_id for _, product_id in hits]))
+                .all()
             )
-            .offset(skip)
-            .limit(limit)
-            .all()
+            return _index_hits(hits, products, query)
+
+        terms = tokenize(query)
+        if not terms:
+            return []
+        match, rank, snippet, fts = _search_clauses(db.get_bind().dialect.name, terms)
+        rank = rank.label(SEARCH_RANK)
+        products = db.query(Product, rank, snippet.label(SEARCH_SNIPPET))
+        if fts:
+            products = products.join(*fts)
+        products = products.options(*PRODUCT_LOAD_PLANS[load]).filter(match)
+        keyset = Keyset(rank, Product.id, descending=True)
+        return _search_hits(
+            keyset.paginate(products, cursor=cursor, skip=skip, limit=limit).all()
         )
 
     def get_available_variations(
@@ -112,5 +345,231 @@ class CRUDProduct(CRUDBase[Product, ProductCreate, ProductUpdate]):
             .all()
         )
 
+    def rebuild_search_index(self, db: Session) -> int:
+        """Load every product into the in-process search index"""
+        product_index.clear()
+        query = db.query(Product).options(selectinload(Product.variations))
+        cursor = None
+        while True:
+            products = self.keyset.paginate(query, cursor=cursor, limit=INDEX_BATCH).all()
+            for product in products:
+                _index_product(product)
+            cursor = self.keyset.next_cursor(products, INDEX_BATCH)
+            if cursor is None:
+                return len(product_index)
+
+    def remove(self, db: Session, *, id: int) -> Product:
+        obj = super().remove(db, id=id)
+        catalog_cache.invalidate_product(obj.id, obj.category_id)
+        product_index.remove(obj.id)
+        return obj
+
+
+class AsyncCRUDProduct(AsyncCRUDBase[Product, ProductCreate, ProductUpdate]):
+    # An AsyncSession cannot lazy load during response serialization, so
+    # anything returned to an endpoint must use the RESPONSE plan.
+
+    async def validators(
+        self, db: AsyncSession, *, product_id: Optional[int] = None,
+        category_id: Optional[int] = None
+    ) -> Validators:
+        result = await db.execute(_validators_query(product_id, category_id))
+        return _validators(result.one(), product_id)
+
+    async def get(
+        self, db: AsyncSession, id: Any, *, load: ProductLoad = ProductLoad.RESPONSE
+    ) -> Optional[Product]:
+        result = await db.execute(
+            select(Product)
+            .options(*PRODUCT_LOAD_PLANS[load])
+            .where(Product.id == id)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalars().first()
+
+    async def get_multi(
+        self, db: AsyncSession, *, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+        load: ProductLoad = ProductLoad.RESPONSE
+    ) -> List[Product]:
+        query = select(Product).options(*PRODUCT_LOAD_PLANS[load])
+        result = await db.execute(
+            self.keyset.paginate(query, cursor=cursor, skip=skip, limit=limit)
+        )
+        return list(result.scalars().all())
+
+    async def get_by_name(self, db: AsyncSession, *, name: str) -> Optional[Product]:
+        result = await db.execute(select(Product).where(Product.name == name))
+        return result.scalars().first()
+
+    async def get_multi_by_category(
+        self, db: AsyncSession, *, category_id: int, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None, load: ProductLoad = ProductLoad.RESPONSE
+    ) -> List[Product]:
+        query = (
+            select(Product)
+            .options(*PRODUCT_LOAD_PLANS[load])
+            .where(Product.category_id == category_id)
+        )
+        result = await db.execute(
+            self.keyset.paginate(query, cursor=cursor, skip=skip, limit=limit)
+        )
+        return list(result.scalars().all())
+
+    async def create_with_variations(
+        self, db: AsyncSession, *, obj_in: ProductCreate
+    ) -> Product:
+        # Create product
+        obj_in_data = obj_in.model_dump(exclude={"variations", "images"})
+        db_obj = Product(**obj_in_data)
+        db.add(db_obj)
+        await db.flush()  # Flush to get the product ID
+
+        # Create variations and images, a multi-row insert each
+        await async_bulk_insert(db, ProductVariation, [
+            {**variation_in.model_dump(), "product_id": db_obj.id}
+            for variation_in in obj_in.variations
+        ])
+        await async_bulk_insert(db, ProductImage, [
+            {**image_in.model_dump(), "product_id": db_obj.id}
+            for image_in in obj_in.images
+        ])
+
+        await db.commit()
+        await async_catalog_cache.invalidate_product(db_obj.id, db_obj.category_id)
+        product = await self.get(db, id=db_obj.id)
+        _index_product(product)
+        return product
+
+    async def add_image(
+        self, db: AsyncSession, *, product: Product, obj_in: ProductImageCreate
+    ) -> ProductImage:
+        image = ProductImage(**obj_in.model_dump(), product_id=product.id)
+        db.add(image)
+        await db.commit()
+        await async_catalog_cache.invalidate_product(product.id, product.category_id)
+        return image
+
+    async def import_products(
+        self, db: AsyncSession, *, file: BinaryIO, format: ImportFormat, upsert: bool = False
+    ) -> ProductImportReport:
+        """Async counterpart of `CRUDProduct.import_products`"""
+        importer = _importer(upsert)
+        # Parsing reads the spooled upload in between batches; the writes
+        # run on the session's connection through run_sync
+        for batch in importer.batches(PARSERS[format](file)):
+            written = await db.run_sync(importer.ingest, batch)
+            await db.commit()
+            await async_catalog_cache.invalidate_products(written.updated_ids, written.category_ids)
+            stock.forget(written.restocked_ids)
+            written.index()
+        return importer.report
+
+    async def update_with_variations(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: Product,
+        obj_in: ProductUpdate,
+        variations: Optional[List[ProductVariationCreate]] = None
+    ) -> Product:
+        # Update product
+        old_category_id = db_obj.category_id
+        update_data = obj_in.model_dump(exclude_unset=True)
+        for field, value in update_data.items():
+            setattr(db_obj, field, value)
+
+        # Update variations if provided
+        if variations:
+            # Delete existing variations
+            await db.execute(
+                delete(ProductVariation).where(
+                    ProductVariation.product_id == db_obj.id
+                )
+            )
+
+            # Create new variations
+            await async_bulk_insert(db, ProductVariation, [
+                {**variation_in.model_dump(), "product_id": db_obj.id}
+                for variation_in in variations
+            ])
+            # The loaded collection still holds the deleted rows
+            db.expire(db_obj, ["variations"])
+
+        db.add(db_obj)
+        await db.commit()
+        await async_catalog_cache.invalidate_product(
+            db_obj.id, old_category_id, db_obj.category_id
+        )
+        product = await self.get(db, id=db_obj.id)
+        _index_product(product)
+        return product
+
+    async def search(
+        self, db: AsyncSession, *, query: str, skip: int = 0, limit: int = 100,
+        cursor: Optional[str] = None, load: ProductLoad = ProductLoad.RESPONSE
+    ) -> List[Product]:
+        """Full-text search over names and descriptions, most relevant first"""
+        if product_index.enabled:
+            hits = _index_page(query, cursor=cursor, skip=skip, limit=limit)
+            if not hits:
+                return []
+            result = await db.execute(
+                select(Product)
+                .options(*PRODUCT_LOAD_PLANS[load])
+                .where(Product.id.in_([product_id for _, product_id in hits]))
+            )
+            return _index_hits(hits, list(result.scalars().all()), query)
+
+        terms = tokenize(query)
+        if not terms:
+            return []
+        match, rank, snippet, fts = _search_clauses(db.get_bind().dialect.name, terms)
+        rank = rank.label(SEARCH_RANK)
+        products = select(Product, rank, snippet.label(SEARCH_SNIPPET))
+        if fts:
+            products = products.join(*fts)
+        products = products.options(*PRODUCT_LOAD_PLANS[load]).where(match)
+        keyset = Keyset(rank, Product.id, descending=True)
+        result = await db.execute(
+            keyset.paginate(products, cursor=cursor, skip=skip, limit=limit)
+        )
+        return _search_hits(result.all())
+
+    async def get_available_variations(
+        self, db: AsyncSession, *, product_id: int
+    ) -> List[ProductVariation]:
+        result = await db.execute(
+            select(ProductVariation).where(
+                ProductVariation.product_id == product_id,
+                ProductVariation.is_available == True
+            )
+        )
+        return list(result.scalars().all())
+
+    async def rebuild_search_index(self, db: AsyncSession) -> int:
+        """Load every product into the in-process search index"""
+        product_index.clear()
+        query = select(Product).options(selectinload(Product.variations))
+        cursor = None
+        while True:
+            result = await db.execute(
+                self.keyset.paginate(query, cursor=cursor, limit=INDEX_BATCH)
+            )
+            products = list(result.scalars().all())
+            for product in products:
+                _index_product(product)
+            cursor = self.keyset.next_cursor(products, INDEX_BATCH)
+            if cursor is None:
+                return len(product_index)
+
+    async def remove(self, db: AsyncSession, *, id: int) -> Product:
+        obj = await self.get(db, id=id)
+        await db.delete(obj)
+        await db.commit()
+        await async_catalog_cache.invalidate_product(obj.id, obj.category_id)
+        product_index.remove(obj.id)
+        return obj
+
 
-product = CRUDProduct(Product) 
\ No newline at end of file
+product = CRUDProduct(Product)
+async_product = AsyncCRUDProduct(Product) 
\ No newline at end of file
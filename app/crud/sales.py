@@ -0,0 +1,337 @@
+import enum
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from sqlalchemy import Select, delete, func, insert, literal, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.product import Product
+from app.models.sales import DailySales, ProductSales
+
+# Sales rollups
+#
+# DailySales holds revenue, units and the order count per day (the order's
+# UTC creation date) and status; ProductSales the same per product variation
+# too. Both are kept current inside the transaction that writes an order:
+# placing it adds its items under its status, and changing its status or its
+# items moves them. Each change is an upsert adding a delta, so concurrent
+# orders never overwrite each other's counts, and rows are written in key
+# order so they lock rows in the same order. Reports read only these tables,
+# so they cost as much as the days and products in range, however many
+# orders there are. `rebuild` recomputes both tables from the orders.
+#
+# ProductSales counts an order once per variation, so its orders summed over
+# a product's variations count an order holding two of them twice.
+
+
+class SalesMetric(str, enum.Enum):
+    REVENUE = "revenue"
+    UNITS = "units"
+    ORDERS = "orders"
+
+
+# product_id, variation_id, revenue and units of an order's items
+Line = Tuple[int, int, float, int]
+
+DAILY_KEY = ("day", "status")
+PRODUCT_KEY = ("day", "product_id", "variation_id", "status")
+
+
+def item_lines(items: Iterable[Dict[str, Any]]) -> List[Line]:
+    """Lines of priced order item rows, one per variation"""
+    totals: Dict[Tuple[int, int], List] = {}
+    for item in items:
+        total = totals.setdefault((item["product_id"], item["variation_id"]), [0.0, 0])
+        total[0] += item["price"] * item["quantity"]
+        total[1] += item["quantity"]
+    return [(product_id, variation_id, revenue, units) for (product_id, variation_id), (revenue, units) in totals.items()]
+
+
+def order_lines(db: Session, order_id: int) -> List[Line]:
+    """Lines of an order's stored items"""
+    rows = db.execute(
+        select(
+            OrderItem.product_id,
+            OrderItem.variation_id,
+            func.sum(OrderItem.price * OrderItem.quantity),
+            func.sum(OrderItem.quantity),
+        )
+        .where(OrderItem.order_id == order_id)
+        .group_by(OrderItem.product_id, OrderItem.variation_id)
+    ).all()
+    return [tuple(row) for row in rows]
+
+
+def _insert_for(dialect: str):
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"Sales rollups are not available on {dialect}")
+
+
+class SalesDelta:
+    """Changes to the rollups, summed per row before they are written"""
+
+    def __init__(self):
+        self.days: Dict[tuple, List] = {}
+        self.products: Dict[tuple, List] = {}
+
+    def add(self, day: date, status: OrderStatus, lines: Sequence[Line], sign: int = 1) -> None:
+        """Count (or with sign=-1, uncount) one order"""
+        totals = self.days.setdefault((day, status), [0.0, 0, 0])
+        totals[2] += sign
+        for product_id, variation_id, revenue, units in lines:
+            totals[0] += sign * revenue
+            totals[1] += sign * units
+            row = self.products.setdefault((day, product_id, variation_id, status), [0.0, 0, 0])
+            row[0] += sign * revenue
+            row[1] += sign * units
+            row[2] += sign
+
+    def write(self, db: Session) -> None:
+        insert_ = _insert_for(db.get_bind().dialect.name)
+        now = datetime.utcnow()
+        for model, key, changes in (
+            (DailySales, DAILY_KEY, self.days),
+            (ProductSales, PRODUCT_KEY, self.products),
+        ):
+            if changes:
+                db.execute(_upsert(insert_, model, key, changes, now))
+
+
+def _upsert(insert_, model: Type, key: Sequence[str], changes: Dict[tuple, List], now: datetime):
+    table = model.__table__
+    statement = insert_(table).values([
+        {
+            **dict(zip(key, values)),
+            "revenue": revenue, "units": units, "orders": orders,
+            "created_at": now, "updated_at": now,
+        }
+        for values, (revenue, units, orders) in sorted(changes.items())
+    ])
+    return statement.on_conflict_do_update(
+        index_elements=list(key),
+        set_={
+            "revenue": table.c.revenue + statement.excluded.revenue,
+            "units": table.c.units + statement.excluded.units,
+            "orders": table.c.orders + statement.excluded.orders,
+            "updated_at": statement.excluded.updated_at,
+        },
+    )
+
+
+def record_order(db: Session, order: Order, lines: Sequence[Line]) -> None:
+    """Count a new order, flushed but not committed, with the lines of its items"""
+    delta = SalesDelta()
+    delta.add(order.created_at.date(), order.status, lines)
+    delta.write(db)
+
+
+def move_order(
+    db: Session,
+    order_id: int,
+    *,
+    status: Optional[OrderStatus] = None,
+    lines: Optional[Sequence[Line]] = None,
+) -> None:
+    """
+    Move an order's counts to its new status and/or the lines of its new
+    items. Runs before either is written: the order row is locked, so two
+    changes to one order cannot both move it from the same status.
+    """
+    created_at, current = db.execute(
+        select(Order.created_at, Order.status).where(Order.id == order_id).with_for_update()
+    ).one()
+    before = order_lines(db, order_id)
+    day = created_at.date()
+    delta = SalesDelta()
+    delta.add(day, current, before, sign=-1)
+    delta.add(day, status or current, before if lines is None else lines)
+    delta.write(db)
+
+
+def rebuild(db: Session) -> Dict[str, int]:
+    """
+    Recompute both rollups from the orders, without committing. On
+    PostgreSQL the tables are locked first: orders written meanwhile wait and
+    then add their deltas to the rebuilt rows.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE dailysales, productsales IN EXCLUSIVE MODE"))
+    db.execute(delete(DailySales))
+    db.execute(delete(ProductSales))
+    now = literal(datetime.utcnow())
+    day = func.date(Order.created_at)
+    revenue = func.sum(OrderItem.price * OrderItem.quantity)
+    orders = func.count(Order.id.distinct())
+
+    # Orders without items count with no revenue
+    daily = (
+        select(
+            day, Order.status, func.coalesce(revenue, 0), func.coalesce(func.sum(OrderItem.quantity), 0),
+            orders, now, now,
+        )
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .group_by(day, Order.status)
+    )
+    products = (
+        select(
+            day, OrderItem.product_id, OrderItem.variation_id, Order.status, revenue,
+            func.sum(OrderItem.quantity), orders, now, now,
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .group_by(day, OrderItem.product_id, OrderItem.variation_id, Order.status)
+    )
+    totals = ("revenue", "units", "orders", "created_at", "updated_at")
+    days = db.execute(insert(DailySales).from_select([*DAILY_KEY, *totals], daily)).rowcount
+    rows = db.execute(insert(ProductSales).from_select([*PRODUCT_KEY, *totals], products)).rowcount
+    return {"daily_rows": days, "product_rows": rows}
+
+
+def _in_range(query: Select, model: Type, date_from, date_to, statuses) -> Select:
+    if date_from is not None:
+        query = query.where(model.day >= date_from)
+    if date_to is not None:
+        query = query.where(model.day <= date_to)
+    if statuses:
+        query = query.where(model.status.in_(statuses))
+    return query
+
+
+def _series_query(
+    date_from: Optional[date],
+    date_to: Optional[date],
+    statuses: Sequence[OrderStatus],
+    product_id: Optional[int],
+) -> Select:
+    model = DailySales if product_id is None else ProductSales
+    query = (
+        select(model.day, func.sum(model.revenue), func.sum(model.units), func.sum(model.orders))
+        .group_by(model.day)
+        # Rows all of whose orders moved to another status
+        .having(func.sum(model.orders) > 0)
+        .order_by(model.day)
+    )
+    if product_id is not None:
+        query = query.where(ProductSales.product_id == product_id)
+    return _in_range(query, model, date_from, date_to, statuses)
+
+
+def _top_query(
+    date_from: Optional[date],
+    date_to: Optional[date],
+    statuses: Sequence[OrderStatus],
+    by: SalesMetric,
+    limit: int,
+) -> Select:
+    totals = {
+        SalesMetric.REVENUE: func.sum(ProductSales.revenue),
+        SalesMetric.UNITS: func.sum(ProductSales.units),
+        SalesMetric.ORDERS: func.sum(ProductSales.orders),
+    }
+    top = _in_range(
+        select(ProductSales.product_id, *(total.label(metric.value) for metric, total in totals.items()))
+        .group_by(ProductSales.product_id)
+        .having(totals[SalesMetric.ORDERS] > 0)
+        .order_by(totals[by].desc(), ProductSales.product_id)
+        .limit(limit),
+        ProductSales, date_from, date_to, statuses,
+    ).subquery()
+    return (
+        select(top.c.product_id, Product.name, top.c.revenue, top.c.units, top.c.orders)
+        .join(Product, Product.id == top.c.product_id)
+        .order_by(top.c[by.value].desc(), top.c.product_id)
+    )
+
+
+def _point(row) -> Dict[str, Any]:
+    day, revenue, units, orders = row
+    return {"day": day, "revenue": round(revenue, 2), "units": units, "orders": orders}
+
+
+def _product(row) -> Dict[str, Any]:
+    product_id, name, revenue, units, orders = row
+    return {
+        "product_id": product_id, "name": name,
+        "revenue": round(revenue, 2), "units": units, "orders": orders,
+    }
+
+
+class CRUDSales:
+    def time_series(
+        self,
+        db: Session,
+        *,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        statuses: Sequence[OrderStatus] = (),
+        product_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Revenue, units and orders per day in [date_from, date_to] of orders
+        in one of `statuses` (any if empty), of one product if given. Days
+        without orders are left out.
+        """
+        rows = db.execute(_series_query(date_from, date_to, statuses, product_id)).all()
+        return [_point(row) for row in rows]
+
+    def top_products(
+        self,
+        db: Session,
+        *,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        statuses: Sequence[OrderStatus] = (),
+        by: SalesMetric = SalesMetric.REVENUE,
+        limit: int = 10,
+    ) -> List[Dict[str, Any]]:
+        """The `limit` products with the most `by` in [date_from, date_to]"""
+        rows = db.execute(_top_query(date_from, date_to, statuses, by, limit)).all()
+        return [_product(row) for row in rows]
+
+    def rebuild(self, db: Session) -> Dict[str, int]:
+        written = rebuild(db)
+        db.commit()
+        return written
+
+
+class AsyncCRUDSales:
+    async def time_series(
+        self,
+        db: AsyncSession,
+        *,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        statuses: Sequence[OrderStatus] = (),
+        product_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Async counterpart of `CRUDSales.time_series`"""
+        result = await db.execute(_series_query(date_from, date_to, statuses, product_id))
+        return [_point(row) for row in result.all()]
+
+    async def top_products(
+        self,
+        db: AsyncSession,
+        *,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        statuses: Sequence[OrderStatus] = (),
+        by: SalesMetric = SalesMetric.REVENUE,
+        limit: int = 10,
+    ) -> List[Dict[str, Any]]:
+        """Async counterpart of `CRUDSales.top_products`"""
+        result = await db.execute(_top_query(date_from, date_to, statuses, by, limit))
+        return [_product(row) for row in result.all()]
+
+    async def rebuild(self, db: AsyncSession) -> Dict[str, int]:
+        written = await db.run_sync(rebuild)
+        await db.commit()
+        return written
+
+
+sales = CRUDSales()
+async_sales = AsyncCRUDSales()
@@ -0,0 +1,206 @@
+import time
+from datetime import datetime
+from itertools import chain, repeat
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from sqlalchemy import Float, Select, cast, delete, extract, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.rfm import SECONDS_PER_DAY, SEGMENTS, RFMScores, RFMSegment, RFMTotals, score
+from app.crud.base import write_rows
+from app.crud.pagination import Keyset
+from app.models.order import Order, OrderStatus
+from app.models.segment import UserSegment
+
+# Customer segments
+#
+# `rebuild` reads every order that was not cancelled as (user id, creation
+# time, total) through a server-side cursor, RFM_CHUNK_SIZE rows at a time,
+# and folds each chunk into app.core.rfm's per-user arrays with NumPy: one
+# query, and no Python per order or per user except to hand the rows it
+# writes to the driver. The scores and segments replace UserSegment's rows
+# in one transaction, readers seeing the previous rebuild until it commits.
+
+EPOCH = datetime(1970, 1, 1)
+# julianday() of the Unix epoch
+EPOCH_JULIAN_DAY = 2440587.5
+
+SEGMENTS_KEYSET = Keyset(UserSegment.user_id)
+SEGMENT_COLUMNS = (
+    "user_id", "recency_days", "frequency", "monetary",
+    "recency_score", "frequency_score", "monetary_score", "segment",
+    "created_at", "updated_at",
+)
+
+
+def _epoch_seconds(dialect: str):
+    """Order.created_at (naive UTC) as seconds since the epoch"""
+    if dialect == "postgresql":
+        return cast(extract("epoch", Order.created_at), Float)
+    if dialect == "sqlite":
+        return (func.julianday(Order.created_at) - EPOCH_JULIAN_DAY) * SECONDS_PER_DAY
+    raise NotImplementedError(f"Customer segments are not available on {dialect}")
+
+
+def _chunks(db: Session, query: Select, chunk_size: int) -> Iterator[List[tuple]]:
+    """
+    The rows of `query` as plain tuples, `chunk_size` at a time, from a
+    server-side cursor on PostgreSQL (SQLite steps through its results
+    anyway). Straight from the DBAPI cursor: building a Row per order costs
+    more than fetching it. `query` may only hold literal parameters.
+    """
+    connection = db.connection()
+    statement = query.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}).string
+    dbapi_connection = connection.connection
+    if connection.dialect.driver == "psycopg2":
+        cursor = dbapi_connection.cursor("rfm_orders")
+        cursor.itersize = chunk_size
+    elif connection.dialect.driver == "asyncpg":
+        cursor = dbapi_connection.cursor(server_side=True)
+    else:
+        cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(statement)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def fold_orders(db: Session, chunk_size: int) -> RFMTotals:
+    """RFM totals of all orders that were not cancelled"""
+    query = (
+        select(Order.user_id, _epoch_seconds(db.get_bind().dialect.name), Order.total_amount)
+        .where(Order.status != OrderStatus.CANCELLED)
+    )
+    totals = RFMTotals()
+    for rows in _chunks(db, query, chunk_size):
+        chunk = np.fromiter(
+            chain.from_iterable(rows), dtype=np.float64, count=3 * len(rows)
+        ).reshape(-1, 3)
+        totals.add(chunk[:, 0].astype(np.int64), chunk[:, 1], chunk[:, 2])
+    return totals
+
+
+def write_segments(db: Session, scores: RFMScores, now: datetime, chunk_size: int) -> None:
+    """Replace UserSegment's rows with `scores`, `chunk_size` rows per write"""
+    db.execute(delete(UserSegment))
+    # Enum columns take member names
+    names = np.array([segment.name for segment in SEGMENTS], dtype=object)
+    columns = (
+        scores.user_ids, scores.recency_days, scores.frequency, scores.monetary,
+        scores.recency_score, scores.frequency_score, scores.monetary_score,
+        names[scores.segment],
+    )
+    for start in range(0, len(scores.user_ids), chunk_size):
+        values = [column[start:start + chunk_size].tolist() for column in columns]
+        write_rows(db, UserSegment.__table__, SEGMENT_COLUMNS, list(zip(*values, repeat(now), repeat(now))))
+
+
+def rebuild(db: Session, now: Optional[datetime] = None, chunk_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Recompute every customer's segment as of `now` (UTC, default the current
+    time), without committing, and return the counts and wall time of each
+    step. On PostgreSQL the table is locked first, so a second rebuild waits
+    for this one rather than interleaving with it.
+    """
+    now = now or datetime.utcnow()
+    chunk_size = chunk_size or settings.RFM_CHUNK_SIZE
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE usersegment IN EXCLUSIVE MODE"))
+    started = time.perf_counter()
+    totals = fold_orders(db, chunk_size)
+    fetched = time.perf_counter()
+    scores = score(totals, (now - EPOCH).total_seconds())
+    scored = time.perf_counter()
+    write_segments(db, scores, now, chunk_size)
+    written = time.perf_counter()
+    return {
+        "users": len(scores.user_ids),
+        "orders": totals.orders,
+        "fetch_seconds": fetched - started,
+        "score_seconds": scored - fetched,
+        "write_seconds": written - scored,
+        "seconds": written - started,
+    }
+
+
+def _segments_query(segment: Optional[RFMSegment], skip: int, limit: int, cursor: Optional[str]) -> Select:
+    query = select(UserSegment)
+    if segment is not None:
+        query = query.where(UserSegment.segment == segment)
+    return SEGMENTS_KEYSET.paginate(query, cursor=cursor, skip=skip, limit=limit)
+
+
+def _summary_query() -> Select:
+    return (
+        select(UserSegment.segment, func.count(), func.sum(UserSegment.monetary))
+        .group_by(UserSegment.segment)
+    )
+
+
+def _summary(rows) -> List[Dict[str, Any]]:
+    """In SEGMENTS order, best first"""
+    found = {segment: (users, monetary) for segment, users, monetary in rows}
+    return [
+        {"segment": segment, "users": found[segment][0], "monetary": round(found[segment][1], 2)}
+        for segment in SEGMENTS
+        if segment in found
+    ]
+
+
+class CRUDSegment:
+    def get_multi(
+        self,
+        db: Session,
+        *,
+        segment: Optional[RFMSegment] = None,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> List[UserSegment]:
+        """Customers' segments by user id, of one segment if given"""
+        return list(db.scalars(_segments_query(segment, skip, limit, cursor)))
+
+    def summary(self, db: Session) -> List[Dict[str, Any]]:
+        """Customers and their total spend per segment"""
+        return _summary(db.execute(_summary_query()).all())
+
+    def rebuild(self, db: Session, **kwargs) -> Dict[str, Any]:
+        report = rebuild(db, **kwargs)
+        db.commit()
+        return report
+
+
+class AsyncCRUDSegment:
+    async def get_multi(
+        self,
+        db: AsyncSession,
+        *,
+        segment: Optional[RFMSegment] = None,
+        skip: int = 0,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> List[UserSegment]:
+        """Async counterpart of `CRUDSegment.get_multi`"""
+        return list(await db.scalars(_segments_query(segment, skip, limit, cursor)))
+
+    async def summary(self, db: AsyncSession) -> List[Dict[str, Any]]:
+        """Async counterpart of `CRUDSegment.summary`"""
+        result = await db.execute(_summary_query())
+        return _summary(result.all())
+
+    async def rebuild(self, db: AsyncSession, **kwargs) -> Dict[str, Any]:
+        report = await db.run_sync(rebuild, **kwargs)
+        await db.commit()
+        return report
+
+
+segment = CRUDSegment()
+async_segment = AsyncCRUDSegment()
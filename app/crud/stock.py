@@ -0,0 +1,444 @@
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from sqlalchemy import case, delete, event, exists, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.cache import catalog_cache
+from app.core.config import settings
+from app.core.stock import StockCounter, stock_counter
+from app.crud.sales import move_order
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.product import Product, ProductVariation
+from app.models.stock import StockReservation
+from app.schemas.order import OrderItemCreate
+
+logger = logging.getLogger(__name__)
+
+# Stock reservations
+#
+# Placing an order takes the units of every item from stock at once, in the
+# order's transaction, or raises InsufficientStock without taking any. The
+# units an order took are kept as StockReservation rows, which expire while
+# the order is unpaid; cancelling it gives them back, and so does replacing
+# its items, before the new items are taken. Orders still unpaid when their
+# reservations expire are cancelled by `expire`,
+# which any number of workers may run at once: each locks the orders it
+# picks with SKIP LOCKED, and skips those another worker or a status change
+# holds. Variations whose stock is NULL are not tracked and never run out.
+#
+# Two backends take and give back the units:
+# - DatabaseStock: one conditional UPDATE ... WHERE stock >= wanted for all
+#   of an order's variations. The row locks it takes serialize orders of one
+#   variation until they commit; the CHECK constraint on stock backs it up.
+# - RedisStock: app.core.stock's Lua counters, so orders of a hot variation
+#   only meet in Redis. Counters change only once the database transaction
+#   has settled: units taken by an order that rolls back are given back, and
+#   units given back are counted once the cancellation commits. A Redis
+#   failure at that point is logged and leaves the counter low, never high.
+#   `flush` writes the counters' changes back to the stock column.
+#
+# Product responses show stock, so every commit that changes the stock column
+# drops the cached catalog pages of the products and categories it touched.
+
+COMMIT_ACTIONS = "stock_after_commit"
+LOAD_RETRY_SECONDS = 0.02
+ROLLBACK_ACTIONS = "stock_after_rollback"
+
+# Units taken per variation id, and the units each short one has
+Taken = Tuple[Dict[int, int], Dict[int, int]]
+
+
+class InsufficientStock(ValueError):
+    """Raised with every item of an order that is short of stock"""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _after_commit(db: Session, action: Callable[[], None]) -> None:
+    db.info.setdefault(COMMIT_ACTIONS, []).append(action)
+
+
+def _after_rollback(db: Session, action: Callable[[], None]) -> None:
+    db.info.setdefault(ROLLBACK_ACTIONS, []).append(action)
+
+
+def _run(actions: Iterable[Callable[[], None]]) -> None:
+    for action in actions:
+        try:
+            action()
+        except Exception:
+            logger.exception("Stock follow-up action failed")
+
+
+@event.listens_for(Session, "after_commit")
+def _run_commit_actions(session: Session) -> None:
+    session.info.pop(ROLLBACK_ACTIONS, None)
+    _run(session.info.pop(COMMIT_ACTIONS, ()))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _run_rollback_actions(session: Session, transaction) -> None:
+    # Also reached after a commit, which already took the actions; and when
+    # the session is closed without committing, which rolls back
+    if transaction.parent is None:
+        session.info.pop(COMMIT_ACTIONS, None)
+        _run(session.info.pop(ROLLBACK_ACTIONS, ()))
+
+
+def quantities(items: Sequence[OrderItemCreate]) -> Dict[int, int]:
+    """Units wanted per variation"""
+    wanted: Counter = Counter()
+    for item in items:
+        wanted[item.variation_id] += item.quantity
+    return dict(wanted)
+
+
+def _stock_errors(items: Sequence[OrderItemCreate], short: Mapping[int, int]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "loc": ["body", "items", index],
+            "msg": "Not enough stock",
+            "product_id": item.product_id,
+            "variation_id": item.variation_id,
+            "available": short[item.variation_id],
+        }
+        for index, item in enumerate(items)
+        if item.variation_id in short
+    ]
+
+
+def _by_variation(wanted: Mapping[int, int]):
+    return case(dict(wanted), value=ProductVariation.id)
+
+
+def _stock_changed(db: Session, variation_ids: Iterable[int]) -> None:
+    """Drop the cached catalog pages showing these variations once the transaction commits"""
+    variation_ids = list(variation_ids)
+    if not variation_ids:
+        return
+    products = db.execute(
+        select(Product.id, Product.category_id)
+        .join(ProductVariation, ProductVariation.product_id == Product.id)
+        .where(ProductVariation.id.in_(variation_ids))
+        .distinct()
+    ).all()
+    _after_commit(db, lambda: catalog_cache.invalidate_products(
+        [product_id for product_id, _ in products],
+        [category_id for _, category_id in products],
+    ))
+
+
+def _add_stock(db: Session, deltas: Mapping[int, int]) -> None:
+    """Add signed `deltas` to the stock of the tracked variations among them"""
+    if deltas:
+        _stock_changed(db, db.scalars(
+            update(ProductVariation)
+            .where(ProductVariation.id.in_(list(deltas)), ProductVariation.stock.is_not(None))
+            .values(stock=ProductVariation.stock + _by_variation(deltas))
+            .returning(ProductVariation.id)
+            .execution_options(synchronize_session=False)
+        ).all())
+
+
+class DatabaseStock:
+    def reserve(self, db: Session, wanted: Mapping[int, int]) -> Taken:
+        """
+        Take `wanted` (variation id -> units) from the tracked variations
+        among them. When any is short the caller must roll back what the
+        others gave.
+        """
+        taken = set(db.scalars(
+            update(ProductVariation)
+            .where(
+                ProductVariation.id.in_(list(wanted)),
+                ProductVariation.stock >= _by_variation(wanted),
+            )
+            .values(stock=ProductVariation.stock - _by_variation(wanted))
+            .returning(ProductVariation.id)
+            .execution_options(synchronize_session=False)
+        ))
+        if len(taken) < len(wanted):
+            short = dict(db.execute(
+                select(ProductVariation.id, ProductVariation.stock).where(
+                    ProductVariation.id.in_([id for id in wanted if id not in taken]),
+                    ProductVariation.stock.is_not(None),
+                )
+            ).all())
+            if short:
+                return {}, short
+        _stock_changed(db, taken)
+        return {id: wanted[id] for id in taken}, {}
+
+    def release(self, db: Session, units: Mapping[int, int]) -> None:
+        """Give back `units`, in the caller's transaction"""
+        _add_stock(db, units)
+
+    def flush(self, db: Session) -> int:
+        return 0
+
+    def forget(self, variation_ids: Iterable[int]) -> None:
+        pass
+
+
+class RedisStock:
+    def __init__(self, counter: StockCounter, *, load_attempts: int = 5):
+        self.counter = counter
+        self.load_attempts = load_attempts
+
+    def _load(self, db: Session, variation_ids: Sequence[int]) -> Dict[int, Optional[int]]:
+        """Load the counters of the variations that exist; returns their stock"""
+        for attempt in range(self.load_attempts):
+            if attempt:
+                # Give the write-back in flight time to finish
+                time.sleep(LOAD_RETRY_SECONDS * attempt)
+            flushes = self.counter.flushes()
+            stock = dict(db.execute(
+                select(ProductVariation.id, ProductVariation.stock)
+                .where(ProductVariation.id.in_(variation_ids))
+            ).all())
+            if not stock or self.counter.load(stock, flushes):
+                return stock
+        raise RuntimeError("Stock counters kept changing while loading")
+
+    def reserve(self, db: Session, wanted: Mapping[int, int]) -> Taken:
+        """Same as `DatabaseStock.reserve`; given back if the transaction rolls back"""
+        # Begin the transaction, so there is one to roll back and give them
+        # back even when every counter was loaded already
+        db.connection()
+        wanted = dict(wanted)
+        for _ in range(self.load_attempts):
+            reservation = self.counter.reserve(wanted)
+            if not reservation.missing:
+                break
+            loaded = self._load(db, reservation.missing)
+            # Variations that do not exist get no counter; pricing rejects them
+            for id in reservation.missing:
+                if id not in loaded:
+                    del wanted[id]
+        else:
+            raise RuntimeError("Stock counters kept disappearing")
+        taken = {id: wanted[id] for id in reservation.taken}
+        if taken:
+            _after_rollback(db, lambda: self.counter.release(taken))
+        return taken, reservation.short
+
+    def release(self, db: Session, units: Mapping[int, int]) -> None:
+        """Give back `units` once the caller's transaction commits"""
+        if units:
+            _after_commit(db, lambda: self.counter.release(units))
+
+    def flush(self, db: Session) -> int:
+        """Write the counters' changes back to the stock column; returns the variations updated"""
+        batch = self.counter.take_writeback()
+        if not batch:
+            return 0
+        deltas = {id: delta for id, delta in batch.items() if delta}
+        _add_stock(db, deltas)
+        db.commit()
+        self.counter.finish_writeback()
+        return len(deltas)
+
+    def forget(self, variation_ids: Iterable[int]) -> None:
+        self.counter.forget(variation_ids)
+
+
+def _expires_at(status: OrderStatus, now: datetime) -> Optional[datetime]:
+    if status != OrderStatus.CREATED:
+        return None
+    return now + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+
+
+def backend_for(name: str):
+    if name == "database":
+        return DatabaseStock()
+    if name == "redis":
+        return RedisStock(stock_counter)
+    raise ValueError(f"Unknown stock backend {name}")
+
+
+class CRUDStock:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def reserve(self, db: Session, *, items: Sequence[OrderItemCreate]) -> Dict[int, int]:
+        """
+        Take the units of every item, or raise InsufficientStock listing each
+        item short of stock. Returns the units taken per tracked variation.
+        """
+        taken, short = self.backend.reserve(db, quantities(items))
+        if short:
+            raise InsufficientStock(_stock_errors(items, short))
+        return taken
+
+    def hold(
+        self, db: Session, *, order_id: int, taken: Mapping[int, int],
+        status: OrderStatus = OrderStatus.CREATED, now: Optional[datetime] = None
+    ) -> None:
+        """Record the units an order took; they expire while its status is CREATED"""
+        now = now or datetime.utcnow()
+        expires_at = _expires_at(status, now)
+        db.add_all([
+            StockReservation(
+                order_id=order_id, variation_id=variation_id, quantity=quantity,
+                expires_at=expires_at, created_at=now, updated_at=now,
+            )
+            for variation_id, quantity in sorted(taken.items())
+        ])
+
+    def release(self, db: Session, *, order_ids: Sequence[int]) -> Dict[int, int]:
+        """Give back what orders hold and drop their reservations; returns the units"""
+        units = dict(db.execute(
+            select(StockReservation.variation_id, func.sum(StockReservation.quantity))
+            .where(StockReservation.order_id.in_(order_ids))
+            .group_by(StockReservation.variation_id)
+        ).all())
+        self.backend.release(db, units)
+        db.execute(delete(StockReservation).where(StockReservation.order_id.in_(order_ids)))
+        return units
+
+    def settle(
+        self, db: Session, *, order_id: int, status: Optional[OrderStatus] = None,
+        items: Optional[Sequence[OrderItemCreate]] = None
+    ) -> None:
+        """
+        Follow an order to `status` (None keeps it) and, given `items`, to
+        new items. Cancelling gives back what it took, replacing its items
+        gives it back and takes the new ones, and an order no longer cancelled
+        takes its items again, raising InsufficientStock if it cannot.
+
+        Locks the order row, and runs before pricing and move_order, so
+        variations are locked before sales rollups as when an order is placed.
+        """
+        previous = db.scalar(select(Order.status).where(Order.id == order_id).with_for_update())
+        status = status or previous
+        holds = previous != OrderStatus.CANCELLED
+        if holds and (status == OrderStatus.CANCELLED or items is not None):
+            self.release(db, order_ids=[order_id])
+            holds = False
+        if holds:
+            db.execute(
+                update(StockReservation)
+                .where(StockReservation.order_id == order_id)
+                .values(expires_at=_expires_at(status, datetime.utcnow()))
+                .execution_options(synchronize_session=False)
+            )
+        elif status != OrderStatus.CANCELLED:
+            if items is None:
+                items = db.execute(
+                    select(OrderItem.product_id, OrderItem.variation_id, OrderItem.quantity)
+                    .where(OrderItem.order_id == order_id)
+                    .order_by(OrderItem.id)
+                ).all()
+            taken = self.reserve(db, items=items)
+            self.hold(db, order_id=order_id, taken=taken, status=status)
+
+    def expire(self, db: Session, *, now: Optional[datetime] = None, limit: Optional[int] = None) -> int:
+        """
+        Cancel up to `limit` unpaid orders whose reservations expired, giving
+        their units back, and commit. Returns how many were cancelled.
+        """
+        now = now or datetime.utcnow()
+        order_ids = list(db.scalars(
+            select(Order.id)
+            .where(
+                Order.status == OrderStatus.CREATED,
+                exists().where(StockReservation.order_id == Order.id, StockReservation.expires_at <= now),
+            )
+            .order_by(Order.id)
+            .limit(limit or settings.STOCK_SWEEP_BATCH)
+            .with_for_update(skip_locked=True, of=Order)
+        ))
+        if not order_ids:
+            db.rollback()
+            return 0
+        self.release(db, order_ids=order_ids)
+        for order_id in order_ids:
+            move_order(db, order_id, status=OrderStatus.CANCELLED)
+        db.execute(
+            update(Order)
+            .where(Order.id.in_(order_ids))
+            .values(status=OrderStatus.CANCELLED, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return len(order_ids)
+
+    def expire_all(self, db: Session, *, now: Optional[datetime] = None) -> int:
+        """Run `expire` batch after batch until no expired order is left"""
+        total = 0
+        while True:
+            cancelled = self.expire(db, now=now)
+            total += cancelled
+            if cancelled < settings.STOCK_SWEEP_BATCH:
+                return total
+
+    def set_stock(self, db: Session, *, variation_id: int, stock: Optional[int]) -> Optional[ProductVariation]:
+        """Set a variation's units left to order (None stops tracking them), and commit"""
+        variation = db.get(ProductVariation, variation_id, with_for_update=True)
+        if variation is None:
+            return None
+        variation.stock = stock
+        _stock_changed(db, [variation_id])
+        db.commit()
+        self.forget([variation_id])
+        db.refresh(variation)
+        return variation
+
+    def forget(self, variation_ids: Iterable[int]) -> None:
+        """After variations' stock was set, reload what the backend keeps of it"""
+        self.backend.forget(variation_ids)
+
+    def flush(self, db: Session) -> int:
+        return self.backend.flush(db)
+
+
+def jobs(
+    session_factory: Callable[[], Session],
+    *,
+    sweep_seconds: float = settings.STOCK_SWEEP_SECONDS,
+    writeback_seconds: float = settings.STOCK_WRITEBACK_SECONDS,
+) -> List[Tuple[float, Callable[[], int]]]:
+    """
+    Upkeep to run periodically, as (interval in seconds, job) pairs, leaving
+    out those switched off with 0. Each job opens its own session.
+    """
+
+    def expire() -> int:
+        with session_factory() as db:
+            return stock.expire_all(db)
+
+    def flush() -> int:
+        with session_factory() as db:
+            return stock.flush(db)
+
+    scheduled = []
+    if sweep_seconds > 0:
+        scheduled.append((sweep_seconds, expire))
+    if isinstance(stock.backend, RedisStock) and writeback_seconds > 0:
+        scheduled.append((writeback_seconds, flush))
+    return scheduled
+
+
+class AsyncCRUDStock:
+    # Orders reach the backend through run_sync on their session; the
+    # counters' Redis calls are short and made from that thread
+
+    def __init__(self, crud: CRUDStock):
+        self.crud = crud
+
+    async def set_stock(
+        self, db: AsyncSession, *, variation_id: int, stock: Optional[int]
+    ) -> Optional[ProductVariation]:
+        """Async counterpart of `CRUDStock.set_stock`"""
+        return await db.run_sync(self.crud.set_stock, variation_id=variation_id, stock=stock)
+
+
+stock = CRUDStock(backend_for(settings.STOCK_BACKEND))
+async_stock = AsyncCRUDStock(stock)
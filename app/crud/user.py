@@ -1,7 +1,15 @@
 from typing import Any, Dict, Optional, Union
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.security import get_password_hash, verify_password
-from app.crud.base import CRUDBase
+from app.core.principal_cache import async_principal_cache, principal_cache
+from app.core.security import (
+    async_get_password_hash,
+    async_verify_and_update_password,
+    get_password_hash,
+    verify_and_update_password,
+)
+from app.crud.base import AsyncCRUDBase, CRUDBase
 from app.models.user import User
 from app.schemas.user import UserCreate, UserUpdate
 
@@ -34,14 +42,84 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             hashed_password = get_password_hash(update_data["password"])
             del update_data["password"]
             update_data["hashed_password"] = hashed_password
-        return super().update(db, db_obj=db_obj, obj_in=update_data)
+        db_obj = super().update(db, db_obj=db_obj, obj_in=update_data)
+        principal_cache.invalidate(db_obj.id)
+        return db_obj
+
+    def remove(self, db: Session, *, id: int) -> User:
+        obj = super().remove(db, id=id)
+        principal_cache.invalidate(id)
+        return obj
 
     def authenticate(self, db: Session, *, email: str, password: str) -> Optional[User]:
         user = self.get_by_email(db, email=email)
         if not user:
             return None
-        if not verify_password(password, user.hashed_password):
+        valid, new_hash = verify_and_update_password(password, user.hashed_password)
+        if not valid:
+            return None
+        if new_hash:
+            # Stored with outdated hash settings, rehashed transparently
+            user.hashed_password = new_hash
+            db.commit()
+        return user
+
+    def is_active(self, user: User) -> bool:
+        return user.is_active
+
+    def is_admin(self, user: User) -> bool:
+        return user.role == "admin"
+
+
+class AsyncCRUDUser(AsyncCRUDBase[User, UserCreate, UserUpdate]):
+    async def get_by_email(self, db: AsyncSession, *, email: str) -> Optional[User]:
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalars().first()
+
+    async def create(self, db: AsyncSession, *, obj_in: UserCreate) -> User:
+        db_obj = User(
+            email=obj_in.email,
+            hashed_password=await async_get_password_hash(obj_in.password),
+            full_name=obj_in.full_name,
+            phone=obj_in.phone,
+            role=obj_in.role,
+        )
+        db.add(db_obj)
+        await db.commit()
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update(
+        self, db: AsyncSession, *, db_obj: User, obj_in: Union[UserUpdate, Dict[str, Any]]
+    ) -> User:
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.model_dump(exclude_unset=True)
+        if update_data.get("password"):
+            hashed_password = await async_get_password_hash(update_data["password"])
+            del update_data["password"]
+            update_data["hashed_password"] = hashed_password
+        db_obj = await super().update(db, db_obj=db_obj, obj_in=update_data)
+        await async_principal_cache.invalidate(db_obj.id)
+        return db_obj
+
+    async def remove(self, db: AsyncSession, *, id: int) -> User:
+        obj = await super().remove(db, id=id)
+        await async_principal_cache.invalidate(id)
+        return obj
+
+    async def authenticate(self, db: AsyncSession, *, email: str, password: str) -> Optional[User]:
+        user = await self.get_by_email(db, email=email)
+        if not user:
+            return None
+        valid, new_hash = await async_verify_and_update_password(password, user.hashed_password)
+        if not valid:
             return None
+        if new_hash:
+            # Stored with outdated hash settings, rehashed transparently
+            user.hashed_password = new_hash
+            await db.commit()
         return user
 
     def is_active(self, user: User) -> bool:
@@ -51,4 +129,5 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         return user.role == "admin"
 
 
-user = CRUDUser(User) 
\ No newline at end of file
+user = CRUDUser(User)
+async_user = AsyncCRUDUser(User) 
\ No newline at end of file
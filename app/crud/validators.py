@@ -0,0 +1,80 @@
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+
+from fastapi import Response
+from sqlalchemy import Select, func, select
+
+# Conditional GET validators
+#
+# A catalog response is fingerprinted by the row count and the latest
+# `updated_at` of every table it renders, fetched in one aggregate statement
+# before anything is loaded. Inserts and updates move `updated_at` and
+# deletes change a count, so every write to those rows gives a new ETag. The
+# fingerprint is taken before the body is read, so a body is never older than
+# its ETag, and cached bodies are only served under the ETag of the read that
+# rendered them (see app/core/cache.py): a write racing the request can only
+# make a client fetch the body once more, never keep a stale one.
+
+# (model, WHERE criteria) of the rows a response renders
+Scope = Tuple[Any, Sequence[Any]]
+
+
+def fingerprint(*scopes: Scope) -> Select:
+    columns = []
+    for model, criteria in scopes:
+        columns.append(select(func.count()).select_from(model).where(*criteria).scalar_subquery())
+        columns.append(select(func.max(model.updated_at)).where(*criteria).scalar_subquery())
+    return select(*columns)
+
+
+@dataclass(frozen=True)
+class Validators:
+    etag: str
+    last_modified: Optional[datetime]
+    # False when the requested resource has no current representation
+    exists: bool = True
+
+    @classmethod
+    def from_row(cls, row: Sequence[Any], *, exists: bool = True) -> "Validators":
+        digest = hashlib.sha1(repr(tuple(row)).encode()).hexdigest()[:24]
+        stamps = [value for value in row if isinstance(value, datetime)]
+        return cls(f'"{digest}"', max(stamps) if stamps else None, exists)
+
+    def headers(self) -> Dict[str, str]:
+        # Responses depend on the caller's token, so only the client may
+        # store them, and it has to revalidate every time
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(
+                self.last_modified.replace(tzinfo=timezone.utc), usegmt=True
+            )
+        return headers
+
+    def not_modified(self, request_headers: Mapping[str, str]) -> bool:
+        """Whether the request's If-None-Match (or else If-Modified-Since) still holds"""
+        # Not even `*` matches a missing resource (RFC 9110, 13.1.2); the
+        # endpoint answers 404
+        if not self.exists:
+            return False
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since and self.last_modified is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                return False
+            # HTTP dates have whole seconds
+            modified = self.last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+            return modified <= since
+        return False
+
+    def not_modified_response(self) -> Response:
+        return Response(status_code=304, headers=self.headers())
@@ -0,0 +1,11 @@
+# Import all the models, so that Base has them before being
+# imported by Alembic or used to create tables in tests
+from app.models.base import Base  # noqa
+from app.models.category import Category  # noqa
+from app.models.log import Log  # noqa
+from app.models.order import Order, OrderItem  # noqa
+from app.models.product import Product, ProductVariation, ProductImage  # noqa
+from app.models.sales import DailySales, ProductSales  # noqa
+from app.models.segment import UserSegment  # noqa
+from app.models.stock import StockReservation  # noqa
+from app.models.user import User  # noqa
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import settings
+
+# Connection pool instrumentation
+#
+# Pool events count checkouts, checkins, new connections and invalidations.
+# SQLAlchemy has no event for the start of a checkout, so the pool classes
+# below time `connect()` itself: the wait for a free connection (or a pool
+# timeout) plus the pre-ping. Counters are per worker process, like the
+# cache counters, and meant for sizing DB_POOL_SIZE/DB_MAX_OVERFLOW.
+
+# Checkout waits kept for the percentiles
+WAIT_SAMPLES = 1000
+
+
+def pool_options() -> Dict[str, Any]:
+    """create_engine arguments for the pool settings"""
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_use_lifo": settings.DB_POOL_USE_LIFO,
+    }
+
+
+class PoolMetrics:
+    """Checkout counters and wait times of one engine's pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def on_connect(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def on_checkin(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.checkins += 1
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def record_wait(self, seconds: float, timed_out: bool) -> None:
+        with self._lock:
+            self._waits.append(seconds)
+            self._wait_total += seconds
+            self._wait_max = max(self._wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def stats(self, pool: Optional[QueuePool] = None) -> Dict[str, float]:
+        with self._lock:
+            waits = sorted(self._waits)
+            waited = len(waits)
+            stats = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "wait_ms_avg": self._wait_total / (self.checkouts + self.timeouts) * 1000
+                if self.checkouts + self.timeouts else 0.0,
+                "wait_ms_p50": waits[waited // 2] * 1000 if waits else 0.0,
+                "wait_ms_p99": waits[max(int(waited * 0.99) - 1, 0)] * 1000 if waits else 0.0,
+                "wait_ms_max": self._wait_max * 1000,
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                pool_size=pool.size(),
+                overflow=pool.overflow(),
+                checked_in=pool.checkedin(),
+            )
+        return stats
+
+
+class _TimedCheckout:
+    """Times checkouts of a queue pool into its `metrics`"""
+
+    metrics: Optional[PoolMetrics] = None
+
+    def connect(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - started, timed_out)
+
+    def recreate(self):
+        # engine.dispose() swaps in a new pool, which keeps counting here
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument(engine: Engine) -> PoolMetrics:
+    """Collect pool metrics of a sync engine (or an async engine's `sync_engine`)"""
+    metrics = PoolMetrics()
+    engine.pool.metrics = metrics
+    event.listen(engine, "connect", metrics.on_connect)
+    event.listen(engine, "checkout", metrics.on_checkout)
+    event.listen(engine, "checkin", metrics.on_checkin)
+    event.listen(engine, "invalidate", metrics.on_invalidate)
+    return metrics
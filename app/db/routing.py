@@ -0,0 +1,217 @@
+import asyncio
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Sequence, Set
+
+import redis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+# Read replica routing
+#
+# Sessions of read-only endpoints are flagged with `info["replica"]`. In such
+# a session plain SELECTs, including CRUD reads and lazy loads, go to one
+# replica picked round-robin when the session first reads; flushes, DML,
+# raw SQL and SELECT ... FOR UPDATE always go to the primary. Once a session
+# commits a write (a flush, DML or raw SQL through execute(), or rows written
+# on its connection and marked with `mark_written`) it reads from the primary
+# too, and so does every read-only session of that user for `sticky_seconds`,
+# so users see their own writes while replicas catch up. The windows are
+# shared by all workers through Redis, as the end of the window on the wall
+# clock under a key expiring with it; each worker keeps the windows it has
+# seen in a local LRU and only asks Redis about users it has no open window
+# for. Without Redis, or when it fails, windows are kept per worker.
+
+logger = logging.getLogger(__name__)
+
+# Users remembered at once; the oldest windows are dropped first
+MAX_STICKY_USERS = 100000
+
+
+def sticky_key(user_id: int) -> str:
+    return f"replica:sticky:{user_id}"
+
+
+class ReplicaRouter:
+    """Round-robin replica choice and per-user read-your-writes windows, on a sync Redis client"""
+
+    def __init__(
+        self,
+        replicas: Sequence[Engine],
+        *,
+        sticky_seconds: float,
+        client: Optional[redis.Redis] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.replicas = list(replicas)
+        self.sticky_seconds = sticky_seconds
+        self.client = client
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._next = itertools.cycle(self.replicas)
+        # user id -> end of the window on `clock`, oldest first
+        self._sticky: "OrderedDict[int, float]" = OrderedDict()
+
+    @property
+    def shared(self) -> bool:
+        """Whether windows go through Redis; only worth it when there are replicas"""
+        return self.client is not None and bool(self.replicas) and self.sticky_seconds > 0
+
+    def next_replica(self) -> Engine:
+        with self._lock:
+            return next(self._next)
+
+    def _stick_locally(self, user_id: int, until: float) -> None:
+        with self._lock:
+            self._sticky[user_id] = until
+            self._sticky.move_to_end(user_id)
+            while len(self._sticky) > MAX_STICKY_USERS:
+                self._sticky.popitem(last=False)
+
+    def _sticky_locally(self, user_id: int) -> bool:
+        with self._lock:
+            until = self._sticky.get(user_id)
+            if until is None:
+                return False
+            if until <= self.clock():
+                del self._sticky[user_id]
+                return False
+            return True
+
+    def _shared_window(self, user_id: int, value: Optional[str]) -> bool:
+        """Whether a window read from Redis is still open; it is then kept locally"""
+        if value is None or float(value) <= self.clock():
+            return False
+        self._stick_locally(user_id, float(value))
+        return True
+
+    def _share(self, user_id: int, until: float) -> None:
+        try:
+            self.client.set(
+                sticky_key(user_id), repr(until), px=math.ceil(self.sticky_seconds * 1000)
+            )
+        except redis.RedisError:
+            logger.warning("Sticky window write failed for %s", user_id, exc_info=True)
+
+    def stick(self, user_id: int) -> None:
+        until = self.clock() + self.sticky_seconds
+        self._stick_locally(user_id, until)
+        if self.shared:
+            self._share(user_id, until)
+
+    def is_sticky(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return False
+        if self._sticky_locally(user_id):
+            return True
+        if not self.shared:
+            return False
+        try:
+            return self._shared_window(user_id, self.client.get(sticky_key(user_id)))
+        except redis.RedisError:
+            logger.warning("Sticky window read failed for %s", user_id, exc_info=True)
+            return False
+
+
+class AsyncReplicaRouter(ReplicaRouter):
+    """Same router on a `redis.asyncio` client, for the async read dependency"""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._writes: Set[asyncio.Future] = set()
+
+    def _share(self, user_id: int, until: float) -> None:
+        # stick() runs in after_commit, which cannot await: the write goes
+        # out as a task on the running loop, held here until it is done
+        write = asyncio.ensure_future(self._write(user_id, until))
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    async def _write(self, user_id: int, until: float) -> None:
+        try:
+            await self.client.set(
+                sticky_key(user_id), repr(until), px=math.ceil(self.sticky_seconds * 1000)
+            )
+        except redis.RedisError:
+            logger.warning("Sticky window write failed for %s", user_id, exc_info=True)
+
+    async def is_sticky(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return False
+        if self._sticky_locally(user_id):
+            return True
+        if not self.shared:
+            return False
+        try:
+            return self._shared_window(user_id, await self.client.get(sticky_key(user_id)))
+        except redis.RedisError:
+            logger.warning("Sticky window read failed for %s", user_id, exc_info=True)
+            return False
+
+
+def _replica_safe(clause) -> bool:
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class RoutingSession(Session):
+    """
+    Session that sends the plain reads of replica-flagged sessions to a
+    replica of `router`; without a router it only uses its own bind.
+    """
+
+    def __init__(self, *args, router: Optional[ReplicaRouter] = None, **kw):
+        super().__init__(*args, **kw)
+        self.router = router
+        self._replica: Optional[Engine] = None
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            self.router is not None
+            and self.router.replicas
+            and self.info.get("replica")
+            and not self._flushing
+            and _replica_safe(clause)
+        ):
+            # One replica per session, so a request reads one consistent snapshot
+            if self._replica is None:
+                self._replica = self.router.next_replica()
+            return self._replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+def mark_written(session: Session) -> None:
+    """Record a write made outside the session's flushes and execute(), e.g. on its raw connection"""
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session: Session, flush_context) -> None:
+    mark_written(session)
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _do_orm_execute(orm_execute_state) -> None:
+    # Bulk INSERT/UPDATE/DELETE and raw SQL write without a flush
+    if not orm_execute_state.is_select:
+        mark_written(orm_execute_state.session)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session: RoutingSession) -> None:
+    if not session.info.pop("wrote", False):
+        return
+    session.info["replica"] = False
+    user_id = session.info.get("user_id")
+    if session.router is not None and user_id is not None:
+        session.router.stick(user_id)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    session.info.pop("wrote", None)
@@ -1,14 +1,61 @@
+from typing import AsyncGenerator, Generator
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from app.core.cache import async_redis_client, redis_client
 from app.core.config import settings
+from app.db.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, instrument, pool_options
+from app.db.routing import AsyncReplicaRouter, ReplicaRouter, RoutingSession
 
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_engine(settings.DATABASE_URL, poolclass=InstrumentedQueuePool, **pool_options())
+pool_metrics = instrument(engine)
+replica_router = ReplicaRouter(
+    [create_engine(url, **pool_options()) for url in settings.REPLICA_URLS],
+    sticky_seconds=settings.REPLICA_STICKY_SECONDS,
+    client=redis_client,
+)
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, bind=engine, class_=RoutingSession, router=replica_router
+)
 
+# The async engine is only built when the async path is switched on, so the
+# sync deployment does not need an asyncio driver installed.
+async_engine = None
+async_pool_metrics = None
+async_replica_router = None
+AsyncSessionLocal = None
+if settings.ASYNC_DB:
+    async_engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **pool_options()
+    )
+    async_pool_metrics = instrument(async_engine.sync_engine)
+    # The routing session runs under AsyncSession, so it picks sync engines
+    async_replica_router = AsyncReplicaRouter(
+        [
+            create_async_engine(url, **pool_options()).sync_engine
+            for url in settings.ASYNC_REPLICA_URLS
+        ],
+        sticky_seconds=settings.REPLICA_STICKY_SECONDS,
+        client=async_redis_client,
+    )
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine,
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        router=async_replica_router,
+        autoflush=False,
+        expire_on_commit=False,
+    )
 
-def get_db():
+
+def get_db() -> Generator:
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,14 +1,40 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 
+from app.core.compression import CompressionMiddleware, compression_options
 from app.core.config import settings
+from app.core.media import UnsupportedMediaType, UploadTooLarge, media_storage
+from app.core.media_files import media_files
 from app.api.v1.api import api_router
+from app.api.v1.async_api import async_api_router
+from app.core.passwords import PasswordHasherBusy
+from app.core.rate_limit import RateLimitMiddleware, rate_limiter
+from app.core.search import product_index
+from app.core.security import password_hasher
+from app.crud import crud_product, crud_stock
+from app.crud.pagination import NEXT_CURSOR_HEADER, InvalidCursor
+from app.db import session
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_PREFIX}/openapi.json"
+    openapi_url=f"{settings.API_PREFIX}/openapi.json",
+    # Response models are rendered with orjson instead of json.dumps
+    default_response_class=ORJSONResponse,
 )
 
+# Innermost, so it sees the final body of every endpoint
+app.add_middleware(CompressionMiddleware, **compression_options())
+
+# Added before CORS, which then wraps it, so 429 responses carry CORS headers
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 # Set CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -16,7 +42,87 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(status_code=400, content={"detail": "Invalid cursor"})
+
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many sign-in attempts, try again shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@app.exception_handler(UploadTooLarge)
+async def upload_too_large_handler(request: Request, exc: UploadTooLarge):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+@app.exception_handler(UnsupportedMediaType)
+async def unsupported_media_type_handler(request: Request, exc: UnsupportedMediaType):
+    return JSONResponse(status_code=415, content={"detail": str(exc)})
+
+
+@app.on_event("startup")
+async def build_search_index():
+    if not product_index.enabled:
+        return
+    if settings.ASYNC_DB:
+        async with session.AsyncSessionLocal() as db:
+            await crud_product.async_product.rebuild_search_index(db)
+    else:
+        with session.SessionLocal() as db:
+            crud_product.product.rebuild_search_index(db)
+
+
+async def _repeat(seconds: float, job) -> None:
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await run_in_threadpool(job)
+        except Exception:
+            logger.exception("Stock upkeep failed")
+
+
+@app.on_event("startup")
+async def start_stock_upkeep():
+    # Expires unpaid orders and writes Redis counters back; the jobs lock
+    # what they take, so every worker may run them
+    app.state.stock_tasks = [
+        asyncio.create_task(_repeat(seconds, job))
+        for seconds, job in crud_stock.jobs(session.SessionLocal)
+    ]
+
+
+@app.on_event("shutdown")
+async def stop_stock_upkeep():
+    for task in app.state.stock_tasks:
+        task.cancel()
+    await asyncio.gather(*app.state.stock_tasks, return_exceptions=True)
+
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_media_workers():
+    media_storage.shutdown()
+    media_files.files.clear()
+
+# Served outside API_PREFIX, so not rate limited
+app.mount(settings.MEDIA_URL, media_files)
+
 # Include API router
-app.include_router(api_router, prefix=settings.API_PREFIX) 
\ No newline at end of file
+if settings.ASYNC_DB:
+    app.include_router(async_api_router, prefix=settings.API_PREFIX)
+else:
+    app.include_router(api_router, prefix=settings.API_PREFIX) 
\ No newline at end of file
@@ -0,0 +1,9 @@
+from app.models.base import Base
+from app.models.category import Category
+from app.models.log import Log, LogLevel
+from app.models.order import Order, OrderItem, OrderStatus, PaymentMethod, DeliveryMethod
+from app.models.product import Product, ProductVariation, ProductImage
+from app.models.sales import DailySales, ProductSales
+from app.models.segment import UserSegment
+from app.models.stock import StockReservation
+from app.models.user import User, UserRole
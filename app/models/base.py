@@ -1,12 +1,10 @@
 from datetime import datetime
-from typing import Any
 from sqlalchemy.ext.declarative import as_declarative, declared_attr
-from sqlalchemy import Column, DateTime
+from sqlalchemy import Column, DateTime, Integer
 
 
 @as_declarative()
 class Base:
-    id: Any
     __name__: str
 
     # Generate __tablename__ automatically
@@ -15,5 +13,6 @@ class Base:
         return cls.__name__.lower()
 
     # Common columns for all models
+    id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False) 
\ No newline at end of file
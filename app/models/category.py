@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey
+from sqlalchemy import Column, String, Integer, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
@@ -9,7 +9,15 @@ class Category(Base):
     image = Column(String)  # Path to image
     order = Column(Integer, default=0)
     parent_id = Column(Integer, ForeignKey("category.id"), nullable=True)
+    # Materialized path of ids from the root, e.g. "/1/5/12/"
+    path = Column(String, nullable=False, default="/")
     
     # Relationships
-    parent = relationship("Category", remote_side="Category.id", backref="subcategories")
-    products = relationship("Product", back_populates="category") 
\ No newline at end of file
+    parent = relationship("Category", remote_side="Category.id", back_populates="subcategories")
+    subcategories = relationship("Category", back_populates="parent", order_by="Category.order")
+    products = relationship("Product", back_populates="category") 
+
+    __table_args__ = (
+        # Prefix LIKE lookups on path for subtree queries
+        Index("ix_category_path", "path", postgresql_ops={"path": "varchar_pattern_ops"}),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Float, Enum, Text
+from sqlalchemy import Column, String, Integer, ForeignKey, Float, Enum, Index, Text
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 import enum
@@ -44,6 +44,13 @@ class Order(Base):
     user = relationship("User", backref="orders")
     items = relationship("OrderItem", back_populates="order")
 
+    __table_args__ = (
+        # Serves keyset pages of a user's orders, newest first
+        Index("ix_order_user_id_created_at_id", "user_id", "created_at", "id"),
+        # Serves the admin export, oldest first, and its date range filter
+        Index("ix_order_created_at_id", "created_at", "id"),
+    )
+
 
 class OrderItem(Base):
     order_id = Column(Integer, ForeignKey("order.id"), nullable=False)
@@ -55,4 +62,13 @@ class OrderItem(Base):
     # Relationships
     order = relationship("Order", back_populates="items")
     product = relationship("Product")
-    variation = relationship("ProductVariation") 
\ No newline at end of file
+    variation = relationship("ProductVariation")
+
+    @property
+    def product_name(self) -> str:
+        return self.product.name
+
+    __table_args__ = (
+        # Serves loading an order's items, in order
+        Index("ix_orderitem_order_id_id", "order_id", "id"),
+    ) 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Boolean, Float, Table
+from sqlalchemy import DDL, CheckConstraint, Column, String, Integer, ForeignKey, Boolean, Float, Index, Table, event
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 
@@ -11,8 +11,81 @@ class Product(Base):
     
     # Relationships
     category = relationship("Category", back_populates="products")
-    variations = relationship("ProductVariation", back_populates="product")
-    images = relationship("ProductImage", back_populates="product")
+    variations = relationship("ProductVariation", back_populates="product", cascade="all, delete-orphan")
+    images = relationship("ProductImage", back_populates="product", cascade="all, delete-orphan")
+
+    @property
+    def category_name(self) -> str:
+        return self.category.name
+
+    __table_args__ = (
+        # Serves keyset pages of a category's products
+        Index("ix_product_category_id_id", "category_id", "id"),
+        # Serves lookups by name: the duplicate check and the import's upsert key
+        Index("ix_product_name", "name"),
+    )
+
+
+# Full-text search index, created with the table. The index lives outside
+# the mapped columns because each backend builds it differently:
+# - PostgreSQL: a generated `search_vector` tsvector column (name weighted
+#   above description) with a GIN index
+# - SQLite: an external-content FTS5 table `product_fts` kept in sync by
+#   triggers
+# CRUDProduct.search queries whichever one the session is bound to.
+
+_POSTGRES_SEARCH_DDL = (
+    """
+    ALTER TABLE product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX ix_product_search_vector ON product USING gin (search_vector)",
+)
+
+_SQLITE_SEARCH_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description, content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER product_fts_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER product_fts_delete AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER product_fts_update AFTER UPDATE OF name, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+)
+
+for _statement in _POSTGRES_SEARCH_DDL:
+    event.listen(
+        Product.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql")
+    )
+for _statement in _SQLITE_SEARCH_DDL:
+    event.listen(
+        Product.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    Product.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS product_fts").execute_if(dialect="sqlite"),
+)
 
 
 class ProductVariation(Base):
@@ -21,11 +94,18 @@ class ProductVariation(Base):
     color_hex = Column(String, nullable=False)
     price = Column(Float, nullable=False)
     is_available = Column(Boolean, default=True)
+    # Units left to order, reservations taken; NULL when stock is not tracked
+    stock = Column(Integer, nullable=True)
     
     # Relationships
     product = relationship("Product", back_populates="variations")
     images = relationship("ProductImage", back_populates="variation")
 
+    __table_args__ = (
+        # The last line of defence against overselling
+        CheckConstraint("stock >= 0", name="ck_productvariation_stock"),
+    )
+
 
 class ProductImage(Base):
     product_id = Column(Integer, ForeignKey("product.id"), nullable=False)
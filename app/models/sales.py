@@ -0,0 +1,41 @@
+from sqlalchemy import Column, Date, Enum, Float, ForeignKey, Index, Integer
+from app.models.base import Base
+from app.models.order import OrderStatus
+
+
+class DailySales(Base):
+    """Revenue, units and orders of a day's orders in one status"""
+
+    day = Column(Date, nullable=False)  # the order's created_at, UTC
+    status = Column(Enum(OrderStatus), nullable=False)
+    revenue = Column(Float, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # The upsert key; serves the time series
+        Index("ux_dailysales_day_status", "day", "status", unique=True),
+    )
+
+
+class ProductSales(Base):
+    """Revenue, units and orders of one variation in a day's orders in one status"""
+
+    day = Column(Date, nullable=False)
+    product_id = Column(Integer, ForeignKey("product.id"), nullable=False)
+    variation_id = Column(Integer, ForeignKey("productvariation.id"), nullable=False)
+    status = Column(Enum(OrderStatus), nullable=False)
+    revenue = Column(Float, nullable=False, default=0)
+    units = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # The upsert key; serves the top products of a date range
+        Index(
+            "ux_productsales_day_product_id_variation_id_status",
+            "day", "product_id", "variation_id", "status",
+            unique=True,
+        ),
+        # Serves one product's time series
+        Index("ix_productsales_product_id_day", "product_id", "day"),
+    )
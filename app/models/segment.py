@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Enum, Float, ForeignKey, Index, Integer, SmallInteger
+from app.core.rfm import RFMSegment
+from app.models.base import Base
+
+
+class UserSegment(Base):
+    """A customer's RFM measures, scores and segment, as of the last rebuild (created_at)"""
+
+    user_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    recency_days = Column(Integer, nullable=False)  # since the last order
+    frequency = Column(Integer, nullable=False)
+    monetary = Column(Float, nullable=False)
+    recency_score = Column(SmallInteger, nullable=False)
+    frequency_score = Column(SmallInteger, nullable=False)
+    monetary_score = Column(SmallInteger, nullable=False)
+    segment = Column(Enum(RFMSegment), nullable=False)
+
+    __table_args__ = (
+        Index("ux_usersegment_user_id", "user_id", unique=True),
+        # Serves one segment's pages
+        Index("ix_usersegment_segment_user_id", "segment", "user_id"),
+    )
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer
+from app.models.base import Base
+
+
+class StockReservation(Base):
+    """Units of a variation an order took; an unpaid order holds them until `expires_at`"""
+
+    order_id = Column(Integer, ForeignKey("order.id"), nullable=False)
+    variation_id = Column(Integer, ForeignKey("productvariation.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    # NULL once the order is paid
+    expires_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_stockreservation_order_id", "order_id"),
+        # Serves the expiry sweep
+        Index("ix_stockreservation_expires_at", "expires_at"),
+    )
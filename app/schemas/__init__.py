@@ -0,0 +1,10 @@
+from app.schemas.category import CategoryCreate, CategoryUpdate, CategoryResponse
+from app.schemas.order import OrderCreate, OrderUpdate, OrderResponse, OrderItemCreate
+from app.schemas.product import (
+    ProductCreate,
+    ProductUpdate,
+    ProductResponse,
+    ProductVariationCreate,
+    ProductImageCreate,
+)
+from app.schemas.user import UserCreate, UserUpdate, UserResponse, Token, TokenPayload
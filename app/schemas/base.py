@@ -1,6 +1,7 @@
 from datetime import datetime
-from typing import Optional
-from pydantic import BaseModel, ConfigDict
+from functools import lru_cache
+from typing import Any, Optional
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
 
 class BaseSchema(BaseModel):
@@ -13,4 +14,15 @@ class TimestampSchema(BaseSchema):
 
 
 class BaseResponseSchema(BaseSchema):
-    id: int 
\ No newline at end of file
+    id: int 
+
+
+@lru_cache
+def _adapter(type_: Any) -> TypeAdapter:
+    return TypeAdapter(type_)
+
+
+def to_json(type_: Any, obj: Any) -> str:
+    """Serialize ORM objects through a response schema, e.g. for caching"""
+    adapter = _adapter(type_)
+    return adapter.dump_json(adapter.validate_python(obj, from_attributes=True)).decode()
@@ -9,14 +9,15 @@ class OrderItemBase(BaseModel):
     product_id: int
     variation_id: int
     quantity: conint(gt=0)
-    price: confloat(gt=0)
 
 
 class OrderItemCreate(OrderItemBase):
+    # The price is taken from the variation when the order is placed
     pass
 
 
 class OrderItemResponse(OrderItemBase, BaseResponseSchema):
+    price: confloat(gt=0)
     product_name: str
     variation: ProductVariationResponse
 
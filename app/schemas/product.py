@@ -1,5 +1,5 @@
-from typing import Optional, List
-from pydantic import BaseModel, confloat
+from typing import Any, Dict, Optional, List
+from pydantic import BaseModel, Field, confloat, conint
 from app.schemas.base import BaseResponseSchema, TimestampSchema
 
 
@@ -21,6 +21,8 @@ class ProductVariationBase(BaseModel):
     color_hex: str
     price: confloat(gt=0)
     is_available: bool = True
+    # Units left to order; None does not track stock
+    stock: Optional[conint(ge=0)] = None
 
 
 class ProductVariationCreate(ProductVariationBase):
@@ -32,6 +34,7 @@ class ProductVariationUpdate(BaseModel):
     color_hex: Optional[str] = None
     price: Optional[confloat(gt=0)] = None
     is_available: Optional[bool] = None
+    stock: Optional[conint(ge=0)] = None
 
 
 class ProductVariationResponse(ProductVariationBase, BaseResponseSchema, TimestampSchema):
@@ -60,4 +63,26 @@ class ProductUpdate(BaseModel):
 class ProductResponse(ProductBase, BaseResponseSchema, TimestampSchema):
     variations: List[ProductVariationResponse] = []
     images: List[ProductImageResponse] = []
-    category_name: str 
\ No newline at end of file
+    category_name: str
+
+
+class ProductSearchResult(ProductResponse):
+    # Relevance of the match (higher is better) and a fragment of the name or
+    # description with the matched words wrapped in <mark></mark>
+    rank: float = Field(validation_alias="search_rank")
+    snippet: Optional[str] = Field(default=None, validation_alias="search_snippet")
+
+
+class ProductImportError(BaseModel):
+    # Line of the upload the product starts on, and why it was rejected
+    row: int
+    name: Optional[str] = None
+    errors: List[Dict[str, Any]]
+
+
+class ProductImportReport(BaseModel):
+    created: int = 0
+    updated: int = 0
+    # Every rejected product; `errors` lists the first CATALOG_IMPORT_MAX_ERRORS
+    failed: int = 0
+    errors: List[ProductImportError] = []
@@ -0,0 +1,19 @@
+from datetime import date
+from pydantic import BaseModel
+
+
+class SalesPoint(BaseModel):
+    day: date
+    revenue: float
+    units: int
+    orders: int
+
+
+class TopProduct(BaseModel):
+    product_id: int
+    name: str
+    revenue: float
+    units: int
+    # Orders holding the product, counted once per variation they hold
+    orders: int
+
@@ -0,0 +1,32 @@
+from datetime import datetime
+from pydantic import BaseModel
+from app.core.rfm import RFMSegment
+from app.schemas.base import BaseSchema
+
+
+class UserSegmentResponse(BaseSchema):
+    user_id: int
+    recency_days: int
+    frequency: int
+    monetary: float
+    recency_score: int
+    frequency_score: int
+    monetary_score: int
+    segment: RFMSegment
+    # When the segments were rebuilt
+    created_at: datetime
+
+
+class SegmentSummary(BaseModel):
+    segment: RFMSegment
+    users: int
+    monetary: float
+
+
+class SegmentRebuild(BaseModel):
+    users: int
+    orders: int
+    fetch_seconds: float
+    score_seconds: float
+    write_seconds: float
+    seconds: float
@@ -0,0 +1,14 @@
+from typing import Optional
+from pydantic import BaseModel, conint
+from app.schemas.base import BaseSchema
+
+
+class VariationStockUpdate(BaseModel):
+    # Units left to order; None stops tracking the variation's stock
+    stock: Optional[conint(ge=0)]
+
+
+class VariationStock(BaseSchema):
+    id: int
+    product_id: int
+    stock: Optional[int] = None
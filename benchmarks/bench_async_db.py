@@ -0,0 +1,156 @@
+"""
+Compare the sync and async database paths under concurrent load.
+
+Both routers are mounted on their own FastAPI app and driven in-process
+through httpx's ASGI transport, so the numbers reflect the application
+(threadpool vs event loop) rather than network overhead.
+
+    python -m benchmarks.bench_async_db --requests 2000 --concurrency 100
+    python -m benchmarks.bench_async_db --sqlite   # no Postgres required
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import List
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api.v1.api import api_router
+from app.api.v1.async_api import async_api_router
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.db.base import Base
+from app.db.session import get_async_db, get_db
+from app.models.category import Category
+from app.models.user import User, UserRole
+
+SQLITE_PATH = "bench_async_db.sqlite3"
+
+
+def build_apps(sync_url: str, async_url: str, pool_size: int):
+    # Size both pools to the concurrency so connection waits do not skew
+    # the comparison; the sync path is then bound by the threadpool only.
+    pool = {"pool_size": pool_size, "max_overflow": 0}
+    sync_engine = create_engine(sync_url, **pool)
+    # aiosqlite runs on a NullPool, which takes no sizing arguments
+    async_engine = create_async_engine(
+        async_url, **({} if async_url.startswith("sqlite") else pool)
+    )
+    SyncSession = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
+    AsyncSessionFactory = async_sessionmaker(
+        async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+
+    def override_get_db():
+        db = SyncSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_async_db():
+        async with AsyncSessionFactory() as db:
+            yield db
+
+    sync_app = FastAPI()
+    sync_app.include_router(api_router, prefix=settings.API_PREFIX)
+    sync_app.dependency_overrides[get_db] = override_get_db
+
+    async_app = FastAPI()
+    async_app.include_router(async_api_router, prefix=settings.API_PREFIX)
+    async_app.dependency_overrides[get_async_db] = override_get_async_db
+
+    return sync_engine, async_engine, sync_app, async_app
+
+
+def seed(sync_engine, categories: int) -> tuple:
+    Base.metadata.drop_all(bind=sync_engine)
+    Base.metadata.create_all(bind=sync_engine)
+    db = sessionmaker(bind=sync_engine)()
+    try:
+        user = User(
+            email="bench@example.com",
+            hashed_password="x",
+            role=UserRole.USER,
+            is_active=True,
+        )
+        db.add(user)
+        db.add_all([Category(name=f"Category {i}", order=i) for i in range(categories)])
+        db.commit()
+        return user.id, [c.id for c in db.query(Category.id).all()]
+    finally:
+        db.close()
+
+
+async def run_load(app: FastAPI, token: str, paths: List[str], concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(path: str) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(path) for path in paths))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": len(paths) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--sqlite", action="store_true", help="use a local SQLite file")
+    args = parser.parse_args()
+
+    if args.sqlite:
+        sync_url = f"sqlite:///{SQLITE_PATH}"
+        async_url = f"sqlite+aiosqlite:///{SQLITE_PATH}"
+    else:
+        sync_url, async_url = settings.DATABASE_URL, settings.ASYNC_DATABASE_URL
+
+    sync_engine, async_engine, sync_app, async_app = build_apps(
+        sync_url, async_url, args.concurrency
+    )
+    user_id, category_ids = seed(sync_engine, args.categories)
+    token = create_access_token(user_id)
+    paths = [
+        f"{settings.API_PREFIX}/categories/{category_ids[i % len(category_ids)]}"
+        for i in range(args.requests)
+    ]
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {sync_engine.url.drivername}")
+    for name, app in (("sync", sync_app), ("async", async_app)):
+        result = asyncio.run(run_load(app, token, paths, args.concurrency))
+        print(
+            f"{name:>5}: {result['rps']:8.1f} req/s  "
+            f"p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms"
+        )
+
+    asyncio.run(async_engine.dispose())
+    sync_engine.dispose()
+    if args.sqlite and os.path.exists(SQLITE_PATH):
+        os.remove(SQLITE_PATH)
+
+
+if __name__ == "__main__":
+    main()
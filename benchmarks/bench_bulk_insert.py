@@ -0,0 +1,118 @@
+"""
+Compare per-object ORM inserts with multi-row INSERT ... RETURNING for product writes.
+
+Each round creates a product with `--variations` variations and `--images`
+images, once the way CRUDProduct.create_with_variations used to (an ORM
+object and `db.add` per row, flushed) and once with the bulk_insert calls it
+makes now, counting statements and timing both. The read-back and cache
+invalidation that follow the writes are the same on both paths and left out.
+
+    python -m benchmarks.bench_bulk_insert --variations 30 --images 100
+    python -m benchmarks.bench_bulk_insert --sqlite   # no Postgres required
+"""
+import argparse
+import os
+import statistics
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.crud.base import bulk_insert
+from app.db.base import Base
+from app.models.category import Category
+from app.models.product import Product, ProductImage, ProductVariation
+from app.schemas.product import ProductCreate, ProductImageCreate, ProductVariationCreate
+
+SQLITE_PATH = "bench_bulk_insert.sqlite3"
+
+
+def per_object(db: Session, obj_in: ProductCreate) -> int:
+    """The previous create_with_variations write path"""
+    db_obj = Product(**obj_in.model_dump(exclude={"variations", "images"}))
+    db.add(db_obj)
+    db.flush()
+    for variation_in in obj_in.variations:
+        db.add(ProductVariation(product_id=db_obj.id, **variation_in.model_dump()))
+    db.flush()
+    for image_in in obj_in.images:
+        db.add(ProductImage(product_id=db_obj.id, **image_in.model_dump()))
+    db.commit()
+    return db_obj.id
+
+
+def bulk(db: Session, obj_in: ProductCreate) -> int:
+    """The current create_with_variations write path"""
+    db_obj = Product(**obj_in.model_dump(exclude={"variations", "images"}))
+    db.add(db_obj)
+    db.flush()
+    bulk_insert(db, ProductVariation, [
+        {**variation_in.model_dump(), "product_id": db_obj.id}
+        for variation_in in obj_in.variations
+    ])
+    bulk_insert(db, ProductImage, [
+        {**image_in.model_dump(), "product_id": db_obj.id}
+        for image_in in obj_in.images
+    ])
+    db.commit()
+    return db_obj.id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--variations", type=int, default=30)
+    parser.add_argument("--images", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--sqlite", action="store_true", help="use a local SQLite file")
+    args = parser.parse_args()
+
+    url = f"sqlite:///{SQLITE_PATH}" if args.sqlite else settings.DATABASE_URL
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    statements = []
+    event.listen(
+        engine, "before_cursor_execute", lambda *args: statements.append(args[2])
+    )
+
+    db = sessionmaker(bind=engine)()
+    try:
+        category = Category(name="Bench", path="/")
+        db.add(category)
+        db.commit()
+        obj_in = ProductCreate(
+            name="Bench product",
+            category_id=category.id,
+            variations=[
+                ProductVariationCreate(color_name=f"Color {v}", color_hex="#000000", price=10 + v)
+                for v in range(args.variations)
+            ],
+            images=[
+                ProductImageCreate(image_path=f"products/{i}.jpg", order=i)
+                for i in range(args.images)
+            ],
+        )
+
+        print(
+            f"{args.variations} variations, {args.images} images per product, "
+            f"{engine.url.drivername}"
+        )
+        print(f"{'path':>12}  {'statements':>10}  {'ms':>8}")
+        for name, write in (("per-object", per_object), ("bulk", bulk)):
+            samples = []
+            for _ in range(args.repeat):
+                statements.clear()
+                started = time.perf_counter()
+                write(db, obj_in)
+                samples.append(time.perf_counter() - started)
+            print(f"{name:>12}  {len(statements):>10}  {statistics.median(samples) * 1000:>8.2f}")
+    finally:
+        db.close()
+        engine.dispose()
+        if args.sqlite and os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Measure the throughput of the bulk catalog import.
+
+Generates `--products` products with `--variations` variations and one image
+each as NDJSON and CSV, then runs each upload through CRUDProduct.import_products
+the way POST /products/import does: streamed parsing, batch validation and COPY
+(executemany on SQLite). The NDJSON file is imported a second time with
+`upsert`, which updates every product in place. The goal is 10k products/s.
+
+    python -m benchmarks.bench_catalog_import --products 100000
+    python -m benchmarks.bench_catalog_import --sqlite   # no Postgres required
+"""
+import argparse
+import io
+import os
+import time
+
+import orjson
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.crud import crud_product
+from app.crud.catalog_import import ImportFormat
+from app.db.base import Base
+from app.models.category import Category
+from app.models.product import Product, ProductImage, ProductVariation
+
+SQLITE_PATH = "bench_catalog_import.sqlite3"
+GOAL = 10_000
+
+
+def ndjson(products: int, variations: int, category_id: int) -> bytes:
+    return b"".join(
+        orjson.dumps({
+            "name": f"Product {p}",
+            "description": f"Description of product {p}",
+            "category_id": category_id,
+            "variations": [
+                {"color_name": f"Color {v}", "color_hex": "#a0b0c0", "price": 10 + v}
+                for v in range(variations)
+            ],
+            "images": [{"image_path": f"products/{p}.jpg"}],
+        }, option=orjson.OPT_APPEND_NEWLINE)
+        for p in range(products)
+    )
+
+
+def csv(products: int, variations: int, category_id: int) -> bytes:
+    lines = ["name,description,category_id,color_name,color_hex,price,images"]
+    lines.extend(
+        f"Product {p},Description of product {p},{category_id},Color {v},#a0b0c0,{10 + v},products/{p}.jpg"
+        for p in range(products)
+        for v in range(variations)
+    )
+    return "\n".join(lines).encode()
+
+
+def run(session_factory, body: bytes, format: ImportFormat, upsert: bool) -> tuple:
+    db = session_factory()
+    try:
+        started = time.perf_counter()
+        report = crud_product.product.import_products(
+            db, file=io.BytesIO(body), format=format, upsert=upsert
+        )
+        return time.perf_counter() - started, report
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--variations", type=int, default=2)
+    parser.add_argument("--sqlite", action="store_true", help="use a local SQLite file")
+    args = parser.parse_args()
+
+    url = f"sqlite:///{SQLITE_PATH}" if args.sqlite else settings.DATABASE_URL
+    engine = create_engine(url)
+    try:
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(bind=engine)
+        with session_factory() as db:
+            category = Category(name="Bench", path="/")
+            db.add(category)
+            db.commit()
+            category_id = category.id
+        bodies = {
+            ImportFormat.NDJSON: ndjson(args.products, args.variations, category_id),
+            ImportFormat.CSV: csv(args.products, args.variations, category_id),
+        }
+        print(
+            f"{args.products} products, {args.variations} variations each, batches of "
+            f"{settings.CATALOG_IMPORT_BATCH_SIZE}, {engine.url.drivername}"
+        )
+        print(f"{'run':>14}  {'seconds':>8}  {'products/s':>10}  {'goal':>5}")
+        runs = [
+            ("ndjson", ImportFormat.NDJSON, False),
+            ("ndjson upsert", ImportFormat.NDJSON, True),
+            ("csv", ImportFormat.CSV, False),
+        ]
+        for label, format, upsert in runs:
+            if not upsert:
+                with session_factory() as db:
+                    for model in (ProductImage, ProductVariation, Product):
+                        db.execute(delete(model))
+                    db.commit()
+            seconds, report = run(session_factory, bodies[format], format, upsert)
+            assert report.failed == 0, report.errors[:3]
+            rate = args.products / seconds
+            print(f"{label:>14}  {seconds:>8.2f}  {rate:>10.0f}  {'ok' if rate >= GOAL else 'miss':>5}")
+    finally:
+        engine.dispose()
+        if args.sqlite and os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+
+
+if __name__ == "__main__":
+    main()
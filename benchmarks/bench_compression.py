@@ -0,0 +1,106 @@
+"""
+Measure bytes saved and CPU time of response compression per response size.
+
+Renders product pages shaped like GET /products responses (variations and
+images included) cut to each size bucket, then compresses every one with each
+encoder the middleware can use, whole and streamed in `--chunk` byte chunks,
+and reports the compressed size, bytes saved and CPU microseconds per response.
+
+    python -m benchmarks.bench_compression --repeat 200
+    python -m benchmarks.bench_compression --sizes 512,4096,65536 --chunk 8192
+"""
+import argparse
+import json
+import time
+
+from app.core.compression import GzipEncoder, ZstdEncoder, available_encodings
+from app.core.config import settings
+
+
+def product(i: int) -> dict:
+    return {
+        "id": i,
+        "name": f"Product {i}",
+        "description": f"Comfortable everyday item number {i} made from organic cotton.",
+        "category_id": i % 12 + 1,
+        "category_name": f"Category {i % 12 + 1}",
+        "is_active": True,
+        "created_at": "2024-02-20T10:15:00",
+        "updated_at": "2024-02-21T08:30:00",
+        "variations": [
+            {
+                "id": i * 10 + v,
+                "product_id": i,
+                "color_name": color,
+                "color_hex": hex_,
+                "price": 19.99 + v * 5,
+                "stock": 20 + (i * 7 + v) % 30,
+            }
+            for v, (color, hex_) in enumerate((("Red", "#ff0000"), ("Navy", "#000080"), ("Sand", "#c2b280")))
+        ],
+        "images": [
+            {"id": i * 10 + n, "product_id": i, "image_url": f"/media/products/{i}/{n}.jpg", "is_main": n == 0}
+            for n in range(3)
+        ],
+    }
+
+
+def body_of_size(size: int) -> bytes:
+    """A JSON array of products, trimmed to `size` bytes"""
+    items, body = [], b"[]"
+    while len(body) < size:
+        items.append(product(len(items) + 1))
+        body = json.dumps(items).encode()
+    return body[:size]
+
+
+def encoders(name: str):
+    if name == "zstd":
+        return ZstdEncoder(settings.COMPRESSION_ZSTD_LEVEL)
+    return GzipEncoder(settings.COMPRESSION_GZIP_LEVEL)
+
+
+def measure(name: str, body: bytes, repeat: int, chunk: int):
+    """(compressed bytes, CPU us whole, CPU us streamed) per response"""
+    started = time.process_time()
+    for _ in range(repeat):
+        compressed = encoders(name).compress(body)
+    whole = (time.process_time() - started) / repeat * 1_000_000
+
+    started = time.process_time()
+    for _ in range(repeat):
+        encoder = encoders(name)
+        streamed = sum(len(encoder.compress_chunk(body[i:i + chunk])) for i in range(0, len(body), chunk))
+        streamed += len(encoder.finish())
+    streaming = (time.process_time() - started) / repeat * 1_000_000
+    return len(compressed), streamed, whole, streaming
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="256,1024,4096,16384,65536,262144,1048576")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--chunk", type=int, default=4096, help="streamed chunk size in bytes")
+    args = parser.parse_args()
+
+    print(
+        f"gzip level {settings.COMPRESSION_GZIP_LEVEL}, zstd level {settings.COMPRESSION_ZSTD_LEVEL}, "
+        f"minimum size {settings.COMPRESSION_MINIMUM_SIZE} bytes, {args.repeat} repeats"
+    )
+    print(
+        f"{'bytes':>9} {'encoding':>8} {'compressed':>10} {'saved':>9} {'ratio':>6} "
+        f"{'us whole':>9} {'us stream':>9} {'stream bytes':>12}"
+    )
+    for size in (int(s) for s in args.sizes.split(",")):
+        body = body_of_size(size)
+        repeat = max(1, args.repeat * 4096 // max(size, 4096))
+        for name in available_encodings():
+            compressed, streamed, whole, streaming = measure(name, body, repeat, args.chunk)
+            print(
+                f"{size:>9} {name:>8} {compressed:>10} {size - compressed:>9} "
+                f"{size / compressed:>6.1f} {whole:>9.1f} {streaming:>9.1f} {streamed:>12}"
+            )
+
+
+if __name__ == "__main__":
+    main()
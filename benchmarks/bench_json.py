@@ -0,0 +1,112 @@
+"""
+Compare ways of encoding a product list response as JSON at 10, 100 and 1000 items.
+
+Builds products with `--variations` variations and `--images` images as ORM
+objects (nothing touches a database), then encodes them as
+List[ProductResponse] the way FastAPI renders a response_model (validate from
+attributes, dump to JSON-compatible Python, render) with json.dumps and with
+orjson, through jsonable_encoder instead of the pydantic dump, and with
+pydantic's own dump_json (`to_json`, used for cached catalog bodies).
+
+    python -m benchmarks.bench_json --repeat 20
+    python -m benchmarks.bench_json --items 10,100,1000 --variations 5 --images 5
+"""
+import argparse
+import time
+from datetime import datetime
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from app.models.category import Category
+from app.models.product import Product, ProductImage, ProductVariation
+from app.schemas.base import to_json
+from app.schemas.product import ProductResponse
+
+adapter = TypeAdapter(List[ProductResponse])
+
+
+def build_products(count: int, variations: int, images: int) -> List[Product]:
+    now = datetime.utcnow()
+    category = Category(id=1, name="Shoes", created_at=now, updated_at=now)
+    products = []
+    for i in range(1, count + 1):
+        product = Product(
+            id=i, name=f"Product {i}", description=f"Everyday sneaker number {i}",
+            category_id=1, is_available=True, created_at=now, updated_at=now,
+        )
+        product.category = category
+        product.variations = [
+            ProductVariation(
+                id=i * 100 + v, product_id=i, color_name=f"Color {v}", color_hex="#a0b0c0",
+                price=49.99 + v, is_available=True, created_at=now, updated_at=now,
+            )
+            for v in range(variations)
+        ]
+        product.images = [
+            ProductImage(
+                id=i * 100 + n, product_id=i, variation_id=None,
+                image_path=f"products/{i}/{n}.jpg", order=n, created_at=now, updated_at=now,
+            )
+            for n in range(images)
+        ]
+        products.append(product)
+    return products
+
+
+def fastapi_json(products: List[Product]) -> bytes:
+    value = adapter.validate_python(products, from_attributes=True)
+    return JSONResponse(adapter.dump_python(value, mode="json")).body
+
+
+def fastapi_orjson(products: List[Product]) -> bytes:
+    value = adapter.validate_python(products, from_attributes=True)
+    return ORJSONResponse(adapter.dump_python(value, mode="json")).body
+
+
+def jsonable_encoder_json(products: List[Product]) -> bytes:
+    value = adapter.validate_python(products, from_attributes=True)
+    return JSONResponse(jsonable_encoder(value)).body
+
+
+def pydantic_dump_json(products: List[Product]) -> bytes:
+    return to_json(List[ProductResponse], products).encode()
+
+
+ENCODERS = (
+    ("json.dumps", fastapi_json),
+    ("orjson", fastapi_orjson),
+    ("jsonable_encoder", jsonable_encoder_json),
+    ("dump_json", pydantic_dump_json),
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", default="10,100,1000")
+    parser.add_argument("--variations", type=int, default=3)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=10, help="repeats of the 1000 item list")
+    args = parser.parse_args()
+
+    print(f"{args.variations} variations, {args.images} images per product")
+    print(f"{'items':>6} {'encoder':>17} {'bytes':>9} {'us/response':>12} {'us/item':>8}")
+    for count in (int(n) for n in args.items.split(",")):
+        products = build_products(count, args.variations, args.images)
+        repeat = max(1, args.repeat * 1000 // count)
+        for name, encode in ENCODERS:
+            body = encode(products)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                encode(products)
+            per_response = (time.perf_counter() - started) / repeat * 1_000_000
+            print(
+                f"{count:>6} {name:>17} {len(body):>9} {per_response:>12.1f} "
+                f"{per_response / count:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
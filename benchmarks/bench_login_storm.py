@@ -0,0 +1,197 @@
+"""
+Measure catalog latency during a login storm, with inline and pooled password hashing.
+
+The sync API is driven in-process through httpx's ASGI transport. Catalog
+reads run at a steady concurrency, first alone, then while a burst of logins
+hits /auth/login: once hashing on the request threads (the previous
+behaviour) and once through the PasswordHasher process pool. Logins turned
+away with 503 by the pool are counted separately.
+
+    python -m benchmarks.bench_login_storm --logins 400 --login-concurrency 100
+    python -m benchmarks.bench_login_storm --sqlite   # no Postgres required
+    python -m benchmarks.bench_login_storm --sqlite --scheme sha256_crypt --rounds 200000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI
+from passlib.context import CryptContext
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api.v1.api import api_router
+from app.core import security
+from app.core.config import settings
+from app.core.passwords import PasswordHasher, PasswordHasherBusy
+from app.db.base import Base
+from app.db.session import get_db
+from app.main import password_hasher_busy_handler
+from app.models.category import Category
+from app.models.user import User
+
+SQLITE_PATH = "bench_login_storm.sqlite3"
+PASSWORD = "correct horse battery"
+
+
+class InlineHasher:
+    """Hashes on the calling thread, like verify_password used to"""
+
+    def __init__(self, context_options: dict):
+        self.context = CryptContext(**context_options)
+
+    def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return self.context.verify(password, hashed_password), None
+
+    def hash(self, password: str) -> str:
+        return self.context.hash(password)
+
+    def shutdown(self) -> None:
+        pass
+
+
+def context_options(scheme: str, rounds: int) -> dict:
+    return {
+        "schemes": [scheme],
+        f"{scheme}__default_rounds": rounds,
+        f"{scheme}__min_rounds": rounds,
+        f"{scheme}__max_rounds": rounds,
+    }
+
+
+def build_app(url: str) -> Tuple[object, FastAPI]:
+    engine = create_engine(url, pool_size=50, max_overflow=0)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(api_router, prefix=settings.API_PREFIX)
+    app.add_exception_handler(PasswordHasherBusy, password_hasher_busy_handler)
+    app.dependency_overrides[get_db] = override_get_db
+    return engine, app
+
+
+def seed(engine, users: int, hashed_password: str) -> str:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        db.add_all(
+            User(email=f"user{i}@example.com", hashed_password=hashed_password)
+            for i in range(users)
+        )
+        db.add_all(Category(name=f"Category {i}", order=i) for i in range(50))
+        db.commit()
+        return security.create_access_token(db.query(User.id).first()[0])
+    finally:
+        db.close()
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    samples = sorted(samples)
+    return samples[max(int(len(samples) * fraction) - 1, 0)] * 1000
+
+
+async def run(app: FastAPI, token: str, args, storm: bool) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    catalog: List[float] = []
+    statuses: List[int] = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        done = asyncio.Event()
+
+        async def reader() -> None:
+            headers = {"Authorization": f"Bearer {token}"}
+            while not done.is_set():
+                started = time.perf_counter()
+                response = await client.get(f"{settings.API_PREFIX}/categories/", headers=headers)
+                catalog.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        logins = asyncio.Semaphore(args.login_concurrency)
+
+        async def login(i: int) -> None:
+            async with logins:
+                response = await client.post(
+                    f"{settings.API_PREFIX}/auth/login",
+                    data={"username": f"user{i % args.users}@example.com", "password": PASSWORD},
+                )
+                statuses.append(response.status_code)
+
+        readers = [asyncio.create_task(reader()) for _ in range(args.catalog_concurrency)]
+        if storm:
+            await asyncio.gather(*(login(i) for i in range(args.logins)))
+        else:
+            await asyncio.sleep(args.baseline_seconds)
+        done.set()
+        await asyncio.gather(*readers)
+
+    return {
+        "catalog_p50_ms": statistics.median(catalog) * 1000,
+        "catalog_p99_ms": percentile(catalog, 0.99),
+        "logins_ok": statuses.count(200),
+        "logins_503": statuses.count(503),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--login-concurrency", type=int, default=100)
+    parser.add_argument("--catalog-concurrency", type=int, default=10)
+    parser.add_argument("--baseline-seconds", type=float, default=3)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--scheme", default="bcrypt")
+    parser.add_argument("--rounds", type=int, default=settings.BCRYPT_ROUNDS)
+    parser.add_argument("--sqlite", action="store_true", help="use a local SQLite file")
+    args = parser.parse_args()
+
+    options = context_options(args.scheme, args.rounds)
+    url = f"sqlite:///{SQLITE_PATH}" if args.sqlite else settings.DATABASE_URL
+    engine, app = build_app(url)
+    token = seed(engine, args.users, CryptContext(**options).hash(PASSWORD))
+
+    print(
+        f"{args.logins} logins at concurrency {args.login_concurrency}, "
+        f"{args.catalog_concurrency} catalog readers, {args.scheme} rounds={args.rounds}, "
+        f"{engine.url.drivername}"
+    )
+    pooled = PasswordHasher(
+        options,
+        workers=settings.PASSWORD_HASH_WORKERS,
+        queue_size=settings.PASSWORD_HASH_QUEUE,
+        timeout=settings.PASSWORD_HASH_TIMEOUT,
+    )
+    pooled.start()
+    scenarios = (
+        ("no logins", InlineHasher(options), False),
+        ("inline", InlineHasher(options), True),
+        ("pooled", pooled, True),
+    )
+    try:
+        for name, hasher, storm in scenarios:
+            security.password_hasher = hasher
+            result = asyncio.run(run(app, token, args, storm))
+            print(
+                f"{name:>10}: catalog p50 {result['catalog_p50_ms']:8.2f} ms  "
+                f"p99 {result['catalog_p99_ms']:8.2f} ms  "
+                f"logins ok {result['logins_ok']:>5}  503 {result['logins_503']:>5}"
+            )
+    finally:
+        pooled.shutdown()
+        engine.dispose()
+        if args.sqlite and os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Measure media file serving against Starlette's StaticFiles.
+
+Stores a small thumbnail and a `--large` MB file, then calls the MEDIA_URL
+app and a StaticFiles app over the same directory directly as ASGI apps, so
+the numbers are the server-side cost of a response without the network:
+the thumbnail, the large file, a 1 MB range of it and a conditional request
+answered with 304. Each case runs `--requests` times, `--concurrency` at once.
+
+    python -m benchmarks.bench_media_files --requests 5000
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from fastapi import UploadFile
+from starlette.staticfiles import StaticFiles
+
+from app.core.config import settings
+from app.core.media import MediaStorage
+from app.core.media_files import MediaFiles
+from app.core.variants import VariantCache
+
+
+def scope(path: str, headers: dict) -> dict:
+    return {
+        "type": "http", "method": "GET", "path": path, "root_path": "", "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "http_version": "1.1", "scheme": "http", "server": ("localhost", 80),
+    }
+
+
+def receiver():
+    """A `receive` like a server's: the request, then nothing until disconnect"""
+    requested = False
+
+    async def receive() -> dict:
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    return receive
+
+
+async def request(app, path: str, headers: dict) -> int:
+    sent = 0
+
+    async def send(message):
+        nonlocal sent
+        sent += len(message.get("body", b""))
+
+    await app(scope(path, headers), receiver(), send)
+    return sent
+
+
+async def measure(app, path: str, headers: dict, args) -> tuple:
+    sent = 0
+
+    async def worker(count: int) -> None:
+        nonlocal sent
+        for _ in range(count):
+            received = await request(app, path, headers)
+            sent += received
+
+    share, extra = divmod(args.requests, args.concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(share + (i < extra)) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    return args.requests / elapsed, sent / elapsed / 2**20
+
+
+async def run(storage: MediaStorage, media: MediaFiles, args) -> None:
+    thumbnail = await storage.save(UploadFile(io.BytesIO(b"\x89PNG\r\n\x1a\n" + os.urandom(8 * 1024))))
+    large = await storage.save(UploadFile(io.BytesIO(b"\xff\xd8\xff" + os.urandom(args.large * 2**20))))
+    apps = {"media": media, "static": StaticFiles(directory=storage.root)}
+    # Each app's own ETag, for the 304 case
+    etags = {}
+    for name, app in apps.items():
+        headers = {}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                headers.update((k.decode(), v.decode()) for k, v in message["headers"])
+
+        await app(scope(f"/{thumbnail}", {}), receiver(), send)
+        etags[name] = headers["etag"]
+
+    cases = [
+        ("thumbnail 8 KB", f"/{thumbnail}", {}),
+        (f"large {args.large} MB", f"/{large}", {}),
+        ("range 1 MB", f"/{large}", {"Range": "bytes=1048576-2097151"}),
+        ("304", f"/{thumbnail}", None),
+    ]
+    warmup = argparse.Namespace(requests=20, concurrency=1)
+    print(f"{'case':<16}  {'app':<8}  {'req/s':>9}  {'MB/s':>8}")
+    for label, path, headers in cases:
+        for name, app in apps.items():
+            sent = {"If-None-Match": etags[name]} if headers is None else headers
+            await measure(app, path, sent, warmup)
+            rate, throughput = await measure(app, path, sent, args)
+            print(f"{label:<16}  {name:<8}  {rate:>9.0f}  {throughput:>8.1f}")
+    print(f"descriptor cache: {media.files.hits} hits, {media.files.misses} misses")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--large", type=int, default=4, help="size of the large file in MB")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_media_")
+    storage = MediaStorage(
+        root, settings.UPLOAD_DIR,
+        max_size=(args.large + 1) * 2**20,
+        chunk_size=settings.UPLOAD_CHUNK_SIZE,
+        variant_widths=(),
+        variant_quality=settings.IMAGE_VARIANT_QUALITY,
+        workers=settings.IMAGE_WORKERS,
+    )
+    cache = VariantCache(
+        storage, settings.IMAGE_CACHE_DIR,
+        max_bytes=settings.IMAGE_CACHE_MAX_BYTES, quality=settings.IMAGE_VARIANT_QUALITY,
+    )
+    media = MediaFiles(
+        storage, cache,
+        fd_cache_size=settings.MEDIA_FD_CACHE_SIZE,
+        chunk_size=settings.MEDIA_READ_CHUNK_SIZE,
+        inline_size=settings.MEDIA_INLINE_READ_SIZE,
+    )
+    try:
+        asyncio.run(run(storage, media, args))
+    finally:
+        media.files.clear()
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
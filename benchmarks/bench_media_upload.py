@@ -0,0 +1,87 @@
+"""
+Measure what an image upload costs the request that carries it.
+
+Stores `--uploads` distinct photos of `--width` x `--height` pixels through
+MediaStorage.save, the way the category and product image endpoints do, and
+reports the time per upload with the WebP variants rendered by the process
+pool (the default) and, for comparison, rendered inline before answering.
+Uploading every photo a second time shows the cost of a duplicate, which is
+hashed and dropped.
+
+    python -m benchmarks.bench_media_upload --uploads 20
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from fastapi import UploadFile
+from PIL import Image
+
+from app.core import images
+from app.core.config import settings
+from app.core.media import MediaStorage
+
+
+def photo(width: int, height: int) -> bytes:
+    # Noise compresses badly, so the JPEG is about as large as a real photo
+    image = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def upload_all(storage: MediaStorage, photos, inline: bool) -> float:
+    started = time.perf_counter()
+    for body in photos:
+        relative = await storage.save(UploadFile(io.BytesIO(body), size=len(body)))
+        if inline:
+            images.render_variants(
+                storage.path(relative), settings.VARIANT_WIDTHS, settings.IMAGE_VARIANT_QUALITY
+            )
+    return (time.perf_counter() - started) / len(photos)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--width", type=int, default=2400)
+    parser.add_argument("--height", type=int, default=1600)
+    args = parser.parse_args()
+
+    photos = [photo(args.width, args.height) for _ in range(args.uploads)]
+    size = sum(map(len, photos)) / len(photos)
+    print(
+        f"{args.uploads} uploads of {size / 2**20:.1f} MB, variants at "
+        f"{settings.IMAGE_VARIANT_WIDTHS} px, chunks of {settings.UPLOAD_CHUNK_SIZE} bytes"
+    )
+    print(f"{'variants':>10}  {'ms/upload':>10}  {'duplicate ms':>12}  {'MB/s':>7}")
+    for label, inline in (("pool", False), ("inline", True)):
+        root = tempfile.mkdtemp(prefix="bench_media_")
+        storage = MediaStorage(
+            root, settings.UPLOAD_DIR,
+            max_size=max(settings.MAX_UPLOAD_SIZE, max(map(len, photos))),
+            chunk_size=settings.UPLOAD_CHUNK_SIZE,
+            variant_widths=() if inline else settings.VARIANT_WIDTHS,
+            variant_quality=settings.IMAGE_VARIANT_QUALITY,
+            workers=settings.IMAGE_WORKERS,
+        )
+        try:
+            storage.submit(int).result()  # start the pool before timing
+            first = asyncio.run(upload_all(storage, photos, inline))
+            duplicate = asyncio.run(upload_all(storage, photos, False))
+            storage.drain()
+            print(
+                f"{label:>10}  {first * 1000:>10.1f}  {duplicate * 1000:>12.1f}  "
+                f"{size / 2**20 / first:>7.0f}"
+            )
+        finally:
+            storage.shutdown()
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measure on-the-fly image variants: first render, cached hits, and a burst.
+
+Stores a `--width` x `--height` photo, then asks the variant cache for it at
+every IMAGE_RESIZE_WIDTHS width the way GET /media/{path}?width= does:
+once cold (rendered in the worker pool), then `--hits` times warm. Finally
+`--burst` concurrent requests for a variant not rendered yet show that they
+share one render.
+
+    python -m benchmarks.bench_media_variants --burst 100
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from fastapi import UploadFile
+from PIL import Image
+
+from app.core.config import settings
+from app.core.images import ImageFormat
+from app.core.media import MediaStorage
+from app.core.variants import VariantCache
+
+
+async def run(storage: MediaStorage, cache: VariantCache, body: bytes, args) -> None:
+    path = await storage.save(UploadFile(io.BytesIO(body), size=len(body)))
+    print(f"{'width':>6}  {'cold ms':>8}  {'warm us':>8}  {'KB':>6}")
+    for width in settings.RESIZE_WIDTHS:
+        started = time.perf_counter()
+        variant = await cache.get(path, width=width, format=ImageFormat.WEBP)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(args.hits):
+            await cache.get(path, width=width, format=ImageFormat.WEBP)
+        warm = (time.perf_counter() - started) / args.hits
+        print(f"{width:>6}  {cold * 1000:>8.1f}  {warm * 1e6:>8.1f}  {os.path.getsize(variant) / 1024:>6.1f}")
+
+    renders = cache.renders
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        cache.get(path, width=settings.RESIZE_WIDTHS[0], format=ImageFormat.JPEG)
+        for _ in range(args.burst)
+    ))
+    print(
+        f"{args.burst} concurrent requests for a new variant: {cache.renders - renders} "
+        f"render(s), {(time.perf_counter() - started) * 1000:.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=2400)
+    parser.add_argument("--height", type=int, default=1600)
+    parser.add_argument("--hits", type=int, default=1000)
+    parser.add_argument("--burst", type=int, default=50)
+    args = parser.parse_args()
+
+    image = Image.radial_gradient("L").resize((args.width, args.height)).convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    root = tempfile.mkdtemp(prefix="bench_media_")
+    storage = MediaStorage(
+        root, settings.UPLOAD_DIR,
+        max_size=settings.MAX_UPLOAD_SIZE,
+        chunk_size=settings.UPLOAD_CHUNK_SIZE,
+        variant_widths=(),
+        variant_quality=settings.IMAGE_VARIANT_QUALITY,
+        workers=settings.IMAGE_WORKERS,
+    )
+    cache = VariantCache(
+        storage, settings.IMAGE_CACHE_DIR,
+        max_bytes=settings.IMAGE_CACHE_MAX_BYTES, quality=settings.IMAGE_VARIANT_QUALITY,
+    )
+    try:
+        storage.submit(int).result()  # start the pool before timing
+        asyncio.run(run(storage, cache, buffer.getvalue(), args))
+    finally:
+        storage.shutdown()
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Measure throughput and memory of the streaming admin order export.
+
+Seeds `--orders` orders with `--items` items each, then streams all of them
+through CRUDOrder.export and the NDJSON and CSV encoders the way
+GET /admin/orders/export does, discarding the bytes. The worker's resident
+memory (from /proc/self/statm, so Linux only) is sampled after every chunk;
+the peak above the level before the export is what the export costs. Seeding
+runs in a child process so its allocations do not hide the export's.
+
+    python -m benchmarks.bench_order_export --orders 1000000
+    python -m benchmarks.bench_order_export --sqlite   # no Postgres required
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.crud import crud_order
+from app.crud.export import ExportFormat, chunks, encoder_for
+from app.db.base import Base
+from app.models.category import Category
+from app.models.order import DeliveryMethod, Order, OrderItem, OrderStatus, PaymentMethod
+from app.models.product import Product, ProductVariation
+from app.models.user import User
+
+SQLITE_PATH = "bench_order_export.sqlite3"
+BATCH = 10_000
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+STATUSES = list(OrderStatus)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE / 2**20
+
+
+def seed(url: str, orders: int, items: int) -> None:
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        user = User(email="bench@example.com", hashed_password="x")
+        category = Category(name="Bench", path="/")
+        db.add_all([user, category])
+        db.flush()
+        product = Product(name="Sneaker", category_id=category.id)
+        product.variations = [
+            ProductVariation(color_name=f"Color {v}", color_hex="#a0b0c0", price=10 + v)
+            for v in range(items)
+        ]
+        db.add(product)
+        db.flush()
+        variation_ids = [variation.id for variation in product.variations]
+
+        start = datetime(2024, 1, 1)
+        for first in range(0, orders, BATCH):
+            count = min(BATCH, orders - first)
+            order_ids = db.scalars(
+                insert(Order).returning(Order.id),
+                [
+                    {
+                        "user_id": user.id, "status": STATUSES[i % len(STATUSES)],
+                        "total_amount": 42.5, "full_name": "Bench Buyer",
+                        "email": "bench@example.com", "phone": "+70000000000",
+                        "delivery_method": DeliveryMethod.COURIER,
+                        "delivery_address": "1 Export Street, Apt 2",
+                        "payment_method": PaymentMethod.CARD,
+                        "created_at": start + timedelta(seconds=i),
+                    }
+                    for i in range(first, first + count)
+                ],
+            ).all()
+            db.execute(
+                insert(OrderItem),
+                [
+                    {
+                        "order_id": order_id, "product_id": product.id,
+                        "variation_id": variation_id, "quantity": 1, "price": 10,
+                    }
+                    for order_id in order_ids
+                    for variation_id in variation_ids
+                ],
+            )
+        db.commit()
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def export(session_factory, format: ExportFormat) -> tuple:
+    gc.collect()
+    baseline = peak = rss_mb()
+    sent = 0
+    started = time.perf_counter()
+    for chunk in chunks(encoder_for(format), crud_order.order.export(session_factory())):
+        sent += len(chunk)
+        peak = max(peak, rss_mb())
+    return time.perf_counter() - started, sent, peak - baseline
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=2)
+    parser.add_argument("--sqlite", action="store_true", help="use a local SQLite file")
+    args = parser.parse_args()
+
+    url = f"sqlite:///{SQLITE_PATH}" if args.sqlite else settings.DATABASE_URL
+    # Seeded in another process, so its memory does not hide the export's
+    seeder = multiprocessing.Process(target=seed, args=(url, args.orders, args.items))
+    seeder.start()
+    seeder.join()
+    engine = create_engine(url)
+    try:
+        session_factory = sessionmaker(bind=engine)
+        print(
+            f"{args.orders} orders, {args.items} items each, batches of "
+            f"{settings.ORDER_EXPORT_BATCH_SIZE}, {engine.url.drivername}"
+        )
+        print(f"{'format':>7}  {'seconds':>8}  {'orders/s':>9}  {'MB sent':>8}  {'RSS +MB':>8}")
+        for format in ExportFormat:
+            seconds, sent, rss = export(session_factory, format)
+            print(
+                f"{format.value:>7}  {seconds:>8.1f}  {args.orders / seconds:>9.0f}  "
+                f"{sent / 2**20:>8.1f}  {rss:>8.1f}"
+            )
+    finally:
+        engine.dispose()
+        if args.sqlite and os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Compare OFFSET and keyset (cursor) pagination from page 1 to page 10,000.
+
+A category is seeded with `pages * limit` products, then the same page is
+fetched through CRUDProduct.get_multi_by_category with `skip` and with the
+cursor of the previous page. OFFSET has to walk past every skipped row, so
+its latency grows with the page number; the keyset seek stays flat.
+
+    python -m benchmarks.bench_pagination --limit 20 --pages 10000
+    python -m benchmarks.bench_pagination --sqlite   # no Postgres required
+"""
+import argparse
+import os
+import statistics
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.core.config import settings
+from app.crud import crud_product
+from app.crud.product import ProductLoad
+from app.db.base import Base
+from app.models.category import Category
+from app.models.product import Product
+
+SQLITE_PATH = "bench_pagination.sqlite3"
+BATCH = 10_000
+
+
+def seed(engine, rows: int) -> int:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        category = Category(name="Bench", path="/")
+        db.add(category)
+        db.flush()
+        for start in range(0, rows, BATCH):
+            db.execute(
+                insert(Product),
+                [
+                    {"name": f"Product {i}", "category_id": category.id}
+                    for i in range(start, min(start + BATCH, rows))
+                ],
+            )
+        db.commit()
+        return category.id
+    finally:
+        db.close()
+
+
+def timed(fetch, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fetch()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def bench_page(db: Session, category_id: int, page: int, limit: int, repeat: int) -> tuple:
+    skip = (page - 1) * limit
+    cursor = None
+    if skip:
+        # The cursor a client would hold after reading the previous page
+        previous = crud_product.product.get_multi_by_category(
+            db, category_id=category_id, skip=skip - limit, limit=limit, load=ProductLoad.BARE
+        )
+        cursor = crud_product.product.keyset.next_cursor(previous, limit)
+
+    def by_offset():
+        return crud_product.product.get_multi_by_category(
+            db, category_id=category_id, skip=skip, limit=limit, load=ProductLoad.BARE
+        )
+
+    def by_cursor():
+        return crud_product.product.get_multi_by_category(
+            db, category_id=category_id, cursor=cursor, limit=limit, load=ProductLoad.BARE
+        )
+
+    assert [p.id for p in by_offset()] == [p.id for p in by_cursor()]
+    return timed(by_offset, repeat), timed(by_cursor, repeat)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--sqlite", action="store_true", help="use a local SQLite file")
+    args = parser.parse_args()
+
+    url = f"sqlite:///{SQLITE_PATH}" if args.sqlite else settings.DATABASE_URL
+    engine = create_engine(url)
+    category_id = seed(engine, args.pages * args.limit)
+
+    print(f"{args.pages * args.limit} products, {args.limit} per page, {engine.url.drivername}")
+    print(f"{'page':>8}  {'offset ms':>10}  {'cursor ms':>10}")
+    db = sessionmaker(bind=engine)()
+    try:
+        for page in (1, 10, 100, 1_000, 10_000):
+            if page > args.pages:
+                break
+            offset_ms, cursor_ms = bench_page(db, category_id, page, args.limit, args.repeat)
+            print(f"{page:>8}  {offset_ms:>10.3f}  {cursor_ms:>10.3f}")
+    finally:
+        db.close()
+        engine.dispose()
+        if args.sqlite and os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measure the per-request cost of the rate limiter with and without local token batches.
+
+Runs `--requests` acquires spread over `--clients` identities, concurrently
+on one event loop like a worker under load, once taking every token from
+Redis, once with local batches of RATE_LIMIT_LOCAL_BATCH tokens, and once on
+the in-process fallback. Limits are set high enough that nothing is refused.
+
+    python -m benchmarks.bench_rate_limit --requests 20000 --clients 100
+    python -m benchmarks.bench_rate_limit --fakeredis   # no Redis required
+"""
+import argparse
+import asyncio
+import time
+
+import fakeredis
+import redis.asyncio
+
+from app.core.config import settings
+from app.core.rate_limit import Limit, RateLimiter, Rule
+
+
+def build(client: redis.asyncio.Redis, local_batch: int, redis_retry: float) -> RateLimiter:
+    return RateLimiter(
+        client,
+        default=Rule("bench", (Limit(1_000_000, 60), Limit(10_000_000, 3600))),
+        routes={},
+        prefix=settings.API_PREFIX,
+        local_batch=local_batch,
+        local_ttl=settings.RATE_LIMIT_LOCAL_TTL,
+        redis_timeout=1,
+        redis_retry=redis_retry,
+    )
+
+
+async def run(limiter: RateLimiter, args) -> float:
+    queue = list(range(args.requests))
+    refused = 0
+
+    async def worker() -> None:
+        nonlocal refused
+        while queue:
+            i = queue.pop()
+            if await limiter.acquire(limiter.default, f"ip:{i % args.clients}") is not None:
+                refused += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    assert refused == 0, f"{refused} requests refused"
+    return elapsed / args.requests * 1_000_000
+
+
+async def main_async(args) -> None:
+    if args.fakeredis:
+        client = fakeredis.FakeAsyncRedis()
+    else:
+        client = redis.asyncio.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT)
+    down = fakeredis.FakeServer()
+    down.connected = False
+    scenarios = (
+        ("redis", build(client, 1, 5)),
+        (f"batch {settings.RATE_LIMIT_LOCAL_BATCH}", build(client, settings.RATE_LIMIT_LOCAL_BATCH, 5)),
+        ("fallback", build(fakeredis.FakeAsyncRedis(server=down), 1, 3600)),
+    )
+    print(
+        f"{args.requests} requests, {args.clients} clients, concurrency {args.concurrency}, "
+        f"{'fakeredis' if args.fakeredis else settings.REDIS_URL}"
+    )
+    try:
+        for name, limiter in scenarios:
+            await client.flushdb()
+            per_request = await run(limiter, args)
+            stats = limiter.stats()
+            print(
+                f"{name:>10}: {per_request:8.1f} us/request  "
+                f"redis calls {stats['redis_calls']:>6.0f}  local hits {stats['local_hits']:>6.0f}"
+            )
+    finally:
+        await client.flushdb()
+        await client.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--fakeredis", action="store_true", help="use an in-process fake Redis")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
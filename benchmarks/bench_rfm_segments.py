@@ -0,0 +1,146 @@
+"""
+Measure the customer segment rebuild over a large order table.
+
+Seeds `--orders` orders from `--users` customers over `--days` days, then
+runs the RFM rebuild (streamed chunks folded with NumPy, scored and
+written to usersegment) and reports the wall time of each step and how much
+the process's peak RSS grew (the seeding runs in a child process, so it
+does not count). For comparison the same orders are also
+folded into per-user totals row by row in Python, the approach the NumPy
+fold replaces.
+
+    python -m benchmarks.bench_rfm_segments --orders 10000000
+    python -m benchmarks.bench_rfm_segments --sqlite   # no Postgres required
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.crud import crud_segment
+from app.crud.base import write_rows
+from app.db.base import Base
+from app.models.order import Order, OrderStatus
+from app.models.user import User
+
+SQLITE_PATH = "bench_rfm_segments.sqlite3"
+BATCH = 100_000
+START = datetime(2024, 1, 1)
+USER_COLUMNS = ("id", "email", "hashed_password", "is_active", "role", "created_at", "updated_at")
+ORDER_COLUMNS = (
+    "user_id", "status", "total_amount", "full_name", "email", "phone",
+    "delivery_method", "payment_method", "created_at", "updated_at",
+)
+
+
+def seed(url: str, args) -> None:
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as db:
+        write_orders(db, args)
+    engine.dispose()
+
+
+def write_orders(db, args) -> None:
+    now = datetime.utcnow()
+    for first in range(1, args.users + 1, BATCH):
+        write_rows(db, User.__table__, USER_COLUMNS, [
+            (user_id, f"user{user_id}@example.com", "x", True, "USER", now, now)
+            for user_id in range(first, min(first + BATCH, args.users + 1))
+        ])
+    rng = np.random.default_rng(42)
+    statuses = np.array([status.name for status in OrderStatus], dtype=object)
+    for first in range(0, args.orders, BATCH):
+        count = min(BATCH, args.orders - first)
+        # A few customers order much more often than most
+        user_ids = (rng.pareto(1.5, count) * args.users / 20).astype(np.int64) % args.users + 1
+        amounts = rng.gamma(2.0, 40.0, count).round(2)
+        seconds = rng.integers(0, args.days * 86400, count)
+        write_rows(db, Order.__table__, ORDER_COLUMNS, [
+            (user_id, status, amount, "Bench Buyer", "bench@example.com", "+70000000000",
+             "PICKUP", "CARD", START + timedelta(seconds=second), now)
+            for user_id, status, amount, second in zip(
+                user_ids.tolist(), statuses[rng.integers(0, len(statuses), count)].tolist(),
+                amounts.tolist(), seconds.tolist(),
+            )
+        ])
+        db.commit()
+
+
+def python_fold(db) -> int:
+    """Per-user last order, count and total, one row at a time"""
+    totals = {}
+    query = (
+        select(Order.user_id, Order.created_at, Order.total_amount)
+        .where(Order.status != OrderStatus.CANCELLED)
+        .execution_options(yield_per=settings.RFM_CHUNK_SIZE)
+    )
+    for user_id, created_at, amount in db.execute(query):
+        total = totals.get(user_id)
+        if total is None:
+            totals[user_id] = [created_at, 1, amount]
+        else:
+            total[0] = max(total[0], created_at)
+            total[1] += 1
+            total[2] += amount
+    return len(totals)
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=None, help="default: a tenth of --orders")
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--chunk-size", type=int, default=settings.RFM_CHUNK_SIZE)
+    parser.add_argument("--no-python", action="store_true", help="skip the row-by-row fold")
+    parser.add_argument("--sqlite", action="store_true", help="use a local SQLite file")
+    args = parser.parse_args()
+    args.users = args.users or max(1, args.orders // 10)
+
+    url = f"sqlite:///{SQLITE_PATH}" if args.sqlite else settings.DATABASE_URL
+    started = time.perf_counter()
+    seeder = multiprocessing.Process(target=seed, args=(url, args))
+    seeder.start()
+    seeder.join()
+    engine = create_engine(url)
+    db = sessionmaker(bind=engine)()
+    try:
+        print(
+            f"{args.orders} orders from {args.users} customers, {engine.url.drivername}: "
+            f"seeded in {time.perf_counter() - started:.1f} s"
+        )
+
+        before = peak_rss_mb()
+        report = crud_segment.segment.rebuild(db, chunk_size=args.chunk_size)
+        print(
+            f"rebuild: {report['users']} customers from {report['orders']} orders in {report['seconds']:.2f} s "
+            f"({report['orders'] / report['seconds']:,.0f} orders/s); fetch {report['fetch_seconds']:.2f} s, "
+            f"score {report['score_seconds']:.2f} s, write {report['write_seconds']:.2f} s; "
+            f"peak RSS +{peak_rss_mb() - before:.0f} MB (chunks of {args.chunk_size})"
+        )
+
+        if not args.no_python:
+            started = time.perf_counter()
+            users = python_fold(db)
+            print(f"row-by-row Python fold of {users} customers: {time.perf_counter() - started:.2f} s")
+    finally:
+        db.close()
+        engine.dispose()
+        if args.sqlite and os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+
+
+if __name__ == "__main__":
+    main()
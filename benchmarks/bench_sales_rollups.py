@@ -0,0 +1,187 @@
+"""
+Measure sales reports from the rollups against scanning the orders.
+
+Seeds `--orders` orders over `--days` days, each with `--items` items drawn
+from `--products` products, rebuilds the rollups from them, then times the
+admin reports (a 90-day revenue series and the top 10 products of the same
+range) read from the rollups, and the same aggregates computed from order
+and orderitem. Finally `--place` orders are placed through
+CRUDOrder.create_with_items, which updates the rollups as it goes.
+
+    python -m benchmarks.bench_sales_rollups --orders 1000000
+    python -m benchmarks.bench_sales_rollups --sqlite   # no Postgres required
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.crud import crud_order, crud_sales
+from app.db.base import Base
+from app.models.category import Category
+from app.models.order import DeliveryMethod, Order, OrderItem, OrderStatus, PaymentMethod
+from app.models.product import Product, ProductVariation
+from app.models.user import User
+from app.schemas.order import OrderCreate, OrderItemCreate
+
+SQLITE_PATH = "bench_sales_rollups.sqlite3"
+BATCH = 10_000
+STATUSES = list(OrderStatus)
+START = datetime(2024, 1, 1)
+
+
+def seed(db, args) -> list:
+    user = User(email="bench@example.com", hashed_password="x")
+    category = Category(name="Bench", path="/")
+    db.add_all([user, category])
+    db.flush()
+    variations = []
+    for p in range(args.products):
+        product = Product(name=f"Product {p}", category_id=category.id)
+        product.variations = [
+            ProductVariation(color_name=f"Color {v}", color_hex="#a0b0c0", price=10 + v)
+            for v in range(3)
+        ]
+        db.add(product)
+        db.flush()
+        variations += [(product.id, variation.id, variation.price) for variation in product.variations]
+
+    rng = random.Random(42)
+    seconds = args.days * 86400
+    for first in range(0, args.orders, BATCH):
+        count = min(BATCH, args.orders - first)
+        order_ids = db.scalars(
+            insert(Order).returning(Order.id),
+            [
+                {
+                    "user_id": user.id, "status": rng.choice(STATUSES), "total_amount": 0,
+                    "full_name": "Bench Buyer", "email": "bench@example.com",
+                    "phone": "+70000000000", "delivery_method": DeliveryMethod.PICKUP,
+                    "payment_method": PaymentMethod.CARD,
+                    "created_at": START + timedelta(seconds=rng.randrange(seconds)),
+                }
+                for _ in range(count)
+            ],
+        ).all()
+        db.execute(insert(OrderItem), [
+            {
+                "order_id": order_id, "product_id": product_id, "variation_id": variation_id,
+                "quantity": rng.randint(1, 3), "price": price,
+            }
+            for order_id in order_ids
+            for product_id, variation_id, price in rng.sample(variations, args.items)
+        ])
+        db.commit()
+    return variations
+
+
+def timed(fn, repeat: int) -> float:
+    """Milliseconds per call"""
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def scan_series(db, date_from: date, date_to: date) -> list:
+    day = func.date(Order.created_at)
+    return db.execute(
+        select(day, func.sum(OrderItem.price * OrderItem.quantity), func.sum(OrderItem.quantity))
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(Order.created_at >= date_from, Order.created_at < date_to + timedelta(days=1))
+        .where(Order.status != OrderStatus.CANCELLED)
+        .group_by(day)
+        .order_by(day)
+    ).all()
+
+
+def scan_top(db, date_from: date, date_to: date) -> list:
+    revenue = func.sum(OrderItem.price * OrderItem.quantity)
+    return db.execute(
+        select(OrderItem.product_id, revenue)
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(Order.created_at >= date_from, Order.created_at < date_to + timedelta(days=1))
+        .where(Order.status != OrderStatus.CANCELLED)
+        .group_by(OrderItem.product_id)
+        .order_by(revenue.desc())
+        .limit(10)
+    ).all()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--place", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--sqlite", action="store_true", help="use a local SQLite file")
+    args = parser.parse_args()
+
+    url = f"sqlite:///{SQLITE_PATH}" if args.sqlite else settings.DATABASE_URL
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        started = time.perf_counter()
+        variations = seed(db, args)
+        print(
+            f"{args.orders} orders over {args.days} days, {args.items} items each, "
+            f"{engine.url.drivername}: seeded in {time.perf_counter() - started:.1f} s"
+        )
+        started = time.perf_counter()
+        written = crud_sales.sales.rebuild(db)
+        print(
+            f"rebuild: {written['daily_rows']} daily and {written['product_rows']} product rows "
+            f"in {time.perf_counter() - started:.2f} s"
+        )
+
+        date_to = START.date() + timedelta(days=args.days - 1)
+        date_from = date_to - timedelta(days=89)
+        kept = [s for s in STATUSES if s != OrderStatus.CANCELLED]
+        reports = {
+            "90-day series": (
+                lambda: crud_sales.sales.time_series(db, date_from=date_from, date_to=date_to, statuses=kept),
+                lambda: scan_series(db, date_from, date_to),
+            ),
+            "top 10 products": (
+                lambda: crud_sales.sales.top_products(db, date_from=date_from, date_to=date_to, statuses=kept),
+                lambda: scan_top(db, date_from, date_to),
+            ),
+        }
+        print(f"{'report':<16}  {'rollup ms':>10}  {'scan ms':>10}")
+        for name, (rollup, scan) in reports.items():
+            print(f"{name:<16}  {timed(rollup, args.repeat):>10.2f}  {timed(scan, max(1, args.repeat // 10)):>10.1f}")
+
+        user_id = db.scalar(select(User.id))
+        rng = random.Random(7)
+        started = time.perf_counter()
+        for _ in range(args.place):
+            items = [
+                OrderItemCreate(product_id=product_id, variation_id=variation_id, quantity=1)
+                for product_id, variation_id, _ in rng.sample(variations, args.items)
+            ]
+            crud_order.order.create_with_items(db, obj_in=OrderCreate(
+                full_name="Bench Buyer", email="bench@example.com", phone="+70000000000",
+                delivery_method=DeliveryMethod.PICKUP, payment_method=PaymentMethod.CARD,
+                items=items,
+            ), user_id=user_id)
+        elapsed = time.perf_counter() - started
+        print(f"placed {args.place} orders with rollups: {elapsed / args.place * 1000:.2f} ms each")
+    finally:
+        db.close()
+        engine.dispose()
+        if args.sqlite and os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+
+
+if __name__ == "__main__":
+    main()
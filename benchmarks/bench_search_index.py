@@ -0,0 +1,112 @@
+"""
+Measure the in-process search index: memory per 100k products and latency.
+
+A synthetic catalog (names, descriptions and variation colors drawn from a
+generated vocabulary) is indexed with ProductSearchIndex, then a mix of
+exact, prefix, multi-word and misspelled queries is timed.
+
+    python -m benchmarks.bench_search_index --products 100000 --queries 2000
+"""
+import argparse
+import itertools
+import random
+import statistics
+import time
+import tracemalloc
+from typing import List
+
+from app.core.search import ProductSearchIndex
+
+COLORS = ["black", "white", "red", "navy", "olive", "sand", "graphite", "coral", "teal"]
+# English letter frequencies, so words share trigrams about as often as real ones
+LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
+LETTER_WEIGHTS = [
+    12.7, 9.1, 8.2, 7.5, 7.0, 6.7, 6.3, 6.1, 6.0, 4.3, 4.0, 2.8, 2.8,
+    2.4, 2.4, 2.2, 2.0, 2.0, 1.9, 1.5, 1.0, 0.8, 0.2, 0.2, 0.1, 0.1,
+]
+
+
+def vocabulary(size: int, rng: random.Random) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(LETTERS, LETTER_WEIGHTS, k=rng.randint(3, 10))))
+    return sorted(words)
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    at = rng.randrange(len(word))
+    return word[:at] + word[at + 1:] if len(word) > 4 else word
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    words = vocabulary(args.vocabulary, rng)
+    rng.shuffle(words)
+    # Word popularity follows a long tail, like real catalog text
+    popularity = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    catalog = [
+        (
+            product_id,
+            " ".join(rng.choices(words, cum_weights=popularity, k=3)),
+            " ".join(rng.choices(words, cum_weights=popularity, k=15)),
+            rng.sample(COLORS, 3),
+        )
+        for product_id in range(1, args.products + 1)
+    ]
+
+    # Memory is traced on a separate build, tracing slows indexing down a lot
+    tracemalloc.start()
+    traced = ProductSearchIndex(enabled=True)
+    for product in catalog:
+        traced.add(*product)
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+
+    index = ProductSearchIndex(enabled=True)
+    started = time.perf_counter()
+    for product in catalog:
+        index.add(*product)
+    build_seconds = time.perf_counter() - started
+
+    queries = []
+    for _ in range(args.queries):
+        name = catalog[rng.randrange(len(catalog))][1].split()
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(name[0])
+        elif kind < 0.6:
+            queries.append(name[0][:3])
+        elif kind < 0.8:
+            queries.append(" ".join(name[:2]))
+        else:
+            queries.append(misspell(name[0], rng))
+
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, limit=20)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    print(f"{args.products} products, {args.vocabulary} words in vocabulary")
+    print(f"build: {build_seconds:.1f} s")
+    print(
+        f"memory: {index_bytes / 2**20:.1f} MiB "
+        f"({index_bytes / 2**20 * 100_000 / args.products:.1f} MiB per 100k products)"
+    )
+    print(
+        f"query: p50 {statistics.median(latencies) * 1000:.2f} ms  "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
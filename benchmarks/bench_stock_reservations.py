@@ -0,0 +1,146 @@
+"""
+Measure flash-sale order throughput on one hot variation, per stock backend.
+
+Seeds one variation with `--stock` units, then `--threads` threads place
+`--orders` single-unit orders for it through CRUDOrder.create_with_items,
+each with its own session, so most are refused once it sells out. Reports
+orders per second placed or refused, and checks that exactly `--stock`
+were placed and that the stock column ends at zero (after write-back for
+the Redis counters): any oversell fails the run. With `--reserve-only`
+each attempt only takes the unit and commits, leaving out the order rows,
+to time the backends alone.
+
+    python -m benchmarks.bench_stock_reservations --orders 20000 --threads 32
+    python -m benchmarks.bench_stock_reservations --reserve-only --orders 50000
+    python -m benchmarks.bench_stock_reservations --sqlite --fakeredis   # no Postgres or Redis required
+"""
+import argparse
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.stock import StockCounter, stock_counter
+from app.crud import crud_order, crud_stock
+from app.crud.stock import DatabaseStock, InsufficientStock, RedisStock
+from app.db.base import Base
+from app.models.category import Category
+from app.models.order import DeliveryMethod, Order, PaymentMethod
+from app.models.product import Product, ProductVariation
+from app.models.user import User
+from app.schemas.order import OrderCreate, OrderItemCreate
+
+SQLITE_PATH = "bench_stock_reservations.sqlite3"
+
+
+def seed(Session, stock: int) -> tuple:
+    with Session() as db:
+        user = User(email="bench@example.com", hashed_password="x")
+        category = Category(name="Bench", path="/")
+        db.add_all([user, category])
+        db.flush()
+        product = Product(name="Hot product", category_id=category.id)
+        product.variations = [ProductVariation(color_name="Hot", color_hex="#ff0000", price=10, stock=stock)]
+        db.add(product)
+        db.commit()
+        return user.id, product.id, product.variations[0].id
+
+
+def run(engine, Session, args, backend) -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    user_id, product_id, variation_id = seed(Session, args.stock)
+    # A counter left by an earlier run would not match the fresh database
+    backend.forget([variation_id])
+    crud_stock.stock.backend = backend
+    order_in = OrderCreate(
+        full_name="Bench Buyer", email="bench@example.com", phone="+70000000000",
+        delivery_method=DeliveryMethod.PICKUP, payment_method=PaymentMethod.CARD,
+        items=[OrderItemCreate(product_id=product_id, variation_id=variation_id, quantity=1)],
+    )
+    placed, refused, latencies = [], [], []
+
+    def buy(count: int) -> None:
+        for _ in range(count):
+            started = time.perf_counter()
+            with Session() as db:
+                try:
+                    if args.reserve_only:
+                        crud_stock.stock.reserve(db, items=order_in.items)
+                        db.commit()
+                    else:
+                        crud_order.order.create_with_items(db, obj_in=order_in, user_id=user_id)
+                except InsufficientStock:
+                    refused.append(1)
+                else:
+                    placed.append(1)
+            latencies.append(time.perf_counter() - started)
+
+    per_thread = args.orders // args.threads
+    threads = [threading.Thread(target=buy, args=(per_thread,)) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with Session() as db:
+        crud_stock.stock.flush(db)
+        left = db.scalar(select(ProductVariation.stock).where(ProductVariation.id == variation_id))
+        orders = len(placed) if args.reserve_only else db.scalar(select(func.count(Order.id)))
+    latencies.sort()
+    name = type(backend).__name__
+    print(
+        f"{name:<14}  {len(latencies) / elapsed:>8.0f}  {len(placed):>7}  {len(refused):>8}  "
+        f"{latencies[len(latencies) // 2] * 1000:>7.2f}  {latencies[int(len(latencies) * 0.99)] * 1000:>7.2f}  "
+        f"{orders - args.stock:>9}  {left:>5}"
+    )
+    assert len(placed) == orders == args.stock and left == 0, f"{name} oversold or lost stock"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--stock", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--backend", choices=["database", "redis", "both"], default="both")
+    parser.add_argument("--sqlite", action="store_true", help="use a local SQLite file")
+    parser.add_argument("--fakeredis", action="store_true", help="use an in-process fake Redis")
+    parser.add_argument("--reserve-only", action="store_true", help="take units without placing orders")
+    args = parser.parse_args()
+
+    url = f"sqlite:///{SQLITE_PATH}" if args.sqlite else settings.DATABASE_URL
+    connect_args = {"timeout": 60} if args.sqlite else {}
+    engine = create_engine(url, pool_size=args.threads, connect_args=connect_args)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    counter = stock_counter
+    if args.fakeredis:
+        import fakeredis
+
+        counter = StockCounter(fakeredis.FakeRedis(decode_responses=True))
+    backends = []
+    if args.backend in ("database", "both"):
+        backends.append(DatabaseStock())
+    if args.backend in ("redis", "both"):
+        backends.append(RedisStock(counter))
+
+    print(
+        f"{args.orders} {'reservations' if args.reserve_only else 'orders'} for {args.stock} units "
+        f"from {args.threads} threads, {engine.url.drivername}"
+    )
+    print(f"{'backend':<14}  {'orders/s':>8}  {'placed':>7}  {'refused':>8}  {'p50 ms':>7}  {'p99 ms':>7}  {'oversold':>9}  {'left':>5}")
+    try:
+        for backend in backends:
+            run(engine, Session, args, backend)
+    finally:
+        engine.dispose()
+        if args.sqlite and os.path.exists(SQLITE_PATH):
+            os.remove(SQLITE_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,22 @@
+from contextlib import contextmanager
+
+import fakeredis
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from app.main import app
+from app.core.cache import async_catalog_cache, catalog_cache
+from app.core.principal_cache import async_principal_cache, principal_cache
+from app.core.rate_limit import rate_limiter
+from app.core.security import create_access_token
 from app.db.base import Base
 from app.db.session import get_db
+from app.models.category import Category
+from app.models.product import Product, ProductImage, ProductVariation
+from app.models.user import User, UserRole
 
 # Create in-memory SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -18,6 +28,35 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    """Run the catalog cache against an in-process fake Redis"""
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(catalog_cache, "client", client)
+    monkeypatch.setattr(catalog_cache, "hits", 0)
+    monkeypatch.setattr(catalog_cache, "misses", 0)
+    monkeypatch.setattr(
+        async_catalog_cache, "client", fakeredis.FakeAsyncRedis(decode_responses=True)
+    )
+    return client
+
+
+@pytest.fixture(autouse=True)
+def principal_caches():
+    """Start every test with empty authenticated user caches"""
+    principal_cache.clear()
+    async_principal_cache.clear()
+    yield
+    principal_cache.clear()
+    async_principal_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    """Tests send many requests from one client; test_rate_limit turns it back on"""
+    monkeypatch.setattr(rate_limiter, "enabled", False)
+
+
 @pytest.fixture(scope="function")
 def db():
     Base.metadata.create_all(bind=engine)
@@ -39,4 +78,88 @@ def client(db):
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as test_client:
         yield test_client
-    app.dependency_overrides.clear() 
\ No newline at end of file
+    app.dependency_overrides.clear() 
+
+
+@pytest.fixture(scope="function")
+def admin_headers(db):
+    admin = User(
+        email="admin@example.com", hashed_password="unused", role=UserRole.ADMIN
+    )
+    db.add(admin)
+    db.commit()
+    # Like an admin past their first request, so statement counts leave
+    # out the current user lookup
+    principal_cache.set(admin)
+    return {"Authorization": f"Bearer {create_access_token(admin.id)}"}
+
+
+@pytest.fixture(scope="function")
+def count_queries():
+    """Collect the SQL statements executed inside a `with` block"""
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return counter
+
+
+class Clock:
+    """Stands in for time.time or time.monotonic; moves only when a test sets `now`"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(scope="function")
+def clock():
+    return Clock()
+
+
+@pytest.fixture(scope="function")
+def create_product(db):
+    """
+    Add a product and commit it, in `category_id` or else a new category.
+    Every dict in `variations` adds a variation with those fields over the
+    defaults, and every variation gets `images` images.
+    """
+    def create(
+        name: str = "Product",
+        *,
+        category_id: int = None,
+        description: str = None,
+        variations=({},),
+        images: int = 0,
+    ) -> Product:
+        if category_id is None:
+            category = Category(name=f"{name} category", path="/")
+            db.add(category)
+            db.flush()
+            category_id = category.id
+        product = Product(name=name, description=description, category_id=category_id)
+        product.variations = [
+            ProductVariation(
+                **{"color_name": f"Color {index}", "color_hex": "#000000", "price": 10, **fields}
+            )
+            for index, fields in enumerate(variations)
+        ]
+        product.images = [
+            ProductImage(image_path=f"products/{name}/{index}-{n}.jpg", order=n, variation=variation)
+            for index, variation in enumerate(product.variations)
+            for n in range(images)
+        ]
+        db.add(product)
+        db.commit()
+        return product
+    return create
@@ -0,0 +1,325 @@
+import io
+import json
+
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI, status
+from httpx import ASGITransport, AsyncClient
+from PIL import Image
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.api.v1.async_api import async_api_router
+from app.core.config import settings
+from app.core.media import media_storage
+from app.core.security import create_access_token
+from app.db.base import Base
+from app.db.session import get_async_db
+from app.models.category import Category
+from app.models.product import Product, ProductVariation
+from app.models.user import User, UserRole
+
+async_engine = create_async_engine(
+    "sqlite+aiosqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+@pytest_asyncio.fixture
+async def async_client():
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(async_api_router, prefix=settings.API_PREFIX)
+    app.dependency_overrides[get_async_db] = override_get_async_db
+
+    async with TestingAsyncSessionLocal() as db:
+        admin = User(email="admin@example.com", hashed_password="x", role=UserRole.ADMIN)
+        db.add(admin)
+        await db.commit()
+        token = create_access_token(admin.id)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url="http://test",
+        headers={"Authorization": f"Bearer {token}"},
+    ) as client:
+        yield client
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+
+
+@pytest.mark.asyncio
+async def test_async_category_tree(async_client):
+    response = await async_client.post(
+        "/api/v1/categories/", params={"name": "Root", "order": 1}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    root_id = response.json()["id"]
+    await async_client.post(
+        "/api/v1/categories/", params={"name": "Child", "parent_id": root_id}
+    )
+
+    response = await async_client.get("/api/v1/categories/tree")
+    assert response.status_code == status.HTTP_200_OK
+    tree = response.json()
+    assert [c["name"] for c in tree] == ["Root"]
+    assert [c["name"] for c in tree[0]["subcategories"]] == ["Child"]
+
+
+@pytest.mark.asyncio
+async def test_async_conditional_get(async_client):
+    await async_client.post("/api/v1/categories/", params={"name": "Root"})
+    etag = (await async_client.get("/api/v1/categories/tree")).headers["ETag"]
+
+    response = await async_client.get("/api/v1/categories/tree", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    await async_client.post("/api/v1/categories/", params={"name": "Other"})
+    response = await async_client.get("/api/v1/categories/tree", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_async_update_and_delete_category(async_client):
+    response = await async_client.post("/api/v1/categories/", params={"name": "Old"})
+    category_id = response.json()["id"]
+
+    response = await async_client.put(
+        f"/api/v1/categories/{category_id}", params={"name": "New"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["name"] == "New"
+
+    response = await async_client.delete(f"/api/v1/categories/{category_id}")
+    assert response.status_code == status.HTTP_200_OK
+    response = await async_client.get(f"/api/v1/categories/{category_id}")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_async_get_orders(async_client):
+    response = await async_client.get("/api/v1/orders/")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+
+@pytest.mark.asyncio
+async def test_async_create_order_is_priced_server_side(async_client):
+    async with TestingAsyncSessionLocal() as db:
+        category = Category(name="Bags", path="/")
+        db.add(category)
+        await db.flush()
+        product = Product(name="Tote", category_id=category.id)
+        product.variations = [ProductVariation(color_name="Sand", color_hex="#c2b280", price=24.5)]
+        db.add(product)
+        await db.commit()
+        item = {"product_id": product.id, "variation_id": product.variations[0].id}
+
+    order = {
+        "full_name": "Buyer", "email": "admin@example.com", "phone": "+70000000000",
+        "delivery_method": "pickup", "payment_method": "card",
+    }
+    response = await async_client.post(
+        "/api/v1/orders/", json={**order, "items": [{**item, "quantity": 2, "price": 1}]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["total_amount"] == 49.0
+
+    response = await async_client.post(
+        "/api/v1/orders/", json={**order, "items": [{**item, "variation_id": 999, "quantity": 1}]}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"][0]["loc"] == ["body", "items", 0]
+
+
+@pytest.mark.asyncio
+async def test_async_export_orders(async_client):
+    async with TestingAsyncSessionLocal() as db:
+        category = Category(name="Bags", path="/")
+        db.add(category)
+        await db.flush()
+        product = Product(name="Tote", category_id=category.id)
+        product.variations = [ProductVariation(color_name="Sand", color_hex="#c2b280", price=24.5)]
+        db.add(product)
+        await db.commit()
+        item = {"product_id": product.id, "variation_id": product.variations[0].id, "quantity": 1}
+
+    order = {
+        "full_name": "Buyer", "email": "admin@example.com", "phone": "+70000000000",
+        "delivery_method": "pickup", "payment_method": "card", "items": [item, item],
+    }
+    for _ in range(2):
+        await async_client.post("/api/v1/orders/", json=order)
+
+    response = await async_client.get("/api/v1/admin/orders/export")
+    assert response.status_code == status.HTTP_200_OK
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [len(line["items"]) for line in lines] == [2, 2]
+    assert lines[0]["items"][0]["color_name"] == "Sand"
+
+    response = await async_client.get("/api/v1/admin/orders/export", params={"status": "paid"})
+    assert response.text == ""
+
+
+@pytest.mark.asyncio
+async def test_async_sales_rollups(async_client):
+    async with TestingAsyncSessionLocal() as db:
+        category = Category(name="Bags", path="/")
+        db.add(category)
+        await db.flush()
+        product = Product(name="Tote", category_id=category.id)
+        product.variations = [ProductVariation(color_name="Sand", color_hex="#c2b280", price=24.5)]
+        db.add(product)
+        await db.commit()
+        item = {"product_id": product.id, "variation_id": product.variations[0].id, "quantity": 2}
+
+    order = {
+        "full_name": "Buyer", "email": "admin@example.com", "phone": "+70000000000",
+        "delivery_method": "pickup", "payment_method": "card", "items": [item],
+    }
+    placed = [(await async_client.post("/api/v1/orders/", json=order)).json() for _ in range(2)]
+    await async_client.put(f"/api/v1/orders/{placed[0]['id']}", json={"status": "paid"})
+
+    response = await async_client.get("/api/v1/admin/sales/daily", params={"status": "paid"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [(p["revenue"], p["units"], p["orders"]) for p in response.json()] == [(49.0, 2, 1)]
+    response = await async_client.get("/api/v1/admin/sales/top-products")
+    assert response.json() == [
+        {"product_id": item["product_id"], "name": "Tote", "revenue": 98.0, "units": 4, "orders": 2}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_async_segments(async_client):
+    async with TestingAsyncSessionLocal() as db:
+        category = Category(name="Bags", path="/")
+        db.add(category)
+        await db.flush()
+        product = Product(name="Tote", category_id=category.id)
+        product.variations = [ProductVariation(color_name="Sand", color_hex="#c2b280", price=24.5)]
+        db.add(product)
+        await db.commit()
+        item = {"product_id": product.id, "variation_id": product.variations[0].id, "quantity": 1}
+    order = {
+        "full_name": "Buyer", "email": "admin@example.com", "phone": "+70000000000",
+        "delivery_method": "pickup", "payment_method": "card", "items": [item],
+    }
+    for _ in range(2):
+        await async_client.post("/api/v1/orders/", json=order)
+
+    response = await async_client.post("/api/v1/admin/segments/rebuild")
+    assert response.status_code == status.HTTP_200_OK
+    assert (response.json()["users"], response.json()["orders"]) == (1, 2)
+    response = await async_client.get("/api/v1/admin/segments")
+    assert [(s["recency_days"], s["frequency"], s["monetary"]) for s in response.json()] == [(0, 2, 49.0)]
+    response = await async_client.get("/api/v1/admin/segments/summary")
+    assert [s["users"] for s in response.json()] == [1]
+
+
+@pytest.mark.asyncio
+async def test_async_stock(async_client):
+    async with TestingAsyncSessionLocal() as db:
+        category = Category(name="Bags", path="/")
+        db.add(category)
+        await db.flush()
+        product = Product(name="Tote", category_id=category.id)
+        product.variations = [ProductVariation(color_name="Sand", color_hex="#c2b280", price=24.5, stock=3)]
+        db.add(product)
+        await db.commit()
+        variation_id = product.variations[0].id
+        item = {"product_id": product.id, "variation_id": variation_id, "quantity": 2}
+    order = {
+        "full_name": "Buyer", "email": "admin@example.com", "phone": "+70000000000",
+        "delivery_method": "pickup", "payment_method": "card", "items": [item],
+    }
+    placed = await async_client.post("/api/v1/orders/", json=order)
+    assert placed.status_code == status.HTTP_200_OK
+    response = await async_client.post("/api/v1/orders/", json=order)
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.json()["detail"][0]["available"] == 1
+
+    await async_client.put(f"/api/v1/orders/{placed.json()['id']}", json={"status": "cancelled"})
+    assert (await async_client.post("/api/v1/orders/", json=order)).status_code == status.HTTP_200_OK
+
+    response = await async_client.put(f"/api/v1/admin/variations/{variation_id}/stock", json={"stock": 7})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"id": variation_id, "product_id": item["product_id"], "stock": 7}
+
+
+@pytest.mark.asyncio
+async def test_async_import_products(async_client):
+    async with TestingAsyncSessionLocal() as db:
+        category = Category(name="Bags", path="/")
+        db.add(category)
+        await db.commit()
+    line = {
+        "name": "Tote", "category_id": category.id, "images": [],
+        "variations": [{"color_name": "Sand", "color_hex": "#c2b280", "price": 24.5}],
+    }
+    body = "\n".join([json.dumps(line), json.dumps({**line, "category_id": 999})])
+    response = await async_client.post(
+        "/api/v1/products/import", files={"file": ("products.ndjson", body.encode())}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    report = response.json()
+    assert (report["created"], report["failed"]) == (1, 1)
+    assert report["errors"][0]["row"] == 2
+
+    line["variations"][0]["price"] = 30
+    response = await async_client.post(
+        "/api/v1/products/import", params={"upsert": True},
+        files={"file": ("products.ndjson", json.dumps(line).encode())},
+    )
+    assert response.json()["updated"] == 1
+    response = await async_client.get("/api/v1/products/search", params={"query": "tote"})
+    assert response.json()[0]["variations"][0]["price"] == 30
+
+
+@pytest.mark.asyncio
+async def test_async_upload_product_image(async_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_storage, "root", str(tmp_path))
+    monkeypatch.setattr(media_storage, "variant_widths", ())
+    async with TestingAsyncSessionLocal() as db:
+        category = Category(name="Bags", path="/")
+        db.add(category)
+        await db.flush()
+        product = Product(name="Tote", category_id=category.id)
+        db.add(product)
+        await db.commit()
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "tan").save(buffer, "JPEG")
+    response = await async_client.post(
+        f"/api/v1/products/{product.id}/images", files={"image": ("tote.jpg", buffer.getvalue())}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    path = response.json()["image_path"]
+    assert path.endswith(".jpg") and (tmp_path / path).read_bytes() == buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_async_search_products(async_client):
+    async with TestingAsyncSessionLocal() as db:
+        category = Category(name="Shoes", path="/")
+        db.add(category)
+        await db.flush()
+        db.add_all([
+            Product(name="Trail runner", description="Grippy sole", category_id=category.id),
+            Product(name="Loafer", description="Leather, for trail walks", category_id=category.id),
+        ])
+        await db.commit()
+
+    response = await async_client.get("/api/v1/products/search", params={"query": "trai"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [p["name"] for p in response.json()] == ["Trail runner", "Loafer"]
@@ -0,0 +1,80 @@
+from app.crud import crud_order, crud_product
+from app.models.category import Category
+from app.models.order import DeliveryMethod, PaymentMethod
+from app.models.user import User
+from app.schemas.order import OrderCreate, OrderItemCreate, OrderUpdate
+from app.schemas.product import (
+    ProductCreate, ProductImageCreate, ProductUpdate, ProductVariationCreate
+)
+
+
+def product_in(category_id: int, variations: int, images: int) -> ProductCreate:
+    return ProductCreate(
+        name=f"Product {variations}x{images}",
+        category_id=category_id,
+        variations=[
+            ProductVariationCreate(color_name=f"Color {v}", color_hex="#000000", price=10 + v)
+            for v in range(variations)
+        ],
+        images=[ProductImageCreate(image_path=f"products/{i}.jpg", order=i) for i in range(images)],
+    )
+
+
+def test_product_write_statements_do_not_grow_with_rows(db, count_queries):
+    category = Category(name="Bulk", path="/")
+    db.add(category)
+    db.commit()
+    category_id = category.id
+
+    with count_queries() as small:
+        crud_product.product.create_with_variations(db, obj_in=product_in(category_id, 1, 1))
+    with count_queries() as large:
+        product = crud_product.product.create_with_variations(
+            db, obj_in=product_in(category_id, 30, 100)
+        )
+
+    assert len(large) == len(small)
+    assert sum(statement.startswith("INSERT") for statement in large) == 3
+    assert [v.color_name for v in product.variations] == [f"Color {v}" for v in range(30)]
+    assert len(product.images) == 100
+
+    variations = [
+        ProductVariationCreate(color_name=f"Shade {v}", color_hex="#ffffff", price=5)
+        for v in range(30)
+    ]
+    with count_queries() as update:
+        product = crud_product.product.update_with_variations(
+            db, db_obj=product, obj_in=ProductUpdate(name="Restocked"), variations=variations
+        )
+    assert sum(statement.startswith("INSERT") for statement in update) == 1
+    assert [v.color_name for v in product.variations] == [f"Shade {v}" for v in range(30)]
+
+
+def test_order_items_are_replaced_in_one_insert(db, count_queries):
+    category = Category(name="Bulk orders", path="/")
+    db.add(category)
+    db.commit()
+    product = crud_product.product.create_with_variations(
+        db, obj_in=product_in(category.id, 20, 0)
+    )
+    items = [
+        OrderItemCreate(product_id=product.id, variation_id=variation.id, quantity=1)
+        for variation in product.variations
+    ]
+    user = User(email="bulk@example.com", hashed_password="unused")
+    db.add(user)
+    db.commit()
+    order = crud_order.order.create_with_items(db, obj_in=OrderCreate(
+        full_name="Buyer", email=user.email, phone="+70000000000",
+        delivery_method=DeliveryMethod.PICKUP, payment_method=PaymentMethod.CARD,
+        items=items[:1],
+    ), user_id=user.id)
+
+    with count_queries() as statements:
+        order = crud_order.order.update_with_items(
+            db, db_obj=order, obj_in=OrderUpdate(), items=items
+        )
+    # One for all the items, besides the sales rollup upserts
+    assert sum(statement.startswith("INSERT INTO orderitem") for statement in statements) == 1
+    assert len(order.items) == 20
+    assert order.total_amount == sum(10 + v for v in range(20))
@@ -0,0 +1,123 @@
+import redis
+from fastapi import status
+
+from app.core import cache
+from app.crud.category import category as crud_category
+from app.crud.product import product as crud_product
+from app.schemas.category import CategoryCreate, CategoryUpdate
+from app.schemas.product import ProductUpdate
+
+ETAG = '"etag"'
+
+
+def test_category_tree_is_served_from_cache(client, db, admin_headers, count_queries):
+    crud_category.create(db, obj_in=CategoryCreate(name="Root"))
+
+    first = client.get("/api/v1/categories/tree", headers=admin_headers)
+    with count_queries() as statements:
+        second = client.get("/api/v1/categories/tree", headers=admin_headers)
+
+    assert second.status_code == status.HTTP_200_OK
+    assert second.json() == first.json()
+    # Only the ETag fingerprint hits the database
+    assert len(statements) == 1
+    assert "max(category.updated_at)" in statements[0]
+
+    stats = client.get("/api/v1/admin/cache", headers=admin_headers).json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_category_writes_invalidate_tree(client, db, admin_headers, fake_redis):
+    root = crud_category.create(db, obj_in=CategoryCreate(name="Root"))
+    client.get("/api/v1/categories/tree", headers=admin_headers)
+    assert fake_redis.exists(cache.CATEGORY_TREE_KEY)
+
+    crud_category.create(db, obj_in=CategoryCreate(name="Child", parent_id=root.id))
+    assert not fake_redis.exists(cache.CATEGORY_TREE_KEY)
+    tree = client.get("/api/v1/categories/tree", headers=admin_headers).json()
+    assert [c["name"] for c in tree[0]["subcategories"]] == ["Child"]
+
+    crud_category.update(db, db_obj=root, obj_in=CategoryUpdate(name="Renamed"))
+    tree = client.get("/api/v1/categories/tree", headers=admin_headers).json()
+    assert tree[0]["name"] == "Renamed"
+
+
+def test_product_writes_invalidate_precisely(db, fake_redis, create_product):
+    shoes = crud_category.create(db, obj_in=CategoryCreate(name="Shoes"))
+    hats = crud_category.create(db, obj_in=CategoryCreate(name="Hats"))
+    sneaker = create_product("Sneaker", category_id=shoes.id)
+    boot = create_product("Boot", category_id=shoes.id)
+    cap = create_product("Cap", category_id=hats.id)
+
+    for product in (sneaker, boot, cap):
+        cache.catalog_cache.set_product(product.id, product.category_id, ETAG, "{}")
+    cache.catalog_cache.set_category_products(shoes.id, "skip:0", 100, ETAG, "[]", None)
+    cache.catalog_cache.set_category_products(hats.id, "skip:0", 100, ETAG, "[]", None)
+
+    crud_product.update_with_variations(
+        db, db_obj=sneaker, obj_in=ProductUpdate(category_id=hats.id)
+    )
+    assert cache.catalog_cache.get_product(sneaker.id, ETAG) is None
+    assert cache.catalog_cache.get_category_products(shoes.id, "skip:0", 100, ETAG) is None
+    assert cache.catalog_cache.get_category_products(hats.id, "skip:0", 100, ETAG) is None
+    assert cache.catalog_cache.get_product(boot.id, ETAG) == "{}"
+    assert cache.catalog_cache.get_product(cap.id, ETAG) == "{}"
+
+    crud_product.remove(db, id=boot.id)
+    assert cache.catalog_cache.get_product(boot.id, ETAG) is None
+    assert cache.catalog_cache.get_product(cap.id, ETAG) == "{}"
+
+    # Renaming a category changes the category name in its product details
+    crud_category.update_with_image(db, db_obj=hats, obj_in=CategoryUpdate(name="Caps"))
+    assert cache.catalog_cache.get_product(cap.id, ETAG) is None
+
+
+def test_entries_are_only_served_under_their_etag(db):
+    shoes = crud_category.create(db, obj_in=CategoryCreate(name="Shoes"))
+    cache.catalog_cache.set_product(1, shoes.id, ETAG, "{}")
+    cache.catalog_cache.set_category_products(shoes.id, "skip:0", 100, ETAG, "[]", "next")
+    cache.catalog_cache.set_tree(ETAG, "[]")
+
+    assert cache.catalog_cache.get_product(1, ETAG) == "{}"
+    assert cache.catalog_cache.get_product(1, '"newer"') is None
+    assert cache.catalog_cache.get_category_products(shoes.id, "skip:0", 100, ETAG) == ("[]", "next")
+    assert cache.catalog_cache.get_category_products(shoes.id, "skip:0", 100, '"newer"') is None
+    assert cache.catalog_cache.get_tree('"newer"') is None
+    assert cache.catalog_cache.stats()["misses"] == 3
+
+
+def test_read_racing_a_write_does_not_cache_the_old_body(
+    client, db, admin_headers, monkeypatch, create_product
+):
+    shoes = crud_category.create(db, obj_in=CategoryCreate(name="Shoes"))
+    sneaker = create_product("Sneaker", category_id=shoes.id)
+    set_product = cache.catalog_cache.set_product
+
+    def write_then_set(*args):
+        # The request has read and rendered the old row; a write commits and
+        # invalidates before the request stores what it read
+        crud_product.update_with_variations(db, db_obj=sneaker, obj_in=ProductUpdate(name="Renamed"))
+        set_product(*args)
+
+    monkeypatch.setattr(cache.catalog_cache, "set_product", write_then_set)
+    first = client.get(f"/api/v1/products/{sneaker.id}", headers=admin_headers)
+    assert first.json()["name"] == "Sneaker"
+    monkeypatch.setattr(cache.catalog_cache, "set_product", set_product)
+
+    second = client.get(f"/api/v1/products/{sneaker.id}", headers=admin_headers)
+    assert second.json()["name"] == "Renamed"
+    assert second.headers["ETag"] != first.headers["ETag"]
+    third = client.get(f"/api/v1/products/{sneaker.id}", headers=admin_headers)
+    assert third.json()["name"] == "Renamed"
+
+
+def test_cache_falls_back_when_redis_is_down(client, db, admin_headers, monkeypatch):
+    monkeypatch.setattr(
+        cache.catalog_cache, "client", redis.Redis(port=1, socket_connect_timeout=0.1)
+    )
+    crud_category.create(db, obj_in=CategoryCreate(name="Root"))
+
+    response = client.get("/api/v1/categories/tree", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert [c["name"] for c in response.json()] == ["Root"]
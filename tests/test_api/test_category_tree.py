@@ -0,0 +1,92 @@
+from fastapi import status
+
+from app.crud.category import category as crud_category
+from app.schemas.category import CategoryCreate, CategoryUpdate
+
+
+def build_tree(db, roots: int, depth: int, fanout: int) -> list:
+    """Create `roots` trees of the given depth and fanout, return all ids"""
+    ids = []
+    level = [None] * roots
+    for _ in range(depth):
+        next_level = []
+        for parent_id in level:
+            for i in range(fanout if parent_id else 1):
+                node = crud_category.create(
+                    db, obj_in=CategoryCreate(name=f"c{len(ids)}", order=i, parent_id=parent_id)
+                )
+                ids.append(node.id)
+                next_level.append(node.id)
+        level = next_level
+    return ids
+
+
+def test_category_tree_query_count_is_constant(client, db, admin_headers, count_queries):
+    build_tree(db, roots=1, depth=2, fanout=2)
+    with count_queries() as small:
+        response = client.get("/api/v1/categories/tree", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+
+    build_tree(db, roots=3, depth=4, fanout=3)
+    with count_queries() as large:
+        response = client.get("/api/v1/categories/tree", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 4
+
+    # The ETag fingerprint and one query for the whole tree
+    assert len(small) == len(large) == 2
+
+
+def test_category_tree_shape(client, db, admin_headers):
+    root = crud_category.create(db, obj_in=CategoryCreate(name="Root"))
+    second = crud_category.create(db, obj_in=CategoryCreate(name="B", order=2, parent_id=root.id))
+    first = crud_category.create(db, obj_in=CategoryCreate(name="A", order=1, parent_id=root.id))
+    crud_category.create(db, obj_in=CategoryCreate(name="A1", parent_id=first.id))
+
+    response = client.get("/api/v1/categories/tree", headers=admin_headers)
+    tree = response.json()
+    assert [c["name"] for c in tree] == ["Root"]
+    assert [c["id"] for c in tree[0]["subcategories"]] == [first.id, second.id]
+    assert [c["name"] for c in tree[0]["subcategories"][0]["subcategories"]] == ["A1"]
+    assert tree[0]["subcategories"][1]["subcategories"] == []
+
+
+def test_subtree_and_ancestors(client, db, admin_headers, count_queries):
+    ids = build_tree(db, roots=1, depth=4, fanout=2)
+    root_id, leaf_id = ids[0], ids[-1]
+
+    with count_queries() as statements:
+        response = client.get(f"/api/v1/categories/{root_id}", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    # The ETag fingerprint and the subtree
+    assert len(statements) == 2
+
+    def count(node):
+        return 1 + sum(count(child) for child in node["subcategories"])
+    assert count(response.json()) == len(ids)
+
+    with count_queries() as statements:
+        response = client.get(f"/api/v1/categories/{leaf_id}/ancestors", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(statements) == 1
+    breadcrumb = response.json()
+    assert len(breadcrumb) == 3
+    assert breadcrumb[0]["id"] == root_id
+    assert breadcrumb[-1]["id"] == crud_category.get(db, id=leaf_id).parent_id
+
+
+def test_move_category_updates_subtree_paths(client, db, admin_headers):
+    a = crud_category.create(db, obj_in=CategoryCreate(name="A"))
+    b = crud_category.create(db, obj_in=CategoryCreate(name="B"))
+    child = crud_category.create(db, obj_in=CategoryCreate(name="Child", parent_id=a.id))
+    leaf = crud_category.create(db, obj_in=CategoryCreate(name="Leaf", parent_id=child.id))
+
+    crud_category.update(db, db_obj=child, obj_in=CategoryUpdate(parent_id=b.id))
+    db.expire_all()
+    assert [c.id for c in crud_category.get_ancestors(db, id=leaf.id)] == [b.id, child.id]
+    assert crud_category.get(db, id=leaf.id).path == f"/{b.id}/{child.id}/{leaf.id}/"
+
+    response = client.put(
+        f"/api/v1/categories/{b.id}", params={"parent_id": leaf.id}, headers=admin_headers
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
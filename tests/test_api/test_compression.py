@@ -0,0 +1,126 @@
+import gzip
+
+import pytest
+import zstandard
+from fastapi import FastAPI, status
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.compression import CompressionMiddleware, negotiate
+from app.crud.category import category as crud_category
+from app.schemas.category import CategoryCreate
+
+BODY = b"".join(b'{"id": %d, "name": "Product %d"}\n' % (i, i) for i in range(200))
+
+
+@pytest.fixture
+def app_client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/text")
+    def text(size: int = len(BODY)):
+        return Response(BODY[:size], media_type="application/json", headers={"ETag": '"abc"'})
+
+    @app.get("/image")
+    def image():
+        return Response(BODY, media_type="image/png")
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([BODY[:10], b"", BODY[10:]]), media_type="application/x-ndjson")
+
+    @app.get("/encoded")
+    def encoded():
+        return Response(gzip.compress(BODY), headers={"Content-Encoding": "gzip"})
+
+    @app.get("/no-transform")
+    def no_transform():
+        return PlainTextResponse(BODY, headers={"Cache-Control": "no-transform"})
+
+    return TestClient(app)
+
+
+def test_negotiate():
+    both = ("zstd", "gzip")
+    assert negotiate("gzip, deflate, br, zstd", both) == "zstd"
+    assert negotiate("zstd;q=0.5, gzip", both) == "gzip"
+    assert negotiate("gzip, zstd", ("gzip",)) == "gzip"
+    assert negotiate("*;q=0.1", both) == "zstd"
+    assert negotiate("identity", both) is None
+    assert negotiate("gzip;q=0, zstd;q=0", both) is None
+    assert negotiate("", both) is None
+
+
+def test_gzip_above_minimum_size(app_client):
+    response = app_client.get("/text", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < len(BODY) // 4
+    assert response.headers["ETag"] == 'W/"abc"'
+    assert response.content == BODY
+
+
+def test_zstd_preferred(app_client):
+    with app_client.stream("GET", "/text", headers={"Accept-Encoding": "gzip, zstd"}) as response:
+        assert response.headers["Content-Encoding"] == "zstd"
+        raw = b"".join(response.iter_raw())
+    assert zstandard.ZstdDecompressor().decompress(raw) == BODY
+
+
+def test_zstd_streaming(app_client):
+    with app_client.stream("GET", "/stream", headers={"Accept-Encoding": "zstd"}) as response:
+        assert response.headers["Content-Encoding"] == "zstd"
+        raw = b"".join(response.iter_raw())
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(raw) == BODY
+
+
+def test_small_bodies_and_identity_pass_through(app_client):
+    response = app_client.get("/text?size=100", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+    assert response.headers["ETag"] == '"abc"'
+    assert response.content == BODY[:100]
+
+    # Bodies other clients get compressed vary by Accept-Encoding for all
+    for accept_encoding in ("identity", ""):
+        response = app_client.get("/text", headers={"Accept-Encoding": accept_encoding})
+        assert "Content-Encoding" not in response.headers
+        assert response.headers["Vary"] == "Accept-Encoding"
+        assert response.headers["ETag"] == '"abc"'
+        assert response.content == BODY
+    response = app_client.get("/stream", headers={"Accept-Encoding": "identity"})
+    assert (response.headers["Vary"], response.content) == ("Accept-Encoding", BODY)
+
+
+@pytest.mark.parametrize("path", ["/image", "/encoded", "/no-transform"])
+def test_compressed_media_passes_through(app_client, path):
+    response = app_client.get(path, headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("Content-Encoding") in (None, "gzip")
+    assert response.content == BODY
+    assert "Vary" not in response.headers
+
+
+def test_streaming_response_is_compressed_per_chunk(app_client):
+    with app_client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw) == BODY
+
+
+def test_catalog_response_compressed(client, db, admin_headers):
+    for i in range(50):
+        crud_category.create(db, obj_in=CategoryCreate(name=f"Category {i}"))
+
+    response = client.get("/api/v1/categories/tree", headers={**admin_headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(response.json()) == 50
+
+    # The weak ETag still revalidates
+    response = client.get(
+        "/api/v1/categories/tree",
+        headers={**admin_headers, "Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
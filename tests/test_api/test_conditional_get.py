@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from fastapi import status
+
+from app.crud.category import category as crud_category
+from app.crud.product import product as crud_product
+from app.schemas.category import CategoryCreate, CategoryUpdate
+from app.schemas.product import ProductUpdate, ProductVariationCreate
+
+
+def test_product_not_modified_skips_loading(client, db, admin_headers, count_queries, create_product):
+    shoes = crud_category.create(db, obj_in=CategoryCreate(name="Shoes")).id
+    product_id = create_product("Sneaker", category_id=shoes).id
+
+    response = client.get(f"/api/v1/products/{product_id}", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers["ETag"]
+    assert etag.startswith('"')
+    assert response.headers["Last-Modified"].endswith("GMT")
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    with count_queries() as statements:
+        response = client.get(
+            f"/api/v1/products/{product_id}", headers={**admin_headers, "If-None-Match": etag}
+        )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    # Only the fingerprint, nothing is loaded
+    assert len(statements) == 1
+
+
+def test_product_writes_change_etag(client, db, admin_headers, create_product):
+    shoes = crud_category.create(db, obj_in=CategoryCreate(name="Shoes")).id
+    product_id = create_product("Sneaker", category_id=shoes).id
+    url = f"/api/v1/products/{product_id}"
+    etag = client.get(url, headers=admin_headers).headers["ETag"]
+
+    crud_product.update_with_variations(
+        db,
+        db_obj=crud_product.get(db, id=product_id),
+        obj_in=ProductUpdate(),
+        variations=[ProductVariationCreate(color_name="Blue", color_hex="#00f", price=12)],
+    )
+    response = client.get(url, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["variations"][0]["color_name"] == "Blue"
+    assert response.headers["ETag"] != etag
+
+    # The category name is part of the product response
+    etag = response.headers["ETag"]
+    crud_category.update(
+        db, db_obj=crud_category.get(db, id=shoes), obj_in=CategoryUpdate(name="Boots")
+    )
+    response = client.get(url, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["category_name"] == "Boots"
+
+
+def test_category_product_list_ignores_other_categories(client, db, admin_headers, create_product):
+    shoes = crud_category.create(db, obj_in=CategoryCreate(name="Shoes")).id
+    hats = crud_category.create(db, obj_in=CategoryCreate(name="Hats")).id
+    create_product("Sneaker", category_id=shoes)
+    url = f"/api/v1/products/?category_id={shoes}"
+    etag = client.get(url, headers=admin_headers).headers["ETag"]
+
+    create_product("Cap", category_id=hats)
+    response = client.get(url, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    create_product("Boot", category_id=shoes)
+    response = client.get(url, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 2
+
+    # Deleting a product changes the count even when nothing else moved
+    etag = response.headers["ETag"]
+    crud_product.remove(db, id=response.json()[1]["id"])
+    response = client.get(url, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_category_tree_if_modified_since(client, db, admin_headers):
+    crud_category.create(db, obj_in=CategoryCreate(name="Root"))
+    response = client.get("/api/v1/categories/tree", headers=admin_headers)
+    last_modified = response.headers["Last-Modified"]
+
+    response = client.get(
+        "/api/v1/categories/tree", headers={**admin_headers, "If-Modified-Since": last_modified}
+    )
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(days=1), usegmt=True)
+    response = client.get(
+        "/api/v1/categories/tree", headers={**admin_headers, "If-Modified-Since": earlier}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_category_endpoints_share_validators(client, db, admin_headers):
+    root = crud_category.create(db, obj_in=CategoryCreate(name="Root")).id
+    etag = client.get("/api/v1/categories/", headers=admin_headers).headers["ETag"]
+    for url in ("/api/v1/categories/", "/api/v1/categories/tree", f"/api/v1/categories/{root}"):
+        response = client.get(url, headers={**admin_headers, "If-None-Match": f'W/{etag}, "x"'})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    crud_category.create(db, obj_in=CategoryCreate(name="Child", parent_id=root))
+    response = client.get(
+        f"/api/v1/categories/{root}", headers={**admin_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [c["name"] for c in response.json()["subcategories"]] == ["Child"]
+
+
+def test_if_none_match_star_needs_an_existing_resource(client, db, admin_headers, create_product):
+    shoes = crud_category.create(db, obj_in=CategoryCreate(name="Shoes")).id
+    product_id = create_product("Sneaker", category_id=shoes).id
+    star = {**admin_headers, "If-None-Match": "*"}
+
+    for url in (f"/api/v1/products/{product_id}", f"/api/v1/categories/{shoes}"):
+        assert client.get(url, headers=star).status_code == status.HTTP_304_NOT_MODIFIED
+    for url in (f"/api/v1/products/{product_id + 1}", f"/api/v1/categories/{shoes + 1}"):
+        assert client.get(url, headers=star).status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,62 @@
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.db.pool import InstrumentedQueuePool, instrument
+
+
+@pytest.fixture
+def pooled_engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.sqlite3'}",
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    yield engine
+    engine.dispose()
+
+
+def test_checkouts_and_checkins_are_counted(pooled_engine):
+    metrics = instrument(pooled_engine)
+    for _ in range(3):
+        with pooled_engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+    stats = metrics.stats(pooled_engine.pool)
+    assert stats["checkouts"] == 3
+    assert stats["checkins"] == 3
+    assert stats["connects"] == 1
+    assert stats["checked_out"] == 0
+    assert stats["max_checked_out"] == 1
+    assert stats["pool_size"] == 1
+    assert stats["checked_in"] == 1
+
+
+def test_exhausted_pool_records_timeout_and_wait(pooled_engine):
+    metrics = instrument(pooled_engine)
+    with pooled_engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            pooled_engine.connect()
+
+    stats = metrics.stats(pooled_engine.pool)
+    assert stats["timeouts"] == 1
+    assert stats["checkouts"] == 1
+    assert stats["wait_ms_max"] >= 50
+
+
+def test_metrics_survive_dispose(pooled_engine):
+    metrics = instrument(pooled_engine)
+    pooled_engine.dispose()
+    with pooled_engine.connect():
+        pass
+    assert metrics.stats()["checkouts"] == 1
+    assert metrics.stats()["wait_ms_max"] > 0
+
+
+def test_db_pool_stats_endpoint(client, admin_headers):
+    response = client.get("/api/v1/admin/db-pool", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert {"checkouts", "checkins", "timeouts", "wait_ms_p99", "pool_size"} <= set(response.json())
@@ -0,0 +1,375 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+
+import pytest
+from fastapi import UploadFile, status
+from PIL import Image
+
+from app.core.images import ImageFormat, variant_path
+from app.core.media import UploadTooLarge, media_storage
+from app.core.media_files import FileHandleCache, MediaFiles, media_files
+from app.core.variants import VariantCache, variant_cache
+from app.crud.category import category as crud_category
+from app.crud.product import product as crud_product
+from app.schemas.category import CategoryCreate
+from app.schemas.product import ProductCreate, ProductVariationCreate
+
+
+def png(width: int, height: int, color: str = "teal") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def noise(width: int, height: int) -> bytes:
+    # Variants of noise grow with their width
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (width, height), os.urandom(width * height * 3)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_storage, "root", str(tmp_path))
+    monkeypatch.setattr(media_storage, "variant_widths", (320, 640, 1280))
+    monkeypatch.setattr(variant_cache, "_entries", None)
+    monkeypatch.setattr(variant_cache, "renders", 0)
+    yield tmp_path
+    media_files.files.clear()
+
+
+def store(image: bytes) -> str:
+    return asyncio.run(media_storage.save(UploadFile(io.BytesIO(image))))
+
+
+def stored_files(root) -> list:
+    return sorted(
+        os.path.relpath(os.path.join(path, name), root)
+        for path, _, names in os.walk(root)
+        for name in names
+    )
+
+
+def test_category_image_is_stored_by_content_with_variants(client, admin_headers, media):
+    image = png(1000, 500)
+    response = client.post(
+        "/api/v1/categories/", params={"name": "Shoes"},
+        files={"image": ("photo.gif", image, "image/gif")}, headers=admin_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    digest = hashlib.sha256(image).hexdigest()
+    # The extension comes from the content, not the filename
+    path = f"uploads/{digest[:2]}/{digest[2:4]}/{digest}.png"
+    assert response.json()["image"] == path
+    with open(media / path, "rb") as stored:
+        assert stored.read() == image
+
+    media_storage.drain(timeout=60)
+    # No variant as wide as the original
+    assert stored_files(media) == [path, path[:-4] + "_320.webp", path[:-4] + "_640.webp"]
+    with Image.open(media / (path[:-4] + "_320.webp")) as variant:
+        assert (variant.format, variant.size) == ("WEBP", (320, 160))
+
+    # The same image again is not stored twice
+    category_id = response.json()["id"]
+    response = client.put(
+        f"/api/v1/categories/{category_id}", params={"name": "Shoes"},
+        files={"image": ("copy.png", image, "image/png")}, headers=admin_headers,
+    )
+    assert response.json()["image"] == path
+    media_storage.drain(timeout=60)
+    assert len(stored_files(media)) == 3
+
+
+def test_upload_rejects_other_files(client, admin_headers, media):
+    response = client.post(
+        "/api/v1/categories/", params={"name": "Shoes"},
+        files={"image": ("photo.png", b"<svg></svg>", "image/png")}, headers=admin_headers,
+    )
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    assert stored_files(media) == []
+
+
+def test_upload_size_limit(client, admin_headers, media, monkeypatch):
+    monkeypatch.setattr(media_storage, "max_size", 100)
+    response = client.post(
+        "/api/v1/categories/", params={"name": "Shoes"},
+        files={"image": ("photo.png", png(64, 64), "image/png")}, headers=admin_headers,
+    )
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert stored_files(media) == []
+
+
+@pytest.mark.asyncio
+async def test_size_limit_is_enforced_while_copying(media, monkeypatch):
+    monkeypatch.setattr(media_storage, "max_size", 100)
+    monkeypatch.setattr(media_storage, "chunk_size", 16)
+    # No declared size, so only the copy can catch it
+    upload = UploadFile(io.BytesIO(png(64, 64)))
+    with pytest.raises(UploadTooLarge):
+        await media_storage.save(upload)
+    assert upload.file.tell() <= 112
+    assert stored_files(media) == []
+
+
+def test_upload_product_image(client, db, admin_headers, media):
+    shoes = crud_category.create(db, obj_in=CategoryCreate(name="Shoes")).id
+    product = crud_product.create_with_variations(
+        db,
+        obj_in=ProductCreate(
+            name="Sneaker", category_id=shoes, images=[],
+            variations=[ProductVariationCreate(color_name="Red", color_hex="#f00", price=10)],
+        ),
+    )
+    url = f"/api/v1/products/{product.id}/images"
+    red = product.variations[0].id
+
+    response = client.post(
+        url, params={"variation_id": red, "order": 2},
+        files={"image": ("red.png", png(200, 200, "red"))}, headers=admin_headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    image = response.json()
+    assert (image["variation_id"], image["order"]) == (red, 2)
+    assert os.path.exists(media / image["image_path"])
+
+    response = client.get(f"/api/v1/products/{product.id}", headers=admin_headers)
+    assert [i["image_path"] for i in response.json()["images"]] == [image["image_path"]]
+
+    response = client.post(
+        url, params={"variation_id": red + 1},
+        files={"image": ("red.png", png(200, 200, "red"))}, headers=admin_headers,
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    media_storage.drain(timeout=60)
+
+
+def test_media_variants_are_rendered_once(client, media):
+    path = store(png(600, 300))
+    url = f"/media/{path}"
+
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"] == "image/png"
+    assert response.content == (media / path).read_bytes()
+
+    for _ in range(2):
+        response = client.get(url, params={"width": 128})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["Content-Type"] == "image/webp"
+        assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+        with Image.open(io.BytesIO(response.content)) as variant:
+            assert (variant.format, variant.size) == ("WEBP", (128, 64))
+    assert variant_cache.renders == 1
+
+    # Not upscaled, only re-encoded
+    response = client.get(url, params={"width": 960, "format": "jpeg"})
+    with Image.open(io.BytesIO(response.content)) as variant:
+        assert (variant.format, variant.size) == ("JPEG", (600, 300))
+
+    # Rendered at upload time, so served as it is
+    media_storage.drain(timeout=60)
+    response = client.get(url, params={"width": 320})
+    assert response.content == (media / variant_path(path, 320)).read_bytes()
+    assert variant_cache.renders == 2
+
+
+def test_media_rejects_unknown_paths_and_widths(client, media):
+    path = store(png(60, 30))
+    response = client.get(f"/media/{path}", params={"width": 100})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    for missing in ("uploads/00/00/missing.png", "cache/x.webp", "elsewhere.png"):
+        response = client.get(f"/media/{missing}", params={"width": 64})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+    for outside in ("uploads/../../etc/passwd", "/etc/passwd", "uploads/.partial/x"):
+        assert media_storage.resolve(outside) is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_render(media):
+    path = await media_storage.save(UploadFile(io.BytesIO(png(600, 300))))
+    cache = VariantCache(media_storage, "cache", max_bytes=10**9, quality=80)
+    variants = await asyncio.gather(
+        *(cache.get(path, width=64, format=ImageFormat.WEBP) for _ in range(5))
+    )
+    assert len(set(variants)) == 1
+    assert cache.renders == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_served(media):
+    path = await media_storage.save(UploadFile(io.BytesIO(noise(300, 300))))
+    cache = VariantCache(media_storage, "cache", max_bytes=10**9, quality=80)
+
+    async def get(width: int) -> str:
+        return await cache.get(path, width=width, format=ImageFormat.PNG)
+
+    w256, w128 = await get(256), await get(128)
+    await get(256)
+    cache.max_bytes = cache.size
+    w64 = await get(64)
+    assert [os.path.exists(p) for p in (w256, w128, w64)] == [True, False, True]
+    assert cache.size == os.path.getsize(w256) + os.path.getsize(w64)
+
+    # Another worker finds the files in the directory
+    other = VariantCache(media_storage, "cache", max_bytes=10**9, quality=80)
+    assert await other.get(path, width=64, format=ImageFormat.PNG) == w64
+    assert (other.renders, other.size) == (0, cache.size)
+
+
+@pytest.mark.asyncio
+async def test_cache_touches_the_disk_off_the_event_loop(media, monkeypatch):
+    path = await media_storage.save(UploadFile(io.BytesIO(noise(300, 300))))
+    warm = VariantCache(media_storage, "cache", max_bytes=10**9, quality=80)
+    w64 = await warm.get(path, width=64, format=ImageFormat.PNG)
+    w128 = await warm.get(path, width=128, format=ImageFormat.PNG)
+    sizes = os.path.getsize(w64) + os.path.getsize(w128)
+
+    on_the_loop = []
+    loop_thread = threading.get_ident()
+    for name in ("stat", "remove"):
+        def record(*args, call=getattr(os, name), **kwargs):
+            if threading.get_ident() == loop_thread:
+                on_the_loop.append((call.__name__, args[0]))
+            return call(*args, **kwargs)
+        monkeypatch.setattr(os, name, record)
+
+    # A cold worker scans the directory, then renders and evicts
+    cold = VariantCache(media_storage, "cache", max_bytes=1, quality=80)
+    found = await cold.get(path, width=64, format=ImageFormat.PNG)
+    size = cold.size
+    # Over the limit: the oldest variants go
+    w256 = await cold.get(path, width=256, format=ImageFormat.PNG)
+    monkeypatch.undo()
+    assert on_the_loop == []
+    assert found == w64
+    assert size == sizes
+    assert [os.path.exists(p) for p in (w64, w128, w256)] == [False, False, True]
+    assert cold.renders == 1
+
+
+def test_media_files_are_immutable_and_conditional(client, media):
+    image = png(60, 30)
+    path = store(image)
+    url = f"/media/{path}"
+
+    response = client.get(url)
+    assert response.headers["ETag"] == f'"{hashlib.sha256(image).hexdigest()}"'
+    assert response.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert int(response.headers["Content-Length"]) == len(image)
+
+    etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+    response = client.get(url, headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+    response = client.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    # If-None-Match wins over If-Modified-Since
+    response = client.get(url, headers={"If-None-Match": '"other"', "If-Modified-Since": last_modified})
+    assert response.status_code == status.HTTP_200_OK
+
+    response = client.head(url)
+    assert (response.status_code, response.content) == (status.HTTP_200_OK, b"")
+    assert int(response.headers["Content-Length"]) == len(image)
+    response = client.delete(url)
+    assert response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+    # Outside the API prefix, so not rate limited or routed
+    assert client.get(f"/api/v1/media/{path}").status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_media_range_requests(client, media):
+    image = png(60, 30)
+    path = store(image)
+    url = f"/media/{path}"
+    size = len(image)
+
+    response = client.get(url, headers={"Range": "bytes=10-19"})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.headers["Content-Range"] == f"bytes 10-19/{size}"
+    assert response.content == image[10:20]
+    response = client.get(url, headers={"Range": "bytes=-5"})
+    assert (response.content, response.headers["Content-Range"]) == (image[-5:], f"bytes {size - 5}-{size - 1}/{size}")
+    response = client.get(url, headers={"Range": "bytes=20-"})
+    assert response.content == image[20:]
+    response = client.get(url, headers={"Range": f"bytes=0-{size * 2}"})
+    assert response.headers["Content-Range"] == f"bytes 0-{size - 1}/{size}"
+
+    for spec in (f"bytes={size}-", "bytes=-0"):
+        response = client.get(url, headers={"Range": spec})
+        assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response.headers["Content-Range"] == f"bytes */{size}"
+
+    # Several ranges, a range ending before it starts, or a stale If-Range,
+    # get the whole file
+    for headers in (
+        {"Range": "bytes=0-1,5-6"}, {"Range": "bytes=5-2"}, {"Range": "bytes=0-1", "If-Range": '"stale"'}
+    ):
+        response = client.get(url, headers=headers)
+        assert (response.status_code, response.content) == (status.HTTP_200_OK, image)
+    etag = client.head(url).headers["ETag"]
+    response = client.get(url, headers={"Range": "bytes=0-1", "If-Range": etag})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+
+
+def test_media_descriptors_are_cached(client, media, monkeypatch):
+    monkeypatch.setattr(media_files, "files", FileHandleCache(1))
+    first, second = store(png(60, 30)), store(png(60, 30, "red"))
+    for path in (first, first, second, first):
+        assert client.get(f"/media/{path}").status_code == status.HTTP_200_OK
+    assert (media_files.files.hits, media_files.files.misses) == (1, 3)
+    media_files.files.clear()
+
+
+def test_file_handle_cache_closes_evicted_files_after_their_last_reader(tmp_path):
+    for name in "ab":
+        (tmp_path / name).write_bytes(name.encode())
+    cache = FileHandleCache(1)
+    with cache.open(str(tmp_path / "a")) as a:
+        with cache.open(str(tmp_path / "b")):
+            pass
+        # Evicted while read, so still open
+        assert os.pread(a.fd, 1, 0) == b"a"
+    with pytest.raises(OSError):
+        os.fstat(a.fd)
+    with cache.open(str(tmp_path / "b")) as b:
+        cache.discard(str(tmp_path / "b"))
+        assert os.pread(b.fd, 1, 0) == b"b"
+    with pytest.raises(OSError):
+        os.fstat(b.fd)
+
+
+@pytest.mark.asyncio
+async def test_media_files_use_zero_copy_send_when_offered(media):
+    image = png(60, 30)
+    path = await media_storage.save(UploadFile(io.BytesIO(image)))
+    app = MediaFiles(media_storage, variant_cache, fd_cache_size=8, chunk_size=16, inline_size=16)
+    sent = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopysend":
+            file = message["file"]
+            message = dict(message, body=os.pread(file.fileno(), message["count"], message["offset"]))
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": "GET", "path": f"/{path}", "root_path": "",
+        "query_string": b"", "headers": [(b"range", b"bytes=4-")],
+        "extensions": {"http.response.zerocopysend": {}},
+    }
+    await app(scope, None, send)
+    assert sent[0]["status"] == status.HTTP_206_PARTIAL_CONTENT
+    assert [m["type"] for m in sent[1:]] == ["http.response.zerocopysend"]
+    assert sent[1]["body"] == image[4:]
+
+    # Without the extension, bodies over inline_size are read in chunks
+    sent.clear()
+    del scope["extensions"]
+    await app(scope, None, send)
+    chunks = [m["body"] for m in sent[1:]]
+    assert b"".join(chunks) == image[4:]
+    assert len(chunks) == -(-(len(image) - 4) // 16)
+    app.files.clear()
@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+from fastapi import status
+
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.crud.category import category as crud_category
+from app.crud.order import order as crud_order
+from app.crud.product import product as crud_product
+from app.models.order import DeliveryMethod, Order, OrderItem, OrderStatus, PaymentMethod
+from app.models.user import User
+from app.schemas.category import CategoryCreate
+from app.schemas.product import ProductCreate, ProductVariationCreate
+
+
+@pytest.fixture
+def orders(db, admin_headers):
+    """Five orders on consecutive days; the third has no items"""
+    shoes = crud_category.create(db, obj_in=CategoryCreate(name="Shoes")).id
+    product = crud_product.create_with_variations(
+        db,
+        obj_in=ProductCreate(
+            name="Sneaker",
+            category_id=shoes,
+            variations=[
+                ProductVariationCreate(color_name="Red", color_hex="#f00", price=10),
+                ProductVariationCreate(color_name="Blue", color_hex="#00f", price=12),
+            ],
+            images=[],
+        ),
+    )
+    red, blue = sorted(product.variations, key=lambda v: v.id)
+    admin_id = db.query(User.id).scalar()
+    statuses = [OrderStatus.CREATED, OrderStatus.PAID, OrderStatus.PAID, OrderStatus.SHIPPED, OrderStatus.PAID]
+    for day, order_status in enumerate(statuses, start=1):
+        order = Order(
+            user_id=admin_id, status=order_status, total_amount=22 if day != 3 else 0,
+            full_name="Ann", email="ann@example.com", phone="+100",
+            delivery_method=DeliveryMethod.PICKUP, payment_method=PaymentMethod.CARD,
+            created_at=datetime(2024, 3, day, 12),
+        )
+        db.add(order)
+        db.flush()
+        if day != 3:
+            db.add_all([
+                OrderItem(order_id=order.id, product_id=product.id, variation_id=red.id, quantity=1, price=10),
+                OrderItem(order_id=order.id, product_id=product.id, variation_id=blue.id, quantity=1, price=12),
+            ])
+    db.commit()
+    return admin_headers
+
+
+def test_export_ndjson(client, orders, monkeypatch):
+    # Batches smaller than an order still keep its items together
+    monkeypatch.setattr(settings, "ORDER_EXPORT_BATCH_SIZE", 3)
+    response = client.get("/api/v1/admin/orders/export", headers=orders)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    assert response.headers["Content-Disposition"] == 'attachment; filename="orders.ndjson"'
+
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [order["created_at"][:10] for order in exported] == [f"2024-03-0{day}" for day in range(1, 6)]
+    assert [len(order["items"]) for order in exported] == [2, 2, 0, 2, 2]
+    assert exported[0]["status"] == "created"
+    assert exported[0]["items"][1] == {
+        "product_id": exported[0]["items"][1]["product_id"],
+        "variation_id": exported[0]["items"][1]["variation_id"],
+        "product_name": "Sneaker",
+        "color_name": "Blue",
+        "quantity": 1,
+        "price": 12.0,
+    }
+
+
+def test_export_csv_with_filters(client, orders):
+    response = client.get(
+        "/api/v1/admin/orders/export",
+        params={
+            "format": "csv",
+            "status": ["paid", "shipped"],
+            "created_from": "2024-03-02T00:00:00",
+            "created_to": "2024-03-05T00:00:00",
+        },
+        headers=orders,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["Content-Type"].startswith("text/csv")
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    # Days 2 to 4, one row per item and one for the order without items
+    assert [(row["created_at"][:10], row["status"], row["color_name"]) for row in rows] == [
+        ("2024-03-02", "paid", "Red"),
+        ("2024-03-02", "paid", "Blue"),
+        ("2024-03-03", "paid", ""),
+        ("2024-03-04", "shipped", "Red"),
+        ("2024-03-04", "shipped", "Blue"),
+    ]
+    assert rows[0]["order_id"] == rows[1]["order_id"]
+    assert rows[0]["delivery_method"] == "pickup"
+
+
+def test_export_closes_session_and_keeps_identity_map_empty(db, orders):
+    exported = crud_order.export(db, statuses=[OrderStatus.PAID])
+    assert next(exported)["status"] == OrderStatus.PAID
+    # Rows are not ORM objects, so nothing accumulates in the session
+    assert len(db.identity_map) == 0
+    assert len(list(exported)) == 2
+
+
+def test_export_requires_admin(client, db):
+    user = User(email="user@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+    response = client.get("/api/v1/admin/orders/export", headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,86 @@
+from fastapi import status
+
+from app.models.category import Category
+from app.models.product import Product, ProductVariation
+
+
+def seed_variations(db, count: int, available: bool = True) -> Product:
+    category = Category(name=f"Category {count}", path="/")
+    db.add(category)
+    db.flush()
+    product = Product(name=f"Product {count}", category_id=category.id)
+    product.variations = [
+        ProductVariation(
+            color_name=f"Color {v}", color_hex="#000000", price=10.5 + v, is_available=available
+        )
+        for v in range(count)
+    ]
+    db.add(product)
+    db.commit()
+    return product
+
+
+def order_payload(items: list) -> dict:
+    return {
+        "full_name": "Buyer",
+        "email": "admin@example.com",
+        "phone": "+70000000000",
+        "delivery_method": "pickup",
+        "payment_method": "card",
+        "items": items,
+    }
+
+
+def test_prices_and_total_come_from_database(client, db, admin_headers):
+    product = seed_variations(db, 2)
+    items = [
+        # A client supplied price is ignored
+        {"product_id": product.id, "variation_id": product.variations[0].id, "quantity": 2, "price": 0.01},
+        {"product_id": product.id, "variation_id": product.variations[1].id, "quantity": 1},
+    ]
+    response = client.post("/api/v1/orders/", json=order_payload(items), headers=admin_headers)
+
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert [item["price"] for item in data["items"]] == [10.5, 11.5]
+    assert [item["product_name"] for item in data["items"]] == [product.name] * 2
+    assert data["total_amount"] == 32.5
+
+
+def test_every_invalid_item_is_reported(client, db, admin_headers):
+    product = seed_variations(db, 1)
+    other = seed_variations(db, 2, available=False)
+    items = [
+        {"product_id": product.id, "variation_id": product.variations[0].id, "quantity": 1},
+        {"product_id": product.id, "variation_id": 999, "quantity": 1},
+        {"product_id": product.id, "variation_id": other.variations[0].id, "quantity": 1},
+        {"product_id": other.id, "variation_id": other.variations[1].id, "quantity": 1},
+    ]
+    response = client.post("/api/v1/orders/", json=order_payload(items), headers=admin_headers)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    errors = response.json()["detail"]
+    assert [error["loc"] for error in errors] == [
+        ["body", "items", 1], ["body", "items", 2], ["body", "items", 3]
+    ]
+    assert errors[0]["msg"] == "Product variation not found"
+    assert errors[2]["msg"] == "Product variation is not available"
+    assert client.get("/api/v1/orders/", headers=admin_headers).json() == []
+
+
+def test_order_statement_count_does_not_grow_with_items(client, db, admin_headers, count_queries):
+    def place(count: int):
+        product = seed_variations(db, count)
+        items = [
+            {"product_id": product.id, "variation_id": variation.id, "quantity": 1}
+            for variation in product.variations
+        ]
+        with count_queries() as statements:
+            response = client.post(
+                "/api/v1/orders/", json=order_payload(items), headers=admin_headers
+            )
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()["items"]) == len(items)
+        return statements
+
+    assert len(place(50)) == len(place(1))
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+from fastapi import status
+
+from app.core.security import create_access_token
+from app.crud.pagination import NEXT_CURSOR_HEADER
+from app.models.order import DeliveryMethod, Order, PaymentMethod
+from app.models.user import User
+
+
+def walk(client, url: str, headers: dict) -> list:
+    """Follow next cursors from the first page to the last one"""
+    pages = []
+    response = client.get(url, headers=headers)
+    while True:
+        assert response.status_code == status.HTTP_200_OK
+        pages.append(response.json())
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+        response = client.get(f"{url}&cursor={cursor}", headers=headers)
+
+
+def test_product_pages_follow_cursor(client, admin_headers, count_queries, create_product):
+    for i in range(25):
+        create_product(f"Product {i}", variations=())
+    with count_queries() as statements:
+        pages = walk(client, "/api/v1/products/?limit=10", admin_headers)
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    ids = [product["id"] for page in pages for product in page]
+    assert ids == sorted(set(ids))
+    # Every page after the first seeks past the cursor instead of skipping rows
+    assert sum("(product.id) > (?)" in statement for statement in statements) == 2
+
+
+def test_category_pages_are_cached_with_cursor(client, admin_headers, create_product):
+    category_id = create_product("Product 0", variations=()).category_id
+    for i in range(1, 12):
+        create_product(f"Product {i}", category_id=category_id, variations=())
+    url = f"/api/v1/products/?category_id={category_id}&limit=5"
+
+    first = walk(client, url, admin_headers)
+    second = walk(client, url, admin_headers)
+    assert [len(page) for page in first] == [5, 5, 2]
+    assert second == first
+
+
+def test_skip_and_limit_still_work(client, admin_headers, create_product):
+    for i in range(5):
+        create_product(f"Product {i}", variations=())
+    response = client.get("/api/v1/products/?skip=3&limit=10", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert [p["name"] for p in response.json()] == ["Product 3", "Product 4"]
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_user_orders_are_paged_newest_first(client, db):
+    user = User(email="buyer@example.com", hashed_password="unused")
+    db.add(user)
+    db.flush()
+    placed = datetime(2024, 1, 1)
+    # Pairs of orders share a timestamp, so the id has to break the tie
+    db.add_all(
+        Order(
+            user_id=user.id, total_amount=i, full_name="Buyer", email=user.email,
+            phone="+70000000000", delivery_method=DeliveryMethod.PICKUP,
+            payment_method=PaymentMethod.CARD, created_at=placed + timedelta(days=i // 2),
+        )
+        for i in range(7)
+    )
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+
+    pages = walk(client, "/api/v1/orders/?limit=3", headers)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    totals = [order["total_amount"] for page in pages for order in page]
+    assert totals == [6, 5, 4, 3, 2, 1, 0]
+
+
+def test_invalid_cursor_is_rejected(client, db, admin_headers):
+    response = client.get("/api/v1/products/?cursor=not-a-cursor", headers=admin_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,87 @@
+import pytest
+from fastapi import status
+from passlib.context import CryptContext
+
+from app.core import security
+from app.core.passwords import PasswordHasher, PasswordHasherBusy
+from app.models.user import User
+
+
+def context_options(rounds: int) -> dict:
+    # A cheap scheme with tunable rounds stands in for bcrypt
+    return {
+        "schemes": ["sha256_crypt"],
+        "sha256_crypt__default_rounds": rounds,
+        "sha256_crypt__min_rounds": rounds,
+        "sha256_crypt__max_rounds": rounds,
+    }
+
+
+@pytest.fixture(scope="module")
+def hasher():
+    hasher = PasswordHasher(context_options(2000), workers=1, queue_size=1, timeout=30)
+    yield hasher
+    hasher.shutdown()
+
+
+@pytest.fixture
+def app_hasher(monkeypatch, hasher):
+    monkeypatch.setattr(security, "password_hasher", hasher)
+    return hasher
+
+
+def test_hash_and_verify_in_pool(hasher):
+    hashed = hasher.hash("correct horse")
+    assert hasher.verify("correct horse", hashed) == (True, None)
+    assert hasher.verify("wrong horse", hashed) == (False, None)
+
+
+def test_outdated_hash_is_replaced(hasher):
+    outdated = CryptContext(**context_options(1000)).hash("correct horse")
+    valid, new_hash = hasher.verify("correct horse", outdated)
+    assert valid
+    assert "rounds=2000" in new_hash
+    assert hasher.verify("correct horse", new_hash) == (True, None)
+
+
+def test_full_queue_is_rejected(hasher):
+    for _ in range(2):
+        hasher._slots.acquire()
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash("correct horse")
+    finally:
+        for _ in range(2):
+            hasher._slots.release()
+
+
+def test_login_rehashes_outdated_password(client, db, app_hasher):
+    user = User(
+        email="buyer@example.com",
+        hashed_password=CryptContext(**context_options(1000)).hash("correct horse"),
+    )
+    db.add(user)
+    db.commit()
+
+    response = client.post(
+        "/api/v1/auth/login", data={"username": "buyer@example.com", "password": "correct horse"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    stored = db.query(User.hashed_password).filter(User.email == "buyer@example.com").scalar()
+    assert "rounds=2000" in stored
+
+
+def test_login_gets_503_when_pool_is_busy(client, db, app_hasher):
+    db.add(User(email="buyer@example.com", hashed_password="unused"))
+    db.commit()
+    for _ in range(2):
+        app_hasher._slots.acquire()
+    try:
+        response = client.post(
+            "/api/v1/auth/login", data={"username": "buyer@example.com", "password": "x"}
+        )
+    finally:
+        for _ in range(2):
+            app_hasher._slots.release()
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["Retry-After"] == "1"
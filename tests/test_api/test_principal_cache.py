@@ -0,0 +1,85 @@
+from fastapi import status
+
+from app.core.principal_cache import PrincipalCache, principal_cache
+from app.core.security import create_access_token
+from app.crud.user import user as crud_user
+from app.models.user import User, UserRole
+
+
+def user_selects(statements: list) -> int:
+    return sum("FROM user" in statement for statement in statements)
+
+
+def test_repeated_requests_skip_user_query(client, db, count_queries):
+    buyer = User(email="buyer@example.com", hashed_password="unused")
+    db.add(buyer)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(buyer.id)}"}
+
+    with count_queries() as first:
+        assert client.get("/api/v1/orders/", headers=headers).status_code == status.HTTP_200_OK
+    with count_queries() as second:
+        assert client.get("/api/v1/orders/", headers=headers).status_code == status.HTTP_200_OK
+
+    assert user_selects(first) == 1
+    assert user_selects(second) == 0
+    assert principal_cache.stats()["db_queries_saved"] == 1
+
+
+def test_update_invalidates_cached_user(client, db):
+    buyer = User(email="buyer@example.com", hashed_password="unused")
+    db.add(buyer)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(buyer.id)}"}
+    assert client.get("/api/v1/orders/", headers=headers).status_code == status.HTTP_200_OK
+
+    crud_user.update(db, db_obj=db.get(User, buyer.id), obj_in={"is_active": False})
+
+    response = client.get("/api/v1/orders/", headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Inactive user"
+
+
+def test_entries_expire_and_are_evicted(fake_redis, clock):
+    cache = PrincipalCache(fake_redis, ttl=60, max_size=2, use_redis=False, clock=clock)
+    for user_id in (1, 2):
+        cache.set(User(id=user_id, email=f"{user_id}@example.com", role=UserRole.USER, is_active=True))
+
+    assert cache.get(1).email == "1@example.com"
+    # 2 is now the least recently used entry
+    cache.set(User(id=3, email="3@example.com", role=UserRole.ADMIN, is_active=True))
+    assert cache.get(2) is None
+    assert cache.get(3).role == UserRole.ADMIN
+
+    clock.now = 61
+    assert cache.get(1) is None
+    assert cache.stats()["size"] == 1
+
+
+def test_redis_second_level_is_shared(fake_redis):
+    writer = PrincipalCache(fake_redis, ttl=60, max_size=10, use_redis=True)
+    reader = PrincipalCache(fake_redis, ttl=60, max_size=10, use_redis=True)
+    writer.set(User(id=7, email="shared@example.com", role=UserRole.ADMIN, is_active=True))
+
+    assert reader.get(7).email == "shared@example.com"
+    assert reader.stats()["redis_hits"] == 1
+    assert reader.get(7) is not None
+    assert reader.stats()["hits"] == 1
+
+    writer.invalidate(7)
+    assert PrincipalCache(fake_redis, ttl=60, max_size=10, use_redis=True).get(7) is None
+
+
+def test_principal_cache_stats_endpoint(client, db, admin_headers):
+    buyer = User(email="buyer@example.com", hashed_password="unused")
+    db.add(buyer)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(buyer.id)}"}
+    for _ in range(3):
+        client.get("/api/v1/orders/", headers=headers)
+
+    stats = client.get("/api/v1/admin/principal-cache", headers=admin_headers).json()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 3
+    assert stats["hit_rate"] == 0.75
+    assert stats["db_queries_saved"] == 3
@@ -0,0 +1,60 @@
+from fastapi import status
+
+from app.models.category import Category
+from app.models.product import Product
+
+# The ETag fingerprint, products joined with their category, then one
+# selectin query each for product images, variations and variation images
+MAX_STATEMENTS_PER_PAGE = 5
+
+
+def seed_products(create_product, count: int, variations: int = 3, images: int = 2) -> Category:
+    fields = [{"price": 10 + v} for v in range(variations)]
+    category_id = None
+    for i in range(count):
+        product = create_product(
+            f"Product {count}-{i}", category_id=category_id, variations=fields, images=images
+        )
+        category_id = product.category_id
+    return product.category
+
+
+def test_product_page_statement_count_is_bounded(client, db, admin_headers, count_queries, create_product):
+    seed_products(create_product, 3)
+    with count_queries() as small:
+        response = client.get("/api/v1/products/", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 3
+
+    seed_products(create_product, 100)
+    with count_queries() as large:
+        response = client.get("/api/v1/products/?limit=100", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 100
+
+    assert len(small) <= MAX_STATEMENTS_PER_PAGE
+    assert len(large) == len(small)
+
+
+def test_product_response_is_fully_loaded(client, db, admin_headers, count_queries, create_product):
+    category = seed_products(create_product, 2)
+    product_id = db.query(Product.id).filter(Product.category_id == category.id).first()[0]
+
+    with count_queries() as statements:
+        response = client.get(f"/api/v1/products/{product_id}", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert len(statements) <= MAX_STATEMENTS_PER_PAGE
+
+    data = response.json()
+    assert data["category_name"] == category.name
+    assert len(data["variations"]) == 3
+    assert all(len(variation["images"]) == 2 for variation in data["variations"])
+    assert len(data["images"]) == 6
+
+    with count_queries() as statements:
+        response = client.get(
+            f"/api/v1/products/?category_id={category.id}", headers=admin_headers
+        )
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 2
+    assert len(statements) <= MAX_STATEMENTS_PER_PAGE
@@ -0,0 +1,75 @@
+from fastapi import status
+
+from app.crud.pagination import NEXT_CURSOR_HEADER
+from app.crud.product import product as crud_product
+from app.models.category import Category
+from app.models.product import Product
+from app.schemas.product import ProductUpdate
+
+
+def seed(db, *products) -> Category:
+    category = Category(name="Outdoor", path="/")
+    db.add(category)
+    db.flush()
+    db.add_all(
+        Product(name=name, description=description, category_id=category.id)
+        for name, description in products
+    )
+    db.commit()
+    return category
+
+
+def search(client, headers, query: str, **params):
+    response = client.get(
+        "/api/v1/products/search", params={"query": query, **params}, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    return response
+
+
+def test_search_ranks_name_matches_first(client, db, admin_headers):
+    seed(
+        db,
+        ("Camping stove", "Burns gas, packs small"),
+        ("Tent", "Sleeps two, pairs well with a stove"),
+        ("Sleeping bag", "Down filled"),
+    )
+    results = search(client, admin_headers, "stove").json()
+
+    assert [p["name"] for p in results] == ["Camping stove", "Tent"]
+    assert results[0]["rank"] > results[1]["rank"]
+    assert "<mark>stove</mark>" in results[1]["snippet"]
+
+
+def test_search_matches_prefixes_of_every_term(client, db, admin_headers):
+    seed(db, ("Hiking boots", "Waterproof leather"), ("Hiking poles", "Carbon"))
+
+    assert [p["name"] for p in search(client, admin_headers, "hik wat").json()] == [
+        "Hiking boots"
+    ]
+    assert search(client, admin_headers, "%").json() == []
+
+
+def test_search_index_follows_writes(client, db, admin_headers):
+    seed(db, ("Headlamp", "300 lumens"))
+    lamp = db.query(Product).one()
+
+    crud_product.update_with_variations(db, db_obj=lamp, obj_in=ProductUpdate(name="Torch"))
+    assert search(client, admin_headers, "headlamp").json() == []
+    assert [p["id"] for p in search(client, admin_headers, "torch").json()] == [lamp.id]
+
+    crud_product.remove(db, id=lamp.id)
+    assert search(client, admin_headers, "torch").json() == []
+
+
+def test_search_pages_follow_cursor(client, db, admin_headers):
+    seed(db, *((f"Carabiner {i}", "Locking" if i % 2 else None) for i in range(7)))
+
+    response = search(client, admin_headers, "carabiner", limit=3)
+    ids = [p["id"] for p in response.json()]
+    while NEXT_CURSOR_HEADER in response.headers:
+        cursor = response.headers[NEXT_CURSOR_HEADER]
+        response = search(client, admin_headers, "carabiner", limit=3, cursor=cursor)
+        ids += [p["id"] for p in response.json()]
+
+    assert sorted(ids) == [p.id for p in db.query(Product).order_by(Product.id)]
@@ -0,0 +1,115 @@
+import fakeredis
+import pytest
+from fastapi import status
+
+from app.core.rate_limit import Limit, RateLimiter, Rule, parse_routes, rate_limiter
+
+
+def limiter(client, capacity: int, clock, *, local_batch: int = 1) -> RateLimiter:
+    return RateLimiter(
+        client,
+        default=Rule("default", (Limit(capacity, 60),)),
+        routes=parse_routes("POST /api/v1/auth/login=2/minute"),
+        prefix="/api/v1",
+        local_batch=local_batch,
+        local_ttl=1,
+        redis_timeout=1,
+        redis_retry=5,
+        clock=clock,
+    )
+
+
+def test_parse_routes():
+    routes = parse_routes(" POST /api/v1/auth/login=10/minute, get /api/v1/products=5/second,")
+    assert routes == {
+        ("POST", "/api/v1/auth/login"): Rule("POST /api/v1/auth/login", (Limit(10, 60),)),
+        ("GET", "/api/v1/products"): Rule("GET /api/v1/products", (Limit(5, 1),)),
+    }
+
+
+def test_rule_for_route_override_and_default(clock):
+    rules = limiter(fakeredis.FakeAsyncRedis(), 10, clock)
+    assert rules.rule_for("POST", "/api/v1/auth/login").name == "POST /api/v1/auth/login"
+    assert rules.rule_for("GET", "/api/v1/auth/login").name == "default"
+    assert rules.rule_for("GET", "/docs") is None
+
+
+@pytest.mark.asyncio
+async def test_bucket_in_redis_is_shared_by_workers(clock):
+    client = fakeredis.FakeAsyncRedis()
+    workers = [limiter(client, 3, clock), limiter(client, 3, clock)]
+    rule = workers[0].default
+    results = [await workers[i % 2].acquire(rule, "ip:1") for i in range(4)]
+    assert results[:3] == [None, None, None]
+    # One token comes back every 20 seconds
+    assert 19 < results[3] <= 20
+    assert await workers[0].acquire(rule, "ip:2") is None
+
+
+@pytest.mark.asyncio
+async def test_local_batch_saves_redis_round_trips(clock):
+    batched = limiter(fakeredis.FakeAsyncRedis(), 100, clock, local_batch=5)
+    for _ in range(10):
+        assert await batched.acquire(batched.default, "ip:1") is None
+    stats = batched.stats()
+    assert stats["redis_calls"] == 2
+    assert stats["local_hits"] == 8
+
+    # Tokens left over expire with the grant
+    await batched.acquire(batched.default, "ip:1")
+    clock.now += 1
+    await batched.acquire(batched.default, "ip:1")
+    assert batched.stats()["redis_calls"] == 4
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_in_process_buckets_without_redis(clock):
+    server = fakeredis.FakeServer()
+    server.connected = False
+    fallback = limiter(fakeredis.FakeAsyncRedis(server=server), 2, clock)
+    rule = fallback.default
+    assert await fallback.acquire(rule, "ip:1") is None
+    assert await fallback.acquire(rule, "ip:1") is None
+    assert await fallback.acquire(rule, "ip:1") == pytest.approx(30)
+    assert fallback.stats()["fallbacks"] == 1
+    assert fallback.stats()["redis_up"] == 0
+
+    clock.now += 30
+    assert await fallback.acquire(rule, "ip:1") is None
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "enabled", True)
+    monkeypatch.setattr(rate_limiter, "client", fakeredis.FakeAsyncRedis())
+    monkeypatch.setattr(
+        rate_limiter, "routes", [(("POST", "/api/v1/auth/login"), Rule("login", (Limit(2, 60),)))]
+    )
+    rate_limiter.clear()
+    yield rate_limiter
+    rate_limiter.clear()
+
+
+def test_middleware_answers_429_per_route(client, limited):
+    login = {"username": "x@example.com", "password": "x"}
+    for _ in range(2):
+        response = client.post("/api/v1/auth/login", data=login)
+        assert response.status_code != status.HTTP_429_TOO_MANY_REQUESTS
+    response = client.post("/api/v1/auth/login", data=login)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response.json() == {"detail": "Too many requests"}
+    assert int(response.headers["Retry-After"]) >= 1
+
+    # Other routes have their own bucket
+    assert client.get("/api/v1/categories/").status_code != status.HTTP_429_TOO_MANY_REQUESTS
+
+
+def test_middleware_keys_by_user(client, limited, monkeypatch, admin_headers):
+    monkeypatch.setattr(limited, "default", Rule("default", (Limit(1, 60),)))
+    assert client.get("/api/v1/categories/").status_code == status.HTTP_401_UNAUTHORIZED
+    assert client.get("/api/v1/categories/").status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    # The same client with a token has a bucket of its own
+    assert client.get("/api/v1/categories/", headers=admin_headers).status_code == status.HTTP_200_OK
+    response = client.get("/api/v1/categories/", headers=admin_headers)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
@@ -0,0 +1,262 @@
+import asyncio
+from datetime import datetime
+
+import fakeredis
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, delete, insert, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.api import deps
+from app.core.security import create_access_token
+from app.crud.base import bulk_insert, write_rows
+from app.crud.product import ProductLoad, product as crud_product
+from app.db import session as db_session
+from app.db.base import Base
+from app.db.routing import AsyncReplicaRouter, ReplicaRouter, RoutingSession
+from app.main import app
+from app.models.category import Category
+from app.models.product import Product, ProductVariation
+from app.models.user import User
+from app.schemas.product import ProductUpdate
+
+
+@pytest.fixture
+def engines(tmp_path):
+    engines = [
+        create_engine(f"sqlite:///{tmp_path / name}.sqlite3")
+        for name in ("primary", "replica_a", "replica_b")
+    ]
+    for engine in engines:
+        Base.metadata.create_all(bind=engine)
+    yield engines
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def router(engines, clock, fake_redis):
+    return ReplicaRouter(engines[1:], sticky_seconds=5, client=fake_redis, clock=clock)
+
+
+@pytest.fixture
+def Session(engines, router):
+    return sessionmaker(
+        autoflush=False, bind=engines[0], class_=RoutingSession, router=router
+    )
+
+
+def seed_everywhere(engines, *objects):
+    """Rows every database has, as if replication had caught up"""
+    for engine in engines:
+        db = sessionmaker(bind=engine)()
+        db.add_all(obj() for obj in objects)
+        db.commit()
+        db.close()
+
+
+def replicate(engines, model):
+    """Copy the primary's rows of `model` to the replicas, as replication would"""
+    with engines[0].connect() as primary:
+        rows = [dict(row._mapping) for row in primary.execute(select(model.__table__))]
+    for engine in engines[1:]:
+        with engine.begin() as replica:
+            replica.execute(delete(model.__table__))
+            replica.execute(insert(model.__table__), rows)
+
+
+def category_names(db):
+    return db.scalars(select(Category.name)).all()
+
+
+def test_reads_go_to_replicas_round_robin(engines, Session):
+    for name, engine in zip(("primary", "a", "b"), engines):
+        seed_everywhere([engine], lambda name=name: Category(name=name))
+
+    seen = []
+    for _ in range(4):
+        db = Session(info={"replica": True})
+        seen.append(category_names(db))
+        db.close()
+    assert seen == [["a"], ["b"], ["a"], ["b"]]
+
+    db = Session()
+    assert category_names(db) == ["primary"]
+    db.close()
+
+
+def test_writes_and_locking_reads_go_to_primary(engines, Session):
+    db = Session(info={"replica": True})
+    assert db.scalars(select(Category).with_for_update()).all() == []
+    db.add(Category(name="new"))
+    db.commit()
+    # After its own write the session reads from the primary
+    assert category_names(db) == ["new"]
+    db.close()
+
+    replica = sessionmaker(bind=engines[1])()
+    assert category_names(replica) == []
+    replica.close()
+
+
+def test_writer_sticks_to_primary_for_the_window(Session, router, clock):
+    db = Session(info={"user_id": 7})
+    db.add(Category(name="new"))
+    db.commit()
+    db.close()
+    assert router.is_sticky(7)
+    assert not router.is_sticky(8)
+
+    clock.now += 5
+    assert not router.is_sticky(7)
+
+
+def test_core_writes_stick_to_primary(engines, Session, router, fake_redis):
+    seed_everywhere(engines, lambda: Category(id=1, name="old"))
+    for write in (
+        lambda db: db.execute(update(Category).values(name="new")),
+        lambda db: bulk_insert(db, Category, [{"name": "new", "path": "/"}]),
+        lambda db: write_rows(
+            db, Category.__table__, ["name", "path", "order", "created_at", "updated_at"],
+            [("new", "/", 0, datetime.utcnow(), datetime.utcnow())],
+        ),
+    ):
+        db = Session(info={"replica": True, "user_id": 7})
+        write(db)
+        db.commit()
+        # Read back from the primary, not a replica that has not caught up
+        assert "new" in category_names(db)
+        db.close()
+        assert router.is_sticky(7)
+        router._sticky.clear()
+        fake_redis.flushall()
+
+
+def test_windows_are_shared_between_workers(engines, Session, router, clock, fake_redis):
+    other_worker = ReplicaRouter(engines[1:], sticky_seconds=5, client=fake_redis, clock=clock)
+    db = Session(info={"user_id": 7})
+    db.add(Category(name="new"))
+    db.commit()
+    db.close()
+    assert other_worker.is_sticky(7)
+    assert not other_worker.is_sticky(8)
+
+    # Known locally now, Redis is not asked again
+    fake_redis.flushall()
+    assert other_worker.is_sticky(7)
+    clock.now += 5
+    assert not other_worker.is_sticky(7)
+
+
+@pytest.mark.asyncio
+async def test_async_router_shares_windows(engines, clock):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    writer, reader = (
+        AsyncReplicaRouter(engines[1:], sticky_seconds=5, client=client, clock=clock)
+        for _ in range(2)
+    )
+    writer.stick(7)
+    await asyncio.gather(*writer._writes)
+    assert await reader.is_sticky(7)
+    assert not await reader.is_sticky(8)
+    clock.now += 5
+    assert not await reader.is_sticky(7)
+
+
+def test_rollback_does_not_stick(Session, router):
+    db = Session(info={"user_id": 7})
+    db.add(Category(name="new"))
+    db.flush()
+    db.rollback()
+    db.close()
+    assert not router.is_sticky(7)
+
+
+@pytest.fixture
+def routed_client(monkeypatch, engines, Session, router):
+    seed_everywhere(
+        engines,
+        lambda: User(id=1, email="buyer@example.com", hashed_password="unused"),
+        lambda: Category(id=1, name="Shirts", path="/"),
+        lambda: Product(id=1, name="Shirt", category_id=1),
+        lambda: ProductVariation(
+            id=1, product_id=1, color_name="Red", color_hex="#ff0000", price=10
+        ),
+    )
+    monkeypatch.setattr(db_session, "replica_router", router)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[deps.get_db] = override_get_db
+    with TestClient(app) as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+def test_user_reads_own_order_until_window_ends(routed_client, clock):
+    headers = {"Authorization": f"Bearer {create_access_token(1)}"}
+    response = routed_client.post(
+        "/api/v1/orders/",
+        json={
+            "full_name": "Buyer",
+            "email": "buyer@example.com",
+            "phone": "+70000000000",
+            "delivery_method": "pickup",
+            "payment_method": "card",
+            "items": [{"product_id": 1, "variation_id": 1, "quantity": 1}],
+        },
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    # The replicas have not seen the order yet, the primary serves the read
+    response = routed_client.get("/api/v1/orders/", headers=headers)
+    assert len(response.json()) == 1
+
+    clock.now += 5
+    response = routed_client.get("/api/v1/orders/", headers=headers)
+    assert response.json() == []
+
+
+def test_lagging_replica_body_is_not_served_once_it_catches_up(routed_client, engines, Session):
+    headers = {"Authorization": f"Bearer {create_access_token(1)}"}
+    db = Session()
+    shirt = crud_product.get(db, id=1, load=ProductLoad.BARE)
+    crud_product.update_with_variations(db, db_obj=shirt, obj_in=ProductUpdate(name="New shirt"))
+    db.close()
+
+    # The write dropped the cached product; the replicas refill it with the old row
+    stale = routed_client.get("/api/v1/products/1", headers=headers)
+    assert stale.json()["name"] == "Shirt"
+
+    replicate(engines, Product)
+    fresh = routed_client.get("/api/v1/products/1", headers=headers)
+    assert fresh.headers["ETag"] != stale.headers["ETag"]
+    assert fresh.json()["name"] == "New shirt"
+
+
+@pytest.mark.asyncio
+async def test_async_session_reads_from_replica(tmp_path, engines):
+    seed_everywhere(engines[:1], lambda: Category(name="primary"))
+    seed_everywhere(engines[1:2], lambda: Category(name="a"))
+    primary = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary'}.sqlite3")
+    replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica_a'}.sqlite3")
+    AsyncSessionLocal = async_sessionmaker(
+        primary,
+        sync_session_class=RoutingSession,
+        router=ReplicaRouter([replica.sync_engine], sticky_seconds=5),
+    )
+    async with AsyncSessionLocal() as db:
+        db.info["replica"] = True
+        assert (await db.scalars(select(Category.name))).all() == ["a"]
+    async with AsyncSessionLocal() as db:
+        assert (await db.scalars(select(Category.name))).all() == ["primary"]
+    await primary.dispose()
+    await replica.dispose()
@@ -0,0 +1,142 @@
+from datetime import datetime
+
+from fastapi import status
+
+from app.core.security import create_access_token
+from app.crud.order import order as crud_order
+from app.crud.sales import sales as crud_sales
+from app.models.order import DeliveryMethod, Order, OrderStatus, PaymentMethod
+from app.models.sales import DailySales, ProductSales
+from app.models.user import User
+from app.schemas.order import OrderItemCreate, OrderUpdate
+
+DAILY = "/api/v1/admin/sales/daily"
+TOP = "/api/v1/admin/sales/top-products"
+
+
+def seed_products(create_product) -> list:
+    """Sneaker in two colors and Boot in one, as (product id, [(product id, variation id)])"""
+    sneaker = create_product("Sneaker", variations=[{"price": 10}, {"price": 12}])
+    boot = create_product("Boot", category_id=sneaker.category_id, variations=[{"price": 30}])
+    return [(p.id, [(p.id, v.id) for v in p.variations]) for p in (sneaker, boot)]
+
+
+def place(client, headers, *items) -> dict:
+    response = client.post("/api/v1/orders/", headers=headers, json={
+        "full_name": "Buyer", "email": "admin@example.com", "phone": "+70000000000",
+        "delivery_method": "pickup", "payment_method": "card",
+        "items": [
+            {"product_id": product_id, "variation_id": variation_id, "quantity": quantity}
+            for (product_id, variation_id), quantity in items
+        ],
+    })
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()
+
+
+def rollups(db) -> tuple:
+    daily = sorted(
+        (row.day, row.status, round(row.revenue, 2), row.units, row.orders)
+        for row in db.query(DailySales)
+    )
+    products = sorted(
+        (row.day, row.product_id, row.variation_id, row.status, round(row.revenue, 2), row.units, row.orders)
+        for row in db.query(ProductSales)
+    )
+    return daily, products
+
+
+def test_rollups_follow_orders(client, db, admin_headers, create_product):
+    (sneaker, (red, blue)), (boot, (black,)) = seed_products(create_product)
+    first = place(client, admin_headers, (red, 2), (blue, 1))
+    place(client, admin_headers, (black, 1), (red, 1))
+    today = datetime.utcnow().date().isoformat()
+
+    response = client.get(DAILY, headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{"day": today, "revenue": 72.0, "units": 5, "orders": 2}]
+    response = client.get(DAILY, params={"product_id": sneaker}, headers=admin_headers)
+    # Counted once per variation
+    assert response.json() == [{"day": today, "revenue": 42.0, "units": 4, "orders": 3}]
+
+    response = client.put(f"/api/v1/orders/{first['id']}", json={"status": "paid"}, headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    response = client.get(DAILY, params={"status": "paid"}, headers=admin_headers)
+    assert response.json() == [{"day": today, "revenue": 32.0, "units": 3, "orders": 1}]
+    response = client.get(DAILY, params={"status": "created"}, headers=admin_headers)
+    assert response.json() == [{"day": today, "revenue": 40.0, "units": 2, "orders": 1}]
+    # Changing nothing moves nothing
+    client.put(f"/api/v1/orders/{first['id']}", json={"status": "paid"}, headers=admin_headers)
+    response = client.get(DAILY, params={"status": "paid"}, headers=admin_headers)
+    assert response.json()[0]["orders"] == 1
+
+    response = client.get(TOP, headers=admin_headers)
+    assert response.json() == [
+        {"product_id": sneaker, "name": "Sneaker", "revenue": 42.0, "units": 4, "orders": 3},
+        {"product_id": boot, "name": "Boot", "revenue": 30.0, "units": 1, "orders": 1},
+    ]
+    response = client.get(TOP, params={"by": "units", "limit": 1, "status": "created"}, headers=admin_headers)
+    assert [p["name"] for p in response.json()] == ["Sneaker"]
+    response = client.get(TOP, params={"date_from": "2000-01-01", "date_to": "2000-12-31"}, headers=admin_headers)
+    assert response.json() == []
+    assert client.get(TOP, params={"limit": 0}, headers=admin_headers).status_code == 422
+
+
+def test_replacing_items_moves_their_sales(client, db, admin_headers, create_product):
+    (sneaker, (red, blue)), (boot, (black,)) = seed_products(create_product)
+    placed = place(client, admin_headers, (red, 1), (blue, 1))
+
+    order = db.get(Order, placed["id"])
+    crud_order.update_with_items(
+        db, db_obj=order, obj_in=OrderUpdate(status=OrderStatus.SHIPPED),
+        items=[OrderItemCreate(product_id=boot, variation_id=black[1], quantity=2)],
+    )
+    daily, products = rollups(db)
+    day = daily[0][0]
+    assert daily == [
+        (day, OrderStatus.CREATED, 0, 0, 0),
+        (day, OrderStatus.SHIPPED, 60, 2, 1),
+    ]
+    assert [p for p in products if p[-1]] == [
+        (day, boot, black[1], OrderStatus.SHIPPED, 60, 2, 1),
+    ]
+
+
+def test_rebuild_matches_the_incremental_rollups(client, db, admin_headers, create_product):
+    (sneaker, (red, blue)), (boot, (black,)) = seed_products(create_product)
+    placed = [
+        place(client, admin_headers, (red, 1), (blue, 2), (red, 1)),
+        place(client, admin_headers, (black, 3)),
+        place(client, admin_headers, (blue, 1)),
+    ]
+    for order, order_status in zip(placed, ("paid", "cancelled")):
+        client.put(f"/api/v1/orders/{order['id']}", json={"status": order_status}, headers=admin_headers)
+    # Rows all of whose orders moved are left at zero by the increments
+    incremental = tuple([row for row in rows if row[-1]] for rows in rollups(db))
+
+    # An order from before the rollups, without items
+    db.add(Order(
+        user_id=db.query(User.id).scalar(), status=OrderStatus.DELIVERED, total_amount=0,
+        full_name="Ann", email="ann@example.com", phone="+100",
+        delivery_method=DeliveryMethod.PICKUP, payment_method=PaymentMethod.CARD,
+        created_at=datetime(2024, 3, 1, 23, 59),
+    ))
+    db.commit()
+    assert crud_sales.rebuild(db) == {"daily_rows": 4, "product_rows": 4}
+    daily, products = rollups(db)
+    assert daily[0] == (datetime(2024, 3, 1).date(), OrderStatus.DELIVERED, 0, 0, 1)
+    assert (daily[1:], products) == incremental
+
+    # The rebuilt rows take increments like the others
+    place(client, admin_headers, (blue, 1))
+    response = client.get(DAILY, params={"status": "created"}, headers=admin_headers)
+    assert response.json()[0]["orders"] == 2
+
+
+def test_reports_are_admin_only(client, db):
+    user = User(email="user@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+    for url in (DAILY, TOP):
+        assert client.get(url, headers=headers).status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,100 @@
+import pytest
+from fastapi import status
+
+from app.core.search import ProductSearchIndex, product_index
+from app.crud.pagination import NEXT_CURSOR_HEADER
+from app.crud.product import product as crud_product
+from app.models.category import Category
+from app.schemas.product import ProductCreate, ProductUpdate, ProductVariationCreate
+
+
+@pytest.fixture
+def memory_search(monkeypatch):
+    monkeypatch.setattr(product_index, "enabled", True)
+    product_index.clear()
+    yield product_index
+    product_index.clear()
+
+
+def create(db, category_id: int, name: str, description: str = None, colors=()):
+    return crud_product.create_with_variations(db, obj_in=ProductCreate(
+        name=name,
+        description=description,
+        category_id=category_id,
+        variations=[
+            ProductVariationCreate(color_name=color, color_hex="#000000", price=10)
+            for color in colors
+        ],
+        images=[],
+    ))
+
+
+def search(client, headers, query: str, **params):
+    response = client.get(
+        "/api/v1/products/search", params={"query": query, **params}, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    return response
+
+
+@pytest.fixture
+def category(db):
+    category = Category(name="Footwear", path="/")
+    db.add(category)
+    db.commit()
+    return category
+
+
+def test_index_matches_exact_prefix_and_typos():
+    index = ProductSearchIndex(enabled=True)
+    index.add(1, "Running sneakers", "Light mesh upper", ["Ocean blue"])
+    index.add(2, "Leather boots", "Waterproof, for hiking", ["Brown"])
+    index.add(3, "Hiking sandals", None, ["Blue"])
+
+    assert [pid for _, pid in index.search("boots")] == [2]
+    assert [pid for _, pid in index.search("snea")] == [1]
+    assert [pid for _, pid in index.search("sneakrs")] == [1]
+    assert [pid for _, pid in index.search("hiking")] == [3, 2]
+    assert [pid for _, pid in index.search("blue hiking")] == [3]
+    assert index.search("boots blue") == []
+
+    index.add(2, "Leather shoes", None, [])
+    assert index.search("boots") == []
+    index.remove(3)
+    assert index.search("sandals") == []
+    assert len(index) == 2
+
+
+def test_search_endpoint_uses_index(client, db, admin_headers, memory_search, category):
+    sneakers = create(db, category.id, "Trail sneakers", "Grippy sole", ["Forest green"])
+    create(db, category.id, "Canvas shoes", "Pairs with green laces")
+
+    results = search(client, admin_headers, "sneekers").json()
+    assert [p["id"] for p in results] == [sneakers.id]
+    assert results[0]["snippet"] == "Trail <mark>sneakers</mark>"
+
+    assert [p["name"] for p in search(client, admin_headers, "green").json()] == [
+        "Trail sneakers", "Canvas shoes"
+    ]
+
+    crud_product.update_with_variations(
+        db, db_obj=sneakers, obj_in=ProductUpdate(name="Trail runners")
+    )
+    assert search(client, admin_headers, "sneakers").json() == []
+    crud_product.remove(db, id=sneakers.id)
+    assert search(client, admin_headers, "runners").json() == []
+
+
+def test_rebuild_and_page_through_index(client, db, admin_headers, memory_search, category):
+    created = [create(db, category.id, f"Slipper {i}") for i in range(5)]
+    memory_search.clear()
+
+    assert crud_product.rebuild_search_index(db) == 5
+    response = search(client, admin_headers, "slipper", limit=2)
+    ids = [p["id"] for p in response.json()]
+    while NEXT_CURSOR_HEADER in response.headers:
+        cursor = response.headers[NEXT_CURSOR_HEADER]
+        response = search(client, admin_headers, "slipper", limit=2, cursor=cursor)
+        ids += [p["id"] for p in response.json()]
+
+    assert ids == [p.id for p in reversed(created)]
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from fastapi import status
+
+from app.core.rfm import quintile_scores
+from app.core.security import create_access_token
+from app.crud.pagination import NEXT_CURSOR_HEADER
+from app.crud.segment import segment as crud_segment
+from app.models.order import DeliveryMethod, Order, OrderStatus, PaymentMethod
+from app.models.segment import UserSegment
+from app.models.user import User
+
+SEGMENTS = "/api/v1/admin/segments"
+
+
+def seed_orders(db) -> list:
+    """
+    A user with only a cancelled order, then five customers, the k-th with
+    k orders of 10 each, the latest (100, 50, 20, 5, 1)[k - 1] days ago and
+    the first one also with a cancelled order today. Returns their user ids.
+    """
+    now = datetime.utcnow()
+    users = [User(email=f"user{k}@example.com", hashed_password="x") for k in range(6)]
+    db.add_all(users)
+    db.flush()
+    orders = []
+    for k, (user, days) in enumerate(zip(users[1:], (100, 50, 20, 5, 1)), start=1):
+        for n in range(k):
+            orders.append((user.id, OrderStatus.DELIVERED, now - timedelta(days=days + n * 200, hours=1)))
+    orders.append((users[0].id, OrderStatus.CANCELLED, now))
+    orders.append((users[1].id, OrderStatus.CANCELLED, now))
+    db.add_all([
+        Order(
+            user_id=user_id, status=order_status, total_amount=10, created_at=created_at,
+            full_name="Buyer", email="buyer@example.com", phone="+100",
+            delivery_method=DeliveryMethod.PICKUP, payment_method=PaymentMethod.CARD,
+        )
+        for user_id, order_status, created_at in orders
+    ])
+    db.commit()
+    return [user.id for user in users]
+
+
+def segments(db) -> list:
+    return sorted(
+        (row.user_id, row.recency_days, row.frequency, row.monetary,
+         row.recency_score, row.frequency_score, row.monetary_score, row.segment)
+        for row in db.query(UserSegment)
+    )
+
+
+def test_quintile_scores():
+    assert quintile_scores(np.arange(1, 11)).tolist() == [1, 1, 2, 2, 3, 3, 4, 4, 5, 5]
+    # Fewer days since the last order is better
+    assert quintile_scores(np.arange(1, 11), higher_is_better=False).tolist() == [5, 5, 4, 4, 3, 3, 2, 2, 1, 1]
+    # Ties share the lower score
+    assert quintile_scores(np.array([1, 1, 1, 1, 1, 1, 1, 2, 3, 9])).tolist() == [1] * 7 + [4, 5, 5]
+    assert quintile_scores(np.array([])).tolist() == []
+
+
+def test_segments_from_orders(client, db, admin_headers):
+    cancelled, *customers = seed_orders(db)
+    response = client.post(f"{SEGMENTS}/rebuild", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    report = response.json()
+    assert (report["users"], report["orders"]) == (5, 15)
+    assert report["seconds"] >= report["fetch_seconds"]
+
+    response = client.get(SEGMENTS, headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert [
+        (s["user_id"], s["recency_days"], s["frequency"], s["monetary"],
+         s["recency_score"], s["frequency_score"], s["monetary_score"], s["segment"])
+        for s in response.json()
+    ] == [
+        (customers[0], 100, 1, 10.0, 1, 1, 1, "lost"),
+        (customers[1], 50, 2, 20.0, 2, 2, 2, "hibernating"),
+        (customers[2], 20, 3, 30.0, 3, 3, 3, "needs_attention"),
+        (customers[3], 5, 4, 40.0, 4, 4, 4, "loyal"),
+        (customers[4], 1, 5, 50.0, 5, 5, 5, "champions"),
+    ]
+
+    response = client.get(SEGMENTS, params={"segment": "loyal"}, headers=admin_headers)
+    assert [s["user_id"] for s in response.json()] == [customers[3]]
+    response = client.get(SEGMENTS, params={"limit": 3}, headers=admin_headers)
+    response = client.get(
+        SEGMENTS, params={"limit": 3, "cursor": response.headers[NEXT_CURSOR_HEADER]}, headers=admin_headers
+    )
+    assert [s["user_id"] for s in response.json()] == customers[3:]
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+    response = client.get(f"{SEGMENTS}/summary", headers=admin_headers)
+    assert response.json() == [
+        {"segment": "champions", "users": 1, "monetary": 50.0},
+        {"segment": "loyal", "users": 1, "monetary": 40.0},
+        {"segment": "needs_attention", "users": 1, "monetary": 30.0},
+        {"segment": "hibernating", "users": 1, "monetary": 20.0},
+        {"segment": "lost", "users": 1, "monetary": 10.0},
+    ]
+
+
+def test_rebuild_replaces_segments_whatever_the_chunk_size(db):
+    seed_orders(db)
+    crud_segment.rebuild(db)
+    expected = segments(db)
+    assert len(expected) == 5
+    for chunk_size in (1, 2, 7):
+        crud_segment.rebuild(db, chunk_size=chunk_size)
+        assert segments(db) == expected
+
+    # As of a later time, everyone's last order is further away
+    crud_segment.rebuild(db, now=datetime.utcnow() + timedelta(days=10))
+    assert [row[1] for row in segments(db)] == [row[1] + 10 for row in expected]
+
+
+def test_segments_are_admin_only(client, db):
+    user = User(email="user@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+    assert client.post(f"{SEGMENTS}/rebuild", headers=headers).status_code == status.HTTP_400_BAD_REQUEST
+    for url in (SEGMENTS, f"{SEGMENTS}/summary"):
+        assert client.get(url, headers=headers).status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,35 @@
+from fastapi import status
+from fastapi.responses import ORJSONResponse
+
+from app.crud.category import category as crud_category
+from app.crud.user import user as crud_user
+from app.main import app
+from app.models.user import User, UserRole
+from app.schemas.category import CategoryCreate
+
+
+def test_default_response_class_is_orjson():
+    assert app.router.default_response_class is ORJSONResponse
+
+
+def test_response_models_render_compact_json(client, db, admin_headers):
+    crud_category.create(db, obj_in=CategoryCreate(name="Ñandú"))
+    response = client.get("/api/v1/categories/", headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    # orjson writes UTF-8 without spaces between items
+    assert '"name":"Ñandú","description":null' in response.text
+
+
+def test_update_sets_columns_of_expired_object(db):
+    user = User(email="user@example.com", hashed_password="unused")
+    db.add(user)
+    db.commit()
+    # Every attribute is expired after the commit; updates must still apply
+    assert "full_name" not in user.__dict__
+
+    updated = crud_user.update(
+        db, db_obj=user, obj_in={"full_name": "Ann", "role": UserRole.ADMIN, "unknown": 1}
+    )
+    assert (updated.full_name, updated.role) == ("Ann", UserRole.ADMIN)
+    db.expire_all()
+    assert db.get(User, user.id).full_name == "Ann"
@@ -0,0 +1,367 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import status
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.core.security import create_access_token
+from app.core.stock import UNTRACKED, StockCounter
+from app.crud.order import order as crud_order
+from app.crud.stock import DatabaseStock, InsufficientStock, RedisStock, stock as crud_stock
+from app.db.base import Base
+from app.models.category import Category
+from app.models.order import Order, OrderStatus
+from app.models.product import Product, ProductVariation
+from app.models.sales import DailySales
+from app.models.stock import StockReservation
+from app.models.user import User
+from app.schemas.order import OrderCreate, OrderItemCreate, OrderUpdate
+
+
+def seed_variations(db, *stock) -> list:
+    """One product with a variation per `stock` value, as (product id, variation id)"""
+    category = Category(name="Shoes", path="/")
+    db.add(category)
+    db.flush()
+    product = Product(name="Sneaker", category_id=category.id)
+    product.variations = [
+        ProductVariation(color_name=f"Color {index}", color_hex="#000000", price=10, stock=units)
+        for index, units in enumerate(stock)
+    ]
+    db.add(product)
+    db.commit()
+    return [(product.id, variation.id) for variation in product.variations]
+
+
+def order_json(*items) -> dict:
+    return {
+        "full_name": "Buyer", "email": "admin@example.com", "phone": "+70000000000",
+        "delivery_method": "pickup", "payment_method": "card",
+        "items": [
+            {"product_id": product_id, "variation_id": variation_id, "quantity": quantity}
+            for (product_id, variation_id), quantity in items
+        ],
+    }
+
+
+def order_in(*items) -> OrderCreate:
+    return OrderCreate(**order_json(*items))
+
+
+def stock_of(db, *variations) -> list:
+    db.expire_all()
+    return [db.get(ProductVariation, variation_id).stock for _, variation_id in variations]
+
+
+@pytest.fixture
+def redis_stock(monkeypatch, fake_redis):
+    backend = RedisStock(StockCounter(fake_redis))
+    monkeypatch.setattr(crud_stock, "backend", backend)
+    return backend
+
+
+def test_orders_take_stock_all_or_nothing(client, db, admin_headers):
+    red, blue, untracked = seed_variations(db, 3, 1, None)
+
+    response = client.post("/api/v1/orders/", json=order_json((red, 2), (untracked, 5)), headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert stock_of(db, red, blue, untracked) == [1, 1, None]
+
+    # Short of blue: red is not taken either
+    response = client.post(
+        "/api/v1/orders/", json=order_json((red, 1), (blue, 2)), headers=admin_headers
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.json()["detail"] == [{
+        "loc": ["body", "items", 1], "msg": "Not enough stock",
+        "product_id": blue[0], "variation_id": blue[1], "available": 1,
+    }]
+    assert stock_of(db, red, blue) == [1, 1]
+    assert db.scalar(select(func.count(Order.id))) == 1
+
+    # Items of one variation add up
+    response = client.post(
+        "/api/v1/orders/", json=order_json((red, 1), (red, 1)), headers=admin_headers
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+    response = client.post(
+        "/api/v1/orders/", json=order_json((red, 1), (blue, 1)), headers=admin_headers
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert stock_of(db, red, blue) == [0, 0]
+
+    # Invalid items still get 400, and take nothing
+    response = client.post(
+        "/api/v1/orders/", json=order_json((untracked, 1), ((red[0], 999), 1)), headers=admin_headers
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_status_changes_keep_or_give_back_stock(client, db, admin_headers):
+    (red,) = seed_variations(db, 3)
+    first = client.post("/api/v1/orders/", json=order_json((red, 2)), headers=admin_headers).json()
+    second = client.post("/api/v1/orders/", json=order_json((red, 1)), headers=admin_headers).json()
+    assert stock_of(db, red) == [0]
+
+    def move(order, order_status):
+        return client.put(f"/api/v1/orders/{order['id']}", json={"status": order_status}, headers=admin_headers)
+
+    # Paid orders keep their units, and no longer expire
+    assert move(first, "paid").status_code == status.HTTP_200_OK
+    reservation = db.scalars(select(StockReservation).where(StockReservation.order_id == first["id"])).one()
+    assert (reservation.quantity, reservation.expires_at) == (2, None)
+    assert move(first, "cancelled").status_code == status.HTTP_200_OK
+    assert stock_of(db, red) == [2]
+    assert move(second, "cancelled").status_code == status.HTTP_200_OK
+    assert stock_of(db, red) == [3]
+    assert db.scalar(select(func.count(StockReservation.id))) == 0
+
+    # An order no longer cancelled takes its items again, if they are left
+    assert move(second, "created").status_code == status.HTTP_200_OK
+    assert stock_of(db, red) == [2]
+    client.put(f"/api/v1/admin/variations/{red[1]}/stock", json={"stock": 1}, headers=admin_headers)
+    response = move(first, "paid")
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.json()["detail"][0]["available"] == 1
+    db.expire_all()
+    assert db.get(Order, first["id"]).status == OrderStatus.CANCELLED
+
+
+def test_replacing_items_swaps_their_stock(client, db, admin_headers):
+    red, blue = seed_variations(db, 2, 2)
+    placed = client.post("/api/v1/orders/", json=order_json((red, 2)), headers=admin_headers).json()
+
+    order = db.get(Order, placed["id"])
+    with pytest.raises(InsufficientStock):
+        crud_order.update_with_items(
+            db, db_obj=order, obj_in=OrderUpdate(),
+            items=[OrderItemCreate(product_id=blue[0], variation_id=blue[1], quantity=3)],
+        )
+    assert stock_of(db, red, blue) == [0, 2]
+
+    order = db.get(Order, placed["id"])
+    crud_order.update_with_items(
+        db, db_obj=order, obj_in=OrderUpdate(status=OrderStatus.PAID),
+        items=[OrderItemCreate(product_id=blue[0], variation_id=blue[1], quantity=1)],
+    )
+    assert stock_of(db, red, blue) == [2, 1]
+    reservation = db.scalars(select(StockReservation)).one()
+    assert (reservation.variation_id, reservation.quantity, reservation.expires_at) == (blue[1], 1, None)
+
+
+def test_expire_cancels_unpaid_orders(client, db, admin_headers):
+    (red,) = seed_variations(db, 5)
+    paid = client.post("/api/v1/orders/", json=order_json((red, 1)), headers=admin_headers).json()
+    unpaid = client.post("/api/v1/orders/", json=order_json((red, 2)), headers=admin_headers).json()
+    client.put(f"/api/v1/orders/{paid['id']}", json={"status": "paid"}, headers=admin_headers)
+
+    assert crud_stock.expire(db) == 0
+    later = datetime.utcnow() + timedelta(minutes=16)
+    assert crud_stock.expire_all(db, now=later) == 1
+    db.expire_all()
+    assert db.get(Order, unpaid["id"]).status == OrderStatus.CANCELLED
+    assert db.get(Order, paid["id"]).status == OrderStatus.PAID
+    assert stock_of(db, red) == [4]
+    # The sales rollups follow the cancellation
+    cancelled = db.scalars(select(DailySales).where(DailySales.status == OrderStatus.CANCELLED)).one()
+    assert (cancelled.units, cancelled.orders) == (2, 1)
+    assert crud_stock.expire(db, now=later) == 0
+
+
+def test_stock_changes_refresh_cached_products(client, db, admin_headers):
+    (red,) = seed_variations(db, 5)
+    url = f"/api/v1/products/{red[0]}"
+
+    def shown():
+        return client.get(url, headers=admin_headers).json()["variations"][0]["stock"]
+
+    def listed():
+        response = client.get("/api/v1/products/", params={"category_id": category_id}, headers=admin_headers)
+        return response.json()[0]["variations"][0]["stock"]
+
+    category_id = db.get(Product, red[0]).category_id
+    assert (shown(), listed()) == (5, 5)
+    placed = client.post("/api/v1/orders/", json=order_json((red, 2)), headers=admin_headers).json()
+    assert (shown(), listed()) == (3, 3)
+    client.put(f"/api/v1/orders/{placed['id']}", json={"status": "cancelled"}, headers=admin_headers)
+    assert (shown(), listed()) == (5, 5)
+    client.put(f"/api/v1/admin/variations/{red[1]}/stock", json={"stock": 100}, headers=admin_headers)
+    assert (shown(), listed()) == (100, 100)
+
+    client.post("/api/v1/orders/", json=order_json((red, 1)), headers=admin_headers)
+    assert crud_stock.expire_all(db, now=datetime.utcnow() + timedelta(minutes=16)) == 1
+    assert shown() == 100
+
+
+def test_redis_write_back_refreshes_cached_products(client, db, admin_headers, redis_stock):
+    (red,) = seed_variations(db, 5)
+    url = f"/api/v1/products/{red[0]}"
+    assert client.get(url, headers=admin_headers).json()["variations"][0]["stock"] == 5
+    client.post("/api/v1/orders/", json=order_json((red, 2)), headers=admin_headers)
+    assert crud_stock.flush(db) == 1
+    assert client.get(url, headers=admin_headers).json()["variations"][0]["stock"] == 3
+
+
+def test_set_variation_stock(client, db, admin_headers):
+    (red,) = seed_variations(db, None)
+    url = f"/api/v1/admin/variations/{red[1]}/stock"
+    response = client.put(url, json={"stock": 5}, headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"id": red[1], "product_id": red[0], "stock": 5}
+    assert client.put(url, json={"stock": -1}, headers=admin_headers).status_code == 422
+    response = client.put(url, json={"stock": None}, headers=admin_headers)
+    assert response.json()["stock"] is None
+    response = client.put("/api/v1/admin/variations/999/stock", json={"stock": 1}, headers=admin_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    user = User(email="user@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(user.id)}"}
+    assert client.put(url, json={"stock": 1}, headers=headers).status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_redis_counters_take_stock_and_write_back(client, db, admin_headers, redis_stock):
+    red, blue, untracked = seed_variations(db, 3, 1, None)
+    counter = redis_stock.counter
+
+    response = client.post("/api/v1/orders/", json=order_json((red, 2), (untracked, 1)), headers=admin_headers)
+    assert response.status_code == status.HTTP_200_OK
+    placed = response.json()
+    assert (counter.get(red[1]), counter.get(untracked[1])) == ("1", UNTRACKED)
+    # The database follows on write-back
+    assert stock_of(db, red) == [3]
+
+    response = client.post("/api/v1/orders/", json=order_json((red, 1), (blue, 2)), headers=admin_headers)
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert response.json()["detail"][0]["available"] == 1
+    assert (counter.get(red[1]), counter.get(blue[1])) == ("1", "1")
+
+    # Units taken by a transaction that rolls back are given back
+    crud_stock.reserve(db, items=order_in((red, 1)).items)
+    assert counter.get(red[1]) == "0"
+    db.rollback()
+    assert counter.get(red[1]) == "1"
+
+    client.put(f"/api/v1/orders/{placed['id']}", json={"status": "cancelled"}, headers=admin_headers)
+    assert counter.get(red[1]) == "3"
+    assert crud_stock.flush(db) == 0  # the order and its cancellation cancel out
+    assert stock_of(db, red) == [3]
+
+    client.post("/api/v1/orders/", json=order_json((red, 2), (blue, 1)), headers=admin_headers)
+    assert crud_stock.flush(db) == 2
+    assert stock_of(db, red, blue) == [1, 0]
+    assert crud_stock.flush(db) == 0
+
+    # Setting stock reloads the counter from the database
+    client.put(f"/api/v1/admin/variations/{red[1]}/stock", json={"stock": 10}, headers=admin_headers)
+    assert counter.get(red[1]) is None
+    client.post("/api/v1/orders/", json=order_json((red, 4)), headers=admin_headers)
+    assert counter.get(red[1]) == "6"
+
+
+def test_catalog_import_sets_stock(client, db, admin_headers, redis_stock):
+    category = Category(name="Shoes", path="/")
+    db.add(category)
+    db.commit()
+    category_id = category.id
+
+    def upload(*rows):
+        body = "name,category_id,color_name,color_hex,price,stock\n" + "".join(
+            f"Sneaker,{category_id},{color},#000,10,{units}\n" for color, units in rows
+        )
+        response = client.post(
+            "/api/v1/products/import", params={"format": "csv", "upsert": True},
+            files={"file": ("products.csv", body.encode())}, headers=admin_headers,
+        )
+        assert response.json()["failed"] == 0
+        return {v.color_name: v for v in db.scalars(select(ProductVariation))}
+
+    variations = upload(("Red", 5), ("Blue", ""))
+    assert (variations["Red"].stock, variations["Blue"].stock) == (5, None)
+    red = (variations["Red"].product_id, variations["Red"].id)
+    client.post("/api/v1/orders/", json=order_json((red, 2)), headers=admin_headers)
+    assert redis_stock.counter.get(red[1]) == "3"
+
+    # Restocking drops the counter, so it loads the new stock
+    upload(("Red", 10), ("Blue", ""))
+    assert redis_stock.counter.get(red[1]) is None
+    client.post("/api/v1/orders/", json=order_json((red, 1)), headers=admin_headers)
+    assert redis_stock.counter.get(red[1]) == "9"
+    # Rows without stock keep it
+    crud_stock.flush(db)
+    assert upload(("Red", ""), ("Blue", ""))["Red"].stock == 9
+    assert redis_stock.counter.get(red[1]) == "9"
+
+
+def test_redis_counter_load_retries_after_a_write_back(fake_redis):
+    counter = StockCounter(fake_redis)
+    assert counter.load({1: 5}, counter.flushes())
+    counter.reserve({1: 2})
+
+    # A write-back finishing between reading the database and loading would
+    # be counted twice; the load refuses and is read again
+    flushes = counter.flushes()
+    assert counter.take_writeback() == {1: -2}
+    counter.finish_writeback()
+    counter.forget([2])
+    assert not counter.load({2: 3}, flushes)
+    assert counter.get(2) is None
+    assert counter.load({2: 3}, counter.flushes())
+
+    # Changes made while a batch is in flight wait for the next write-back,
+    # and counters wait to load until it is done
+    counter.reserve({1: 1})
+    assert counter.take_writeback() == {1: -1}
+    counter.reserve({1: 1})
+    assert counter.take_writeback() == {}  # leased
+    counter.forget([3])
+    assert not counter.load({3: 3}, counter.flushes())
+    counter.finish_writeback()
+    assert counter.load({3: 3}, counter.flushes())
+    assert counter.take_writeback() == {1: -1}
+
+
+@pytest.mark.parametrize("backend", ["database", "redis"])
+def test_hot_variation_never_oversells(tmp_path, monkeypatch, fake_redis, backend):
+    if backend == "redis":
+        monkeypatch.setattr(crud_stock, "backend", RedisStock(StockCounter(fake_redis)))
+    else:
+        monkeypatch.setattr(crud_stock, "backend", DatabaseStock())
+    # A file, so every thread has its own connection and transactions
+    engine = create_engine(f"sqlite:///{tmp_path / 'stock.sqlite3'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        user = User(email="buyer@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        (hot,) = seed_variations(db, 50)
+
+    placed, refused = [], []
+
+    def buy(count: int) -> None:
+        for _ in range(count):
+            with Session() as db:
+                try:
+                    order = crud_order.create_with_items(db, obj_in=order_in((hot, 1)), user_id=user_id)
+                except InsufficientStock:
+                    refused.append(1)
+                else:
+                    placed.append(order.id)
+
+    threads = [threading.Thread(target=buy, args=(25,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with Session() as db:
+        crud_stock.flush(db)
+        assert (len(placed), len(refused)) == (50, 150)
+        assert db.scalar(select(func.count(Order.id))) == 50
+        assert stock_of(db, hot) == [0]
+    engine.dispose()